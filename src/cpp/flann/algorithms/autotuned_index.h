@@ -175,6 +175,27 @@ public:
         }
     }
 
+    void removePoints(const std::vector<size_t>& ids)
+    {
+        if (bestIndex_) {
+            bestIndex_->removePoints(ids);
+        }
+    }
+
+    void relocatePoints(size_t first_id, const Matrix<ElementType>& new_points)
+    {
+        if (bestIndex_) {
+            bestIndex_->relocatePoints(first_id, new_points);
+        }
+    }
+
+    void rebuildIndex()
+    {
+        if (bestIndex_) {
+            bestIndex_->rebuildIndex();
+        }
+    }
+
     
     template<typename Archive>
     void serialize(Archive& ar)
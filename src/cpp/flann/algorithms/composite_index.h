@@ -101,7 +101,8 @@ public:
     }
 
     CompositeIndex(const CompositeIndex& other) : BaseClass(other),
-    	kmeans_index_(other.kmeans_index_), kdtree_index_(other.kdtree_index_)
+    	kmeans_index_(static_cast<KMeansIndex<Distance>*>(other.kmeans_index_->clone())),
+    	kdtree_index_(static_cast<KDTreeIndex<Distance>*>(other.kdtree_index_->clone()))
     {
     }
 
@@ -178,6 +179,23 @@ public:
         kdtree_index_->removePoint(index);
     }
 
+    void removePoints(const std::vector<size_t>& ids)
+    {
+        kmeans_index_->removePoints(ids);
+        kdtree_index_->removePoints(ids);
+    }
+
+    void relocatePoints(size_t first_id, const Matrix<ElementType>& new_points)
+    {
+        kmeans_index_->relocatePoints(first_id, new_points);
+        kdtree_index_->relocatePoints(first_id, new_points);
+    }
+
+    void rebuildIndex()
+    {
+        throw FLANNException("The composite index cannot be rebuilt, the ids of its sub-indexes would diverge");
+    }
+
 
     /**
      * \brief Saves the index to a stream
@@ -42,6 +42,7 @@ typedef unsigned __int64 uint64_t;
 #endif
 
 #include "flann/defines.h"
+#include "flann/util/simd.h"
 
 
 namespace flann
@@ -145,11 +146,17 @@ struct L2
      *
      *	The computation of squared root at the end is omitted for
      *	efficiency.
+     *
+     *	Float, unsigned char and int vectors use the SIMD kernels of
+     *	simd.h, which compute the whole distance regardless of worst_dist.
      */
     template <typename Iterator1, typename Iterator2>
     ResultType operator()(Iterator1 a, Iterator2 b, size_t size, ResultType worst_dist = -1) const
     {
         ResultType result = ResultType();
+        if (simd::compute<T>(simd::KERNEL_L2, a, b, size, result)) {
+            return result;
+        }
         ResultType diff0, diff1, diff2, diff3;
         Iterator1 last = a + size;
         Iterator1 lastgroup = last - 3;
@@ -206,11 +213,17 @@ struct L1
      *
      *	This is highly optimised, with loop unrolling, as it is one
      *	of the most expensive inner loops.
+     *
+     *	Float, unsigned char and int vectors use the SIMD kernels of
+     *	simd.h, which compute the whole distance regardless of worst_dist.
      */
     template <typename Iterator1, typename Iterator2>
     ResultType operator()(Iterator1 a, Iterator2 b, size_t size, ResultType worst_dist = -1) const
     {
         ResultType result = ResultType();
+        if (simd::compute<T>(simd::KERNEL_L1, a, b, size, result)) {
+            return result;
+        }
         ResultType diff0, diff1, diff2, diff3;
         Iterator1 last = a + size;
         Iterator1 lastgroup = last - 3;
@@ -466,17 +479,20 @@ struct HammingLUT
 /**
  * Hamming distance functor (pop count between two binary vectors, i.e. xor them and count the number of bits set)
  * That code was taken from brief.cpp in OpenCV
+ *
+ * R is the type in which the distances are returned, the count itself is
+ * always computed with integers.
  */
-template<class T>
+template<class T, class R = int>
 struct HammingPopcnt
 {
     typedef T ElementType;
-    typedef int ResultType;
+    typedef R ResultType;
 
     template<typename Iterator1, typename Iterator2>
     ResultType operator()(Iterator1 a, Iterator2 b, size_t size, ResultType /*worst_dist*/ = -1) const
     {
-        ResultType result = 0;
+        int result = 0;
 #if __GNUC__
 #if ANDROID && HAVE_NEON
         static uint64_t features = android_getCpuFeatures();
@@ -519,9 +535,9 @@ struct HammingPopcnt
 #else
         HammingLUT lut;
         result = lut(reinterpret_cast<const unsigned char*> (a),
-                     reinterpret_cast<const unsigned char*> (b), size * sizeof(pop_t));
+                     reinterpret_cast<const unsigned char*> (b), size * sizeof(ElementType));
 #endif
-        return result;
+        return ResultType(result);
     }
 };
 
@@ -589,11 +605,17 @@ struct HistIntersectionDistance
 
     /**
      *  Compute the histogram intersection distance
+     *
+     *	Float, unsigned char and int vectors use the SIMD kernels of
+     *	simd.h, which compute the whole distance regardless of worst_dist.
      */
     template <typename Iterator1, typename Iterator2>
     ResultType operator()(Iterator1 a, Iterator2 b, size_t size, ResultType worst_dist = -1) const
     {
         ResultType result = ResultType();
+        if (simd::compute<T>(simd::KERNEL_HIK, a, b, size, result)) {
+            return result;
+        }
         ResultType min0, min1, min2, min3;
         Iterator1 last = a + size;
         Iterator1 lastgroup = last - 3;
@@ -440,6 +440,26 @@ private:
     	pool_.free();
     }
 
+    void updatePointPointers()
+    {
+    	for (size_t i=0;i<tree_roots_.size();++i) {
+    		updateNodePoints(tree_roots_[i]);
+    	}
+    }
+
+    void updateNodePoints(NodePtr node)
+    {
+    	if (node->pivot_index!=SIZE_MAX) {
+    		node->pivot = points_[node->pivot_index];
+    	}
+    	for (size_t i=0;i<node->points.size();++i) {
+    		node->points[i].point = points_[node->points[i].index];
+    	}
+    	for (size_t i=0;i<node->childs.size();++i) {
+    		updateNodePoints(node->childs[i]);
+    	}
+    }
+
     void copyTree(NodePtr& dst, const NodePtr& src)
     {
     	dst = new(pool_) Node();
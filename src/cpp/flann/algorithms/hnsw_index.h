@@ -0,0 +1,521 @@
+/***********************************************************************
+ * Software License Agreement (BSD License)
+ *
+ * Copyright 2008-2009  Marius Muja (mariusm@cs.ubc.ca). All rights reserved.
+ * Copyright 2008-2009  David G. Lowe (lowe@cs.ubc.ca). All rights reserved.
+ *
+ * THE BSD LICENSE
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions
+ * are met:
+ *
+ * 1. Redistributions of source code must retain the above copyright
+ *    notice, this list of conditions and the following disclaimer.
+ * 2. Redistributions in binary form must reproduce the above copyright
+ *    notice, this list of conditions and the following disclaimer in the
+ *    documentation and/or other materials provided with the distribution.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+ * IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+ * OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+ * IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+ * INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+ * NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+ * THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ *************************************************************************/
+
+#ifndef FLANN_HNSW_INDEX_H_
+#define FLANN_HNSW_INDEX_H_
+
+#include <algorithm>
+#include <cmath>
+#include <functional>
+#include <mutex>
+#include <queue>
+#include <vector>
+
+#include "flann/general.h"
+#include "flann/algorithms/nn_index.h"
+#include "flann/util/matrix.h"
+#include "flann/util/params.h"
+#include "flann/util/random.h"
+#include "flann/util/result_set.h"
+#include "flann/util/saving.h"
+
+namespace flann
+{
+
+struct HNSWIndexParams : public IndexParams
+{
+    HNSWIndexParams(int connections = 16, int ef_construction = 200)
+    {
+        (*this)["algorithm"] = FLANN_INDEX_HNSW;
+        // number of links of a point on the upper layers, twice as many on the bottom one
+        (*this)["connections"] = connections;
+        // size of the candidate list when inserting a point
+        (*this)["ef_construction"] = ef_construction;
+    }
+};
+
+
+/**
+ * Hierarchical navigable small world graph index
+ *
+ * Each point is linked to its near neighbors in a layered graph, the upper
+ * layers holding exponentially fewer points. A search descends greedily
+ * through the upper layers and then explores the bottom one keeping the
+ * checks closest points found, or the number of neighbors searched if it is
+ * larger (unlimited checks explore the whole graph).
+ *
+ * Points are inserted in the graph as they are added, removed points stay in
+ * the graph to keep it connected but are not returned.
+ */
+template <typename Distance>
+class HNSWIndex : public NNIndex<Distance>
+{
+public:
+    typedef typename Distance::ElementType ElementType;
+    typedef typename Distance::ResultType DistanceType;
+
+    typedef NNIndex<Distance> BaseClass;
+
+    HNSWIndex(const IndexParams& params = HNSWIndexParams(), Distance d = Distance()) :
+    	BaseClass(params, d), entry_point_(NO_ENTRY), max_level_(0)
+    {
+        initParams();
+    }
+
+    HNSWIndex(const Matrix<ElementType>& input_data, const IndexParams& params = HNSWIndexParams(),
+              Distance d = Distance()) :
+    	BaseClass(params, d), entry_point_(NO_ENTRY), max_level_(0)
+    {
+        initParams();
+        setDataset(input_data);
+    }
+
+    HNSWIndex(const HNSWIndex& other) : BaseClass(other),
+    	connections_(other.connections_),
+    	ef_construction_(other.ef_construction_),
+    	level_mult_(other.level_mult_),
+    	entry_point_(other.entry_point_),
+    	max_level_(other.max_level_),
+    	links_(other.links_)
+    {
+    }
+
+    HNSWIndex& operator=(HNSWIndex other)
+    {
+    	this->swap(other);
+    	return *this;
+    }
+
+    virtual ~HNSWIndex()
+    {
+    }
+
+    BaseClass* clone() const
+    {
+    	return new HNSWIndex(*this);
+    }
+
+    using BaseClass::buildIndex;
+
+    /**
+     * Inserts the points in the graph, which never needs to be rebuilt, so
+     * rebuild_threshold is ignored.
+     */
+    void addPoints(const Matrix<ElementType>& points, float /*rebuild_threshold*/ = 2)
+    {
+        assert(points.cols==veclen_);
+        size_t old_size = size_;
+
+        extendDataset(points);
+        links_.resize(size_);
+        for (size_t i=old_size;i<size_;++i) {
+            insertPoint(i);
+        }
+    }
+
+    flann_algorithm_t getType() const
+    {
+        return FLANN_INDEX_HNSW;
+    }
+
+    int usedMemory() const
+    {
+        size_t memory = links_.size()*sizeof(links_[0]);
+        for (size_t i=0;i<links_.size();++i) {
+            for (size_t level=0;level<links_[i].size();++level) {
+                memory += sizeof(links_[i][level]) + links_[i][level].capacity()*sizeof(unsigned int);
+            }
+        }
+        return int(memory);
+    }
+
+    template<typename Archive>
+    void serialize(Archive& ar)
+    {
+    	ar.setObject(this);
+
+    	ar & *static_cast<NNIndex<Distance>*>(this);
+
+    	ar & connections_;
+    	ar & ef_construction_;
+    	ar & entry_point_;
+    	ar & max_level_;
+    	ar & links_;
+
+    	if (Archive::is_loading::value) {
+            level_mult_ = 1/log(double(connections_));
+            index_params_["algorithm"] = getType();
+            index_params_["connections"] = int(connections_);
+            index_params_["ef_construction"] = int(ef_construction_);
+    	}
+    }
+
+    void saveIndex(FILE* stream)
+    {
+    	serialization::SaveArchive sa(stream);
+    	sa & *this;
+    }
+
+    void loadIndex(FILE* stream)
+    {
+    	serialization::LoadArchive la(stream);
+    	la & *this;
+    }
+
+    void findNeighbors(ResultSet<DistanceType>& result, const ElementType* vec, const SearchParams& searchParams) const
+    {
+        if (entry_point_==NO_ENTRY) return;
+
+        // at least as many points as neighbors searched are kept
+        size_t ef = searchParams.checks>0 ? size_t(searchParams.checks) : size_;
+        ef = std::max(ef, result.capacity());
+        std::vector<Candidate> nearest(1, Candidate(distance_(points_[entry_point_], vec, veclen_), entry_point_));
+        for (size_t level=max_level_;level>0;--level) {
+            searchLayer(vec, nearest, 1, level, false);
+        }
+        searchLayer(vec, nearest, ef, 0, true);
+
+        for (size_t i=0;i<nearest.size();++i) {
+            result.addPoint(nearest[i].first, nearest[i].second);
+        }
+    }
+
+protected:
+    void buildIndexImpl()
+    {
+        if (connections_<2) {
+            throw FLANNException("The number of connections must be at least 2");
+        }
+        links_.resize(size_);
+        for (size_t i=0;i<size_;++i) {
+            insertPoint(i);
+        }
+    }
+
+    void freeIndex()
+    {
+        links_.clear();
+        entry_point_ = NO_ENTRY;
+        max_level_ = 0;
+    }
+
+private:
+    /** A point and its distance to the query */
+    typedef std::pair<DistanceType, size_t> Candidate;
+
+    /** The points to explore, closest first */
+    typedef std::priority_queue<Candidate, std::vector<Candidate>, std::greater<Candidate> > CandidateQueue;
+
+    /** The closest points found, farthest first */
+    typedef std::priority_queue<Candidate> ResultQueue;
+
+    /**
+     * The points visited by a search. Marking them with a number that
+     * changes at every search avoids clearing the marks.
+     */
+    struct VisitedList
+    {
+        VisitedList() : mark(0) {}
+
+        void reset(size_t size)
+        {
+            if (marks.size()<size) {
+                marks.resize(size, 0);
+            }
+            if (++mark==0) {
+                std::fill(marks.begin(), marks.end(), 0);
+                mark = 1;
+            }
+        }
+
+        /**
+         * @return true if the point was already visited
+         */
+        bool visit(size_t index)
+        {
+            if (marks[index]==mark) return true;
+            marks[index] = mark;
+            return false;
+        }
+
+        std::vector<unsigned int> marks;
+        unsigned int mark;
+    };
+
+    /**
+     * The visited lists not in use by a search, reused by the next ones.
+     * Copies of the index start with an empty pool.
+     */
+    class VisitedListPool
+    {
+    public:
+        VisitedListPool() {}
+
+        VisitedListPool(const VisitedListPool&) {}
+
+        VisitedListPool& operator=(const VisitedListPool&)
+        {
+            return *this;
+        }
+
+        ~VisitedListPool()
+        {
+            for (size_t i=0;i<free_.size();++i) {
+                delete free_[i];
+            }
+        }
+
+        VisitedList* acquire(size_t size)
+        {
+            VisitedList* visited = NULL;
+            {
+                std::lock_guard<std::mutex> lock(mutex_);
+                if (!free_.empty()) {
+                    visited = free_.back();
+                    free_.pop_back();
+                }
+            }
+            if (visited==NULL) {
+                visited = new VisitedList();
+            }
+            visited->reset(size);
+            return visited;
+        }
+
+        void release(VisitedList* visited)
+        {
+            std::lock_guard<std::mutex> lock(mutex_);
+            free_.push_back(visited);
+        }
+
+    private:
+        std::mutex mutex_;
+        std::vector<VisitedList*> free_;
+    };
+
+    void initParams()
+    {
+        connections_ = std::max(get_param(index_params_,"connections",16), 0);
+        ef_construction_ = std::max(get_param(index_params_,"ef_construction",200), 1);
+        level_mult_ = 1/log(double(std::max(connections_, size_t(2))));
+    }
+
+    bool isRemoved(size_t index) const
+    {
+        return removed_ && removed_points_.test(index);
+    }
+
+    size_t maxLinks(size_t level) const
+    {
+        return level==0 ? 2*connections_ : connections_;
+    }
+
+    size_t randomLevel() const
+    {
+        return size_t(-log(1.0-rand_double())*level_mult_);
+    }
+
+    /**
+     * Searches a layer of the graph starting from the given points, which
+     * are replaced by the (up to) ef closest points found, closest first.
+     */
+    void searchLayer(const ElementType* vec, std::vector<Candidate>& points, size_t ef, size_t level,
+                     bool skip_removed) const
+    {
+        VisitedList* visited = visited_pool_.acquire(size_);
+        CandidateQueue candidates;
+        ResultQueue results;
+        for (size_t i=0;i<points.size();++i) {
+            visited->visit(points[i].second);
+            candidates.push(points[i]);
+            if (!(skip_removed && isRemoved(points[i].second))) {
+                results.push(points[i]);
+            }
+        }
+
+        while (!candidates.empty()) {
+            Candidate current = candidates.top();
+            if (results.size()>=ef && current.first>results.top().first) break;
+            candidates.pop();
+
+            const std::vector<unsigned int>& neighbors = links_[current.second][level];
+            for (size_t i=0;i<neighbors.size();++i) {
+                size_t neighbor = neighbors[i];
+                if (visited->visit(neighbor)) continue;
+                DistanceType dist = distance_(points_[neighbor], vec, veclen_);
+                if (results.size()<ef || dist<results.top().first) {
+                    candidates.push(Candidate(dist, neighbor));
+                    if (!(skip_removed && isRemoved(neighbor))) {
+                        results.push(Candidate(dist, neighbor));
+                        if (results.size()>ef) results.pop();
+                    }
+                }
+            }
+        }
+        visited_pool_.release(visited);
+
+        points.resize(results.size());
+        for (size_t i=results.size();i>0;--i) {
+            points[i-1] = results.top();
+            results.pop();
+        }
+    }
+
+    /**
+     * Selects up to max_links neighbors among candidates sorted by distance,
+     * skipping those closer to an already selected neighbor than to the
+     * point, so that the links go in different directions.
+     */
+    void selectNeighbors(const std::vector<Candidate>& candidates, size_t max_links,
+                         std::vector<unsigned int>& neighbors) const
+    {
+        neighbors.clear();
+        for (size_t i=0;i<candidates.size() && neighbors.size()<max_links;++i) {
+            const ElementType* candidate = points_[candidates[i].second];
+            bool diverse = true;
+            for (size_t j=0;j<neighbors.size();++j) {
+                if (distance_(points_[neighbors[j]], candidate, veclen_)<candidates[i].first) {
+                    diverse = false;
+                    break;
+                }
+            }
+            if (diverse) {
+                neighbors.push_back((unsigned int)candidates[i].second);
+            }
+        }
+    }
+
+    /**
+     * Links a point to a new neighbor, pruning its links when it has too many.
+     */
+    void addLink(size_t index, size_t neighbor, size_t level)
+    {
+        std::vector<unsigned int>& links = links_[index][level];
+        if (links.size()<maxLinks(level)) {
+            links.push_back((unsigned int)neighbor);
+            return;
+        }
+
+        std::vector<Candidate> candidates;
+        candidates.reserve(links.size()+1);
+        candidates.push_back(Candidate(distance_(points_[neighbor], points_[index], veclen_), neighbor));
+        for (size_t i=0;i<links.size();++i) {
+            candidates.push_back(Candidate(distance_(points_[links[i]], points_[index], veclen_), links[i]));
+        }
+        std::sort(candidates.begin(), candidates.end());
+        selectNeighbors(candidates, maxLinks(level), links);
+    }
+
+    void insertPoint(size_t index)
+    {
+        size_t level = randomLevel();
+        links_[index].assign(level+1, std::vector<unsigned int>());
+
+        if (entry_point_==NO_ENTRY) {
+            entry_point_ = index;
+            max_level_ = level;
+            return;
+        }
+
+        const ElementType* vec = points_[index];
+        std::vector<Candidate> nearest(1, Candidate(distance_(points_[entry_point_], vec, veclen_), entry_point_));
+        for (size_t l=max_level_;l>level;--l) {
+            searchLayer(vec, nearest, 1, l, false);
+        }
+        for (size_t l=std::min(level, max_level_)+1;l-->0;) {
+            searchLayer(vec, nearest, ef_construction_, l, false);
+            std::vector<unsigned int>& neighbors = links_[index][l];
+            selectNeighbors(nearest, connections_, neighbors);
+            for (size_t i=0;i<neighbors.size();++i) {
+                addLink(neighbors[i], index, l);
+            }
+        }
+
+        if (level>max_level_) {
+            entry_point_ = index;
+            max_level_ = level;
+        }
+    }
+
+    void swap(HNSWIndex& other)
+    {
+    	BaseClass::swap(other);
+    	std::swap(connections_, other.connections_);
+    	std::swap(ef_construction_, other.ef_construction_);
+    	std::swap(level_mult_, other.level_mult_);
+    	std::swap(entry_point_, other.entry_point_);
+    	std::swap(max_level_, other.max_level_);
+    	links_.swap(other.links_);
+    }
+
+private:
+    static const size_t NO_ENTRY = size_t(-1);
+
+    /**
+     * Number of links of a point on the upper layers
+     */
+    size_t connections_;
+
+    /**
+     * Size of the candidate list when inserting a point
+     */
+    size_t ef_construction_;
+
+    /**
+     * Normalization of the random layers of the points
+     */
+    double level_mult_;
+
+    /**
+     * The point on the top layer where the searches start
+     */
+    size_t entry_point_;
+
+    /**
+     * The top layer
+     */
+    size_t max_level_;
+
+    /**
+     * The links of each point on each of its layers
+     */
+    std::vector<std::vector<std::vector<unsigned int> > > links_;
+
+    /**
+     * Visited lists reused by the searches
+     */
+    mutable VisitedListPool visited_pool_;
+
+    USING_BASECLASS_SYMBOLS
+};
+
+}
+
+#endif // FLANN_HNSW_INDEX_H_
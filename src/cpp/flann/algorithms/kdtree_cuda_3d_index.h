@@ -149,6 +149,11 @@ public:
     	throw FLANNException( "removePoint not implemented for this index type!" );
     }
 
+    void removePoints(const std::vector<size_t>& ids)
+    {
+    	throw FLANNException( "removePoints not implemented for this index type!" );
+    }
+
     ElementType* getPoint(size_t id)
     {
     	return dataset_[id];
@@ -37,6 +37,7 @@
 #include <cstring>
 #include <stdarg.h>
 #include <cmath>
+#include <mutex>
 
 #include "flann/general.h"
 #include "flann/algorithms/nn_index.h"
@@ -88,7 +89,7 @@ public:
      *          params = parameters passed to the kdtree algorithm
      */
     KDTreeIndex(const IndexParams& params = KDTreeIndexParams(), Distance d = Distance() ) :
-    	BaseClass(params, d), mean_(NULL), var_(NULL)
+    	BaseClass(params, d)
     {
         trees_ = get_param(index_params_,"trees",4);
     }
@@ -102,7 +103,7 @@ public:
      *          params = parameters passed to the kdtree algorithm
      */
     KDTreeIndex(const Matrix<ElementType>& dataset, const IndexParams& params = KDTreeIndexParams(),
-                Distance d = Distance() ) : BaseClass(params,d ), mean_(NULL), var_(NULL)
+                Distance d = Distance() ) : BaseClass(params,d )
     {
         trees_ = get_param(index_params_,"trees",4);
 
@@ -252,24 +253,30 @@ protected:
      */
     void buildIndexImpl()
     {
-        // Create a permutable array of indices to the input vectors.
-    	std::vector<int> ind(size_);
-        for (size_t i = 0; i < size_; ++i) {
-            ind[i] = int(i);
-        }
-
-        mean_ = new DistanceType[veclen_];
-        var_ = new DistanceType[veclen_];
+        int cores = get_param(index_params_,"cores",1);
+        std::vector<unsigned int> seeds = rand_seeds(trees_);
 
         tree_roots_.resize(trees_);
-        /* Construct the randomized trees. */
+        /* Construct the randomized trees, each one from its own seed so that
+           they do not depend on the thread building them. */
+#pragma omp parallel for schedule(dynamic) num_threads(cores)
         for (int i = 0; i < trees_; i++) {
+            ScopedRandomSeed seed(seeds[i]);
+            BuildContext context(veclen_);
+
+            // Create a permutable array of indices to the input vectors.
+            std::vector<int> ind(size_);
+            for (size_t j = 0; j < size_; ++j) {
+                ind[j] = int(j);
+            }
             /* Randomize the order of vectors to allow for unbiased sampling. */
-            std::random_shuffle(ind.begin(), ind.end());
-            tree_roots_[i] = divideTree(&ind[0], int(size_) );
+            RandomGenerator generator;
+            std::random_shuffle(ind.begin(), ind.end(), generator);
+            tree_roots_[i] = divideTree(context, &ind[0], int(size_) );
+
+#pragma omp critical
+            pool_.merge(context.pool);
         }
-        delete[] mean_;
-        delete[] var_;
     }
 
     void freeIndex()
@@ -279,12 +286,39 @@ protected:
     		if (tree_roots_[i]!=NULL) tree_roots_[i]->~Node();
     	}
     	pool_.free();
+    	scratch_pool_.clear();
+    }
+
+    void updatePointPointers()
+    {
+    	for (size_t i=0;i<tree_roots_.size();++i) {
+    		if (tree_roots_[i]!=NULL) updateLeafPoints(tree_roots_[i]);
+    	}
     }
 
 
 private:
 
     /*--------------------- Internal Data Structures --------------------------*/
+
+    /**
+     * Working space of the construction of a tree, so that several
+     * trees can be built at the same time.
+     */
+    struct BuildContext
+    {
+        BuildContext(size_t veclen) : mean(veclen), var(veclen) {}
+
+        /**
+         * Pool the nodes of the tree are allocated from
+         */
+        PooledAllocator pool;
+        /**
+         * Mean and variance of the points being divided
+         */
+        std::vector<DistanceType> mean;
+        std::vector<DistanceType> var;
+    };
     struct Node
     {
     	/**
@@ -350,6 +384,97 @@ private:
     typedef BranchStruct<NodePtr, DistanceType> BranchSt;
     typedef BranchSt* Branch;
 
+    /**
+     * Scratch space of an approximate search: the heap of the branches not
+     * taken and the set of the points already checked. The checked points
+     * are also listed, so that the set is cleared in time proportional to
+     * the number of checks rather than to the size of the index.
+     */
+    struct SearchScratch
+    {
+        SearchScratch(size_t size) : size(size), heap((int)size), checked(size) {}
+
+        void setChecked(int index)
+        {
+            checked.set(index);
+            checked_ids.push_back(index);
+        }
+
+        void clear()
+        {
+            heap.clear();
+            for (size_t i=0;i<checked_ids.size();++i) {
+                checked.reset_block(checked_ids[i]);
+            }
+            checked_ids.clear();
+        }
+
+        size_t size;
+        Heap<BranchSt> heap;
+        DynamicBitset checked;
+        std::vector<int> checked_ids;
+    };
+
+    /**
+     * The scratch spaces not in use by a search. A search takes one and
+     * returns it when done, so there are as many scratch spaces as there
+     * have been concurrent searches, and a search only allocates one when
+     * all are in use or the size of the index has changed. Copies of the
+     * index start with an empty pool.
+     */
+    class SearchScratchPool
+    {
+    public:
+        SearchScratchPool() {}
+
+        SearchScratchPool(const SearchScratchPool&) {}
+
+        SearchScratchPool& operator=(const SearchScratchPool&)
+        {
+            return *this;
+        }
+
+        ~SearchScratchPool()
+        {
+            clear();
+        }
+
+        SearchScratch* acquire(size_t size)
+        {
+            std::unique_lock<std::mutex> lock(mutex_);
+            while (!free_.empty()) {
+                SearchScratch* scratch = free_.back();
+                free_.pop_back();
+                if (scratch->size==size) {
+                    return scratch;
+                }
+                delete scratch;
+            }
+            lock.unlock();
+            return new SearchScratch(size);
+        }
+
+        void release(SearchScratch* scratch)
+        {
+            scratch->clear();
+            std::lock_guard<std::mutex> lock(mutex_);
+            free_.push_back(scratch);
+        }
+
+        void clear()
+        {
+            std::lock_guard<std::mutex> lock(mutex_);
+            for (size_t i=0;i<free_.size();++i) {
+                delete free_[i];
+            }
+            free_.clear();
+        }
+
+    private:
+        std::mutex mutex_;
+        std::vector<SearchScratch*> free_;
+    };
+
 
     void copyTree(NodePtr& dst, const NodePtr& src)
     {
@@ -367,6 +492,17 @@ private:
     	}
     }
 
+    void updateLeafPoints(NodePtr node)
+    {
+    	if (node->child1==NULL && node->child2==NULL) {
+    		node->point = points_[node->divfeat];
+    	}
+    	else {
+    		updateLeafPoints(node->child1);
+    		updateLeafPoints(node->child2);
+    	}
+    }
+
     /**
      * Create a tree node that subdivides the list of vecs from vind[first]
      * to vind[last].  The routine is called recursively on each sublist.
@@ -376,9 +512,9 @@ private:
      *                  first = index of the first vector
      *                  last = index of the last vector
      */
-    NodePtr divideTree(int* ind, int count)
+    NodePtr divideTree(BuildContext& context, int* ind, int count)
     {
-        NodePtr node = new(pool_) Node(); // allocate memory
+        NodePtr node = new(context.pool) Node(); // allocate memory
 
         /* If too few exemplars remain, then make this a leaf node. */
         if (count == 1) {
@@ -390,12 +526,12 @@ private:
             int idx;
             int cutfeat;
             DistanceType cutval;
-            meanSplit(ind, count, idx, cutfeat, cutval);
+            meanSplit(context, ind, count, idx, cutfeat, cutval);
 
             node->divfeat = cutfeat;
             node->divval = cutval;
-            node->child1 = divideTree(ind, idx);
-            node->child2 = divideTree(ind+idx, count-idx);
+            node->child1 = divideTree(context, ind, idx);
+            node->child2 = divideTree(context, ind+idx, count-idx);
         }
 
         return node;
@@ -407,10 +543,12 @@ private:
      * Make a random choice among those with the highest variance, and use
      * its variance as the threshold value.
      */
-    void meanSplit(int* ind, int count, int& index, int& cutfeat, DistanceType& cutval)
+    void meanSplit(BuildContext& context, int* ind, int count, int& index, int& cutfeat, DistanceType& cutval)
     {
-        memset(mean_,0,veclen_*sizeof(DistanceType));
-        memset(var_,0,veclen_*sizeof(DistanceType));
+        DistanceType* mean = &context.mean[0];
+        DistanceType* var = &context.var[0];
+        memset(mean,0,veclen_*sizeof(DistanceType));
+        memset(var,0,veclen_*sizeof(DistanceType));
 
         /* Compute mean values.  Only the first SAMPLE_MEAN values need to be
             sampled to get a good estimate.
@@ -419,25 +557,25 @@ private:
         for (int j = 0; j < cnt; ++j) {
             ElementType* v = points_[ind[j]];
             for (size_t k=0; k<veclen_; ++k) {
-                mean_[k] += v[k];
+                mean[k] += v[k];
             }
         }
         DistanceType div_factor = DistanceType(1)/cnt;
         for (size_t k=0; k<veclen_; ++k) {
-            mean_[k] *= div_factor;
+            mean[k] *= div_factor;
         }
 
         /* Compute variances (no need to divide by count). */
         for (int j = 0; j < cnt; ++j) {
             ElementType* v = points_[ind[j]];
             for (size_t k=0; k<veclen_; ++k) {
-                DistanceType dist = v[k] - mean_[k];
-                var_[k] += dist * dist;
+                DistanceType dist = v[k] - mean[k];
+                var[k] += dist * dist;
             }
         }
         /* Select one of the highest variance indices at random. */
-        cutfeat = selectDivision(var_);
-        cutval = mean_[cutfeat];
+        cutfeat = selectDivision(var);
+        cutval = mean[cutfeat];
 
         int lim1, lim2;
         planeSplit(ind, count, cutfeat, cutval, lim1, lim2);
@@ -546,21 +684,19 @@ private:
         BranchSt branch;
 
         int checkCount = 0;
-        Heap<BranchSt>* heap = new Heap<BranchSt>((int)size_);
-        DynamicBitset checked(size_);
+        SearchScratch* scratch = scratch_pool_.acquire(size_);
 
         /* Search once through each tree down to root. */
         for (i = 0; i < trees_; ++i) {
-            searchLevel<with_removed>(result, vec, tree_roots_[i], 0, checkCount, maxCheck, epsError, heap, checked);
+            searchLevel<with_removed>(result, vec, tree_roots_[i], 0, checkCount, maxCheck, epsError, *scratch);
         }
 
         /* Keep searching other branches from heap until finished. */
-        while ( heap->popMin(branch) && (checkCount < maxCheck || !result.full() )) {
-            searchLevel<with_removed>(result, vec, branch.node, branch.mindist, checkCount, maxCheck, epsError, heap, checked);
+        while ( scratch->heap.popMin(branch) && (checkCount < maxCheck || !result.full() )) {
+            searchLevel<with_removed>(result, vec, branch.node, branch.mindist, checkCount, maxCheck, epsError, *scratch);
         }
 
-        delete heap;
-
+        scratch_pool_.release(scratch);
     }
 
     /**
@@ -570,7 +706,7 @@ private:
      */
     template<bool with_removed>
     void searchLevel(ResultSet<DistanceType>& result_set, const ElementType* vec, NodePtr node, DistanceType mindist, int& checkCount, int maxCheck,
-                     float epsError, Heap<BranchSt>* heap, DynamicBitset& checked) const
+                     float epsError, SearchScratch& scratch) const
     {
         if (result_set.worstDist()<mindist) {
             //			printf("Ignoring branch, too far\n");
@@ -584,8 +720,8 @@ private:
             	if (removed_points_.test(index)) return;
             }
             /*  Do not check same node more than once when searching multiple trees. */
-            if ( checked.test(index) || ((checkCount>=maxCheck)&& result_set.full()) ) return;
-            checked.set(index);
+            if ( scratch.checked.test(index) || ((checkCount>=maxCheck)&& result_set.full()) ) return;
+            scratch.setChecked(index);
             checkCount++;
 
             DistanceType dist = distance_(node->point, vec, veclen_);
@@ -610,11 +746,11 @@ private:
         DistanceType new_distsq = mindist + distance_.accum_dist(val, node->divval, node->divfeat);
         //		if (2 * checkCount < maxCheck  ||  !result.full()) {
         if ((new_distsq*epsError < result_set.worstDist())||  !result_set.full()) {
-            heap->insert( BranchSt(otherChild, new_distsq) );
+            scratch.heap.insert( BranchSt(otherChild, new_distsq) );
         }
 
         /* Call recursively to search next level down. */
-        searchLevel<with_removed>(result_set, vec, bestChild, mindist, checkCount, maxCheck, epsError, heap, checked);
+        searchLevel<with_removed>(result_set, vec, bestChild, mindist, checkCount, maxCheck, epsError, scratch);
     }
 
     /**
@@ -740,9 +876,6 @@ private:
      */
     int trees_;
 
-    DistanceType* mean_;
-    DistanceType* var_;
-
     /**
      * Array of k-d trees used to find neighbours.
      */
@@ -757,6 +890,11 @@ private:
      */
     PooledAllocator pool_;
 
+    /**
+     * Scratch spaces reused by the approximate searches.
+     */
+    mutable SearchScratchPool scratch_pool_;
+
     USING_BASECLASS_SYMBOLS
 };   // class KDTreeIndex
 
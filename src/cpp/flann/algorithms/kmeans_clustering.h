@@ -0,0 +1,279 @@
+/***********************************************************************
+ * Software License Agreement (BSD License)
+ *
+ * Copyright 2008-2009  Marius Muja (mariusm@cs.ubc.ca). All rights reserved.
+ * Copyright 2008-2009  David G. Lowe (lowe@cs.ubc.ca). All rights reserved.
+ *
+ * THE BSD LICENSE
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions
+ * are met:
+ *
+ * 1. Redistributions of source code must retain the above copyright
+ *    notice, this list of conditions and the following disclaimer.
+ * 2. Redistributions in binary form must reproduce the above copyright
+ *    notice, this list of conditions and the following disclaimer in the
+ *    documentation and/or other materials provided with the distribution.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+ * IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+ * OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+ * IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+ * INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+ * NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+ * THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ *************************************************************************/
+
+#ifndef FLANN_KMEANS_CLUSTERING_H_
+#define FLANN_KMEANS_CLUSTERING_H_
+
+#include <algorithm>
+#include <cstring>
+#include <vector>
+
+#include "flann/general.h"
+#include "flann/algorithms/dist.h"
+#include "flann/algorithms/nn_index.h"
+#include "flann/algorithms/kdtree_index.h"
+#include "flann/algorithms/linear_index.h"
+#include "flann/util/dynamic_bitset.h"
+#include "flann/util/matrix.h"
+#include "flann/util/params.h"
+#include "flann/util/random.h"
+
+namespace flann
+{
+
+struct KMeansClusteringParams : public IndexParams
+{
+    KMeansClusteringParams(int iterations = 11, int batch_size = 0, int trees = 4, int checks = 32, int cores = 1)
+    {
+        // maximum number of updates of the centers, negative to run until convergence
+        (*this)["iterations"] = iterations;
+        // number of points sampled at each update, 0 to use all the points
+        (*this)["batch_size"] = batch_size;
+        // number of kd-trees of the index of the centers
+        (*this)["trees"] = trees;
+        // checks of the search of the closest center, FLANN_CHECKS_UNLIMITED for an exact search
+        (*this)["checks"] = checks;
+        // number of threads searching the closest centers
+        (*this)["cores"] = cores;
+    }
+};
+
+
+/**
+ * Flat k-means clustering for the euclidean distance
+ *
+ * The closest center of each point is searched in an index of the centers,
+ * randomized kd-trees or a linear scan for exact searches, so that large
+ * numbers of clusters can be computed. The centers start at distinct random
+ * points and are updated either with the means of their points (Lloyd) or,
+ * when a batch size is given, with batches of random points, each one moving
+ * its center by the inverse of the number of points seen by the center
+ * (mini-batch k-means), which reads only part of the points.
+ */
+template <typename T>
+class KMeansClustering
+{
+public:
+    typedef T ElementType;
+    typedef typename Accumulator<T>::Type DistanceType;
+
+    KMeansClustering(const Matrix<ElementType>& points, const IndexParams& params = KMeansClusteringParams()) :
+        points_(points)
+    {
+        iterations_ = get_param(params,"iterations",11);
+        batch_size_ = std::max(get_param(params,"batch_size",0), 0);
+        trees_ = get_param(params,"trees",4);
+        checks_ = get_param(params,"checks",32);
+        cores_ = get_param(params,"cores",1);
+    }
+
+    /**
+     * Computes the clusters.
+     * @param[in,out] centers The cluster centers, centers.rows is the number of clusters
+     * @param[out] labels The cluster of each point, can be NULL
+     * @param[out] inertia The sum of the squared distances of the points to their centers, can be NULL
+     */
+    void compute(Matrix<DistanceType>& centers, int* labels = NULL, double* inertia = NULL)
+    {
+        if (centers.rows<1 || centers.rows>points_.rows) {
+            throw FLANNException("The number of clusters must be between 1 and the number of points");
+        }
+        if (centers.cols!=points_.cols) {
+            throw FLANNException("The centers must have the dimension of the points");
+        }
+
+        chooseInitialCenters(centers);
+
+        bool needs_labels = labels!=NULL || inertia!=NULL;
+        std::vector<int> assignment;
+        if (labels==NULL) {
+            assignment.resize(points_.rows);
+            labels = &assignment[0];
+        }
+        std::vector<DistanceType> dists(points_.rows);
+
+        if (batch_size_==0 || batch_size_>=points_.rows) {
+            std::fill(labels, labels+points_.rows, -1);
+            for (int iteration=0;;++iteration) {
+                bool changed = assign(centers, NULL, points_.rows, labels, &dists[0]);
+                if (!changed || iteration==iterations_) break;
+                updateCenters(centers, labels);
+            }
+        }
+        else {
+            // without a limit, update the centers with as many points as there are
+            int iterations = iterations_<0 ? int((points_.rows+batch_size_-1)/batch_size_) : iterations_;
+            std::vector<size_t> batch(batch_size_);
+            std::vector<int> batch_labels(batch_size_);
+            std::vector<size_t> counts(centers.rows, 0);
+            for (int iteration=0;iteration<iterations;++iteration) {
+                for (size_t i=0;i<batch_size_;++i) {
+                    batch[i] = size_t(rand_double(double(points_.rows)));
+                }
+                assign(centers, &batch[0], batch_size_, &batch_labels[0], &dists[0]);
+                for (size_t i=0;i<batch_size_;++i) {
+                    moveCenter(centers[batch_labels[i]], points_[batch[i]], ++counts[batch_labels[i]]);
+                }
+            }
+            if (needs_labels) {
+                assign(centers, NULL, points_.rows, labels, &dists[0]);
+            }
+        }
+
+        if (inertia!=NULL) {
+            *inertia = 0;
+            for (size_t i=0;i<points_.rows;++i) {
+                *inertia += dists[i];
+            }
+        }
+    }
+
+private:
+    typedef L2<DistanceType> CenterDistance;
+
+    /**
+     * Number of points searched at once, converted to the type of the centers
+     */
+    enum { CHUNK_SIZE = 16384 };
+
+    /**
+     * Starts the centers at distinct random points.
+     */
+    void chooseInitialCenters(Matrix<DistanceType>& centers)
+    {
+        DynamicBitset chosen(points_.rows);
+        for (size_t i=0;i<centers.rows;) {
+            size_t index = size_t(rand_double(double(points_.rows)));
+            if (index>=points_.rows || chosen.test(index)) continue;
+            chosen.set(index);
+            std::copy(points_[index], points_[index]+points_.cols, centers[i]);
+            ++i;
+        }
+    }
+
+    /**
+     * Finds the closest center of the points.
+     * @param ids The points, NULL for all of them
+     * @return true if a label changed
+     */
+    bool assign(Matrix<DistanceType>& centers, const size_t* ids, size_t count, int* labels, DistanceType* dists)
+    {
+        NNIndex<CenterDistance>* index;
+        if (checks_==FLANN_CHECKS_UNLIMITED || trees_<1) {
+            index = new LinearIndex<CenterDistance>(centers, LinearIndexParams());
+        }
+        else {
+            KDTreeIndexParams params(trees_);
+            params["cores"] = cores_;
+            index = new KDTreeIndex<CenterDistance>(centers, params);
+        }
+        index->buildIndex();
+
+        SearchParams search_params(checks_);
+        search_params.cores = cores_;
+
+        std::vector<DistanceType> queries(size_t(CHUNK_SIZE)*points_.cols);
+        std::vector<size_t> closest(CHUNK_SIZE);
+        std::vector<DistanceType> closest_dists(CHUNK_SIZE);
+        bool changed = false;
+        for (size_t start=0;start<count;start+=CHUNK_SIZE) {
+            size_t n = std::min(size_t(CHUNK_SIZE), count-start);
+            for (size_t i=0;i<n;++i) {
+                const ElementType* point = points_[ids==NULL ? start+i : ids[start+i]];
+                std::copy(point, point+points_.cols, &queries[i*points_.cols]);
+            }
+            Matrix<DistanceType> query_matrix(&queries[0], n, points_.cols);
+            Matrix<size_t> indices(&closest[0], n, 1);
+            Matrix<DistanceType> dist_matrix(&closest_dists[0], n, 1);
+            index->knnSearch(query_matrix, indices, dist_matrix, 1, search_params);
+
+            for (size_t i=0;i<n;++i) {
+                int label = int(closest[i]);
+                if (labels[start+i]!=label) {
+                    labels[start+i] = label;
+                    changed = true;
+                }
+                dists[start+i] = closest_dists[i];
+            }
+        }
+        delete index;
+
+        return changed;
+    }
+
+    /**
+     * Moves the centers to the means of their points, the centers of
+     * empty clusters are kept.
+     */
+    void updateCenters(Matrix<DistanceType>& centers, const int* labels)
+    {
+        std::vector<double> sums(centers.rows*centers.cols, 0);
+        std::vector<size_t> counts(centers.rows, 0);
+        for (size_t i=0;i<points_.rows;++i) {
+            const ElementType* point = points_[i];
+            double* sum = &sums[labels[i]*centers.cols];
+            for (size_t k=0;k<centers.cols;++k) {
+                sum[k] += point[k];
+            }
+            counts[labels[i]]++;
+        }
+        for (size_t c=0;c<centers.rows;++c) {
+            if (counts[c]==0) continue;
+            double div_factor = 1.0/counts[c];
+            for (size_t k=0;k<centers.cols;++k) {
+                centers[c][k] = DistanceType(sums[c*centers.cols+k]*div_factor);
+            }
+        }
+    }
+
+    /**
+     * Moves a center towards a point of its batch, by the inverse of the number
+     * of points seen by the center.
+     */
+    void moveCenter(DistanceType* center, const ElementType* point, size_t count)
+    {
+        DistanceType rate = DistanceType(1)/count;
+        for (size_t k=0;k<points_.cols;++k) {
+            center[k] += rate*(point[k]-center[k]);
+        }
+    }
+
+    const Matrix<ElementType> points_;
+
+    int iterations_;
+    size_t batch_size_;
+    int trees_;
+    int checks_;
+    int cores_;
+};
+
+}
+
+#endif // FLANN_KMEANS_CLUSTERING_H_
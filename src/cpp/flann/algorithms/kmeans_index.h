@@ -37,6 +37,7 @@
 #include <cassert>
 #include <limits>
 #include <cmath>
+#include <mutex>
 
 #include "flann/general.h"
 #include "flann/algorithms/nn_index.h"
@@ -115,6 +116,7 @@ public:
         }
         centers_init_  = get_param(params,"centers_init",FLANN_CENTERS_RANDOM);
         cb_index_  = get_param(params,"cb_index",0.4f);
+        cores_ = get_param(params,"cores",1);
 
         initCenterChooser();
         setDataset(inputData);
@@ -138,6 +140,7 @@ public:
         }
         centers_init_  = get_param(params,"centers_init",FLANN_CENTERS_RANDOM);
         cb_index_  = get_param(params,"cb_index",0.4f);
+        cores_ = get_param(params,"cores",1);
 
         initCenterChooser();
     }
@@ -148,6 +151,7 @@ public:
     		iterations_(other.iterations_),
     		centers_init_(other.centers_init_),
     		cb_index_(other.cb_index_),
+    		cores_(other.cores_),
     		memoryCounter_(other.memoryCounter_)
     {
     	initCenterChooser();
@@ -339,7 +343,7 @@ protected:
         	indices[i] = int(i);
         }
 
-        root_ = new(pool_) Node();
+        root_ = newNode();
         computeNodeStatistics(root_, indices);
         computeClustering(root_, &indices[0], (int)size_, branching_);
     }
@@ -464,6 +468,21 @@ private:
     	pool_.free();
     }
 
+    void updatePointPointers()
+    {
+    	if (root_) updateNodePoints(root_);
+    }
+
+    void updateNodePoints(NodePtr node)
+    {
+    	for (size_t i=0;i<node->points.size();++i) {
+    		node->points[i].point = points_[node->points[i].index];
+    	}
+    	for (size_t i=0;i<node->childs.size();++i) {
+    		updateNodePoints(node->childs[i]);
+    	}
+    }
+
     void copyTree(NodePtr& dst, const NodePtr& src)
     {
     	dst = new(pool_) Node();
@@ -496,8 +515,7 @@ private:
     {
         size_t size = indices.size();
 
-        DistanceType* mean = new DistanceType[veclen_];
-        memoryCounter_ += int(veclen_*sizeof(DistanceType));
+        DistanceType* mean = newCenter();
         memset(mean,0,veclen_*sizeof(DistanceType));
 
         for (size_t i=0; i<size; ++i) {
@@ -581,23 +599,17 @@ private:
 
         //	assign points to clusters
         std::vector<int> belongs_to(indices_length);
+        std::vector<DistanceType> sq_dists(indices_length);
+        assignPoints(indices, indices_length, dcenters, branching, belongs_to, sq_dists);
         for (int i=0; i<indices_length; ++i) {
-
-            DistanceType sq_dist = distance_(points_[indices[i]], dcenters[0], veclen_);
-            belongs_to[i] = 0;
-            for (int j=1; j<branching; ++j) {
-                DistanceType new_sq_dist = distance_(points_[indices[i]], dcenters[j], veclen_);
-                if (sq_dist>new_sq_dist) {
-                    belongs_to[i] = j;
-                    sq_dist = new_sq_dist;
-                }
-            }
-            if (sq_dist>radiuses[belongs_to[i]]) {
-                radiuses[belongs_to[i]] = sq_dist;
+            if (sq_dists[i]>radiuses[belongs_to[i]]) {
+                radiuses[belongs_to[i]] = sq_dists[i];
             }
             count[belongs_to[i]]++;
         }
 
+        std::vector<int> closest(indices_length);
+
         bool converged = false;
         int iteration = 0;
         while (!converged && iteration<iterations_) {
@@ -625,18 +637,11 @@ private:
             }
 
             // reassign points to clusters
+            assignPoints(indices, indices_length, dcenters, branching, closest, sq_dists);
             for (int i=0; i<indices_length; ++i) {
-                DistanceType sq_dist = distance_(points_[indices[i]], dcenters[0], veclen_);
-                int new_centroid = 0;
-                for (int j=1; j<branching; ++j) {
-                    DistanceType new_sq_dist = distance_(points_[indices[i]], dcenters[j], veclen_);
-                    if (sq_dist>new_sq_dist) {
-                        new_centroid = j;
-                        sq_dist = new_sq_dist;
-                    }
-                }
-                if (sq_dist>radiuses[new_centroid]) {
-                    radiuses[new_centroid] = sq_dist;
+                int new_centroid = closest[i];
+                if (sq_dists[i]>radiuses[new_centroid]) {
+                    radiuses[new_centroid] = sq_dists[i];
                 }
                 if (new_centroid != belongs_to[i]) {
                     count[belongs_to[i]]--;
@@ -673,8 +678,7 @@ private:
         std::vector<DistanceType*> centers(branching);
 
         for (int i=0; i<branching; ++i) {
-            centers[i] = new DistanceType[veclen_];
-            memoryCounter_ += veclen_*sizeof(DistanceType);
+            centers[i] = newCenter();
             for (size_t k=0; k<veclen_; ++k) {
                 centers[i][k] = (DistanceType)dcenters[i][k];
             }
@@ -683,6 +687,7 @@ private:
 
         // compute kmeans clustering for each of the resulting clusters
         node->childs.resize(branching);
+        std::vector<int> starts(branching);
         int start = 0;
         int end = start;
         for (int c=0; c<branching; ++c) {
@@ -699,15 +704,77 @@ private:
             }
             variance /= s;
 
-            node->childs[c] = new(pool_) Node();
+            node->childs[c] = newNode();
             node->childs[c]->radius = radiuses[c];
             node->childs[c]->pivot = centers[c];
             node->childs[c]->variance = variance;
-            computeClustering(node->childs[c],indices+start, end-start, branching);
+            starts[c] = start;
             start=end;
         }
 
         delete[] dcenters.ptr();
+
+        // the clusters are computed in parallel, each one with its own seed
+        // so that they do not depend on the thread computing them
+        std::vector<unsigned int> seeds = rand_seeds(branching);
+#pragma omp parallel for schedule(dynamic) num_threads(cores_) if (indices_length>=PARALLEL_SIZE)
+        for (int c=0; c<branching; ++c) {
+            ScopedRandomSeed seed(seeds[c]);
+            computeClustering(node->childs[c], indices+starts[c], count[c], branching);
+        }
+    }
+
+
+    /**
+     * Finds the closest center of each point, in parallel for large
+     * clusters.
+     *
+     * Params:
+     *     indices = indices of the points
+     *     indices_length = number of points
+     *     dcenters = the cluster centers
+     *     branching = number of centers
+     *     closest = the index of the closest center of each point
+     *     sq_dists = the distance of each point to its closest center
+     */
+    void assignPoints(int* indices, int indices_length, const Matrix<double>& dcenters, int branching,
+                      std::vector<int>& closest, std::vector<DistanceType>& sq_dists)
+    {
+#pragma omp parallel for schedule(static) num_threads(cores_) if (indices_length>=PARALLEL_SIZE)
+        for (int i=0; i<indices_length; ++i) {
+            DistanceType sq_dist = distance_(points_[indices[i]], dcenters[0], veclen_);
+            int new_centroid = 0;
+            for (int j=1; j<branching; ++j) {
+                DistanceType new_sq_dist = distance_(points_[indices[i]], dcenters[j], veclen_);
+                if (sq_dist>new_sq_dist) {
+                    new_centroid = j;
+                    sq_dist = new_sq_dist;
+                }
+            }
+            closest[i] = new_centroid;
+            sq_dists[i] = sq_dist;
+        }
+    }
+
+
+    /**
+     * Allocates a node of the tree, the clusters being computed in parallel.
+     */
+    NodePtr newNode()
+    {
+        std::lock_guard<std::mutex> lock(build_mutex_);
+        return new(pool_) Node();
+    }
+
+
+    /**
+     * Allocates a cluster center, the clusters being computed in parallel.
+     */
+    DistanceType* newCenter()
+    {
+        std::lock_guard<std::mutex> lock(build_mutex_);
+        memoryCounter_ += int(veclen_*sizeof(DistanceType));
+        return new DistanceType[veclen_];
     }
 
 
@@ -1013,6 +1080,7 @@ private:
     	std::swap(iterations_, other.iterations_);
     	std::swap(centers_init_, other.centers_init_);
     	std::swap(cb_index_, other.cb_index_);
+    	std::swap(cores_, other.cores_);
     	std::swap(root_, other.root_);
     	std::swap(pool_, other.pool_);
     	std::swap(memoryCounter_, other.memoryCounter_);
@@ -1037,6 +1105,16 @@ private:
      * of the cluster.
      */
     float cb_index_;
+
+    /**
+     * Number of threads used to compute the clustering
+     */
+    int cores_;
+
+    /**
+     * Minimum number of points of a cluster computed with several threads
+     */
+    enum { PARALLEL_SIZE = 10000 };
     
     /**
      * The root node in the tree.
@@ -1058,6 +1136,11 @@ private:
      */
     CenterChooser<Distance>* chooseCenters_;
 
+    /**
+     * Guards the allocations of the clusters computed in parallel
+     */
+    std::mutex build_mutex_;
+
     USING_BASECLASS_SYMBOLS
 };
 
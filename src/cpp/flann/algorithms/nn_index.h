@@ -32,6 +32,7 @@
 #define FLANN_NNINDEX_H
 
 #include <vector>
+#include <algorithm>
 
 #include "flann/general.h"
 #include "flann/util/matrix.h"
@@ -144,6 +145,15 @@ public:
         this->buildIndex();
     }
 
+    /**
+     * Rebuilds the index over its current points, discarding the points
+     * that have been removed. The point ids are preserved.
+     */
+    virtual void rebuildIndex()
+    {
+        NNIndex::buildIndex();
+    }
+
 	/**
 	 * @brief Incrementally add points to the index.
 	 * @param points Matrix with points to be added
@@ -160,16 +170,7 @@ public:
      */
     virtual void removePoint(size_t id)
     {
-    	if (!removed_) {
-    		ids_.resize(size_);
-    		for (size_t i=0;i<size_;++i) {
-    			ids_[i] = i;
-    		}
-    		removed_points_.resize(size_);
-    		removed_points_.reset();
-    		last_id_ = size_;
-        	removed_ = true;
-    	}
+    	initRemoved();
 
     	size_t point_index = id_to_index(id);
     	if (point_index!=size_t(-1) && !removed_points_.test(point_index)) {
@@ -178,6 +179,33 @@ public:
     	}
     }
 
+    /**
+     * Remove several points from the index
+     * @param ids Ids of the points to be removed, unknown ids are ignored
+     */
+    virtual void removePoints(const std::vector<size_t>& ids)
+    {
+    	initRemoved();
+
+    	// the ids of the points are sorted, so a sorted list of ids to remove
+    	// can be located in a single forward pass
+    	std::vector<size_t> sorted_ids(ids);
+    	std::sort(sorted_ids.begin(), sorted_ids.end());
+
+    	std::vector<size_t>::iterator point_it = ids_.begin();
+    	for (size_t i=0;i<sorted_ids.size();++i) {
+    		point_it = std::lower_bound(point_it, ids_.end(), sorted_ids[i]);
+    		if (point_it==ids_.end()) {
+    			break;
+    		}
+    		size_t point_index = point_it - ids_.begin();
+    		if (*point_it==sorted_ids[i] && !removed_points_.test(point_index)) {
+    			removed_points_.set(point_index);
+    			removed_count_++;
+    		}
+    	}
+    }
+
 
     /**
      * Get point with specific id
@@ -195,6 +223,35 @@ public:
     	}
     }
 
+    /**
+     * Makes the index use new copies of some of its points, for example
+     * after the buffer holding them has been reallocated. Row i of
+     * new_points holds the point with id first_id+i; ids outside this range
+     * and ids no longer in the index are ignored. The old copies can be
+     * freed once this returns.
+     * @param first_id Id of the point in the first row
+     * @param new_points The new copies of the points
+     */
+    virtual void relocatePoints(size_t first_id, const Matrix<ElementType>& new_points)
+    {
+    	size_t start = 0;
+    	if (ids_.size()!=0) {
+    		start = std::lower_bound(ids_.begin(), ids_.end(), first_id) - ids_.begin();
+    	}
+    	else if (first_id<size_) {
+    		start = first_id;
+    	}
+    	else {
+    		return;
+    	}
+    	for (size_t i=start;i<size_;++i) {
+    		size_t id = ids_.size()==0 ? i : ids_[i];
+    		if (id-first_id>=new_points.rows) break;
+    		points_[i] = new_points[id-first_id];
+    	}
+    	updatePointPointers();
+    }
+
     /**
      * @return number of features in this index.
      */
@@ -278,10 +335,6 @@ public:
     		for (size_t i=0;i<size_;++i) {
     			ar & serialization::make_binary_object (points_[i], veclen_*sizeof(ElementType));
     		}
-    	} else {
-    		if (points_.size()!=size_) {
-    			throw FLANNException("Saved index does not contain the dataset and no dataset was provided.");
-    		}
     	}
 
     	ar & last_id_;
@@ -291,6 +344,25 @@ public:
     		ar & removed_points_;
     	}
     	ar & removed_count_;
+
+    	if (!save_dataset && Archive::is_loading::value) {
+    		if (removed_) {
+    			// the points may have been compacted when the index was rebuilt, the
+    			// dataset provided holds all the points ever added, addressed by id
+    			if (points_.size()!=last_id_) {
+    				throw FLANNException("Saved index does not contain the dataset and no dataset was provided.");
+    			}
+    			std::vector<ElementType*> dataset_points;
+    			dataset_points.swap(points_);
+    			points_.resize(size_);
+    			for (size_t i=0;i<size_;++i) {
+    				points_[i] = dataset_points[ids_[i]];
+    			}
+    		}
+    		else if (points_.size()!=size_) {
+    			throw FLANNException("Saved index does not contain the dataset and no dataset was provided.");
+    		}
+    	}
     }
 
 
@@ -702,6 +774,12 @@ protected:
 
     virtual void buildIndexImpl() = 0;
 
+    /**
+     * Called after points_ was changed by relocatePoints, for the indexes
+     * keeping their own pointers to the points.
+     */
+    virtual void updatePointPointers() {}
+
     size_t id_to_index(size_t id)
     {
     	if (ids_.size()==0) {
@@ -779,6 +857,20 @@ protected:
     }
 
 
+    void initRemoved()
+    {
+    	if (!removed_) {
+    		ids_.resize(size_);
+    		for (size_t i=0;i<size_;++i) {
+    			ids_[i] = i;
+    		}
+    		removed_points_.resize(size_);
+    		removed_points_.reset();
+    		last_id_ = size_;
+    		removed_ = true;
+    	}
+    }
+
     void cleanRemovedPoints()
     {
     	if (!removed_) return;
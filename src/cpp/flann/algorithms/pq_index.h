@@ -0,0 +1,454 @@
+/***********************************************************************
+ * Software License Agreement (BSD License)
+ *
+ * Copyright 2008-2009  Marius Muja (mariusm@cs.ubc.ca). All rights reserved.
+ * Copyright 2008-2009  David G. Lowe (lowe@cs.ubc.ca). All rights reserved.
+ *
+ * THE BSD LICENSE
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions
+ * are met:
+ *
+ * 1. Redistributions of source code must retain the above copyright
+ *    notice, this list of conditions and the following disclaimer.
+ * 2. Redistributions in binary form must reproduce the above copyright
+ *    notice, this list of conditions and the following disclaimer in the
+ *    documentation and/or other materials provided with the distribution.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+ * IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+ * OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+ * IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+ * INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+ * NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+ * THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ *************************************************************************/
+
+#ifndef FLANN_PQ_INDEX_H_
+#define FLANN_PQ_INDEX_H_
+
+#include <algorithm>
+#include <limits>
+#include <vector>
+
+#include "flann/general.h"
+#include "flann/algorithms/nn_index.h"
+#include "flann/util/matrix.h"
+#include "flann/util/params.h"
+#include "flann/util/random.h"
+#include "flann/util/result_set.h"
+#include "flann/util/saving.h"
+
+namespace flann
+{
+
+struct PQIndexParams : public IndexParams
+{
+    PQIndexParams(int subquantizers = 8, int rerank = 0, int iterations = 11)
+    {
+        (*this)["algorithm"] = FLANN_INDEX_PQ;
+        // number of sub-vectors the points are split in, each encoded in one byte
+        (*this)["subquantizers"] = subquantizers;
+        // number of candidates re-ranked with the exact distance (0 searches the codes only)
+        (*this)["rerank"] = rerank;
+        // max iterations of the k-means clustering learning each codebook
+        (*this)["iterations"] = iterations;
+    }
+};
+
+
+/**
+ * Product quantization index
+ *
+ * The points are split in sub-vectors, each encoded in one byte as the index
+ * of the nearest of (up to) 256 centroids learnt by k-means on its subspace.
+ * A search computes the distances from the query to the centroids once and
+ * then the distance to each point as a sum of table lookups.
+ *
+ * When rerank is set, that many of the best candidates are re-ranked with
+ * the exact distance to the original points, so it should be at least the
+ * number of neighbors searched. Otherwise the original points are not read
+ * after the build (unless the index is rebuilt), so they can be memory
+ * mapped or, using the C++ API, released.
+ */
+template <typename Distance>
+class PQIndex : public NNIndex<Distance>
+{
+public:
+    typedef typename Distance::ElementType ElementType;
+    typedef typename Distance::ResultType DistanceType;
+
+    typedef NNIndex<Distance> BaseClass;
+
+    typedef bool needs_kdtree_distance;
+
+    PQIndex(const IndexParams& params = PQIndexParams(), Distance d = Distance()) :
+    	BaseClass(params, d), centroid_count_(0)
+    {
+        initParams();
+    }
+
+    PQIndex(const Matrix<ElementType>& input_data, const IndexParams& params = PQIndexParams(),
+            Distance d = Distance()) :
+    	BaseClass(params, d), centroid_count_(0)
+    {
+        initParams();
+        setDataset(input_data);
+    }
+
+    PQIndex(const PQIndex& other) : BaseClass(other),
+    	subquantizers_(other.subquantizers_),
+    	rerank_(other.rerank_),
+    	iterations_(other.iterations_),
+    	centroid_count_(other.centroid_count_),
+    	bounds_(other.bounds_),
+    	centroids_(other.centroids_),
+    	codes_(other.codes_)
+    {
+    }
+
+    PQIndex& operator=(PQIndex other)
+    {
+    	this->swap(other);
+    	return *this;
+    }
+
+    virtual ~PQIndex()
+    {
+    }
+
+    BaseClass* clone() const
+    {
+    	return new PQIndex(*this);
+    }
+
+    using BaseClass::buildIndex;
+
+    void addPoints(const Matrix<ElementType>& points, float rebuild_threshold = 2)
+    {
+        assert(points.cols==veclen_);
+        size_t old_size = size_;
+
+        extendDataset(points);
+
+        if (rebuild_threshold>1 && size_at_build_*rebuild_threshold<size_) {
+            buildIndex();
+        }
+        else {
+            codes_.resize(size_*subquantizers_);
+            for (size_t i=old_size;i<size_;++i) {
+                encode(points_[i], &codes_[i*subquantizers_]);
+            }
+        }
+    }
+
+    flann_algorithm_t getType() const
+    {
+        return FLANN_INDEX_PQ;
+    }
+
+    /**
+     * @return The memory used by the codes and the codebooks
+     */
+    int usedMemory() const
+    {
+        return int(codes_.size() + centroids_.size()*sizeof(DistanceType) + bounds_.size()*sizeof(size_t));
+    }
+
+    template<typename Archive>
+    void serialize(Archive& ar)
+    {
+    	ar.setObject(this);
+
+    	ar & *static_cast<NNIndex<Distance>*>(this);
+
+    	ar & subquantizers_;
+    	ar & rerank_;
+    	ar & iterations_;
+    	ar & centroid_count_;
+    	ar & bounds_;
+
+    	size_t centroids_size = centroids_.size();
+    	size_t codes_size = codes_.size();
+    	ar & centroids_size;
+    	ar & codes_size;
+    	if (Archive::is_loading::value) {
+    		centroids_.resize(centroids_size);
+    		codes_.resize(codes_size);
+    	}
+    	if (centroids_size>0) {
+    		ar & serialization::make_binary_object(&centroids_[0], centroids_size*sizeof(DistanceType));
+    	}
+    	if (codes_size>0) {
+    		ar & serialization::make_binary_object(&codes_[0], codes_size);
+    	}
+
+    	if (Archive::is_loading::value) {
+            index_params_["algorithm"] = getType();
+            index_params_["subquantizers"] = int(subquantizers_);
+            index_params_["rerank"] = int(rerank_);
+            index_params_["iterations"] = iterations_;
+    	}
+    }
+
+    void saveIndex(FILE* stream)
+    {
+    	serialization::SaveArchive sa(stream);
+    	sa & *this;
+    }
+
+    void loadIndex(FILE* stream)
+    {
+    	serialization::LoadArchive la(stream);
+    	la & *this;
+    }
+
+    void findNeighbors(ResultSet<DistanceType>& result, const ElementType* vec, const SearchParams& /*searchParams*/) const
+    {
+        std::vector<DistanceType> table(subquantizers_*centroid_count_);
+        computeDistanceTable(vec, table);
+
+        if (rerank_==0) {
+            scanCodes(result, table);
+            return;
+        }
+
+        KNNSimpleResultSet<DistanceType> candidates(rerank_);
+        scanCodes(candidates, table);
+        size_t count = candidates.size();
+        if (count==0) return;
+        std::vector<size_t> indices(count);
+        std::vector<DistanceType> dists(count);
+        candidates.copy(&indices[0], &dists[0], count);
+        for (size_t i=0;i<count;++i) {
+            result.addPoint(distance_(points_[indices[i]], vec, veclen_), indices[i]);
+        }
+    }
+
+protected:
+    void buildIndexImpl()
+    {
+        if (subquantizers_<1 || subquantizers_>veclen_) {
+            throw FLANNException("The number of subquantizers must be between 1 and the dimension of the points");
+        }
+
+        bounds_.resize(subquantizers_+1);
+        for (size_t j=0;j<=subquantizers_;++j) {
+            bounds_[j] = j*veclen_/subquantizers_;
+        }
+
+        // the codebooks are learnt from a random sample of the points, whose
+        // first points are the initial centroids
+        size_t sample_size = std::min(size_, size_t(MAX_TRAINING_POINTS));
+        std::vector<size_t> sample_ids = rand_sample(size_, sample_size);
+        std::vector<ElementType*> sample(sample_size);
+        for (size_t i=0;i<sample_size;++i) {
+            sample[i] = points_[sample_ids[i]];
+        }
+
+        int cores = get_param(index_params_,"cores",1);
+
+        centroid_count_ = std::min(size_, size_t(MAX_CENTROIDS));
+        centroids_.resize(centroid_count_*veclen_);
+#pragma omp parallel for schedule(dynamic) num_threads(cores)
+        for (int j=0;j<(int)subquantizers_;++j) {
+            learnCodebook(j, sample);
+        }
+
+        codes_.resize(size_*subquantizers_);
+#pragma omp parallel for schedule(static) num_threads(cores)
+        for (int i=0;i<(int)size_;++i) {
+            encode(points_[i], &codes_[i*subquantizers_]);
+        }
+    }
+
+    void freeIndex()
+    {
+        centroids_.clear();
+        codes_.clear();
+    }
+
+private:
+    void initParams()
+    {
+        subquantizers_ = std::max(get_param(index_params_,"subquantizers",8), 0);
+        rerank_ = std::max(get_param(index_params_,"rerank",0), 0);
+        iterations_ = get_param(index_params_,"iterations",11);
+        if (iterations_<0) {
+            iterations_ = (std::numeric_limits<int>::max)();
+        }
+    }
+
+    /**
+     * Distance between the sub-vector of a point in a subspace and a centroid
+     */
+    template <typename T>
+    DistanceType subspaceDistance(const T* vec, const DistanceType* centroid, size_t subspace) const
+    {
+        DistanceType dist = DistanceType();
+        for (size_t d=bounds_[subspace];d<bounds_[subspace+1];++d) {
+            dist += distance_.accum_dist(vec[d], *centroid++, (int)d);
+        }
+        return dist;
+    }
+
+    const DistanceType* centroid(size_t subspace, size_t c) const
+    {
+        size_t begin = bounds_[subspace];
+        return &centroids_[begin*centroid_count_ + c*(bounds_[subspace+1]-begin)];
+    }
+
+    size_t nearestCentroid(const ElementType* vec, size_t subspace) const
+    {
+        size_t best = 0;
+        DistanceType best_dist = subspaceDistance(vec, centroid(subspace, 0), subspace);
+        for (size_t c=1;c<centroid_count_;++c) {
+            DistanceType dist = subspaceDistance(vec, centroid(subspace, c), subspace);
+            if (dist<best_dist) {
+                best = c;
+                best_dist = dist;
+            }
+        }
+        return best;
+    }
+
+    void encode(const ElementType* vec, unsigned char* code) const
+    {
+        for (size_t j=0;j<subquantizers_;++j) {
+            code[j] = (unsigned char)nearestCentroid(vec, j);
+        }
+    }
+
+    /**
+     * Learns the centroids of a subspace with the k-means algorithm.
+     */
+    void learnCodebook(size_t subspace, const std::vector<ElementType*>& sample)
+    {
+        size_t begin = bounds_[subspace];
+        size_t dims = bounds_[subspace+1]-begin;
+        DistanceType* centroids = &centroids_[begin*centroid_count_];
+
+        for (size_t c=0;c<centroid_count_;++c) {
+            for (size_t d=0;d<dims;++d) {
+                centroids[c*dims+d] = DistanceType(sample[c][begin+d]);
+            }
+        }
+
+        std::vector<size_t> assignment(sample.size(), centroid_count_);
+        std::vector<DistanceType> sums(centroid_count_*dims);
+        std::vector<size_t> counts(centroid_count_);
+        for (int iteration=0;iteration<iterations_;++iteration) {
+            bool changed = false;
+            std::fill(sums.begin(), sums.end(), DistanceType());
+            std::fill(counts.begin(), counts.end(), 0);
+            for (size_t i=0;i<sample.size();++i) {
+                size_t c = nearestCentroid(sample[i], subspace);
+                if (c!=assignment[i]) {
+                    assignment[i] = c;
+                    changed = true;
+                }
+                ++counts[c];
+                for (size_t d=0;d<dims;++d) {
+                    sums[c*dims+d] += sample[i][begin+d];
+                }
+            }
+            if (!changed) break;
+            // the centroids of empty clusters are kept
+            for (size_t c=0;c<centroid_count_;++c) {
+                if (counts[c]==0) continue;
+                for (size_t d=0;d<dims;++d) {
+                    centroids[c*dims+d] = sums[c*dims+d]/counts[c];
+                }
+            }
+        }
+    }
+
+    void computeDistanceTable(const ElementType* vec, std::vector<DistanceType>& table) const
+    {
+        for (size_t j=0;j<subquantizers_;++j) {
+            for (size_t c=0;c<centroid_count_;++c) {
+                table[j*centroid_count_+c] = subspaceDistance(vec, centroid(j, c), j);
+            }
+        }
+    }
+
+    template <typename ResultSetType>
+    void scanCodes(ResultSetType& result, const std::vector<DistanceType>& table) const
+    {
+        const unsigned char* code = codes_.empty() ? NULL : &codes_[0];
+        for (size_t i=0;i<size_;++i, code+=subquantizers_) {
+            if (removed_ && removed_points_.test(i)) continue;
+            const DistanceType* lookup = &table[0];
+            DistanceType dist = DistanceType();
+            for (size_t j=0;j<subquantizers_;++j, lookup+=centroid_count_) {
+                dist += lookup[code[j]];
+            }
+            result.addPoint(dist, i);
+        }
+    }
+
+    void swap(PQIndex& other)
+    {
+    	BaseClass::swap(other);
+    	std::swap(subquantizers_, other.subquantizers_);
+    	std::swap(rerank_, other.rerank_);
+    	std::swap(iterations_, other.iterations_);
+    	std::swap(centroid_count_, other.centroid_count_);
+    	bounds_.swap(other.bounds_);
+    	centroids_.swap(other.centroids_);
+    	codes_.swap(other.codes_);
+    }
+
+private:
+    static const size_t MAX_CENTROIDS = 256;
+
+    /**
+     * Maximum number of points the codebooks are learnt from
+     */
+    static const size_t MAX_TRAINING_POINTS = 65536;
+
+    /**
+     * Number of sub-vectors each point is split in
+     */
+    size_t subquantizers_;
+
+    /**
+     * Number of candidates re-ranked with the exact distance
+     */
+    size_t rerank_;
+
+    /**
+     * Maximum number of k-means iterations learning each codebook
+     */
+    int iterations_;
+
+    /**
+     * Number of centroids of each subspace
+     */
+    size_t centroid_count_;
+
+    /**
+     * The first dimension of each subspace, followed by veclen_
+     */
+    std::vector<size_t> bounds_;
+
+    /**
+     * The centroids, those of a subspace being contiguous
+     */
+    std::vector<DistanceType> centroids_;
+
+    /**
+     * The codes of the points, subquantizers_ bytes each
+     */
+    std::vector<unsigned char> codes_;
+
+    USING_BASECLASS_SYMBOLS
+};
+
+}
+
+#endif // FLANN_PQ_INDEX_H_
@@ -88,6 +88,8 @@ enum flann_algorithm_t
 #ifdef FLANN_USE_CUDA
     FLANN_INDEX_KDTREE_CUDA 	= 7,
 #endif
+    FLANN_INDEX_PQ 				= 8,
+    FLANN_INDEX_HNSW 			= 9,
     FLANN_INDEX_SAVED 			= 254,
     FLANN_INDEX_AUTOTUNED 		= 255,
 };
@@ -143,6 +145,14 @@ enum flann_datatype_t
     FLANN_FLOAT64 	= 9
 };
 
+/* Compression of the saved indexes */
+enum flann_compression_t
+{
+    FLANN_COMPRESSION_NONE = 0,
+    FLANN_COMPRESSION_LZ4 = 1,
+    FLANN_COMPRESSION_LZ4HC = 2
+};
+
 enum flann_checks_t {
     FLANN_CHECKS_UNLIMITED = -1,
     FLANN_CHECKS_AUTOTUNED = -2,
@@ -38,7 +38,11 @@ struct FLANNParameters DEFAULT_FLANN_PARAMETERS = {
     4, 4,
     32, 11, FLANN_CENTERS_RANDOM, 0.2f,
     0.9f, 0.01f, 0, 0.1f,
-    FLANN_LOG_NONE, 0
+    12, 20, 2,
+    FLANN_LOG_NONE, 0,
+    (flann_distance_t)0, 0,
+    8, 0,
+    16, 200
 };
 
 
@@ -54,6 +58,7 @@ flann::IndexParams create_parameters(FLANNParameters* p)
     params["checks"] = p->checks;
     params["cb_index"] = p->cb_index;
     params["eps"] = p->eps;
+    params["cores"] = p->cores;
 
     if (p->algorithm == FLANN_INDEX_KDTREE) {
         params["trees"] = p->trees;
@@ -96,6 +101,17 @@ flann::IndexParams create_parameters(FLANNParameters* p)
         params["multi_probe_level"] = p->multi_probe_level_;
     }
 
+    if (p->algorithm == FLANN_INDEX_PQ) {
+        params["subquantizers"] = p->subquantizers;
+        params["rerank"] = p->rerank;
+        params["iterations"] = p->iterations;
+    }
+
+    if (p->algorithm == FLANN_INDEX_HNSW) {
+        params["connections"] = p->connections;
+        params["ef_construction"] = p->ef_construction;
+    }
+
     params["log_level"] = p->log_level;
     params["random_seed"] = p->random_seed;
 
@@ -156,6 +172,18 @@ void update_flann_parameters(const IndexParams& params, FLANNParameters* flann_p
 	if (has_param(params,"multi_probe_level")) {
 		flann_params->multi_probe_level_ = get_param<unsigned int>(params,"multi_probe_level");
 	}
+	if (has_param(params,"subquantizers")) {
+		flann_params->subquantizers = get_param<int>(params,"subquantizers");
+	}
+	if (has_param(params,"rerank")) {
+		flann_params->rerank = get_param<int>(params,"rerank");
+	}
+	if (has_param(params,"connections")) {
+		flann_params->connections = get_param<int>(params,"connections");
+	}
+	if (has_param(params,"ef_construction")) {
+		flann_params->ef_construction = get_param<int>(params,"ef_construction");
+	}
 	if (has_param(params,"log_level")) {
 		flann_params->log_level = get_param<flann_log_level_t>(params,"log_level");
 	}
@@ -200,6 +228,75 @@ int flann_get_distance_order() {
 }
 
 
+/**
+ * What the flann_index_t handles point to: the index together with the
+ * distance it uses, so that each index is used with its own distance
+ * whatever the distance type set with flann_set_distance_type.
+ */
+struct IndexHandle
+{
+    void* index;
+    flann_distance_t distance_type;
+    int distance_order;
+};
+
+flann_index_t create_index_handle(void* index, flann_distance_t distance_type, int distance_order)
+{
+    if (index==NULL) {
+        return NULL;
+    }
+    IndexHandle* handle = new IndexHandle();
+    handle->index = index;
+    handle->distance_type = distance_type;
+    handle->distance_order = distance_order;
+    return handle;
+}
+
+template<typename Distance>
+Index<Distance>* get_index(flann_index_t index_ptr)
+{
+    return (Index<Distance>*)((IndexHandle*)index_ptr)->index;
+}
+
+flann_distance_t index_distance_type(flann_index_t index_ptr)
+{
+    return index_ptr!=NULL ? ((IndexHandle*)index_ptr)->distance_type : flann_distance_type;
+}
+
+flann_distance_t params_distance_type(FLANNParameters* flann_params)
+{
+    if (flann_params!=NULL && flann_params->distance_type!=0) {
+        return flann_params->distance_type;
+    }
+    return flann_distance_type;
+}
+
+int params_distance_order(FLANNParameters* flann_params)
+{
+    if (flann_params!=NULL && flann_params->distance_type!=0) {
+        return flann_params->distance_order;
+    }
+    return flann_distance_order;
+}
+
+/**
+ * The Hamming distance of the byte variants, which return the distances
+ * as floats like the other distances do. The other variants have no
+ * Hamming distance, it is only defined on binary descriptors.
+ */
+typedef HammingPopcnt<unsigned char, float> ByteHamming;
+
+flann_distance_t flann_get_index_distance_type(flann_index_t index_ptr)
+{
+    return index_distance_type(index_ptr);
+}
+
+int flann_get_index_distance_order(flann_index_t index_ptr)
+{
+    return index_ptr!=NULL ? ((IndexHandle*)index_ptr)->distance_order : flann_distance_order;
+}
+
+
 // used_memory BEGIN
 template<typename Distance>
 int __flann_used_memory(flann_index_t index_ptr)
@@ -208,7 +305,7 @@ int __flann_used_memory(flann_index_t index_ptr)
         if (index_ptr==NULL) {
             throw FLANNException("Invalid index");
         }
-        Index<Distance>* index = (Index<Distance>*)index_ptr;
+        Index<Distance>* index = get_index<Distance>(index_ptr);
         return index->usedMemory();
     }
     catch (std::runtime_error& e) {
@@ -220,25 +317,27 @@ int __flann_used_memory(flann_index_t index_ptr)
 template<typename T>
 int _flann_used_memory(flann_index_t index_ptr)
 {
-    if (flann_distance_type==FLANN_DIST_EUCLIDEAN) {
+    flann_distance_t distance_type = index_distance_type(index_ptr);
+
+    if (distance_type==FLANN_DIST_EUCLIDEAN) {
          return __flann_used_memory<L2<T> >(index_ptr);
     }
-    else if (flann_distance_type==FLANN_DIST_MANHATTAN) {
+    else if (distance_type==FLANN_DIST_MANHATTAN) {
          return __flann_used_memory<L1<T> >(index_ptr);
     }
-    else if (flann_distance_type==FLANN_DIST_MINKOWSKI) {
+    else if (distance_type==FLANN_DIST_MINKOWSKI) {
          return __flann_used_memory<MinkowskiDistance<T> >(index_ptr);
     }
-    else if (flann_distance_type==FLANN_DIST_HIST_INTERSECT) {
+    else if (distance_type==FLANN_DIST_HIST_INTERSECT) {
          return __flann_used_memory<HistIntersectionDistance<T> >(index_ptr);
     }
-    else if (flann_distance_type==FLANN_DIST_HELLINGER) {
+    else if (distance_type==FLANN_DIST_HELLINGER) {
          return __flann_used_memory<HellingerDistance<T> >(index_ptr);
     }
-    else if (flann_distance_type==FLANN_DIST_CHI_SQUARE) {
+    else if (distance_type==FLANN_DIST_CHI_SQUARE) {
          return __flann_used_memory<ChiSquareDistance<T> >(index_ptr);
     }
-    else if (flann_distance_type==FLANN_DIST_KULLBACK_LEIBLER) {
+    else if (distance_type==FLANN_DIST_KULLBACK_LEIBLER) {
          return __flann_used_memory<KL_Divergence<T> >(index_ptr);
     }
     else {
@@ -264,6 +363,9 @@ int flann_used_memory_int(flann_index_t index_ptr)
 }
 int flann_used_memory_byte(flann_index_t index_ptr)
 {
+    if (index_distance_type(index_ptr)==FLANN_DIST_HAMMING) {
+        return __flann_used_memory<ByteHamming>(index_ptr);
+    }
     return _flann_used_memory<unsigned char>(index_ptr);
 }
 // used_memory END
@@ -306,31 +408,35 @@ flann_index_t __flann_build_index(typename Distance::ElementType* dataset, int r
 template<typename T>
 flann_index_t _flann_build_index(T* dataset, int rows, int cols, float* speedup, FLANNParameters* flann_params)
 {
-    if (flann_distance_type==FLANN_DIST_EUCLIDEAN) {
-        return __flann_build_index<L2<T> >(dataset, rows, cols, speedup, flann_params);
+    flann_distance_t distance_type = params_distance_type(flann_params);
+    int distance_order = params_distance_order(flann_params);
+
+    flann_index_t index = NULL;
+    if (distance_type==FLANN_DIST_EUCLIDEAN) {
+        index = __flann_build_index<L2<T> >(dataset, rows, cols, speedup, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_MANHATTAN) {
-        return __flann_build_index<L1<T> >(dataset, rows, cols, speedup, flann_params);
+    else if (distance_type==FLANN_DIST_MANHATTAN) {
+        index = __flann_build_index<L1<T> >(dataset, rows, cols, speedup, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_MINKOWSKI) {
-        return __flann_build_index<MinkowskiDistance<T> >(dataset, rows, cols, speedup, flann_params, MinkowskiDistance<T>(flann_distance_order));
+    else if (distance_type==FLANN_DIST_MINKOWSKI) {
+        index = __flann_build_index<MinkowskiDistance<T> >(dataset, rows, cols, speedup, flann_params, MinkowskiDistance<T>(distance_order));
     }
-    else if (flann_distance_type==FLANN_DIST_HIST_INTERSECT) {
-        return __flann_build_index<HistIntersectionDistance<T> >(dataset, rows, cols, speedup, flann_params);
+    else if (distance_type==FLANN_DIST_HIST_INTERSECT) {
+        index = __flann_build_index<HistIntersectionDistance<T> >(dataset, rows, cols, speedup, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_HELLINGER) {
-        return __flann_build_index<HellingerDistance<T> >(dataset, rows, cols, speedup, flann_params);
+    else if (distance_type==FLANN_DIST_HELLINGER) {
+        index = __flann_build_index<HellingerDistance<T> >(dataset, rows, cols, speedup, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_CHI_SQUARE) {
-        return __flann_build_index<ChiSquareDistance<T> >(dataset, rows, cols, speedup, flann_params);
+    else if (distance_type==FLANN_DIST_CHI_SQUARE) {
+        index = __flann_build_index<ChiSquareDistance<T> >(dataset, rows, cols, speedup, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_KULLBACK_LEIBLER) {
-        return __flann_build_index<KL_Divergence<T> >(dataset, rows, cols, speedup, flann_params);
+    else if (distance_type==FLANN_DIST_KULLBACK_LEIBLER) {
+        index = __flann_build_index<KL_Divergence<T> >(dataset, rows, cols, speedup, flann_params);
     }
     else {
         Logger::error( "Distance type unsupported in the C bindings, use the C++ bindings instead\n");
-        return NULL;
     }
+    return create_index_handle(index, distance_type, distance_order);
 }
 
 flann_index_t flann_build_index(float* dataset, int rows, int cols, float* speedup, FLANNParameters* flann_params)
@@ -350,6 +456,9 @@ flann_index_t flann_build_index_double(double* dataset, int rows, int cols, floa
 
 flann_index_t flann_build_index_byte(unsigned char* dataset, int rows, int cols, float* speedup, FLANNParameters* flann_params)
 {
+    if (params_distance_type(flann_params)==FLANN_DIST_HAMMING) {
+        return create_index_handle(__flann_build_index<ByteHamming>(dataset, rows, cols, speedup, flann_params), FLANN_DIST_HAMMING, 0);
+    }
     return _flann_build_index<unsigned char>(dataset, rows, cols, speedup, flann_params);
 }
 
@@ -368,7 +477,7 @@ void __flann_add_points(flann_index_t index_ptr,  typename Distance::ElementType
             throw FLANNException("Invalid index");
         }
 
-        Index<Distance>* index = (Index<Distance>*)index_ptr;
+        Index<Distance>* index = get_index<Distance>(index_ptr);
         Matrix<ElementType> points = Matrix<ElementType>(dataset,rows,index->veclen());
         index->addPoints(points, rebuild_threshhold);
         return;
@@ -382,25 +491,27 @@ void __flann_add_points(flann_index_t index_ptr,  typename Distance::ElementType
 template<typename T>
 void _flann_add_points(flann_index_t index_ptr, T* dataset, int rows, int rebuild_threshold)
 {
-    if (flann_distance_type==FLANN_DIST_EUCLIDEAN) {
+    flann_distance_t distance_type = index_distance_type(index_ptr);
+
+    if (distance_type==FLANN_DIST_EUCLIDEAN) {
          __flann_add_points<L2<T> >(index_ptr, dataset, rows, rebuild_threshold);
     }
-    else if (flann_distance_type==FLANN_DIST_MANHATTAN) {
+    else if (distance_type==FLANN_DIST_MANHATTAN) {
          __flann_add_points<L1<T> >(index_ptr, dataset, rows, rebuild_threshold);
     }
-    else if (flann_distance_type==FLANN_DIST_MINKOWSKI) {
+    else if (distance_type==FLANN_DIST_MINKOWSKI) {
        __flann_add_points<MinkowskiDistance<T> >(index_ptr, dataset, rows, rebuild_threshold);
     }
-    else if (flann_distance_type==FLANN_DIST_HIST_INTERSECT) {
+    else if (distance_type==FLANN_DIST_HIST_INTERSECT) {
          __flann_add_points<HistIntersectionDistance<T> >(index_ptr, dataset, rows, rebuild_threshold);
     }
-    else if (flann_distance_type==FLANN_DIST_HELLINGER) {
+    else if (distance_type==FLANN_DIST_HELLINGER) {
          __flann_add_points<HellingerDistance<T> >(index_ptr, dataset, rows, rebuild_threshold);
     }
-    else if (flann_distance_type==FLANN_DIST_CHI_SQUARE) {
+    else if (distance_type==FLANN_DIST_CHI_SQUARE) {
          __flann_add_points<ChiSquareDistance<T> >(index_ptr, dataset, rows, rebuild_threshold);
     }
-    else if (flann_distance_type==FLANN_DIST_KULLBACK_LEIBLER) {
+    else if (distance_type==FLANN_DIST_KULLBACK_LEIBLER) {
          __flann_add_points<KL_Divergence<T> >(index_ptr, dataset, rows, rebuild_threshold);
     }
     else {
@@ -422,6 +533,10 @@ void flann_add_points_double(flann_index_t index_ptr, double* dataset, int rows,
 }
 void flann_add_points_byte(flann_index_t index_ptr, unsigned char* dataset, int rows, int rebuild_threshhold)
 {
+    if (index_distance_type(index_ptr)==FLANN_DIST_HAMMING) {
+        __flann_add_points<ByteHamming>(index_ptr, dataset, rows, rebuild_threshhold);
+        return;
+    }
     _flann_add_points<unsigned char>(index_ptr, dataset, rows, rebuild_threshhold);
 }
 void flann_add_points_int(flann_index_t index_ptr, int* dataset, int rows, int rebuild_threshhold)
@@ -439,7 +554,7 @@ void __flann_remove_point(flann_index_t index_ptr, int id_)
         if (index_ptr==NULL) {
             throw FLANNException("Invalid index");
         }
-        Index<Distance>* index = (Index<Distance>*)index_ptr;
+        Index<Distance>* index = get_index<Distance>(index_ptr);
         index->removePoint(id_);
         return;
     }
@@ -452,25 +567,27 @@ void __flann_remove_point(flann_index_t index_ptr, int id_)
 template<typename T>
 void _flann_remove_point(flann_index_t index_ptr, int id_)
 {
-    if (flann_distance_type==FLANN_DIST_EUCLIDEAN) {
+    flann_distance_t distance_type = index_distance_type(index_ptr);
+
+    if (distance_type==FLANN_DIST_EUCLIDEAN) {
          __flann_remove_point<L2<T> >(index_ptr, id_);
     }
-    else if (flann_distance_type==FLANN_DIST_MANHATTAN) {
+    else if (distance_type==FLANN_DIST_MANHATTAN) {
          __flann_remove_point<L1<T> >(index_ptr, id_);
     }
-    else if (flann_distance_type==FLANN_DIST_MINKOWSKI) {
+    else if (distance_type==FLANN_DIST_MINKOWSKI) {
        __flann_remove_point<MinkowskiDistance<T> >(index_ptr, id_);
     }
-    else if (flann_distance_type==FLANN_DIST_HIST_INTERSECT) {
+    else if (distance_type==FLANN_DIST_HIST_INTERSECT) {
          __flann_remove_point<HistIntersectionDistance<T> >(index_ptr, id_);
     }
-    else if (flann_distance_type==FLANN_DIST_HELLINGER) {
+    else if (distance_type==FLANN_DIST_HELLINGER) {
          __flann_remove_point<HellingerDistance<T> >(index_ptr, id_);
     }
-    else if (flann_distance_type==FLANN_DIST_CHI_SQUARE) {
+    else if (distance_type==FLANN_DIST_CHI_SQUARE) {
          __flann_remove_point<ChiSquareDistance<T> >(index_ptr, id_);
     }
-    else if (flann_distance_type==FLANN_DIST_KULLBACK_LEIBLER) {
+    else if (distance_type==FLANN_DIST_KULLBACK_LEIBLER) {
          __flann_remove_point<KL_Divergence<T> >(index_ptr, id_);
     }
     else {
@@ -495,22 +612,342 @@ void flann_remove_point_int(flann_index_t index_ptr, int id_)
 }
 void flann_remove_point_byte(flann_index_t index_ptr, int id_)
 {
+    if (index_distance_type(index_ptr)==FLANN_DIST_HAMMING) {
+        __flann_remove_point<ByteHamming>(index_ptr, id_);
+        return;
+    }
     _flann_remove_point<unsigned char>(index_ptr, id_);
 }
 // {binding_name} END
+
+
+// remove_points BEGIN
+template<typename Distance>
+void __flann_remove_points(flann_index_t index_ptr, int* ids, int count)
+{
+    try {
+        if (index_ptr==NULL) {
+            throw FLANNException("Invalid index");
+        }
+        Index<Distance>* index = get_index<Distance>(index_ptr);
+        std::vector<size_t> point_ids;
+        point_ids.reserve(count);
+        for (int i=0;i<count;++i) {
+            if (ids[i]>=0) {
+                point_ids.push_back(ids[i]);
+            }
+        }
+        index->removePoints(point_ids);
+        return;
+    }
+    catch (std::runtime_error& e) {
+        Logger::error("Caught exception: %s\n",e.what());
+        return;
+    }
+}
+
+template<typename T>
+void _flann_remove_points(flann_index_t index_ptr, int* ids, int count)
+{
+    flann_distance_t distance_type = index_distance_type(index_ptr);
+
+    if (distance_type==FLANN_DIST_EUCLIDEAN) {
+         __flann_remove_points<L2<T> >(index_ptr, ids, count);
+    }
+    else if (distance_type==FLANN_DIST_MANHATTAN) {
+         __flann_remove_points<L1<T> >(index_ptr, ids, count);
+    }
+    else if (distance_type==FLANN_DIST_MINKOWSKI) {
+       __flann_remove_points<MinkowskiDistance<T> >(index_ptr, ids, count);
+    }
+    else if (distance_type==FLANN_DIST_HIST_INTERSECT) {
+         __flann_remove_points<HistIntersectionDistance<T> >(index_ptr, ids, count);
+    }
+    else if (distance_type==FLANN_DIST_HELLINGER) {
+         __flann_remove_points<HellingerDistance<T> >(index_ptr, ids, count);
+    }
+    else if (distance_type==FLANN_DIST_CHI_SQUARE) {
+         __flann_remove_points<ChiSquareDistance<T> >(index_ptr, ids, count);
+    }
+    else if (distance_type==FLANN_DIST_KULLBACK_LEIBLER) {
+         __flann_remove_points<KL_Divergence<T> >(index_ptr, ids, count);
+    }
+    else {
+        Logger::error( "Distance type unsupported in the C bindings, use the C++ bindings instead\n");
+    }
+}
+void flann_remove_points(flann_index_t index_ptr, int* ids, int count)
+{
+    _flann_remove_points<float>(index_ptr, ids, count);
+}
+void flann_remove_points_float(flann_index_t index_ptr, int* ids, int count)
+{
+    _flann_remove_points<float>(index_ptr, ids, count);
+}
+void flann_remove_points_double(flann_index_t index_ptr, int* ids, int count)
+{
+    _flann_remove_points<double>(index_ptr, ids, count);
+}
+void flann_remove_points_int(flann_index_t index_ptr, int* ids, int count)
+{
+    _flann_remove_points<int>(index_ptr, ids, count);
+}
+void flann_remove_points_byte(flann_index_t index_ptr, int* ids, int count)
+{
+    if (index_distance_type(index_ptr)==FLANN_DIST_HAMMING) {
+        __flann_remove_points<ByteHamming>(index_ptr, ids, count);
+        return;
+    }
+    _flann_remove_points<unsigned char>(index_ptr, ids, count);
+}
+// remove_points END
+
+
+// relocate_points BEGIN
+template<typename Distance>
+int __flann_relocate_points(flann_index_t index_ptr, int first_id, typename Distance::ElementType* dataset, int rows)
+{
+    typedef typename Distance::ElementType ElementType;
+    try {
+        if (index_ptr==NULL) {
+            throw FLANNException("Invalid index");
+        }
+        if (first_id<0) {
+            throw FLANNException("Invalid point id");
+        }
+        Index<Distance>* index = get_index<Distance>(index_ptr);
+        Matrix<ElementType> points = Matrix<ElementType>(dataset,rows,index->veclen());
+        index->relocatePoints(first_id, points);
+        return 0;
+    }
+    catch (std::runtime_error& e) {
+        Logger::error("Caught exception: %s\n",e.what());
+        return -1;
+    }
+}
+
+template<typename T>
+int _flann_relocate_points(flann_index_t index_ptr, int first_id, T* dataset, int rows)
+{
+    flann_distance_t distance_type = index_distance_type(index_ptr);
+
+    if (distance_type==FLANN_DIST_EUCLIDEAN) {
+        return __flann_relocate_points<L2<T> >(index_ptr, first_id, dataset, rows);
+    }
+    else if (distance_type==FLANN_DIST_MANHATTAN) {
+        return __flann_relocate_points<L1<T> >(index_ptr, first_id, dataset, rows);
+    }
+    else if (distance_type==FLANN_DIST_MINKOWSKI) {
+        return __flann_relocate_points<MinkowskiDistance<T> >(index_ptr, first_id, dataset, rows);
+    }
+    else if (distance_type==FLANN_DIST_HIST_INTERSECT) {
+        return __flann_relocate_points<HistIntersectionDistance<T> >(index_ptr, first_id, dataset, rows);
+    }
+    else if (distance_type==FLANN_DIST_HELLINGER) {
+        return __flann_relocate_points<HellingerDistance<T> >(index_ptr, first_id, dataset, rows);
+    }
+    else if (distance_type==FLANN_DIST_CHI_SQUARE) {
+        return __flann_relocate_points<ChiSquareDistance<T> >(index_ptr, first_id, dataset, rows);
+    }
+    else if (distance_type==FLANN_DIST_KULLBACK_LEIBLER) {
+        return __flann_relocate_points<KL_Divergence<T> >(index_ptr, first_id, dataset, rows);
+    }
+    else {
+        Logger::error( "Distance type unsupported in the C bindings, use the C++ bindings instead\n");
+        return -1;
+    }
+}
+
+int flann_relocate_points(flann_index_t index_ptr, int first_id, float* dataset, int rows)
+{
+    return _flann_relocate_points<float>(index_ptr, first_id, dataset, rows);
+}
+int flann_relocate_points_float(flann_index_t index_ptr, int first_id, float* dataset, int rows)
+{
+    return _flann_relocate_points<float>(index_ptr, first_id, dataset, rows);
+}
+int flann_relocate_points_double(flann_index_t index_ptr, int first_id, double* dataset, int rows)
+{
+    return _flann_relocate_points<double>(index_ptr, first_id, dataset, rows);
+}
+int flann_relocate_points_byte(flann_index_t index_ptr, int first_id, unsigned char* dataset, int rows)
+{
+    if (index_distance_type(index_ptr)==FLANN_DIST_HAMMING) {
+        return __flann_relocate_points<ByteHamming>(index_ptr, first_id, dataset, rows);
+    }
+    return _flann_relocate_points<unsigned char>(index_ptr, first_id, dataset, rows);
+}
+int flann_relocate_points_int(flann_index_t index_ptr, int first_id, int* dataset, int rows)
+{
+    return _flann_relocate_points<int>(index_ptr, first_id, dataset, rows);
+}
+// relocate_points END
+
+
+// clone_index BEGIN
+template<typename Distance>
+flann_index_t __flann_clone_index(flann_index_t index_ptr, FLANNParameters* flann_params)
+{
+    try {
+        init_flann_parameters(flann_params);
+        if (index_ptr==NULL) {
+            throw FLANNException("Invalid index");
+        }
+        Index<Distance>* index = get_index<Distance>(index_ptr);
+        return new Index<Distance>(*index);
+    }
+    catch (std::runtime_error& e) {
+        Logger::error("Caught exception: %s\n",e.what());
+        return NULL;
+    }
+}
+
+template<typename T>
+flann_index_t _flann_clone_index(flann_index_t index_ptr, FLANNParameters* flann_params)
+{
+    flann_distance_t distance_type = index_distance_type(index_ptr);
+    int distance_order = flann_get_index_distance_order(index_ptr);
+
+    flann_index_t index = NULL;
+    if (distance_type==FLANN_DIST_EUCLIDEAN) {
+        index = __flann_clone_index<L2<T> >(index_ptr, flann_params);
+    }
+    else if (distance_type==FLANN_DIST_MANHATTAN) {
+        index = __flann_clone_index<L1<T> >(index_ptr, flann_params);
+    }
+    else if (distance_type==FLANN_DIST_MINKOWSKI) {
+        index = __flann_clone_index<MinkowskiDistance<T> >(index_ptr, flann_params);
+    }
+    else if (distance_type==FLANN_DIST_HIST_INTERSECT) {
+        index = __flann_clone_index<HistIntersectionDistance<T> >(index_ptr, flann_params);
+    }
+    else if (distance_type==FLANN_DIST_HELLINGER) {
+        index = __flann_clone_index<HellingerDistance<T> >(index_ptr, flann_params);
+    }
+    else if (distance_type==FLANN_DIST_CHI_SQUARE) {
+        index = __flann_clone_index<ChiSquareDistance<T> >(index_ptr, flann_params);
+    }
+    else if (distance_type==FLANN_DIST_KULLBACK_LEIBLER) {
+        index = __flann_clone_index<KL_Divergence<T> >(index_ptr, flann_params);
+    }
+    else {
+        Logger::error( "Distance type unsupported in the C bindings, use the C++ bindings instead\n");
+    }
+    return create_index_handle(index, distance_type, distance_order);
+}
+flann_index_t flann_clone_index(flann_index_t index_ptr, FLANNParameters* flann_params)
+{
+    return _flann_clone_index<float>(index_ptr, flann_params);
+}
+flann_index_t flann_clone_index_float(flann_index_t index_ptr, FLANNParameters* flann_params)
+{
+    return _flann_clone_index<float>(index_ptr, flann_params);
+}
+flann_index_t flann_clone_index_double(flann_index_t index_ptr, FLANNParameters* flann_params)
+{
+    return _flann_clone_index<double>(index_ptr, flann_params);
+}
+flann_index_t flann_clone_index_byte(flann_index_t index_ptr, FLANNParameters* flann_params)
+{
+    if (index_distance_type(index_ptr)==FLANN_DIST_HAMMING) {
+        return create_index_handle(__flann_clone_index<ByteHamming>(index_ptr, flann_params), FLANN_DIST_HAMMING, 0);
+    }
+    return _flann_clone_index<unsigned char>(index_ptr, flann_params);
+}
+flann_index_t flann_clone_index_int(flann_index_t index_ptr, FLANNParameters* flann_params)
+{
+    return _flann_clone_index<int>(index_ptr, flann_params);
+}
+// clone_index END
+
+
+// rebuild_index BEGIN
+template<typename Distance>
+int __flann_rebuild_index(flann_index_t index_ptr, FLANNParameters* flann_params)
+{
+    try {
+        init_flann_parameters(flann_params);
+        if (index_ptr==NULL) {
+            throw FLANNException("Invalid index");
+        }
+        Index<Distance>* index = get_index<Distance>(index_ptr);
+        index->rebuildIndex();
+        return 0;
+    }
+    catch (std::runtime_error& e) {
+        Logger::error("Caught exception: %s\n",e.what());
+        return -1;
+    }
+}
+
+template<typename T>
+int _flann_rebuild_index(flann_index_t index_ptr, FLANNParameters* flann_params)
+{
+    flann_distance_t distance_type = index_distance_type(index_ptr);
+
+    if (distance_type==FLANN_DIST_EUCLIDEAN) {
+        return __flann_rebuild_index<L2<T> >(index_ptr, flann_params);
+    }
+    else if (distance_type==FLANN_DIST_MANHATTAN) {
+        return __flann_rebuild_index<L1<T> >(index_ptr, flann_params);
+    }
+    else if (distance_type==FLANN_DIST_MINKOWSKI) {
+        return __flann_rebuild_index<MinkowskiDistance<T> >(index_ptr, flann_params);
+    }
+    else if (distance_type==FLANN_DIST_HIST_INTERSECT) {
+        return __flann_rebuild_index<HistIntersectionDistance<T> >(index_ptr, flann_params);
+    }
+    else if (distance_type==FLANN_DIST_HELLINGER) {
+        return __flann_rebuild_index<HellingerDistance<T> >(index_ptr, flann_params);
+    }
+    else if (distance_type==FLANN_DIST_CHI_SQUARE) {
+        return __flann_rebuild_index<ChiSquareDistance<T> >(index_ptr, flann_params);
+    }
+    else if (distance_type==FLANN_DIST_KULLBACK_LEIBLER) {
+        return __flann_rebuild_index<KL_Divergence<T> >(index_ptr, flann_params);
+    }
+    else {
+        Logger::error( "Distance type unsupported in the C bindings, use the C++ bindings instead\n");
+        return -1;
+    }
+}
+int flann_rebuild_index(flann_index_t index_ptr, FLANNParameters* flann_params)
+{
+    return _flann_rebuild_index<float>(index_ptr, flann_params);
+}
+int flann_rebuild_index_float(flann_index_t index_ptr, FLANNParameters* flann_params)
+{
+    return _flann_rebuild_index<float>(index_ptr, flann_params);
+}
+int flann_rebuild_index_double(flann_index_t index_ptr, FLANNParameters* flann_params)
+{
+    return _flann_rebuild_index<double>(index_ptr, flann_params);
+}
+int flann_rebuild_index_byte(flann_index_t index_ptr, FLANNParameters* flann_params)
+{
+    if (index_distance_type(index_ptr)==FLANN_DIST_HAMMING) {
+        return __flann_rebuild_index<ByteHamming>(index_ptr, flann_params);
+    }
+    return _flann_rebuild_index<unsigned char>(index_ptr, flann_params);
+}
+int flann_rebuild_index_int(flann_index_t index_ptr, FLANNParameters* flann_params)
+{
+    return _flann_rebuild_index<int>(index_ptr, flann_params);
+}
+// rebuild_index END
 // 
 
 
 template<typename Distance>
-int __flann_save_index(flann_index_t index_ptr, char* filename)
+int __flann_save_index(flann_index_t index_ptr, char* filename, const Compression& compression)
 {
     try {
         if (index_ptr==NULL) {
             throw FLANNException("Invalid index");
         }
 
-        Index<Distance>* index = (Index<Distance>*)index_ptr;
-        index->save(filename);
+        Index<Distance>* index = get_index<Distance>(index_ptr);
+        index->save(filename, compression);
 
         return 0;
     }
@@ -521,28 +958,30 @@ int __flann_save_index(flann_index_t index_ptr, char* filename)
 }
 
 template<typename T>
-int _flann_save_index(flann_index_t index_ptr, char* filename)
+int _flann_save_index(flann_index_t index_ptr, char* filename, const Compression& compression)
 {
-    if (flann_distance_type==FLANN_DIST_EUCLIDEAN) {
-        return __flann_save_index<L2<T> >(index_ptr, filename);
+    flann_distance_t distance_type = index_distance_type(index_ptr);
+
+    if (distance_type==FLANN_DIST_EUCLIDEAN) {
+        return __flann_save_index<L2<T> >(index_ptr, filename, compression);
     }
-    else if (flann_distance_type==FLANN_DIST_MANHATTAN) {
-        return __flann_save_index<L1<T> >(index_ptr, filename);
+    else if (distance_type==FLANN_DIST_MANHATTAN) {
+        return __flann_save_index<L1<T> >(index_ptr, filename, compression);
     }
-    else if (flann_distance_type==FLANN_DIST_MINKOWSKI) {
-        return __flann_save_index<MinkowskiDistance<T> >(index_ptr, filename);
+    else if (distance_type==FLANN_DIST_MINKOWSKI) {
+        return __flann_save_index<MinkowskiDistance<T> >(index_ptr, filename, compression);
     }
-    else if (flann_distance_type==FLANN_DIST_HIST_INTERSECT) {
-        return __flann_save_index<HistIntersectionDistance<T> >(index_ptr, filename);
+    else if (distance_type==FLANN_DIST_HIST_INTERSECT) {
+        return __flann_save_index<HistIntersectionDistance<T> >(index_ptr, filename, compression);
     }
-    else if (flann_distance_type==FLANN_DIST_HELLINGER) {
-        return __flann_save_index<HellingerDistance<T> >(index_ptr, filename);
+    else if (distance_type==FLANN_DIST_HELLINGER) {
+        return __flann_save_index<HellingerDistance<T> >(index_ptr, filename, compression);
     }
-    else if (flann_distance_type==FLANN_DIST_CHI_SQUARE) {
-        return __flann_save_index<ChiSquareDistance<T> >(index_ptr, filename);
+    else if (distance_type==FLANN_DIST_CHI_SQUARE) {
+        return __flann_save_index<ChiSquareDistance<T> >(index_ptr, filename, compression);
     }
-    else if (flann_distance_type==FLANN_DIST_KULLBACK_LEIBLER) {
-        return __flann_save_index<KL_Divergence<T> >(index_ptr, filename);
+    else if (distance_type==FLANN_DIST_KULLBACK_LEIBLER) {
+        return __flann_save_index<KL_Divergence<T> >(index_ptr, filename, compression);
     }
     else {
         Logger::error( "Distance type unsupported in the C bindings, use the C++ bindings instead\n");
@@ -552,27 +991,63 @@ int _flann_save_index(flann_index_t index_ptr, char* filename)
 
 int flann_save_index(flann_index_t index_ptr, char* filename)
 {
-    return _flann_save_index<float>(index_ptr, filename);
+    return _flann_save_index<float>(index_ptr, filename, Compression());
 }
 
 int flann_save_index_float(flann_index_t index_ptr, char* filename)
 {
-    return _flann_save_index<float>(index_ptr, filename);
+    return _flann_save_index<float>(index_ptr, filename, Compression());
 }
 
 int flann_save_index_double(flann_index_t index_ptr, char* filename)
 {
-    return _flann_save_index<double>(index_ptr, filename);
+    return _flann_save_index<double>(index_ptr, filename, Compression());
 }
 
 int flann_save_index_byte(flann_index_t index_ptr, char* filename)
 {
-    return _flann_save_index<unsigned char>(index_ptr, filename);
+    if (index_distance_type(index_ptr)==FLANN_DIST_HAMMING) {
+        return __flann_save_index<ByteHamming>(index_ptr, filename, Compression());
+    }
+    return _flann_save_index<unsigned char>(index_ptr, filename, Compression());
+}
+
+int flann_save_index_with_compression(flann_index_t index_ptr, char* filename,
+                                      flann_compression_t compression, int level)
+{
+    return _flann_save_index<float>(index_ptr, filename, Compression(compression, level));
+}
+
+int flann_save_index_with_compression_float(flann_index_t index_ptr, char* filename,
+                                            flann_compression_t compression, int level)
+{
+    return _flann_save_index<float>(index_ptr, filename, Compression(compression, level));
+}
+
+int flann_save_index_with_compression_double(flann_index_t index_ptr, char* filename,
+                                             flann_compression_t compression, int level)
+{
+    return _flann_save_index<double>(index_ptr, filename, Compression(compression, level));
+}
+
+int flann_save_index_with_compression_byte(flann_index_t index_ptr, char* filename,
+                                           flann_compression_t compression, int level)
+{
+    if (index_distance_type(index_ptr)==FLANN_DIST_HAMMING) {
+        return __flann_save_index<ByteHamming>(index_ptr, filename, Compression(compression, level));
+    }
+    return _flann_save_index<unsigned char>(index_ptr, filename, Compression(compression, level));
+}
+
+int flann_save_index_with_compression_int(flann_index_t index_ptr, char* filename,
+                                          flann_compression_t compression, int level)
+{
+    return _flann_save_index<int>(index_ptr, filename, Compression(compression, level));
 }
 
 int flann_save_index_int(flann_index_t index_ptr, char* filename)
 {
-    return _flann_save_index<int>(index_ptr, filename);
+    return _flann_save_index<int>(index_ptr, filename, Compression());
 }
 
 
@@ -591,59 +1066,280 @@ flann_index_t __flann_load_index(char* filename, typename Distance::ElementType*
 }
 
 template<typename T>
-flann_index_t _flann_load_index(char* filename, T* dataset, int rows, int cols)
+flann_index_t _flann_load_index(char* filename, T* dataset, int rows, int cols,
+                                flann_distance_t distance_type, int distance_order)
 {
-    if (flann_distance_type==FLANN_DIST_EUCLIDEAN) {
-        return __flann_load_index<L2<T> >(filename, dataset, rows, cols);
+    flann_index_t index = NULL;
+    if (distance_type==FLANN_DIST_EUCLIDEAN) {
+        index = __flann_load_index<L2<T> >(filename, dataset, rows, cols);
     }
-    else if (flann_distance_type==FLANN_DIST_MANHATTAN) {
-        return __flann_load_index<L1<T> >(filename, dataset, rows, cols);
+    else if (distance_type==FLANN_DIST_MANHATTAN) {
+        index = __flann_load_index<L1<T> >(filename, dataset, rows, cols);
     }
-    else if (flann_distance_type==FLANN_DIST_MINKOWSKI) {
-        return __flann_load_index<MinkowskiDistance<T> >(filename, dataset, rows, cols, MinkowskiDistance<T>(flann_distance_order));
+    else if (distance_type==FLANN_DIST_MINKOWSKI) {
+        index = __flann_load_index<MinkowskiDistance<T> >(filename, dataset, rows, cols, MinkowskiDistance<T>(distance_order));
     }
-    else if (flann_distance_type==FLANN_DIST_HIST_INTERSECT) {
-        return __flann_load_index<HistIntersectionDistance<T> >(filename, dataset, rows, cols);
+    else if (distance_type==FLANN_DIST_HIST_INTERSECT) {
+        index = __flann_load_index<HistIntersectionDistance<T> >(filename, dataset, rows, cols);
     }
-    else if (flann_distance_type==FLANN_DIST_HELLINGER) {
-        return __flann_load_index<HellingerDistance<T> >(filename, dataset, rows, cols);
+    else if (distance_type==FLANN_DIST_HELLINGER) {
+        index = __flann_load_index<HellingerDistance<T> >(filename, dataset, rows, cols);
     }
-    else if (flann_distance_type==FLANN_DIST_CHI_SQUARE) {
-        return __flann_load_index<ChiSquareDistance<T> >(filename, dataset, rows, cols);
+    else if (distance_type==FLANN_DIST_CHI_SQUARE) {
+        index = __flann_load_index<ChiSquareDistance<T> >(filename, dataset, rows, cols);
     }
-    else if (flann_distance_type==FLANN_DIST_KULLBACK_LEIBLER) {
-        return __flann_load_index<KL_Divergence<T> >(filename, dataset, rows, cols);
+    else if (distance_type==FLANN_DIST_KULLBACK_LEIBLER) {
+        index = __flann_load_index<KL_Divergence<T> >(filename, dataset, rows, cols);
     }
     else {
         Logger::error( "Distance type unsupported in the C bindings, use the C++ bindings instead\n");
-        return NULL;
     }
+    return create_index_handle(index, distance_type, distance_order);
 }
 
 
 flann_index_t flann_load_index(char* filename, float* dataset, int rows, int cols)
 {
-    return _flann_load_index<float>(filename, dataset, rows, cols);
+    return _flann_load_index<float>(filename, dataset, rows, cols, flann_distance_type, flann_distance_order);
 }
 
 flann_index_t flann_load_index_float(char* filename, float* dataset, int rows, int cols)
 {
-    return _flann_load_index<float>(filename, dataset, rows, cols);
+    return _flann_load_index<float>(filename, dataset, rows, cols, flann_distance_type, flann_distance_order);
 }
 
 flann_index_t flann_load_index_double(char* filename, double* dataset, int rows, int cols)
 {
-    return _flann_load_index<double>(filename, dataset, rows, cols);
+    return _flann_load_index<double>(filename, dataset, rows, cols, flann_distance_type, flann_distance_order);
 }
 
 flann_index_t flann_load_index_byte(char* filename, unsigned char* dataset, int rows, int cols)
 {
-    return _flann_load_index<unsigned char>(filename, dataset, rows, cols);
+    if (flann_distance_type==FLANN_DIST_HAMMING) {
+        return create_index_handle(__flann_load_index<ByteHamming>(filename, dataset, rows, cols), FLANN_DIST_HAMMING, 0);
+    }
+    return _flann_load_index<unsigned char>(filename, dataset, rows, cols, flann_distance_type, flann_distance_order);
 }
 
 flann_index_t flann_load_index_int(char* filename, int* dataset, int rows, int cols)
 {
-    return _flann_load_index<int>(filename, dataset, rows, cols);
+    return _flann_load_index<int>(filename, dataset, rows, cols, flann_distance_type, flann_distance_order);
+}
+
+flann_index_t flann_load_index_with_distance(char* filename, float* dataset, int rows, int cols,
+                                             flann_distance_t distance_type, int order)
+{
+    return _flann_load_index<float>(filename, dataset, rows, cols, distance_type, order);
+}
+
+flann_index_t flann_load_index_with_distance_float(char* filename, float* dataset, int rows, int cols,
+                                                   flann_distance_t distance_type, int order)
+{
+    return _flann_load_index<float>(filename, dataset, rows, cols, distance_type, order);
+}
+
+flann_index_t flann_load_index_with_distance_double(char* filename, double* dataset, int rows, int cols,
+                                                    flann_distance_t distance_type, int order)
+{
+    return _flann_load_index<double>(filename, dataset, rows, cols, distance_type, order);
+}
+
+flann_index_t flann_load_index_with_distance_byte(char* filename, unsigned char* dataset, int rows, int cols,
+                                                  flann_distance_t distance_type, int order)
+{
+    if (distance_type==FLANN_DIST_HAMMING) {
+        return create_index_handle(__flann_load_index<ByteHamming>(filename, dataset, rows, cols), FLANN_DIST_HAMMING, 0);
+    }
+    return _flann_load_index<unsigned char>(filename, dataset, rows, cols, distance_type, order);
+}
+
+flann_index_t flann_load_index_with_distance_int(char* filename, int* dataset, int rows, int cols,
+                                                 flann_distance_t distance_type, int order)
+{
+    return _flann_load_index<int>(filename, dataset, rows, cols, distance_type, order);
+}
+
+
+template<typename Distance>
+int __flann_save_index_to_buffer(flann_index_t index_ptr, const Compression& compression, size_t reserve,
+                                 void** buffer, size_t* size)
+{
+    try {
+        if (index_ptr==NULL) {
+            throw FLANNException("Invalid index");
+        }
+
+        Index<Distance>* index = get_index<Distance>(index_ptr);
+        MemoryOutputStream out;
+        index->save(out.stream(), compression);
+        *buffer = out.release(*size, reserve);
+
+        return 0;
+    }
+    catch (std::runtime_error& e) {
+        Logger::error("Caught exception: %s\n",e.what());
+        return -1;
+    }
+}
+
+template<typename T>
+int _flann_save_index_to_buffer(flann_index_t index_ptr, const Compression& compression, size_t reserve,
+                                void** buffer, size_t* size)
+{
+    flann_distance_t distance_type = index_distance_type(index_ptr);
+
+    if (distance_type==FLANN_DIST_EUCLIDEAN) {
+        return __flann_save_index_to_buffer<L2<T> >(index_ptr, compression, reserve, buffer, size);
+    }
+    else if (distance_type==FLANN_DIST_MANHATTAN) {
+        return __flann_save_index_to_buffer<L1<T> >(index_ptr, compression, reserve, buffer, size);
+    }
+    else if (distance_type==FLANN_DIST_MINKOWSKI) {
+        return __flann_save_index_to_buffer<MinkowskiDistance<T> >(index_ptr, compression, reserve, buffer, size);
+    }
+    else if (distance_type==FLANN_DIST_HIST_INTERSECT) {
+        return __flann_save_index_to_buffer<HistIntersectionDistance<T> >(index_ptr, compression, reserve, buffer, size);
+    }
+    else if (distance_type==FLANN_DIST_HELLINGER) {
+        return __flann_save_index_to_buffer<HellingerDistance<T> >(index_ptr, compression, reserve, buffer, size);
+    }
+    else if (distance_type==FLANN_DIST_CHI_SQUARE) {
+        return __flann_save_index_to_buffer<ChiSquareDistance<T> >(index_ptr, compression, reserve, buffer, size);
+    }
+    else if (distance_type==FLANN_DIST_KULLBACK_LEIBLER) {
+        return __flann_save_index_to_buffer<KL_Divergence<T> >(index_ptr, compression, reserve, buffer, size);
+    }
+    else {
+        Logger::error( "Distance type unsupported in the C bindings, use the C++ bindings instead\n");
+        return -1;
+    }
+}
+
+int flann_save_index_to_buffer(flann_index_t index_ptr, flann_compression_t compression, int level,
+                               size_t reserve, void** buffer, size_t* size)
+{
+    return _flann_save_index_to_buffer<float>(index_ptr, Compression(compression, level), reserve, buffer, size);
+}
+
+int flann_save_index_to_buffer_float(flann_index_t index_ptr, flann_compression_t compression, int level,
+                                     size_t reserve, void** buffer, size_t* size)
+{
+    return _flann_save_index_to_buffer<float>(index_ptr, Compression(compression, level), reserve, buffer, size);
+}
+
+int flann_save_index_to_buffer_double(flann_index_t index_ptr, flann_compression_t compression, int level,
+                                      size_t reserve, void** buffer, size_t* size)
+{
+    return _flann_save_index_to_buffer<double>(index_ptr, Compression(compression, level), reserve, buffer, size);
+}
+
+int flann_save_index_to_buffer_byte(flann_index_t index_ptr, flann_compression_t compression, int level,
+                                    size_t reserve, void** buffer, size_t* size)
+{
+    if (index_distance_type(index_ptr)==FLANN_DIST_HAMMING) {
+        return __flann_save_index_to_buffer<ByteHamming>(index_ptr, Compression(compression, level), reserve, buffer, size);
+    }
+    return _flann_save_index_to_buffer<unsigned char>(index_ptr, Compression(compression, level), reserve, buffer, size);
+}
+
+int flann_save_index_to_buffer_int(flann_index_t index_ptr, flann_compression_t compression, int level,
+                                   size_t reserve, void** buffer, size_t* size)
+{
+    return _flann_save_index_to_buffer<int>(index_ptr, Compression(compression, level), reserve, buffer, size);
+}
+
+void flann_free_buffer(void* buffer)
+{
+    free(buffer);
+}
+
+
+template<typename Distance>
+flann_index_t __flann_load_index_from_buffer(const void* buffer, size_t size, typename Distance::ElementType* dataset,
+                                             int rows, int cols, Distance d = Distance())
+{
+    FILE* stream = NULL;
+    try {
+        stream = open_memory_stream(buffer, size);
+        if (stream == NULL) {
+            throw FLANNException("Cannot open the buffer");
+        }
+        Index<Distance>* index = new Index<Distance>(Matrix<typename Distance::ElementType>(dataset,rows,cols), stream, d);
+        fclose(stream);
+        return index;
+    }
+    catch (std::runtime_error& e) {
+        if (stream != NULL) {
+            fclose(stream);
+        }
+        Logger::error("Caught exception: %s\n",e.what());
+        return NULL;
+    }
+}
+
+template<typename T>
+flann_index_t _flann_load_index_from_buffer(const void* buffer, size_t size, T* dataset, int rows, int cols,
+                                            flann_distance_t distance_type, int distance_order)
+{
+    flann_index_t index = NULL;
+    if (distance_type==FLANN_DIST_EUCLIDEAN) {
+        index = __flann_load_index_from_buffer<L2<T> >(buffer, size, dataset, rows, cols);
+    }
+    else if (distance_type==FLANN_DIST_MANHATTAN) {
+        index = __flann_load_index_from_buffer<L1<T> >(buffer, size, dataset, rows, cols);
+    }
+    else if (distance_type==FLANN_DIST_MINKOWSKI) {
+        index = __flann_load_index_from_buffer<MinkowskiDistance<T> >(buffer, size, dataset, rows, cols, MinkowskiDistance<T>(distance_order));
+    }
+    else if (distance_type==FLANN_DIST_HIST_INTERSECT) {
+        index = __flann_load_index_from_buffer<HistIntersectionDistance<T> >(buffer, size, dataset, rows, cols);
+    }
+    else if (distance_type==FLANN_DIST_HELLINGER) {
+        index = __flann_load_index_from_buffer<HellingerDistance<T> >(buffer, size, dataset, rows, cols);
+    }
+    else if (distance_type==FLANN_DIST_CHI_SQUARE) {
+        index = __flann_load_index_from_buffer<ChiSquareDistance<T> >(buffer, size, dataset, rows, cols);
+    }
+    else if (distance_type==FLANN_DIST_KULLBACK_LEIBLER) {
+        index = __flann_load_index_from_buffer<KL_Divergence<T> >(buffer, size, dataset, rows, cols);
+    }
+    else {
+        Logger::error( "Distance type unsupported in the C bindings, use the C++ bindings instead\n");
+    }
+    return create_index_handle(index, distance_type, distance_order);
+}
+
+flann_index_t flann_load_index_from_buffer(const void* buffer, size_t size, float* dataset, int rows, int cols,
+                                           flann_distance_t distance_type, int order)
+{
+    return _flann_load_index_from_buffer<float>(buffer, size, dataset, rows, cols, distance_type, order);
+}
+
+flann_index_t flann_load_index_from_buffer_float(const void* buffer, size_t size, float* dataset, int rows, int cols,
+                                                 flann_distance_t distance_type, int order)
+{
+    return _flann_load_index_from_buffer<float>(buffer, size, dataset, rows, cols, distance_type, order);
+}
+
+flann_index_t flann_load_index_from_buffer_double(const void* buffer, size_t size, double* dataset, int rows, int cols,
+                                                  flann_distance_t distance_type, int order)
+{
+    return _flann_load_index_from_buffer<double>(buffer, size, dataset, rows, cols, distance_type, order);
+}
+
+flann_index_t flann_load_index_from_buffer_byte(const void* buffer, size_t size, unsigned char* dataset, int rows, int cols,
+                                                flann_distance_t distance_type, int order)
+{
+    if (distance_type==FLANN_DIST_HAMMING) {
+        return create_index_handle(__flann_load_index_from_buffer<ByteHamming>(buffer, size, dataset, rows, cols), FLANN_DIST_HAMMING, 0);
+    }
+    return _flann_load_index_from_buffer<unsigned char>(buffer, size, dataset, rows, cols, distance_type, order);
+}
+
+flann_index_t flann_load_index_from_buffer_int(const void* buffer, size_t size, int* dataset, int rows, int cols,
+                                               flann_distance_t distance_type, int order)
+{
+    return _flann_load_index_from_buffer<int>(buffer, size, dataset, rows, cols, distance_type, order);
 }
 
 
@@ -681,25 +1377,28 @@ template<typename T, typename R>
 int _flann_find_nearest_neighbors(T* dataset,  int rows, int cols, T* testset, int tcount,
                                   int* result, R* dists, int nn, FLANNParameters* flann_params)
 {
-    if (flann_distance_type==FLANN_DIST_EUCLIDEAN) {
+    flann_distance_t distance_type = params_distance_type(flann_params);
+    int distance_order = params_distance_order(flann_params);
+
+    if (distance_type==FLANN_DIST_EUCLIDEAN) {
         return __flann_find_nearest_neighbors<L2<T> >(dataset, rows, cols, testset, tcount, result, dists, nn, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_MANHATTAN) {
+    else if (distance_type==FLANN_DIST_MANHATTAN) {
         return __flann_find_nearest_neighbors<L1<T> >(dataset, rows, cols, testset, tcount, result, dists, nn, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_MINKOWSKI) {
-        return __flann_find_nearest_neighbors<MinkowskiDistance<T> >(dataset, rows, cols, testset, tcount, result, dists, nn, flann_params, MinkowskiDistance<T>(flann_distance_order));
+    else if (distance_type==FLANN_DIST_MINKOWSKI) {
+        return __flann_find_nearest_neighbors<MinkowskiDistance<T> >(dataset, rows, cols, testset, tcount, result, dists, nn, flann_params, MinkowskiDistance<T>(distance_order));
     }
-    else if (flann_distance_type==FLANN_DIST_HIST_INTERSECT) {
+    else if (distance_type==FLANN_DIST_HIST_INTERSECT) {
         return __flann_find_nearest_neighbors<HistIntersectionDistance<T> >(dataset, rows, cols, testset, tcount, result, dists, nn, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_HELLINGER) {
+    else if (distance_type==FLANN_DIST_HELLINGER) {
         return __flann_find_nearest_neighbors<HellingerDistance<T> >(dataset, rows, cols, testset, tcount, result, dists, nn, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_CHI_SQUARE) {
+    else if (distance_type==FLANN_DIST_CHI_SQUARE) {
         return __flann_find_nearest_neighbors<ChiSquareDistance<T> >(dataset, rows, cols, testset, tcount, result, dists, nn, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_KULLBACK_LEIBLER) {
+    else if (distance_type==FLANN_DIST_KULLBACK_LEIBLER) {
         return __flann_find_nearest_neighbors<KL_Divergence<T> >(dataset, rows, cols, testset, tcount, result, dists, nn, flann_params);
     }
     else {
@@ -725,6 +1424,9 @@ int flann_find_nearest_neighbors_double(double* dataset,  int rows, int cols, do
 
 int flann_find_nearest_neighbors_byte(unsigned char* dataset,  int rows, int cols, unsigned char* testset, int tcount, int* result, float* dists, int nn, FLANNParameters* flann_params)
 {
+    if (params_distance_type(flann_params)==FLANN_DIST_HAMMING) {
+        return __flann_find_nearest_neighbors<ByteHamming>(dataset, rows, cols, testset, tcount, result, dists, nn, flann_params);
+    }
     return _flann_find_nearest_neighbors(dataset, rows, cols, testset, tcount, result, dists, nn, flann_params);
 }
 
@@ -746,7 +1448,7 @@ int __flann_find_nearest_neighbors_index(flann_index_t index_ptr, typename Dista
         if (index_ptr==NULL) {
             throw FLANNException("Invalid index");
         }
-        Index<Distance>* index = (Index<Distance>*)index_ptr;
+        Index<Distance>* index = get_index<Distance>(index_ptr);
 
         Matrix<int> m_indices(result,tcount, nn);
         Matrix<DistanceType> m_dists(dists, tcount, nn);
@@ -770,25 +1472,27 @@ template<typename T, typename R>
 int _flann_find_nearest_neighbors_index(flann_index_t index_ptr, T* testset, int tcount,
                                         int* result, R* dists, int nn, FLANNParameters* flann_params)
 {
-    if (flann_distance_type==FLANN_DIST_EUCLIDEAN) {
+    flann_distance_t distance_type = index_distance_type(index_ptr);
+
+    if (distance_type==FLANN_DIST_EUCLIDEAN) {
         return __flann_find_nearest_neighbors_index<L2<T> >(index_ptr, testset, tcount, result, dists, nn, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_MANHATTAN) {
+    else if (distance_type==FLANN_DIST_MANHATTAN) {
         return __flann_find_nearest_neighbors_index<L1<T> >(index_ptr, testset, tcount, result, dists, nn, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_MINKOWSKI) {
+    else if (distance_type==FLANN_DIST_MINKOWSKI) {
         return __flann_find_nearest_neighbors_index<MinkowskiDistance<T> >(index_ptr, testset, tcount, result, dists, nn, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_HIST_INTERSECT) {
+    else if (distance_type==FLANN_DIST_HIST_INTERSECT) {
         return __flann_find_nearest_neighbors_index<HistIntersectionDistance<T> >(index_ptr, testset, tcount, result, dists, nn, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_HELLINGER) {
+    else if (distance_type==FLANN_DIST_HELLINGER) {
         return __flann_find_nearest_neighbors_index<HellingerDistance<T> >(index_ptr, testset, tcount, result, dists, nn, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_CHI_SQUARE) {
+    else if (distance_type==FLANN_DIST_CHI_SQUARE) {
         return __flann_find_nearest_neighbors_index<ChiSquareDistance<T> >(index_ptr, testset, tcount, result, dists, nn, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_KULLBACK_LEIBLER) {
+    else if (distance_type==FLANN_DIST_KULLBACK_LEIBLER) {
         return __flann_find_nearest_neighbors_index<KL_Divergence<T> >(index_ptr, testset, tcount, result, dists, nn, flann_params);
     }
     else {
@@ -815,6 +1519,9 @@ int flann_find_nearest_neighbors_index_double(flann_index_t index_ptr, double* t
 
 int flann_find_nearest_neighbors_index_byte(flann_index_t index_ptr, unsigned char* testset, int tcount, int* result, float* dists, int nn, FLANNParameters* flann_params)
 {
+    if (index_distance_type(index_ptr)==FLANN_DIST_HAMMING) {
+        return __flann_find_nearest_neighbors_index<ByteHamming>(index_ptr, testset, tcount, result, dists, nn, flann_params);
+    }
     return _flann_find_nearest_neighbors_index(index_ptr, testset, tcount, result, dists, nn, flann_params);
 }
 
@@ -841,7 +1548,7 @@ int __flann_radius_search(flann_index_t index_ptr,
         if (index_ptr==NULL) {
             throw FLANNException("Invalid index");
         }
-        Index<Distance>* index = (Index<Distance>*)index_ptr;
+        Index<Distance>* index = get_index<Distance>(index_ptr);
 
         Matrix<int> m_indices(indices, 1, max_nn);
         Matrix<DistanceType> m_dists(dists, 1, max_nn);
@@ -868,25 +1575,27 @@ int _flann_radius_search(flann_index_t index_ptr,
                          float radius,
                          FLANNParameters* flann_params)
 {
-    if (flann_distance_type==FLANN_DIST_EUCLIDEAN) {
+    flann_distance_t distance_type = index_distance_type(index_ptr);
+
+    if (distance_type==FLANN_DIST_EUCLIDEAN) {
         return __flann_radius_search<L2<T> >(index_ptr, query, indices, dists, max_nn, radius, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_MANHATTAN) {
+    else if (distance_type==FLANN_DIST_MANHATTAN) {
         return __flann_radius_search<L1<T> >(index_ptr, query, indices, dists, max_nn, radius, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_MINKOWSKI) {
+    else if (distance_type==FLANN_DIST_MINKOWSKI) {
         return __flann_radius_search<MinkowskiDistance<T> >(index_ptr, query, indices, dists, max_nn, radius, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_HIST_INTERSECT) {
+    else if (distance_type==FLANN_DIST_HIST_INTERSECT) {
         return __flann_radius_search<HistIntersectionDistance<T> >(index_ptr, query, indices, dists, max_nn, radius, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_HELLINGER) {
+    else if (distance_type==FLANN_DIST_HELLINGER) {
         return __flann_radius_search<HellingerDistance<T> >(index_ptr, query, indices, dists, max_nn, radius, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_CHI_SQUARE) {
+    else if (distance_type==FLANN_DIST_CHI_SQUARE) {
         return __flann_radius_search<ChiSquareDistance<T> >(index_ptr, query, indices, dists, max_nn, radius, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_KULLBACK_LEIBLER) {
+    else if (distance_type==FLANN_DIST_KULLBACK_LEIBLER) {
         return __flann_radius_search<KL_Divergence<T> >(index_ptr, query, indices, dists, max_nn, radius, flann_params);
     }
     else {
@@ -936,6 +1645,9 @@ int flann_radius_search_byte(flann_index_t index_ptr,
                              float radius,
                              FLANNParameters* flann_params)
 {
+    if (index_distance_type(index_ptr)==FLANN_DIST_HAMMING) {
+        return __flann_radius_search<ByteHamming>(index_ptr, query, indices, dists, max_nn, radius, flann_params);
+    }
     return _flann_radius_search(index_ptr, query, indices, dists, max_nn, radius, flann_params);
 }
 
@@ -951,6 +1663,129 @@ int flann_radius_search_int(flann_index_t index_ptr,
 }
 
 
+template<typename Distance>
+int __flann_radius_search_batch(flann_index_t index_ptr,
+                                typename Distance::ElementType* testset,
+                                int trows,
+                                int* offsets,
+                                int* indices,
+                                typename Distance::ResultType* dists,
+                                int max_total,
+                                float radius,
+                                FLANNParameters* flann_params)
+{
+    typedef typename Distance::ElementType ElementType;
+    typedef typename Distance::ResultType DistanceType;
+
+    try {
+        init_flann_parameters(flann_params);
+        if (index_ptr==NULL) {
+            throw FLANNException("Invalid index");
+        }
+        Index<Distance>* index = get_index<Distance>(index_ptr);
+
+        std::vector<std::vector<size_t> > v_indices;
+        std::vector<std::vector<DistanceType> > v_dists;
+        SearchParams search_params = create_search_params(flann_params);
+        index->radiusSearch(Matrix<ElementType>(testset, trows, index->veclen()),
+                            v_indices,
+                            v_dists, radius, search_params );
+
+        int total = 0;
+        offsets[0] = 0;
+        for (int i=0;i<trows;++i) {
+            // no neighbors are stored when max_neighbors is 0
+            int n = (i<(int)v_indices.size()) ? (int)v_indices[i].size() : 0;
+            for (int j=0;j<n && total+j<max_total;++j) {
+                indices[total+j] = (int)v_indices[i][j];
+                dists[total+j] = v_dists[i][j];
+            }
+            total += n;
+            offsets[i+1] = total;
+        }
+
+        return total;
+    }
+    catch (std::runtime_error& e) {
+        Logger::error("Caught exception: %s\n",e.what());
+        return -1;
+    }
+}
+
+template<typename T, typename R>
+int _flann_radius_search_batch(flann_index_t index_ptr,
+                               T* testset,
+                               int trows,
+                               int* offsets,
+                               int* indices,
+                               R* dists,
+                               int max_total,
+                               float radius,
+                               FLANNParameters* flann_params)
+{
+    flann_distance_t distance_type = index_distance_type(index_ptr);
+
+    if (distance_type==FLANN_DIST_EUCLIDEAN) {
+        return __flann_radius_search_batch<L2<T> >(index_ptr, testset, trows, offsets, indices, dists, max_total, radius, flann_params);
+    }
+    else if (distance_type==FLANN_DIST_MANHATTAN) {
+        return __flann_radius_search_batch<L1<T> >(index_ptr, testset, trows, offsets, indices, dists, max_total, radius, flann_params);
+    }
+    else if (distance_type==FLANN_DIST_MINKOWSKI) {
+        return __flann_radius_search_batch<MinkowskiDistance<T> >(index_ptr, testset, trows, offsets, indices, dists, max_total, radius, flann_params);
+    }
+    else if (distance_type==FLANN_DIST_HIST_INTERSECT) {
+        return __flann_radius_search_batch<HistIntersectionDistance<T> >(index_ptr, testset, trows, offsets, indices, dists, max_total, radius, flann_params);
+    }
+    else if (distance_type==FLANN_DIST_HELLINGER) {
+        return __flann_radius_search_batch<HellingerDistance<T> >(index_ptr, testset, trows, offsets, indices, dists, max_total, radius, flann_params);
+    }
+    else if (distance_type==FLANN_DIST_CHI_SQUARE) {
+        return __flann_radius_search_batch<ChiSquareDistance<T> >(index_ptr, testset, trows, offsets, indices, dists, max_total, radius, flann_params);
+    }
+    else if (distance_type==FLANN_DIST_KULLBACK_LEIBLER) {
+        return __flann_radius_search_batch<KL_Divergence<T> >(index_ptr, testset, trows, offsets, indices, dists, max_total, radius, flann_params);
+    }
+    else {
+        Logger::error( "Distance type unsupported in the C bindings, use the C++ bindings instead\n");
+        return -1;
+    }
+}
+
+int flann_radius_search_batch(flann_index_t index_ptr, float* testset, int trows, int* offsets, int* indices, float* dists,
+                              int max_total, float radius, FLANNParameters* flann_params)
+{
+    return _flann_radius_search_batch(index_ptr, testset, trows, offsets, indices, dists, max_total, radius, flann_params);
+}
+
+int flann_radius_search_batch_float(flann_index_t index_ptr, float* testset, int trows, int* offsets, int* indices, float* dists,
+                                    int max_total, float radius, FLANNParameters* flann_params)
+{
+    return _flann_radius_search_batch(index_ptr, testset, trows, offsets, indices, dists, max_total, radius, flann_params);
+}
+
+int flann_radius_search_batch_double(flann_index_t index_ptr, double* testset, int trows, int* offsets, int* indices, double* dists,
+                                     int max_total, float radius, FLANNParameters* flann_params)
+{
+    return _flann_radius_search_batch(index_ptr, testset, trows, offsets, indices, dists, max_total, radius, flann_params);
+}
+
+int flann_radius_search_batch_byte(flann_index_t index_ptr, unsigned char* testset, int trows, int* offsets, int* indices, float* dists,
+                                   int max_total, float radius, FLANNParameters* flann_params)
+{
+    if (index_distance_type(index_ptr)==FLANN_DIST_HAMMING) {
+        return __flann_radius_search_batch<ByteHamming>(index_ptr, testset, trows, offsets, indices, dists, max_total, radius, flann_params);
+    }
+    return _flann_radius_search_batch(index_ptr, testset, trows, offsets, indices, dists, max_total, radius, flann_params);
+}
+
+int flann_radius_search_batch_int(flann_index_t index_ptr, int* testset, int trows, int* offsets, int* indices, float* dists,
+                                  int max_total, float radius, FLANNParameters* flann_params)
+{
+    return _flann_radius_search_batch(index_ptr, testset, trows, offsets, indices, dists, max_total, radius, flann_params);
+}
+
+
 template<typename Distance>
 int __flann_free_index(flann_index_t index_ptr, FLANNParameters* flann_params)
 {
@@ -959,8 +1794,9 @@ int __flann_free_index(flann_index_t index_ptr, FLANNParameters* flann_params)
         if (index_ptr==NULL) {
             throw FLANNException("Invalid index");
         }
-        Index<Distance>* index = (Index<Distance>*)index_ptr;
+        Index<Distance>* index = get_index<Distance>(index_ptr);
         delete index;
+        delete (IndexHandle*)index_ptr;
 
         return 0;
     }
@@ -973,25 +1809,27 @@ int __flann_free_index(flann_index_t index_ptr, FLANNParameters* flann_params)
 template<typename T>
 int _flann_free_index(flann_index_t index_ptr, FLANNParameters* flann_params)
 {
-    if (flann_distance_type==FLANN_DIST_EUCLIDEAN) {
+    flann_distance_t distance_type = index_distance_type(index_ptr);
+
+    if (distance_type==FLANN_DIST_EUCLIDEAN) {
         return __flann_free_index<L2<T> >(index_ptr, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_MANHATTAN) {
+    else if (distance_type==FLANN_DIST_MANHATTAN) {
         return __flann_free_index<L1<T> >(index_ptr, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_MINKOWSKI) {
+    else if (distance_type==FLANN_DIST_MINKOWSKI) {
         return __flann_free_index<MinkowskiDistance<T> >(index_ptr, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_HIST_INTERSECT) {
+    else if (distance_type==FLANN_DIST_HIST_INTERSECT) {
         return __flann_free_index<HistIntersectionDistance<T> >(index_ptr, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_HELLINGER) {
+    else if (distance_type==FLANN_DIST_HELLINGER) {
         return __flann_free_index<HellingerDistance<T> >(index_ptr, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_CHI_SQUARE) {
+    else if (distance_type==FLANN_DIST_CHI_SQUARE) {
         return __flann_free_index<ChiSquareDistance<T> >(index_ptr, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_KULLBACK_LEIBLER) {
+    else if (distance_type==FLANN_DIST_KULLBACK_LEIBLER) {
         return __flann_free_index<KL_Divergence<T> >(index_ptr, flann_params);
     }
     else {
@@ -1017,6 +1855,9 @@ int flann_free_index_double(flann_index_t index_ptr, FLANNParameters* flann_para
 
 int flann_free_index_byte(flann_index_t index_ptr, FLANNParameters* flann_params)
 {
+    if (index_distance_type(index_ptr)==FLANN_DIST_HAMMING) {
+        return __flann_free_index<ByteHamming>(index_ptr, flann_params);
+    }
     return _flann_free_index<unsigned char>(index_ptr, flann_params);
 }
 
@@ -1038,6 +1879,7 @@ int __flann_compute_cluster_centers(typename Distance::ElementType* dataset, int
 
         Matrix<ElementType> inputData(dataset,rows,cols);
         KMeansIndexParams params(flann_params->branching, flann_params->iterations, flann_params->centers_init, flann_params->cb_index);
+        params["cores"] = flann_params->cores;
         Matrix<DistanceType> centers(result,clusters,cols);
         int clusterNum = hierarchicalClustering<Distance>(inputData, centers, params, d);
 
@@ -1053,25 +1895,28 @@ int __flann_compute_cluster_centers(typename Distance::ElementType* dataset, int
 template<typename T, typename R>
 int _flann_compute_cluster_centers(T* dataset, int rows, int cols, int clusters, R* result, FLANNParameters* flann_params)
 {
-    if (flann_distance_type==FLANN_DIST_EUCLIDEAN) {
+    flann_distance_t distance_type = params_distance_type(flann_params);
+    int distance_order = params_distance_order(flann_params);
+
+    if (distance_type==FLANN_DIST_EUCLIDEAN) {
         return __flann_compute_cluster_centers<L2<T> >(dataset, rows, cols, clusters, result, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_MANHATTAN) {
+    else if (distance_type==FLANN_DIST_MANHATTAN) {
         return __flann_compute_cluster_centers<L1<T> >(dataset, rows, cols, clusters, result, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_MINKOWSKI) {
-        return __flann_compute_cluster_centers<MinkowskiDistance<T> >(dataset, rows, cols, clusters, result, flann_params, MinkowskiDistance<T>(flann_distance_order));
+    else if (distance_type==FLANN_DIST_MINKOWSKI) {
+        return __flann_compute_cluster_centers<MinkowskiDistance<T> >(dataset, rows, cols, clusters, result, flann_params, MinkowskiDistance<T>(distance_order));
     }
-    else if (flann_distance_type==FLANN_DIST_HIST_INTERSECT) {
+    else if (distance_type==FLANN_DIST_HIST_INTERSECT) {
         return __flann_compute_cluster_centers<HistIntersectionDistance<T> >(dataset, rows, cols, clusters, result, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_HELLINGER) {
+    else if (distance_type==FLANN_DIST_HELLINGER) {
         return __flann_compute_cluster_centers<HellingerDistance<T> >(dataset, rows, cols, clusters, result, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_CHI_SQUARE) {
+    else if (distance_type==FLANN_DIST_CHI_SQUARE) {
         return __flann_compute_cluster_centers<ChiSquareDistance<T> >(dataset, rows, cols, clusters, result, flann_params);
     }
-    else if (flann_distance_type==FLANN_DIST_KULLBACK_LEIBLER) {
+    else if (distance_type==FLANN_DIST_KULLBACK_LEIBLER) {
         return __flann_compute_cluster_centers<KL_Divergence<T> >(dataset, rows, cols, clusters, result, flann_params);
     }
     else {
@@ -1105,3 +1950,57 @@ int flann_compute_cluster_centers_int(int* dataset, int rows, int cols, int clus
     return _flann_compute_cluster_centers(dataset, rows, cols, clusters, result, flann_params);
 }
 
+
+template<typename T, typename R>
+int _flann_kmeans(T* dataset, int rows, int cols, int clusters, R* centers, int* labels, double* inertia,
+                  int batch_size, FLANNParameters* flann_params)
+{
+    try {
+        init_flann_parameters(flann_params);
+        if (params_distance_type(flann_params)!=FLANN_DIST_EUCLIDEAN) {
+            throw FLANNException("k-means clustering needs the euclidean distance");
+        }
+
+        Matrix<T> inputData(dataset,rows,cols);
+        KMeansClusteringParams params(flann_params->iterations, batch_size, flann_params->trees,
+                                      flann_params->checks, flann_params->cores);
+        Matrix<R> centersMatrix(centers,clusters,cols);
+
+        return kmeansClustering(inputData, centersMatrix, params, labels, inertia);
+    }
+    catch (std::runtime_error& e) {
+        Logger::error("Caught exception: %s\n",e.what());
+        return -1;
+    }
+}
+
+int flann_kmeans(float* dataset, int rows, int cols, int clusters, float* centers, int* labels, double* inertia,
+                 int batch_size, FLANNParameters* flann_params)
+{
+    return _flann_kmeans(dataset, rows, cols, clusters, centers, labels, inertia, batch_size, flann_params);
+}
+
+int flann_kmeans_float(float* dataset, int rows, int cols, int clusters, float* centers, int* labels, double* inertia,
+                       int batch_size, FLANNParameters* flann_params)
+{
+    return _flann_kmeans(dataset, rows, cols, clusters, centers, labels, inertia, batch_size, flann_params);
+}
+
+int flann_kmeans_double(double* dataset, int rows, int cols, int clusters, double* centers, int* labels, double* inertia,
+                        int batch_size, FLANNParameters* flann_params)
+{
+    return _flann_kmeans(dataset, rows, cols, clusters, centers, labels, inertia, batch_size, flann_params);
+}
+
+int flann_kmeans_byte(unsigned char* dataset, int rows, int cols, int clusters, float* centers, int* labels, double* inertia,
+                      int batch_size, FLANNParameters* flann_params)
+{
+    return _flann_kmeans(dataset, rows, cols, clusters, centers, labels, inertia, batch_size, flann_params);
+}
+
+int flann_kmeans_int(int* dataset, int rows, int cols, int clusters, float* centers, int* labels, double* inertia,
+                     int batch_size, FLANNParameters* flann_params)
+{
+    return _flann_kmeans(dataset, rows, cols, clusters, centers, labels, inertia, batch_size, flann_params);
+}
+
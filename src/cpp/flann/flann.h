@@ -31,6 +31,8 @@
 #ifndef FLANN_H_
 #define FLANN_H_
 
+#include <stddef.h>
+
 #include "defines.h"
 
 #ifdef __cplusplus
@@ -75,6 +77,18 @@ struct FLANNParameters
     /* other parameters */
     enum flann_log_level_t log_level;    /* determines the verbosity of each flann function */
     long random_seed;            /* random seed to use */
+
+    /* distance parameters */
+    enum flann_distance_t distance_type; /* distance of the indexes built with these parameters, 0 for the one set with flann_set_distance_type */
+    int distance_order;          /* order of the minkowski distance */
+
+    /* product quantization parameters */
+    int subquantizers;           /* number of sub-vectors the points are split in, each encoded in one byte */
+    int rerank;                  /* number of candidates re-ranked with the exact distance, 0 to search the codes only */
+
+    /* hnsw parameters */
+    int connections;             /* number of links of a point on the upper layers of the graph, twice as many on the bottom one */
+    int ef_construction;         /* size of the candidate list when inserting a point */
 };
 
 
@@ -97,6 +111,13 @@ FLANN_EXPORT void flann_log_verbosity(int level);
  * Sets the distance type to use throughout FLANN.
  * If distance type specified is MINKOWSKI, the second argument
  * specifies which order the minkowski distance should have.
+ *
+ * The distance is used by the indexes built or loaded afterwards, unless
+ * the distance_type field of their parameters is set. An index keeps
+ * the distance it was created with.
+ *
+ * FLANN_DIST_HAMMING is only supported by the byte variants, for binary
+ * descriptors, with the linear, hierarchical and lsh algorithms.
  */
 FLANN_EXPORT void flann_set_distance_type(enum flann_distance_t distance_type, int order);
 
@@ -111,6 +132,16 @@ FLANN_EXPORT enum flann_distance_t flann_get_distance_type();
  */
 FLANN_EXPORT int flann_get_distance_order();
 
+/**
+ * Gets the distance type used by an index.
+ */
+FLANN_EXPORT enum flann_distance_t flann_get_index_distance_type(flann_index_t index_ptr);
+
+/**
+ * Gets the order of the minkowski distance used by an index.
+ */
+FLANN_EXPORT int flann_get_index_distance_order(flann_index_t index_ptr);
+
 /**
    Builds and returns an index. It uses autotuning if the target_precision field of index_params
    is between 0 and 1, or the parameters specified if it's -1.
@@ -228,6 +259,105 @@ FLANN_EXPORT void flann_remove_point_int(flann_index_t index_ptr, int id_);
 FLANN_EXPORT void flann_remove_point_byte(flann_index_t index_ptr, int id_);
 
 
+/**
+    Removes several points from the index
+
+    Params:
+        index_id The index that should be modified
+        ids = ids of the points to be removed, ids not in the index are ignored
+        count = number of ids
+
+    Returns: void
+*/
+
+FLANN_EXPORT void flann_remove_points(flann_index_t index_ptr, int* ids, int count);
+
+FLANN_EXPORT void flann_remove_points_float(flann_index_t index_ptr, int* ids, int count);
+
+FLANN_EXPORT void flann_remove_points_double(flann_index_t index_ptr, int* ids, int count);
+
+FLANN_EXPORT void flann_remove_points_int(flann_index_t index_ptr, int* ids, int count);
+
+FLANN_EXPORT void flann_remove_points_byte(flann_index_t index_ptr, int* ids, int count);
+
+
+/**
+    Makes an index use new copies of some of its points, for example after
+    the buffer holding them was reallocated. The old copies can be freed
+    once the call returns.
+
+    Params:
+        index_ptr = the index to modify
+        first_id = id of the point stored in the first row of dataset
+        dataset = the new copies of the points with ids first_id to
+                  first_id+rows-1, in row major order
+        rows = number of rows in dataset
+
+    Returns: zero or a number <0 for error
+*/
+FLANN_EXPORT int flann_relocate_points(flann_index_t index_ptr, int first_id, float* dataset, int rows);
+
+FLANN_EXPORT int flann_relocate_points_float(flann_index_t index_ptr, int first_id, float* dataset, int rows);
+
+FLANN_EXPORT int flann_relocate_points_double(flann_index_t index_ptr, int first_id, double* dataset, int rows);
+
+FLANN_EXPORT int flann_relocate_points_int(flann_index_t index_ptr, int first_id, int* dataset, int rows);
+
+FLANN_EXPORT int flann_relocate_points_byte(flann_index_t index_ptr, int first_id, unsigned char* dataset, int rows);
+
+
+/**
+    Creates an independent copy of an index. The copy shares the dataset
+    of the original index and must be released with flann_free_index.
+
+    Params:
+        index_ptr = the index to copy
+        flann_params = generic flann parameters
+
+    Returns: the new index or NULL on error
+*/
+FLANN_EXPORT flann_index_t flann_clone_index(flann_index_t index_ptr,
+                                             struct FLANNParameters* flann_params);
+
+FLANN_EXPORT flann_index_t flann_clone_index_float(flann_index_t index_ptr,
+                                                   struct FLANNParameters* flann_params);
+
+FLANN_EXPORT flann_index_t flann_clone_index_double(flann_index_t index_ptr,
+                                                    struct FLANNParameters* flann_params);
+
+FLANN_EXPORT flann_index_t flann_clone_index_byte(flann_index_t index_ptr,
+                                                  struct FLANNParameters* flann_params);
+
+FLANN_EXPORT flann_index_t flann_clone_index_int(flann_index_t index_ptr,
+                                                 struct FLANNParameters* flann_params);
+
+
+/**
+    Rebuilds an index over its current points, discarding the points that
+    have been removed. The ids of the remaining points are preserved.
+
+    Params:
+        index_ptr = the index to rebuild
+        flann_params = generic flann parameters
+
+    Returns: zero or a number <0 for error
+*/
+FLANN_EXPORT int flann_rebuild_index(flann_index_t index_ptr,
+                                     struct FLANNParameters* flann_params);
+
+FLANN_EXPORT int flann_rebuild_index_float(flann_index_t index_ptr,
+                                           struct FLANNParameters* flann_params);
+
+FLANN_EXPORT int flann_rebuild_index_double(flann_index_t index_ptr,
+                                            struct FLANNParameters* flann_params);
+
+FLANN_EXPORT int flann_rebuild_index_byte(flann_index_t index_ptr,
+                                          struct FLANNParameters* flann_params);
+
+FLANN_EXPORT int flann_rebuild_index_int(flann_index_t index_ptr,
+                                         struct FLANNParameters* flann_params);
+
+
 /**
  * Saves the index to a file. Only the index is saved into the file, the dataset corresponding to the index is not saved.
  *
@@ -250,6 +380,45 @@ FLANN_EXPORT int flann_save_index_byte(flann_index_t index_id,
 FLANN_EXPORT int flann_save_index_int(flann_index_t index_id,
                                       char* filename);
 
+/**
+ * Saves the index to a file, as flann_save_index does, with the given
+ * compression. The data is compressed in independent blocks, by as many
+ * threads as OpenMP uses. Uncompressed indexes are loaded by reading the
+ * file directly, or from a memory mapping of the file with
+ * flann_load_index_from_buffer.
+ *
+ * @param index_id The index that should be saved
+ * @param filename The filename the index should be saved to
+ * @param compression FLANN_COMPRESSION_NONE, FLANN_COMPRESSION_LZ4 or FLANN_COMPRESSION_LZ4HC
+ * @param level The acceleration of FLANN_COMPRESSION_LZ4 (1 by default, higher
+ *        is faster) or the level of FLANN_COMPRESSION_LZ4HC (1 to 16, 9 by default)
+ * @return Returns 0 on success, negative value on error.
+ */
+FLANN_EXPORT int flann_save_index_with_compression(flann_index_t index_id,
+                                                   char* filename,
+                                                   enum flann_compression_t compression,
+                                                   int level);
+
+FLANN_EXPORT int flann_save_index_with_compression_float(flann_index_t index_id,
+                                                         char* filename,
+                                                         enum flann_compression_t compression,
+                                                         int level);
+
+FLANN_EXPORT int flann_save_index_with_compression_double(flann_index_t index_id,
+                                                          char* filename,
+                                                          enum flann_compression_t compression,
+                                                          int level);
+
+FLANN_EXPORT int flann_save_index_with_compression_byte(flann_index_t index_id,
+                                                        char* filename,
+                                                        enum flann_compression_t compression,
+                                                        int level);
+
+FLANN_EXPORT int flann_save_index_with_compression_int(flann_index_t index_id,
+                                                       char* filename,
+                                                       enum flann_compression_t compression,
+                                                       int level);
+
 /**
  * Loads an index from a file.
  *
@@ -284,6 +453,161 @@ FLANN_EXPORT flann_index_t flann_load_index_int(char* filename,
                                                 int rows,
                                                 int cols);
 
+/**
+ * Loads an index from a file, using the given distance instead of the one
+ * set with flann_set_distance_type.
+ *
+ * @param filename File to load the index from.
+ * @param dataset The dataset corresponding to the index.
+ * @param rows Dataset tors
+ * @param cols Dataset columns
+ * @param distance_type The distance the index was built with
+ * @param order The order of the minkowski distance
+ * @return
+ */
+FLANN_EXPORT flann_index_t flann_load_index_with_distance(char* filename,
+                                                          float* dataset,
+                                                          int rows,
+                                                          int cols,
+                                                          enum flann_distance_t distance_type,
+                                                          int order);
+
+FLANN_EXPORT flann_index_t flann_load_index_with_distance_float(char* filename,
+                                                                float* dataset,
+                                                                int rows,
+                                                                int cols,
+                                                                enum flann_distance_t distance_type,
+                                                                int order);
+
+FLANN_EXPORT flann_index_t flann_load_index_with_distance_double(char* filename,
+                                                                 double* dataset,
+                                                                 int rows,
+                                                                 int cols,
+                                                                 enum flann_distance_t distance_type,
+                                                                 int order);
+
+FLANN_EXPORT flann_index_t flann_load_index_with_distance_byte(char* filename,
+                                                               unsigned char* dataset,
+                                                               int rows,
+                                                               int cols,
+                                                               enum flann_distance_t distance_type,
+                                                               int order);
+
+FLANN_EXPORT flann_index_t flann_load_index_with_distance_int(char* filename,
+                                                              int* dataset,
+                                                              int rows,
+                                                              int cols,
+                                                              enum flann_distance_t distance_type,
+                                                              int order);
+
+/**
+ * Saves the index, as flann_save_index does, to a memory buffer allocated
+ * by the library, which the caller frees with flann_free_buffer.
+ *
+ * @param index_id The index that should be saved
+ * @param compression How the index is compressed
+ * @param level The acceleration of FLANN_COMPRESSION_LZ4 or the level of FLANN_COMPRESSION_LZ4HC
+ * @param reserve Number of bytes left free after the index in the buffer,
+ *        e.g. for the caller to append data without copying the buffer
+ * @param buffer Set to the buffer
+ * @param size Set to the size of the saved index, without the reserved bytes
+ * @return Returns 0 on success, negative value on error.
+ */
+FLANN_EXPORT int flann_save_index_to_buffer(flann_index_t index_id,
+                                            enum flann_compression_t compression,
+                                            int level,
+                                            size_t reserve,
+                                            void** buffer,
+                                            size_t* size);
+
+FLANN_EXPORT int flann_save_index_to_buffer_float(flann_index_t index_id,
+                                                  enum flann_compression_t compression,
+                                                  int level,
+                                                  size_t reserve,
+                                                  void** buffer,
+                                                  size_t* size);
+
+FLANN_EXPORT int flann_save_index_to_buffer_double(flann_index_t index_id,
+                                                   enum flann_compression_t compression,
+                                                   int level,
+                                                   size_t reserve,
+                                                   void** buffer,
+                                                   size_t* size);
+
+FLANN_EXPORT int flann_save_index_to_buffer_byte(flann_index_t index_id,
+                                                 enum flann_compression_t compression,
+                                                 int level,
+                                                 size_t reserve,
+                                                 void** buffer,
+                                                 size_t* size);
+
+FLANN_EXPORT int flann_save_index_to_buffer_int(flann_index_t index_id,
+                                                enum flann_compression_t compression,
+                                                int level,
+                                                size_t reserve,
+                                                void** buffer,
+                                                size_t* size);
+
+/**
+ * Frees a buffer allocated by flann_save_index_to_buffer.
+ */
+FLANN_EXPORT void flann_free_buffer(void* buffer);
+
+/**
+ * Loads an index from a memory buffer holding an index saved with
+ * flann_save_index or flann_save_index_to_buffer. The buffer is read in
+ * place and may be freed once the function returns. Data following the
+ * index in the buffer is ignored.
+ *
+ * @param buffer The buffer to load the index from
+ * @param size Size of the buffer in bytes
+ * @param dataset The dataset corresponding to the index.
+ * @param rows Dataset rows
+ * @param cols Dataset columns
+ * @param distance_type The distance the index was built with
+ * @param order The order of the minkowski distance
+ * @return
+ */
+FLANN_EXPORT flann_index_t flann_load_index_from_buffer(const void* buffer,
+                                                        size_t size,
+                                                        float* dataset,
+                                                        int rows,
+                                                        int cols,
+                                                        enum flann_distance_t distance_type,
+                                                        int order);
+
+FLANN_EXPORT flann_index_t flann_load_index_from_buffer_float(const void* buffer,
+                                                              size_t size,
+                                                              float* dataset,
+                                                              int rows,
+                                                              int cols,
+                                                              enum flann_distance_t distance_type,
+                                                              int order);
+
+FLANN_EXPORT flann_index_t flann_load_index_from_buffer_double(const void* buffer,
+                                                               size_t size,
+                                                               double* dataset,
+                                                               int rows,
+                                                               int cols,
+                                                               enum flann_distance_t distance_type,
+                                                               int order);
+
+FLANN_EXPORT flann_index_t flann_load_index_from_buffer_byte(const void* buffer,
+                                                             size_t size,
+                                                             unsigned char* dataset,
+                                                             int rows,
+                                                             int cols,
+                                                             enum flann_distance_t distance_type,
+                                                             int order);
+
+FLANN_EXPORT flann_index_t flann_load_index_from_buffer_int(const void* buffer,
+                                                            size_t size,
+                                                            int* dataset,
+                                                            int rows,
+                                                            int cols,
+                                                            enum flann_distance_t distance_type,
+                                                            int order);
+
 
 /**
    Builds an index and uses it to find nearest neighbors.
@@ -463,6 +787,73 @@ FLANN_EXPORT int flann_radius_search_int(flann_index_t index_ptr, /* the index *
                                          float radius, /* search radius (squared radius for euclidian metric) */
                                          struct FLANNParameters* flann_params);
 
+
+/**
+ * Performs a radius search for multiple query points at once.
+ *
+ * The results are returned in compressed sparse row form: the neighbors of
+ * query i are stored in indices[offsets[i]..offsets[i+1]) (and similarly for
+ * dists). The offsets array must have room for trows+1 elements and is always
+ * filled completely. At most max_total neighbors are written to the indices and
+ * dists arrays; if the returned total is larger than max_total the output was
+ * truncated and the search should be repeated with larger arrays.
+ *
+ * The queries are processed in parallel using the number of cores specified in
+ * the FLANNParameters. The max_neighbors field limits the number of neighbors
+ * returned for each query (-1 for unlimited).
+ *
+ * Returns: total number of neighbors found or a number <0 for error
+ */
+FLANN_EXPORT int flann_radius_search_batch(flann_index_t index_ptr, /* the index */
+                                           float* testset, /* query points */
+                                           int trows, /* number of query points */
+                                           int* offsets, /* array of trows+1 offsets into indices and dists (will be modified) */
+                                           int* indices, /* array for storing the indices found (will be modified) */
+                                           float* dists, /* similar, but for storing distances */
+                                           int max_total, /* size of arrays indices and dists */
+                                           float radius, /* search radius (squared radius for euclidian metric) */
+                                           struct FLANNParameters* flann_params);
+
+FLANN_EXPORT int flann_radius_search_batch_float(flann_index_t index_ptr,
+                                                 float* testset,
+                                                 int trows,
+                                                 int* offsets,
+                                                 int* indices,
+                                                 float* dists,
+                                                 int max_total,
+                                                 float radius,
+                                                 struct FLANNParameters* flann_params);
+
+FLANN_EXPORT int flann_radius_search_batch_double(flann_index_t index_ptr,
+                                                  double* testset,
+                                                  int trows,
+                                                  int* offsets,
+                                                  int* indices,
+                                                  double* dists,
+                                                  int max_total,
+                                                  float radius,
+                                                  struct FLANNParameters* flann_params);
+
+FLANN_EXPORT int flann_radius_search_batch_byte(flann_index_t index_ptr,
+                                                unsigned char* testset,
+                                                int trows,
+                                                int* offsets,
+                                                int* indices,
+                                                float* dists,
+                                                int max_total,
+                                                float radius,
+                                                struct FLANNParameters* flann_params);
+
+FLANN_EXPORT int flann_radius_search_batch_int(flann_index_t index_ptr,
+                                               int* testset,
+                                               int trows,
+                                               int* offsets,
+                                               int* indices,
+                                               float* dists,
+                                               int max_total,
+                                               float radius,
+                                               struct FLANNParameters* flann_params);
+
 /**
    Deletes an index and releases the memory used by it.
 
@@ -541,6 +932,77 @@ FLANN_EXPORT int flann_compute_cluster_centers_int(int* dataset,
                                                    float* result,
                                                    struct FLANNParameters* flann_params);
 
+/**
+   Clusters the features in the dataset with a flat kmeans for the euclidean distance. The closest
+   center of the features is searched in randomized kd-trees of the centers (a linear scan when
+   checks is FLANN_CHECKS_UNLIMITED), with as many threads as the cores parameter, so that large
+   numbers of clusters can be computed.
+
+   Params:
+    dataset = pointer to a data set stored in row major order
+    rows = number of rows (features) in the dataset
+    cols = number of columns in the dataset (feature dimensionality)
+    clusters = number of cluster to compute
+    centers = memory buffer where the output cluster centers are stored
+    labels = memory buffer where the cluster of each feature is stored (rows values), can be NULL
+    inertia = where the sum of the squared distances of the features to their centers is stored, can be NULL
+    batch_size = number of features sampled for each update of the centers (mini-batch kmeans),
+        0 to use all of them
+    flann_params = generic flann parameters (iterations, trees, checks, cores, random_seed)
+
+   Returns: number of clusters computed or a number <0 for error.
+ */
+
+FLANN_EXPORT int flann_kmeans(float* dataset,
+                              int rows,
+                              int cols,
+                              int clusters,
+                              float* centers,
+                              int* labels,
+                              double* inertia,
+                              int batch_size,
+                              struct FLANNParameters* flann_params);
+
+FLANN_EXPORT int flann_kmeans_float(float* dataset,
+                                    int rows,
+                                    int cols,
+                                    int clusters,
+                                    float* centers,
+                                    int* labels,
+                                    double* inertia,
+                                    int batch_size,
+                                    struct FLANNParameters* flann_params);
+
+FLANN_EXPORT int flann_kmeans_double(double* dataset,
+                                     int rows,
+                                     int cols,
+                                     int clusters,
+                                     double* centers,
+                                     int* labels,
+                                     double* inertia,
+                                     int batch_size,
+                                     struct FLANNParameters* flann_params);
+
+FLANN_EXPORT int flann_kmeans_byte(unsigned char* dataset,
+                                   int rows,
+                                   int cols,
+                                   int clusters,
+                                   float* centers,
+                                   int* labels,
+                                   double* inertia,
+                                   int batch_size,
+                                   struct FLANNParameters* flann_params);
+
+FLANN_EXPORT int flann_kmeans_int(int* dataset,
+                                  int rows,
+                                  int cols,
+                                  int clusters,
+                                  float* centers,
+                                  int* labels,
+                                  double* inertia,
+                                  int batch_size,
+                                  struct FLANNParameters* flann_params);
+
 
 #ifdef __cplusplus
 }
@@ -43,6 +43,7 @@
 #include "flann/util/saving.h"
 
 #include "flann/algorithms/all_indices.h"
+#include "flann/algorithms/kmeans_clustering.h"
 
 namespace flann
 {
@@ -115,6 +116,18 @@ public:
     }
 
 
+    /**
+     * Loads an index saved with save(FILE*) from the current position of
+     * the stream, e.g. a stream over a memory buffer.
+     */
+    Index(const Matrix<ElementType>& features, FILE* stream, Distance distance = Distance() )
+    {
+        index_params_["algorithm"] = FLANN_INDEX_SAVED;
+        nnIndex_ = load_saved_index(features, stream, distance);
+        loaded_ = true;
+    }
+
+
     Index(const Index& other) : loaded_(other.loaded_), index_params_(other.index_params_)
     {
     	nnIndex_ = other.nnIndex_->clone();
@@ -160,6 +173,33 @@ public:
     	nnIndex_->removePoint(point_id);
     }
 
+    /**
+     * Remove several points from the index
+     * @param point_ids Ids of the points to be removed
+     */
+    void removePoints(const std::vector<size_t>& point_ids)
+    {
+    	nnIndex_->removePoints(point_ids);
+    }
+
+    /**
+     * Makes the index use new copies of the points with ids first_id to
+     * first_id+new_points.rows-1, e.g. after their buffer was reallocated.
+     */
+    void relocatePoints(size_t first_id, const Matrix<ElementType>& new_points)
+    {
+    	nnIndex_->relocatePoints(first_id, new_points);
+    }
+
+    /**
+     * Rebuilds the index over its current points, discarding the removed
+     * points and keeping the point ids.
+     */
+    void rebuildIndex()
+    {
+    	nnIndex_->rebuildIndex();
+    }
+
     /**
      * Returns pointer to a data point with the specified id.
      * @param point_id the id of point to retrieve
@@ -173,17 +213,29 @@ public:
     /**
      * Save index to file
      * @param filename
+     * @param compression How the index is compressed
      */
-    void save(std::string filename)
+    void save(std::string filename, const Compression& compression = Compression())
     {
         FILE* fout = fopen(filename.c_str(), "wb");
         if (fout == NULL) {
             throw FLANNException("Cannot open file");
         }
-        nnIndex_->saveIndex(fout);
+        save(fout, compression);
         fclose(fout);
     }
 
+    /**
+     * Save index to a stream, at its current position
+     * @param stream
+     * @param compression How the index is compressed
+     */
+    void save(FILE* stream, const Compression& compression = Compression())
+    {
+        serialization::ScopedCompression scope(compression);
+        nnIndex_->saveIndex(stream);
+    }
+
     /**
      * \returns number of features in this index.
      */
@@ -374,6 +426,15 @@ private:
         if (fin == NULL) {
             return NULL;
         }
+        IndexType* nnIndex = load_saved_index(dataset, fin, distance);
+        fclose(fin);
+
+        return nnIndex;
+    }
+
+    IndexType* load_saved_index(const Matrix<ElementType>& dataset, FILE* fin, Distance distance)
+    {
+        long start = ftell(fin);
         IndexHeader header = load_header(fin);
         if (header.h.data_type != flann_datatype_value<ElementType>::value) {
             throw FLANNException("Datatype of saved index is different than of the one to be loaded.");
@@ -382,9 +443,8 @@ private:
         IndexParams params;
         params["algorithm"] = header.h.index_type;
         IndexType* nnIndex = create_index_by_type<Distance>(header.h.index_type, dataset, params, distance);
-        rewind(fin);
+        fseek(fin, start, SEEK_SET);
         nnIndex->loadIndex(fin);
-        fclose(fin);
 
         return nnIndex;
     }
@@ -431,5 +491,27 @@ int hierarchicalClustering(const Matrix<typename Distance::ElementType>& points,
     return clusterNum;
 }
 
+
+/**
+ * Clusters the points with a flat k-means for the euclidean distance, searching the closest
+ * center of the points in randomized kd-trees of the centers.
+ * @param[in] points Points to be clustered
+ * @param centers The computed cluster centres. Matrix should be preallocated and centers.rows is the
+ *  number of clusters requested.
+ * @param params Clustering parameters
+ * @param[out] labels The cluster of each point (points.rows values), can be NULL
+ * @param[out] inertia Sum of the squared distances of the points to their centers, can be NULL
+ * @return number of clusters computed
+ */
+template <typename T>
+int kmeansClustering(const Matrix<T>& points, Matrix<typename Accumulator<T>::Type>& centers,
+                     const KMeansClusteringParams& params, int* labels = NULL, double* inertia = NULL)
+{
+    KMeansClustering<T> kmeans(points, params);
+    kmeans.compute(centers, labels, inertia);
+
+    return int(centers.rows);
+}
+
 }
 #endif /* FLANN_HPP_ */
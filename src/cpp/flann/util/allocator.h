@@ -31,6 +31,7 @@
 #ifndef FLANN_ALLOCATOR_H_
 #define FLANN_ALLOCATOR_H_
 
+#include <algorithm>
 #include <stdlib.h>
 #include <stdio.h>
 
@@ -125,6 +126,40 @@ public:
         wastedMemory = 0;
     }
 
+    /**
+     * Takes over the memory of another pool, which is left empty. The
+     * memory is freed along with the memory of this pool.
+     */
+    void merge(PooledAllocator& other)
+    {
+        if (other.base == NULL) {
+            return;
+        }
+        if (base == NULL) {
+            std::swap(remaining, other.remaining);
+            std::swap(base, other.base);
+            std::swap(loc, other.loc);
+        }
+        else {
+            /* Insert the blocks of the other pool after the current block of
+               this one, which is the one still used for allocating. */
+            void* last = other.base;
+            while (*((void**) last) != NULL) {
+                last = *((void**) last);
+            }
+            *((void**) last) = *((void**) base);
+            *((void**) base) = other.base;
+            wastedMemory += other.remaining;
+        }
+        usedMemory += other.usedMemory;
+        wastedMemory += other.wastedMemory;
+
+        other.base = NULL;
+        other.remaining = 0;
+        other.usedMemory = 0;
+        other.wastedMemory = 0;
+    }
+
     /**
      * Returns a pointer to a piece of new memory of the given size in bytes
      * allocated from the pool.
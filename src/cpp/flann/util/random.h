@@ -34,6 +34,8 @@
 #include <algorithm>
 #include <cstdlib>
 #include <cstddef>
+#include <random>
+#include <unordered_set>
 #include <vector>
 
 #include "flann/general.h"
@@ -42,17 +44,25 @@ namespace flann
 {
 
 /**
- * Seeds the random number generator
+ * The random number generator of the calling thread, so that threads
+ * building indexes at the same time draw reproducible numbers.
+ */
+inline std::mt19937& random_engine()
+{
+    static thread_local std::mt19937 engine;
+    return engine;
+}
+
+/**
+ * Seeds the random number generator of the calling thread
  *  @param seed Random seed
  */
 inline void seed_random(unsigned int seed)
 {
     srand(seed);
+    random_engine().seed(seed);
 }
 
-/*
- * Generates a random double value.
- */
 /**
  * Generates a random double value.
  * @param high Upper limit
@@ -61,7 +71,7 @@ inline void seed_random(unsigned int seed)
  */
 inline double rand_double(double high = 1.0, double low = 0)
 {
-    return low + ((high-low) * (std::rand() / (RAND_MAX + 1.0)));
+    return low + ((high-low) * (random_engine()() / (double(std::mt19937::max()) + 1.0)));
 }
 
 /**
@@ -72,9 +82,69 @@ inline double rand_double(double high = 1.0, double low = 0)
  */
 inline int rand_int(int high = RAND_MAX, int low = 0)
 {
-    return low + (int) ( double(high-low) * (std::rand() / (RAND_MAX + 1.0)));
+    return low + (int) ( double(high-low) * (random_engine()() / (double(std::mt19937::max()) + 1.0)));
+}
+
+/**
+ * Draws the seeds of tasks run in parallel, so that the numbers they
+ * draw do not depend on the thread running them.
+ * @param count Number of seeds
+ * @return The seeds
+ */
+inline std::vector<unsigned int> rand_seeds(size_t count)
+{
+    std::vector<unsigned int> seeds(count);
+    for (size_t i=0;i<count;++i) {
+        seeds[i] = (unsigned int)random_engine()();
+    }
+    return seeds;
+}
+
+/**
+ * Draws distinct random numbers from the [0,n) interval without building
+ * the whole interval (Floyd's algorithm), in random order.
+ * @param n Size of the interval
+ * @param count Number of values to draw, at most n
+ * @return The values
+ */
+inline std::vector<size_t> rand_sample(size_t n, size_t count)
+{
+    std::vector<size_t> sample;
+    sample.reserve(count);
+    std::unordered_set<size_t> drawn(count);
+    for (size_t j=n-count;j<n;++j) {
+        size_t t = std::uniform_int_distribution<size_t>(0, j)(random_engine());
+        if (!drawn.insert(t).second) {
+            t = j;
+            drawn.insert(t);
+        }
+        sample.push_back(t);
+    }
+    std::shuffle(sample.begin(), sample.end(), random_engine());
+    return sample;
 }
 
+/**
+ * Seeds the random number generator of the calling thread for the lifetime
+ * of the object, restoring its state afterwards.
+ */
+class ScopedRandomSeed
+{
+public:
+    explicit ScopedRandomSeed(unsigned int seed) : saved_(random_engine())
+    {
+        random_engine().seed(seed);
+    }
+
+    ~ScopedRandomSeed()
+    {
+        random_engine() = saved_;
+    }
+
+private:
+    std::mt19937 saved_;
+};
+
 
 class RandomGenerator
 {
@@ -90,6 +90,14 @@ public:
 
     virtual DistanceType worstDist() const = 0;
 
+    /**
+     * Number of neighbors the result set holds at most, 0 when it is unbounded
+     */
+    virtual size_t capacity() const
+    {
+        return 0;
+    }
+
 };
 
 /**
@@ -134,6 +142,11 @@ public:
         return count_;
     }
 
+    size_t capacity() const
+    {
+        return capacity_;
+    }
+
     /**
      * Radius search result set always reports full
      * @return
@@ -234,6 +247,11 @@ public:
         return count_;
     }
 
+    size_t capacity() const
+    {
+        return capacity_;
+    }
+
     bool full() const
     {
         return count_ == capacity_;
@@ -337,6 +355,11 @@ public:
         return dist_index_.size();
     }
 
+    size_t capacity() const
+    {
+        return capacity_;
+    }
+
     /**
      * Radius search result set always reports full
      * @return
@@ -560,6 +583,11 @@ public:
         return dist_index_.size();
     }
 
+    size_t capacity() const
+    {
+        return capacity_;
+    }
+
     /**
      * Radius search result set always reports full
      * @return
@@ -794,6 +822,11 @@ public:
         this->clear();
     }
 
+    size_t capacity() const
+    {
+        return capacity_;
+    }
+
     /** Add a possible candidate to the best neighbors
      * @param dist distance for that neighbor
      * @param index index of that neighbor
@@ -32,6 +32,7 @@
 #include <cstring>
 #include <vector>
 #include <stdio.h>
+#include <stdlib.h>
 
 #include "flann/general.h"
 #include "flann/util/serialization.h"
@@ -122,6 +123,115 @@ inline IndexHeader load_header(FILE* stream)
 }
 
 
+/**
+ * Opens a read only stream over a memory buffer, which must stay valid
+ * until the stream is closed. The buffer is read in place.
+ *
+ * @param buffer - Start of the buffer
+ * @param size - Size of the buffer in bytes
+ * @return The stream, or NULL on failure
+ */
+inline FILE* open_memory_stream(const void* buffer, size_t size)
+{
+#ifdef _WIN32
+    // there is no fmemopen on Windows, the buffer goes through a temporary file
+    FILE* stream = tmpfile();
+    if (stream != NULL && (fwrite(buffer, size, 1, stream) != 1 || fseek(stream, 0, SEEK_SET) != 0)) {
+        fclose(stream);
+        stream = NULL;
+    }
+    return stream;
+#else
+    return fmemopen(const_cast<void*>(buffer), size, "rb");
+#endif
+}
+
+
+/**
+ * A stream writing to a memory buffer allocated with malloc, which grows
+ * as data is written.
+ */
+class MemoryOutputStream
+{
+public:
+    MemoryOutputStream() : buffer_(NULL), size_(0)
+    {
+#ifdef _WIN32
+        stream_ = tmpfile();
+#else
+        stream_ = open_memstream(&buffer_, &size_);
+#endif
+        if (stream_ == NULL) {
+            throw FLANNException("Cannot open memory stream");
+        }
+    }
+
+    ~MemoryOutputStream()
+    {
+        if (stream_ != NULL) {
+            fclose(stream_);
+        }
+        free(buffer_);
+    }
+
+    FILE* stream()
+    {
+        return stream_;
+    }
+
+    /**
+     * Closes the stream and passes the ownership of the buffer to the
+     * caller, who frees it with free().
+     *
+     * @param size - Set to the number of bytes written
+     * @param reserve - Number of bytes left free after the data written
+     * @return The buffer
+     */
+    void* release(size_t& size, size_t reserve = 0)
+    {
+#ifdef _WIN32
+        fflush(stream_);
+        long written = ftell(stream_);
+        if (written < 0 || fseek(stream_, 0, SEEK_SET) != 0) {
+            throw FLANNException("Cannot read memory stream");
+        }
+        size_ = written;
+        buffer_ = (char*)malloc(size_ + reserve);
+        if (buffer_ == NULL || (size_ > 0 && fread(buffer_, size_, 1, stream_) != 1)) {
+            throw FLANNException("Cannot read memory stream");
+        }
+        fclose(stream_);
+        stream_ = NULL;
+#else
+        if (fclose(stream_) != 0) {
+            stream_ = NULL;
+            throw FLANNException("Cannot write memory stream");
+        }
+        stream_ = NULL;
+        if (reserve > 0) {
+            char* buffer = (char*)realloc(buffer_, size_ + reserve);
+            if (buffer == NULL) {
+                throw FLANNException("Cannot allocate memory");
+            }
+            buffer_ = buffer;
+        }
+#endif
+        void* buffer = buffer_;
+        buffer_ = NULL;
+        size = size_;
+        return buffer;
+    }
+
+private:
+    MemoryOutputStream(const MemoryOutputStream&);
+    MemoryOutputStream& operator=(const MemoryOutputStream&);
+
+    FILE* stream_;
+    char* buffer_;
+    size_t size_;
+};
+
+
 namespace serialization
 {
 ENUM_SERIALIZER(flann_algorithm_t);
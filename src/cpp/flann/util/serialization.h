@@ -3,9 +3,14 @@
 
 #include <vector>
 #include <map>
+#include <algorithm>
 #include <cstdlib>
 #include <cstring>
 #include <stdio.h>
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+#include "flann/general.h"
 #include "flann/ext/lz4.h"
 #include "flann/ext/lz4hc.h"
 
@@ -23,6 +28,24 @@ namespace flann
         size_t first_block_size;
     };
 
+    /**
+     * How the saved indexes are compressed.
+     */
+    struct Compression
+    {
+        /** compression algorithm */
+        flann_compression_t type;
+        /** acceleration of LZ4 (1 by default, higher is faster), or level of LZ4HC (1 to 16, 9 by default) */
+        int level;
+        /** threads compressing the blocks (0 for as many as OpenMP uses) */
+        int cores;
+
+        Compression(flann_compression_t type_ = FLANN_COMPRESSION_LZ4HC, int level_ = 9, int cores_ = 0)
+            : type(type_), level(level_), cores(cores_)
+        {
+        }
+    };
+
 namespace serialization
 {
 
@@ -373,105 +396,211 @@ public:
     
 #define BLOCK_BYTES (1024 * 64)
 
+/* Values of IndexHeaderStruct::compression */
+enum {
+    /* the data follows the header as is */
+    ARCHIVE_UNCOMPRESSED = 0,
+    /* LZ4HC blocks, each compressed with the previous one as dictionary */
+    ARCHIVE_LZ4_STREAM = 1,
+    /* LZ4 or LZ4HC blocks compressed independently */
+    ARCHIVE_LZ4_BLOCKS = 2
+};
+
+/**
+ * The compression of the archives saved by the calling thread.
+ */
+inline Compression& save_compression()
+{
+    static thread_local Compression compression;
+    return compression;
+}
+
+/**
+ * Sets the compression of the archives saved by the calling thread for
+ * the lifetime of the object, restoring the previous one afterwards.
+ */
+class ScopedCompression
+{
+public:
+    explicit ScopedCompression(const Compression& compression) : saved_(save_compression())
+    {
+        save_compression() = compression;
+    }
+
+    ~ScopedCompression()
+    {
+        save_compression() = saved_;
+    }
+
+private:
+    Compression saved_;
+};
+
 class SaveArchive : public OutputArchive<SaveArchive>
 {
     /**
-     * Based on blockStreaming_doubleBuffer code at:
-     * https://github.com/Cyan4973/lz4/blob/master/examples/blockStreaming_doubleBuffer.c
+     * The data is cut into blocks of BLOCK_BYTES, which are compressed
+     * independently of each other, several at a time in parallel. The
+     * header at the start of the first block is written uncompressed,
+     * with the compressed size of the rest of the block; the following
+     * blocks are preceded by their compressed size, and a zero size ends
+     * the archive. Uncompressed archives write the data as is after the
+     * header, small values going through a single block buffer.
      */
     
     FILE* stream_;
     bool own_stream_;
+    Compression compression_;
     char *buffer_;
     size_t offset_;
 
-    int first_block_;
+    bool first_block_;
+    int cores_;
+    // blocks waiting to be compressed
     char *buffer_blocks_;
+    std::vector<size_t> block_sizes_;
+    size_t max_blocks_;
     char *compressed_buffer_;
-    LZ4_streamHC_t lz4Stream_body;
-    LZ4_streamHC_t* lz4Stream;
+    // compression state of each thread
+    std::vector<void*> states_;
 
     void initBlock()
     {
-        // Alloc the space for both buffer blocks (each compressed block
-        // references the previous)
-        buffer_ = buffer_blocks_ = (char *)malloc(BLOCK_BYTES*2);
-        compressed_buffer_ = (char *)malloc(LZ4_COMPRESSBOUND(BLOCK_BYTES) + sizeof(size_t));
+        compression_ = save_compression();
+        buffer_ = buffer_blocks_ = compressed_buffer_ = NULL;
+        offset_ = 0;
+        first_block_ = true;
+        if (compression_.type == FLANN_COMPRESSION_NONE) {
+            buffer_ = (char *)malloc(BLOCK_BYTES);
+            if (buffer_ == NULL) {
+                throw FLANNException("Error allocating buffer");
+            }
+            return;
+        }
+
+        cores_ = compression_.cores;
+        if (cores_ <= 0) {
+#ifdef _OPENMP
+            cores_ = omp_get_max_threads();
+#else
+            cores_ = 1;
+#endif
+        }
+        // a few blocks per thread, as some compress faster than others
+        max_blocks_ = 4 * cores_;
+        buffer_ = buffer_blocks_ = (char *)malloc(BLOCK_BYTES*max_blocks_);
+        compressed_buffer_ = (char *)malloc(LZ4_COMPRESSBOUND(BLOCK_BYTES)*max_blocks_);
         if (buffer_ == NULL || compressed_buffer_ == NULL) {
             throw FLANNException("Error allocating compression buffer");
         }
-        
-        // Init the LZ4 stream
-        lz4Stream = &lz4Stream_body;
-        LZ4_resetStreamHC(lz4Stream, 9);
-        first_block_ = true;
-        
-        offset_ = 0;
+
+        int state_size = (compression_.type == FLANN_COMPRESSION_LZ4HC) ? LZ4_sizeofStateHC() : LZ4_sizeofState();
+        states_.resize(cores_);
+        for (int i = 0; i < cores_; ++i) {
+            states_[i] = malloc(state_size);
+            if (states_[i] == NULL) {
+                throw FLANNException("Error allocating compression buffer");
+            }
+        }
     }
     
-    void flushBlock()
+    int compressBlock(void* state, const char* block, char* compressed, size_t size)
     {
-        size_t compSz = 0;
-        // Handle header
-        if (first_block_) {
-            // Copy & set the header
-            IndexHeaderStruct *head = (IndexHeaderStruct *)buffer_;
-            size_t headSz = sizeof(IndexHeaderStruct);
-            
-            assert(head->compression == 0);
-            head->compression = 1; // Bool now, enum later
-        
-            // Do the compression for the block
-            compSz = LZ4_compress_HC_continue(
-                lz4Stream, buffer_+headSz, compressed_buffer_+headSz, offset_-headSz,
-                LZ4_COMPRESSBOUND(BLOCK_BYTES));
-            
-            if(compSz <= 0) {
-                throw FLANNException("Error compressing (first block)");
-            }
-            
-            // Handle header
-            head->first_block_size = compSz;
-            memcpy(compressed_buffer_, buffer_, headSz);
-            
-            compSz += headSz;
-            first_block_ = false;
-        } else {
-            size_t headSz = sizeof(compSz);
-            
-            // Do the compression for the block
-            compSz = LZ4_compress_HC_continue(
-                lz4Stream, buffer_, compressed_buffer_+headSz, offset_,
-                LZ4_COMPRESSBOUND(BLOCK_BYTES));
-            
-            if(compSz <= 0) {
+        if (compression_.type == FLANN_COMPRESSION_LZ4HC) {
+            return LZ4_compress_HC_extStateHC(state, block, compressed, size,
+                                              LZ4_COMPRESSBOUND(BLOCK_BYTES), compression_.level);
+        }
+        return LZ4_compress_fast_extState(state, block, compressed, size,
+                                          LZ4_COMPRESSBOUND(BLOCK_BYTES), std::max(compression_.level, 1));
+    }
+
+    void compressBlocks()
+    {
+        int count = (int)block_sizes_.size();
+        size_t headSz = sizeof(IndexHeaderStruct);
+        std::vector<int> compressed_sizes(count);
+
+#pragma omp parallel for schedule(dynamic) num_threads(cores_)
+        for (int i = 0; i < count; ++i) {
+            size_t skip = (first_block_ && i == 0) ? headSz : 0;
+#ifdef _OPENMP
+            void* state = states_[omp_get_thread_num()];
+#else
+            void* state = states_[0];
+#endif
+            compressed_sizes[i] = compressBlock(state, buffer_blocks_ + i*BLOCK_BYTES + skip,
+                                                compressed_buffer_ + i*LZ4_COMPRESSBOUND(BLOCK_BYTES),
+                                                block_sizes_[i] - skip);
+        }
+
+        for (int i = 0; i < count; ++i) {
+            size_t compSz = compressed_sizes[i];
+            if (compressed_sizes[i] <= 0) {
                 throw FLANNException("Error compressing");
             }
-            
-            // Save the size of the compressed block as the header
-            memcpy(compressed_buffer_, &compSz, headSz);
-            compSz += headSz;
+            if (first_block_ && i == 0) {
+                // Set & write the header
+                IndexHeaderStruct *head = (IndexHeaderStruct *)buffer_blocks_;
+                assert(head->compression == 0);
+                head->compression = ARCHIVE_LZ4_BLOCKS;
+                head->first_block_size = compSz;
+                fwrite(head, headSz, 1, stream_);
+            }
+            else {
+                // Write the size of the compressed block as the header
+                fwrite(&compSz, sizeof(compSz), 1, stream_);
+            }
+            fwrite(compressed_buffer_ + i*LZ4_COMPRESSBOUND(BLOCK_BYTES), compSz, 1, stream_);
         }
-        
-        // Write the compressed buffer
-        fwrite(compressed_buffer_, compSz, 1, stream_);
-        
-        // Switch the buffer to the *other* block
-        if (buffer_ == buffer_blocks_)
-            buffer_ = &buffer_blocks_[BLOCK_BYTES];
-        else
-            buffer_ = buffer_blocks_;
+
+        if (count > 0) {
+            first_block_ = false;
+        }
+        block_sizes_.clear();
+        buffer_ = buffer_blocks_;
         offset_ = 0;
     }
+
+    void flushBlock()
+    {
+        if (offset_ == 0) {
+            return;
+        }
+        if (compression_.type == FLANN_COMPRESSION_NONE) {
+            fwrite(buffer_, offset_, 1, stream_);
+            offset_ = 0;
+            return;
+        }
+        block_sizes_.push_back(offset_);
+        if (block_sizes_.size() == max_blocks_) {
+            compressBlocks();
+        }
+        else {
+            buffer_ = buffer_blocks_ + block_sizes_.size()*BLOCK_BYTES;
+            offset_ = 0;
+        }
+    }
     
     void endBlock()
     {
+        flushBlock();
+        if (compression_.type == FLANN_COMPRESSION_NONE) {
+            free(buffer_);
+            buffer_ = NULL;
+            return;
+        }
+        compressBlocks();
+
         // Cleanup memory
         free(buffer_blocks_);
         buffer_blocks_ = NULL;
         buffer_ = NULL;
         free(compressed_buffer_);
         compressed_buffer_ = NULL;
+        for (size_t i = 0; i < states_.size(); ++i) {
+            free(states_[i]);
+        }
+        states_.clear();
         
         // Write a '0' size for next block
         size_t z = 0;
@@ -493,12 +622,7 @@ public:
 
     ~SaveArchive()
     {
-        flushBlock();
         endBlock();
-        if (buffer_) {
-            free(buffer_);
-            buffer_ = NULL;
-        }
     	if (own_stream_) {
     		fclose(stream_);
     	}
@@ -524,6 +648,13 @@ public:
     template<typename T>
     void save_binary(T* ptr, size_t size)
     {
+        if (compression_.type == FLANN_COMPRESSION_NONE && size > BLOCK_BYTES) {
+            // Write large chunks directly
+            flushBlock();
+            fwrite(ptr, size, 1, stream_);
+            return;
+        }
+
         while (size > BLOCK_BYTES) {
             // Flush existing block
             flushBlock();
@@ -552,6 +683,11 @@ class LoadArchive : public InputArchive<LoadArchive>
     /**
      * Based on blockStreaming_doubleBuffer code at:
      * https://github.com/Cyan4973/lz4/blob/master/examples/blockStreaming_doubleBuffer.c
+     *
+     * Archives of independent blocks are read the same way, each block
+     * being decompressed on its own. Uncompressed archives are read ahead
+     * into a single block buffer, except for large chunks which are read
+     * from the stream directly into the loaded objects.
      */
     
     FILE* stream_;
@@ -564,10 +700,12 @@ class LoadArchive : public InputArchive<LoadArchive>
     LZ4_streamDecode_t lz4StreamDecode_body;
     LZ4_streamDecode_t* lz4StreamDecode;
     size_t block_sz_;
+    size_t compression_;
 
     void decompressAndLoadV10(FILE* stream)
     {
         buffer_ = NULL;
+        compression_ = ARCHIVE_LZ4_STREAM;
         
         // Find file size
         size_t pos = ftell(stream);
@@ -652,6 +790,23 @@ class LoadArchive : public InputArchive<LoadArchive>
             fseek(stream, pos, SEEK_SET);
             return decompressAndLoadV10(stream);
         }
+
+        // Uncompressed archives are read directly, header included
+        compression_ = head->compression;
+        if (compression_ == ARCHIVE_UNCOMPRESSED) {
+            free(head);
+            fseek(stream, pos, SEEK_SET);
+            ptr_ = buffer_ = (char *)malloc(BLOCK_BYTES);
+            if (buffer_ == NULL) {
+                throw FLANNException("Error allocating buffer");
+            }
+            block_sz_ = 0;
+            return;
+        }
+        if (compression_ != ARCHIVE_LZ4_STREAM && compression_ != ARCHIVE_LZ4_BLOCKS) {
+            free(head);
+            throw FLANNException("Compression type not supported");
+        }
         
         // Alloc the space for both buffer blocks (each block
         // references the previous)
@@ -686,19 +841,36 @@ class LoadArchive : public InputArchive<LoadArchive>
         }
         
         // Decompress into the regular buffer
-        const int decBytes = LZ4_decompress_safe_continue(
-            lz4StreamDecode, compressed_buffer_, buffer_, compSz, BLOCK_BYTES);
+        const int decBytes = (compression_ == ARCHIVE_LZ4_BLOCKS) ?
+            LZ4_decompress_safe(compressed_buffer_, buffer_, compSz, BLOCK_BYTES) :
+            LZ4_decompress_safe_continue(lz4StreamDecode, compressed_buffer_, buffer_, compSz, BLOCK_BYTES);
         if(decBytes <= 0) {
             throw FLANNException("Invalid index file, cannot decompress block");
         }
         block_sz_ = decBytes;
     }
     
+    void readAhead(size_t size)
+    {
+        // Keep the data not read yet and fill the rest of the buffer
+        size_t left = buffer_+block_sz_-ptr_;
+        memmove(buffer_, ptr_, left);
+        block_sz_ = left + fread(buffer_+left, 1, BLOCK_BYTES-left, stream_);
+        ptr_ = buffer_;
+        if (block_sz_ < size) {
+            throw FLANNException("Invalid index file, cannot read from disk");
+        }
+    }
+
     void preparePtr(size_t size)
     {
         // Return if the new size is less than (or eq) the size of a block
         if (ptr_+size <= buffer_+block_sz_)
             return;
+
+        if (compression_ == ARCHIVE_UNCOMPRESSED) {
+            return readAhead(size);
+        }
         
         // Switch the buffer to the *other* block
         if (buffer_ == buffer_blocks_)
@@ -720,6 +892,13 @@ class LoadArchive : public InputArchive<LoadArchive>
     
     void endBlock()
     {
+        if (compression_ == ARCHIVE_UNCOMPRESSED) {
+            // Give back the data read ahead, which follows the archive
+            fseek(stream_, -(long)(buffer_+block_sz_-ptr_), SEEK_CUR);
+            free(buffer_);
+            buffer_ = NULL;
+        }
+
         // If not v1.0 format hack...
         if (buffer_blocks_ != NULL) {
             // Read the last '0' in the file
@@ -788,6 +967,17 @@ public:
     template<typename T>
     void load_binary(T* ptr, size_t size)
     {
+        if (compression_ == ARCHIVE_UNCOMPRESSED && size > BLOCK_BYTES) {
+            // Copy the data read ahead and read the rest directly
+            size_t left = buffer_+block_sz_-ptr_;
+            memcpy(ptr, ptr_, left);
+            ptr_ += left;
+            if (fread((char *)ptr+left, size-left, 1, stream_) != 1) {
+                throw FLANNException("Invalid index file, cannot read from disk");
+            }
+            return;
+        }
+
         while (size > BLOCK_BYTES) {
             // Load next block
             preparePtr(BLOCK_BYTES);
@@ -0,0 +1,825 @@
+/***********************************************************************
+ * Software License Agreement (BSD License)
+ *
+ * Copyright 2008-2009  Marius Muja (mariusm@cs.ubc.ca). All rights reserved.
+ * Copyright 2008-2009  David G. Lowe (lowe@cs.ubc.ca). All rights reserved.
+ *
+ * THE BSD LICENSE
+ *
+ * Redistribution and use in source and binary forms, with or without
+ * modification, are permitted provided that the following conditions
+ * are met:
+ *
+ * 1. Redistributions of source code must retain the above copyright
+ *    notice, this list of conditions and the following disclaimer.
+ * 2. Redistributions in binary form must reproduce the above copyright
+ *    notice, this list of conditions and the following disclaimer in the
+ *    documentation and/or other materials provided with the distribution.
+ *
+ * THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+ * IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+ * OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+ * IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+ * INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+ * NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+ * DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+ * THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+ * (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+ * THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+ *************************************************************************/
+
+#ifndef FLANN_SIMD_H_
+#define FLANN_SIMD_H_
+
+#include <cmath>
+#include <cstdlib>
+#include <stddef.h>
+#include <string.h>
+
+/*
+ * Vectorized kernels of the L2, L1 and histogram intersection distances for
+ * float, unsigned char and int vectors. The kernels are compiled for SSE2,
+ * AVX2 and AVX-512 with function target attributes, so that the library is
+ * built for the baseline architecture and the widest instruction set that
+ * the CPU supports is selected at runtime.
+ *
+ * The FLANN_SIMD environment variable (scalar, sse2, avx2 or avx512) limits
+ * the instruction set used, "scalar" keeping the original unrolled loops of
+ * the distance functors. Defining FLANN_NO_SIMD disables the kernels when
+ * compiling.
+ */
+#if (defined(__x86_64__) || defined(__i386__)) && defined(__GNUC__) && !defined(__CUDACC__) && !defined(FLANN_NO_SIMD)
+#define FLANN_SIMD_DISPATCH 1
+#include <immintrin.h>
+#if defined(__clang__) || __GNUC__ >= 7
+#define FLANN_SIMD_AVX512 1
+#endif
+#define FLANN_SIMD_TARGET(isa) __attribute__((target(isa)))
+#endif
+
+namespace flann
+{
+
+namespace simd
+{
+
+enum Level
+{
+    LEVEL_SCALAR = 0,
+    LEVEL_SSE2 = 1,
+    LEVEL_AVX2 = 2,
+    LEVEL_AVX512 = 3
+};
+
+enum Kernel
+{
+    KERNEL_L2 = 0,
+    KERNEL_L1 = 1,
+    KERNEL_HIK = 2,
+    KERNEL_COUNT = 3
+};
+
+/**
+ * Vectors shorter than this are left to the inlined scalar loops, which
+ * are faster than an indirect call for them.
+ */
+const size_t MIN_SIZE = 8;
+
+/**
+ * Elements of unsigned char vectors whose squared differences are summed in
+ * 32 bit integers before being added to the result.
+ */
+const size_t UCHAR_L2_BLOCK = 32768;
+
+
+inline const char* level_name(Level level)
+{
+    static const char* names[] = { "scalar", "sse2", "avx2", "avx512" };
+    return names[level];
+}
+
+/**
+ * @return The widest instruction set supported by the CPU
+ */
+inline Level detected_level()
+{
+#ifdef FLANN_SIMD_DISPATCH
+    __builtin_cpu_init();
+#ifdef FLANN_SIMD_AVX512
+    if (__builtin_cpu_supports("avx512f") && __builtin_cpu_supports("avx512bw")) return LEVEL_AVX512;
+#endif
+    if (__builtin_cpu_supports("avx2") && __builtin_cpu_supports("fma")) return LEVEL_AVX2;
+    if (__builtin_cpu_supports("sse2")) return LEVEL_SSE2;
+#endif
+    return LEVEL_SCALAR;
+}
+
+/**
+ * @return The widest instruction set allowed by the FLANN_SIMD environment variable
+ */
+inline Level requested_level()
+{
+    const char* name = getenv("FLANN_SIMD");
+    if (name!=NULL) {
+        for (int level = LEVEL_SCALAR; level<=LEVEL_AVX512; ++level) {
+            if (strcmp(name, level_name(Level(level)))==0) return Level(level);
+        }
+    }
+    return LEVEL_AVX512;
+}
+
+/**
+ * @return The instruction set of the kernels, selected on first use
+ */
+inline Level level()
+{
+    static const Level selected = detected_level()<requested_level() ? detected_level() : requested_level();
+    return selected;
+}
+
+
+/**
+ * The kernels of one element type, NULL where the functor's own loop is used.
+ */
+template <typename T>
+struct KernelTable
+{
+    typedef float (*Function)(const T*, const T*, size_t);
+    Function functions[KERNEL_COUNT];
+};
+
+/**
+ * @return The kernels selected for the element type, NULL for the types without kernels
+ */
+template <typename T>
+inline const KernelTable<T>* kernel_table()
+{
+    return NULL;
+}
+
+
+#ifdef FLANN_SIMD_DISPATCH
+
+/********************************** SSE2 **********************************/
+
+FLANN_SIMD_TARGET("sse2")
+inline float sum_ps_sse2(__m128 v)
+{
+    __m128 shuffled = _mm_shuffle_ps(v, v, _MM_SHUFFLE(2, 3, 0, 1));
+    __m128 sums = _mm_add_ps(v, shuffled);
+    shuffled = _mm_movehl_ps(shuffled, sums);
+    sums = _mm_add_ss(sums, shuffled);
+    return _mm_cvtss_f32(sums);
+}
+
+FLANN_SIMD_TARGET("sse2")
+inline int sum_epi32_sse2(__m128i v)
+{
+    v = _mm_add_epi32(v, _mm_shuffle_epi32(v, _MM_SHUFFLE(1, 0, 3, 2)));
+    v = _mm_add_epi32(v, _mm_shuffle_epi32(v, _MM_SHUFFLE(2, 3, 0, 1)));
+    return _mm_cvtsi128_si32(v);
+}
+
+FLANN_SIMD_TARGET("sse2")
+inline float sum_epi64_sse2(__m128i v)
+{
+    v = _mm_add_epi64(v, _mm_unpackhi_epi64(v, v));
+    long long result;
+    _mm_storel_epi64(reinterpret_cast<__m128i*>(&result), v);
+    return (float)result;
+}
+
+FLANN_SIMD_TARGET("sse2")
+inline float l2_float_sse2(const float* a, const float* b, size_t size)
+{
+    __m128 sum0 = _mm_setzero_ps();
+    __m128 sum1 = _mm_setzero_ps();
+    size_t i = 0;
+    for (; i+8<=size; i+=8) {
+        __m128 diff0 = _mm_sub_ps(_mm_loadu_ps(a+i), _mm_loadu_ps(b+i));
+        __m128 diff1 = _mm_sub_ps(_mm_loadu_ps(a+i+4), _mm_loadu_ps(b+i+4));
+        sum0 = _mm_add_ps(sum0, _mm_mul_ps(diff0, diff0));
+        sum1 = _mm_add_ps(sum1, _mm_mul_ps(diff1, diff1));
+    }
+    float result = sum_ps_sse2(_mm_add_ps(sum0, sum1));
+    for (; i<size; ++i) {
+        float diff = a[i] - b[i];
+        result += diff * diff;
+    }
+    return result;
+}
+
+FLANN_SIMD_TARGET("sse2")
+inline float l1_float_sse2(const float* a, const float* b, size_t size)
+{
+    const __m128 sign = _mm_set1_ps(-0.0f);
+    __m128 sum0 = _mm_setzero_ps();
+    __m128 sum1 = _mm_setzero_ps();
+    size_t i = 0;
+    for (; i+8<=size; i+=8) {
+        sum0 = _mm_add_ps(sum0, _mm_andnot_ps(sign, _mm_sub_ps(_mm_loadu_ps(a+i), _mm_loadu_ps(b+i))));
+        sum1 = _mm_add_ps(sum1, _mm_andnot_ps(sign, _mm_sub_ps(_mm_loadu_ps(a+i+4), _mm_loadu_ps(b+i+4))));
+    }
+    float result = sum_ps_sse2(_mm_add_ps(sum0, sum1));
+    for (; i<size; ++i) {
+        result += std::abs(a[i] - b[i]);
+    }
+    return result;
+}
+
+FLANN_SIMD_TARGET("sse2")
+inline float hik_float_sse2(const float* a, const float* b, size_t size)
+{
+    __m128 sum0 = _mm_setzero_ps();
+    __m128 sum1 = _mm_setzero_ps();
+    size_t i = 0;
+    for (; i+8<=size; i+=8) {
+        sum0 = _mm_add_ps(sum0, _mm_min_ps(_mm_loadu_ps(a+i), _mm_loadu_ps(b+i)));
+        sum1 = _mm_add_ps(sum1, _mm_min_ps(_mm_loadu_ps(a+i+4), _mm_loadu_ps(b+i+4)));
+    }
+    float result = sum_ps_sse2(_mm_add_ps(sum0, sum1));
+    for (; i<size; ++i) {
+        result += a[i] < b[i] ? a[i] : b[i];
+    }
+    return result;
+}
+
+FLANN_SIMD_TARGET("sse2")
+inline float l2_uchar_sse2(const unsigned char* a, const unsigned char* b, size_t size)
+{
+    const __m128i zero = _mm_setzero_si128();
+    float result = 0;
+    size_t i = 0;
+    while (i+16<=size) {
+        size_t end = i + UCHAR_L2_BLOCK < size ? i + UCHAR_L2_BLOCK : size;
+        __m128i sum = _mm_setzero_si128();
+        for (; i+16<=end; i+=16) {
+            __m128i va = _mm_loadu_si128(reinterpret_cast<const __m128i*>(a+i));
+            __m128i vb = _mm_loadu_si128(reinterpret_cast<const __m128i*>(b+i));
+            __m128i lo = _mm_sub_epi16(_mm_unpacklo_epi8(va, zero), _mm_unpacklo_epi8(vb, zero));
+            __m128i hi = _mm_sub_epi16(_mm_unpackhi_epi8(va, zero), _mm_unpackhi_epi8(vb, zero));
+            sum = _mm_add_epi32(sum, _mm_add_epi32(_mm_madd_epi16(lo, lo), _mm_madd_epi16(hi, hi)));
+        }
+        result += (float)sum_epi32_sse2(sum);
+    }
+    for (; i<size; ++i) {
+        float diff = (float)(a[i] - b[i]);
+        result += diff * diff;
+    }
+    return result;
+}
+
+FLANN_SIMD_TARGET("sse2")
+inline float l1_uchar_sse2(const unsigned char* a, const unsigned char* b, size_t size)
+{
+    __m128i sum = _mm_setzero_si128();
+    size_t i = 0;
+    for (; i+16<=size; i+=16) {
+        __m128i va = _mm_loadu_si128(reinterpret_cast<const __m128i*>(a+i));
+        __m128i vb = _mm_loadu_si128(reinterpret_cast<const __m128i*>(b+i));
+        sum = _mm_add_epi64(sum, _mm_sad_epu8(va, vb));
+    }
+    float result = sum_epi64_sse2(sum);
+    for (; i<size; ++i) {
+        result += (float)std::abs(a[i] - b[i]);
+    }
+    return result;
+}
+
+FLANN_SIMD_TARGET("sse2")
+inline float hik_uchar_sse2(const unsigned char* a, const unsigned char* b, size_t size)
+{
+    const __m128i zero = _mm_setzero_si128();
+    __m128i sum = _mm_setzero_si128();
+    size_t i = 0;
+    for (; i+16<=size; i+=16) {
+        __m128i va = _mm_loadu_si128(reinterpret_cast<const __m128i*>(a+i));
+        __m128i vb = _mm_loadu_si128(reinterpret_cast<const __m128i*>(b+i));
+        sum = _mm_add_epi64(sum, _mm_sad_epu8(_mm_min_epu8(va, vb), zero));
+    }
+    float result = sum_epi64_sse2(sum);
+    for (; i<size; ++i) {
+        result += (float)(a[i] < b[i] ? a[i] : b[i]);
+    }
+    return result;
+}
+
+FLANN_SIMD_TARGET("sse2")
+inline float l2_int_sse2(const int* a, const int* b, size_t size)
+{
+    __m128 sum = _mm_setzero_ps();
+    size_t i = 0;
+    for (; i+4<=size; i+=4) {
+        __m128i va = _mm_loadu_si128(reinterpret_cast<const __m128i*>(a+i));
+        __m128i vb = _mm_loadu_si128(reinterpret_cast<const __m128i*>(b+i));
+        __m128 diff = _mm_cvtepi32_ps(_mm_sub_epi32(va, vb));
+        sum = _mm_add_ps(sum, _mm_mul_ps(diff, diff));
+    }
+    float result = sum_ps_sse2(sum);
+    for (; i<size; ++i) {
+        float diff = (float)(a[i] - b[i]);
+        result += diff * diff;
+    }
+    return result;
+}
+
+FLANN_SIMD_TARGET("sse2")
+inline float l1_int_sse2(const int* a, const int* b, size_t size)
+{
+    __m128 sum = _mm_setzero_ps();
+    size_t i = 0;
+    for (; i+4<=size; i+=4) {
+        __m128i va = _mm_loadu_si128(reinterpret_cast<const __m128i*>(a+i));
+        __m128i vb = _mm_loadu_si128(reinterpret_cast<const __m128i*>(b+i));
+        __m128i diff = _mm_sub_epi32(va, vb);
+        __m128i sign = _mm_srai_epi32(diff, 31);
+        sum = _mm_add_ps(sum, _mm_cvtepi32_ps(_mm_sub_epi32(_mm_xor_si128(diff, sign), sign)));
+    }
+    float result = sum_ps_sse2(sum);
+    for (; i<size; ++i) {
+        result += (float)std::abs(a[i] - b[i]);
+    }
+    return result;
+}
+
+FLANN_SIMD_TARGET("sse2")
+inline float hik_int_sse2(const int* a, const int* b, size_t size)
+{
+    __m128 sum = _mm_setzero_ps();
+    size_t i = 0;
+    for (; i+4<=size; i+=4) {
+        __m128i va = _mm_loadu_si128(reinterpret_cast<const __m128i*>(a+i));
+        __m128i vb = _mm_loadu_si128(reinterpret_cast<const __m128i*>(b+i));
+        __m128i less = _mm_cmplt_epi32(va, vb);
+        __m128i smaller = _mm_or_si128(_mm_and_si128(less, va), _mm_andnot_si128(less, vb));
+        sum = _mm_add_ps(sum, _mm_cvtepi32_ps(smaller));
+    }
+    float result = sum_ps_sse2(sum);
+    for (; i<size; ++i) {
+        result += (float)(a[i] < b[i] ? a[i] : b[i]);
+    }
+    return result;
+}
+
+
+/********************************** AVX2 **********************************/
+
+FLANN_SIMD_TARGET("avx2,fma")
+inline float sum_ps_avx2(__m256 v)
+{
+    return sum_ps_sse2(_mm_add_ps(_mm256_castps256_ps128(v), _mm256_extractf128_ps(v, 1)));
+}
+
+FLANN_SIMD_TARGET("avx2,fma")
+inline int sum_epi32_avx2(__m256i v)
+{
+    return sum_epi32_sse2(_mm_add_epi32(_mm256_castsi256_si128(v), _mm256_extracti128_si256(v, 1)));
+}
+
+FLANN_SIMD_TARGET("avx2,fma")
+inline float sum_epi64_avx2(__m256i v)
+{
+    return sum_epi64_sse2(_mm_add_epi64(_mm256_castsi256_si128(v), _mm256_extracti128_si256(v, 1)));
+}
+
+FLANN_SIMD_TARGET("avx2,fma")
+inline float l2_float_avx2(const float* a, const float* b, size_t size)
+{
+    __m256 sum0 = _mm256_setzero_ps();
+    __m256 sum1 = _mm256_setzero_ps();
+    size_t i = 0;
+    for (; i+16<=size; i+=16) {
+        __m256 diff0 = _mm256_sub_ps(_mm256_loadu_ps(a+i), _mm256_loadu_ps(b+i));
+        __m256 diff1 = _mm256_sub_ps(_mm256_loadu_ps(a+i+8), _mm256_loadu_ps(b+i+8));
+        sum0 = _mm256_fmadd_ps(diff0, diff0, sum0);
+        sum1 = _mm256_fmadd_ps(diff1, diff1, sum1);
+    }
+    for (; i+8<=size; i+=8) {
+        __m256 diff = _mm256_sub_ps(_mm256_loadu_ps(a+i), _mm256_loadu_ps(b+i));
+        sum0 = _mm256_fmadd_ps(diff, diff, sum0);
+    }
+    float result = sum_ps_avx2(_mm256_add_ps(sum0, sum1));
+    for (; i<size; ++i) {
+        float diff = a[i] - b[i];
+        result += diff * diff;
+    }
+    return result;
+}
+
+FLANN_SIMD_TARGET("avx2,fma")
+inline float l1_float_avx2(const float* a, const float* b, size_t size)
+{
+    const __m256 sign = _mm256_set1_ps(-0.0f);
+    __m256 sum0 = _mm256_setzero_ps();
+    __m256 sum1 = _mm256_setzero_ps();
+    size_t i = 0;
+    for (; i+16<=size; i+=16) {
+        sum0 = _mm256_add_ps(sum0, _mm256_andnot_ps(sign, _mm256_sub_ps(_mm256_loadu_ps(a+i), _mm256_loadu_ps(b+i))));
+        sum1 = _mm256_add_ps(sum1, _mm256_andnot_ps(sign, _mm256_sub_ps(_mm256_loadu_ps(a+i+8), _mm256_loadu_ps(b+i+8))));
+    }
+    for (; i+8<=size; i+=8) {
+        sum0 = _mm256_add_ps(sum0, _mm256_andnot_ps(sign, _mm256_sub_ps(_mm256_loadu_ps(a+i), _mm256_loadu_ps(b+i))));
+    }
+    float result = sum_ps_avx2(_mm256_add_ps(sum0, sum1));
+    for (; i<size; ++i) {
+        result += std::abs(a[i] - b[i]);
+    }
+    return result;
+}
+
+FLANN_SIMD_TARGET("avx2,fma")
+inline float hik_float_avx2(const float* a, const float* b, size_t size)
+{
+    __m256 sum0 = _mm256_setzero_ps();
+    __m256 sum1 = _mm256_setzero_ps();
+    size_t i = 0;
+    for (; i+16<=size; i+=16) {
+        sum0 = _mm256_add_ps(sum0, _mm256_min_ps(_mm256_loadu_ps(a+i), _mm256_loadu_ps(b+i)));
+        sum1 = _mm256_add_ps(sum1, _mm256_min_ps(_mm256_loadu_ps(a+i+8), _mm256_loadu_ps(b+i+8)));
+    }
+    for (; i+8<=size; i+=8) {
+        sum0 = _mm256_add_ps(sum0, _mm256_min_ps(_mm256_loadu_ps(a+i), _mm256_loadu_ps(b+i)));
+    }
+    float result = sum_ps_avx2(_mm256_add_ps(sum0, sum1));
+    for (; i<size; ++i) {
+        result += a[i] < b[i] ? a[i] : b[i];
+    }
+    return result;
+}
+
+FLANN_SIMD_TARGET("avx2,fma")
+inline float l2_uchar_avx2(const unsigned char* a, const unsigned char* b, size_t size)
+{
+    float result = 0;
+    size_t i = 0;
+    while (i+16<=size) {
+        size_t end = i + UCHAR_L2_BLOCK < size ? i + UCHAR_L2_BLOCK : size;
+        __m256i sum = _mm256_setzero_si256();
+        for (; i+16<=end; i+=16) {
+            __m256i va = _mm256_cvtepu8_epi16(_mm_loadu_si128(reinterpret_cast<const __m128i*>(a+i)));
+            __m256i vb = _mm256_cvtepu8_epi16(_mm_loadu_si128(reinterpret_cast<const __m128i*>(b+i)));
+            __m256i diff = _mm256_sub_epi16(va, vb);
+            sum = _mm256_add_epi32(sum, _mm256_madd_epi16(diff, diff));
+        }
+        result += (float)sum_epi32_avx2(sum);
+    }
+    for (; i<size; ++i) {
+        float diff = (float)(a[i] - b[i]);
+        result += diff * diff;
+    }
+    return result;
+}
+
+FLANN_SIMD_TARGET("avx2,fma")
+inline float l1_uchar_avx2(const unsigned char* a, const unsigned char* b, size_t size)
+{
+    __m256i sum = _mm256_setzero_si256();
+    size_t i = 0;
+    for (; i+32<=size; i+=32) {
+        __m256i va = _mm256_loadu_si256(reinterpret_cast<const __m256i*>(a+i));
+        __m256i vb = _mm256_loadu_si256(reinterpret_cast<const __m256i*>(b+i));
+        sum = _mm256_add_epi64(sum, _mm256_sad_epu8(va, vb));
+    }
+    float result = sum_epi64_avx2(sum);
+    for (; i<size; ++i) {
+        result += (float)std::abs(a[i] - b[i]);
+    }
+    return result;
+}
+
+FLANN_SIMD_TARGET("avx2,fma")
+inline float hik_uchar_avx2(const unsigned char* a, const unsigned char* b, size_t size)
+{
+    const __m256i zero = _mm256_setzero_si256();
+    __m256i sum = _mm256_setzero_si256();
+    size_t i = 0;
+    for (; i+32<=size; i+=32) {
+        __m256i va = _mm256_loadu_si256(reinterpret_cast<const __m256i*>(a+i));
+        __m256i vb = _mm256_loadu_si256(reinterpret_cast<const __m256i*>(b+i));
+        sum = _mm256_add_epi64(sum, _mm256_sad_epu8(_mm256_min_epu8(va, vb), zero));
+    }
+    float result = sum_epi64_avx2(sum);
+    for (; i<size; ++i) {
+        result += (float)(a[i] < b[i] ? a[i] : b[i]);
+    }
+    return result;
+}
+
+FLANN_SIMD_TARGET("avx2,fma")
+inline float l2_int_avx2(const int* a, const int* b, size_t size)
+{
+    __m256 sum = _mm256_setzero_ps();
+    size_t i = 0;
+    for (; i+8<=size; i+=8) {
+        __m256i va = _mm256_loadu_si256(reinterpret_cast<const __m256i*>(a+i));
+        __m256i vb = _mm256_loadu_si256(reinterpret_cast<const __m256i*>(b+i));
+        __m256 diff = _mm256_cvtepi32_ps(_mm256_sub_epi32(va, vb));
+        sum = _mm256_fmadd_ps(diff, diff, sum);
+    }
+    float result = sum_ps_avx2(sum);
+    for (; i<size; ++i) {
+        float diff = (float)(a[i] - b[i]);
+        result += diff * diff;
+    }
+    return result;
+}
+
+FLANN_SIMD_TARGET("avx2,fma")
+inline float l1_int_avx2(const int* a, const int* b, size_t size)
+{
+    __m256 sum = _mm256_setzero_ps();
+    size_t i = 0;
+    for (; i+8<=size; i+=8) {
+        __m256i va = _mm256_loadu_si256(reinterpret_cast<const __m256i*>(a+i));
+        __m256i vb = _mm256_loadu_si256(reinterpret_cast<const __m256i*>(b+i));
+        sum = _mm256_add_ps(sum, _mm256_cvtepi32_ps(_mm256_abs_epi32(_mm256_sub_epi32(va, vb))));
+    }
+    float result = sum_ps_avx2(sum);
+    for (; i<size; ++i) {
+        result += (float)std::abs(a[i] - b[i]);
+    }
+    return result;
+}
+
+FLANN_SIMD_TARGET("avx2,fma")
+inline float hik_int_avx2(const int* a, const int* b, size_t size)
+{
+    __m256 sum = _mm256_setzero_ps();
+    size_t i = 0;
+    for (; i+8<=size; i+=8) {
+        __m256i va = _mm256_loadu_si256(reinterpret_cast<const __m256i*>(a+i));
+        __m256i vb = _mm256_loadu_si256(reinterpret_cast<const __m256i*>(b+i));
+        sum = _mm256_add_ps(sum, _mm256_cvtepi32_ps(_mm256_min_epi32(va, vb)));
+    }
+    float result = sum_ps_avx2(sum);
+    for (; i<size; ++i) {
+        result += (float)(a[i] < b[i] ? a[i] : b[i]);
+    }
+    return result;
+}
+
+
+/********************************* AVX-512 *********************************/
+
+#ifdef FLANN_SIMD_AVX512
+
+/* The tails are read with masked loads, the masked out lanes being zero. */
+
+FLANN_SIMD_TARGET("avx512f,avx512bw")
+inline __mmask16 tail_mask16(size_t count)
+{
+    return (__mmask16)((1u << count) - 1);
+}
+
+FLANN_SIMD_TARGET("avx512f,avx512bw")
+inline __mmask64 tail_mask64(size_t count)
+{
+    return count>=64 ? ~(__mmask64)0 : (__mmask64)((1ull << count) - 1);
+}
+
+FLANN_SIMD_TARGET("avx512f,avx512bw")
+inline __m512 abs_ps_avx512(__m512 v)
+{
+    return _mm512_castsi512_ps(_mm512_and_si512(_mm512_castps_si512(v), _mm512_set1_epi32(0x7fffffff)));
+}
+
+FLANN_SIMD_TARGET("avx512f,avx512bw")
+inline float l2_float_avx512(const float* a, const float* b, size_t size)
+{
+    __m512 sum0 = _mm512_setzero_ps();
+    __m512 sum1 = _mm512_setzero_ps();
+    size_t i = 0;
+    for (; i+32<=size; i+=32) {
+        __m512 diff0 = _mm512_sub_ps(_mm512_loadu_ps(a+i), _mm512_loadu_ps(b+i));
+        __m512 diff1 = _mm512_sub_ps(_mm512_loadu_ps(a+i+16), _mm512_loadu_ps(b+i+16));
+        sum0 = _mm512_fmadd_ps(diff0, diff0, sum0);
+        sum1 = _mm512_fmadd_ps(diff1, diff1, sum1);
+    }
+    for (; i<size; i+=16) {
+        __mmask16 mask = tail_mask16(size-i<16 ? size-i : 16);
+        __m512 diff = _mm512_sub_ps(_mm512_maskz_loadu_ps(mask, a+i), _mm512_maskz_loadu_ps(mask, b+i));
+        sum0 = _mm512_fmadd_ps(diff, diff, sum0);
+    }
+    return _mm512_reduce_add_ps(_mm512_add_ps(sum0, sum1));
+}
+
+FLANN_SIMD_TARGET("avx512f,avx512bw")
+inline float l1_float_avx512(const float* a, const float* b, size_t size)
+{
+    __m512 sum0 = _mm512_setzero_ps();
+    __m512 sum1 = _mm512_setzero_ps();
+    size_t i = 0;
+    for (; i+32<=size; i+=32) {
+        sum0 = _mm512_add_ps(sum0, abs_ps_avx512(_mm512_sub_ps(_mm512_loadu_ps(a+i), _mm512_loadu_ps(b+i))));
+        sum1 = _mm512_add_ps(sum1, abs_ps_avx512(_mm512_sub_ps(_mm512_loadu_ps(a+i+16), _mm512_loadu_ps(b+i+16))));
+    }
+    for (; i<size; i+=16) {
+        __mmask16 mask = tail_mask16(size-i<16 ? size-i : 16);
+        sum0 = _mm512_add_ps(sum0, abs_ps_avx512(_mm512_sub_ps(_mm512_maskz_loadu_ps(mask, a+i), _mm512_maskz_loadu_ps(mask, b+i))));
+    }
+    return _mm512_reduce_add_ps(_mm512_add_ps(sum0, sum1));
+}
+
+FLANN_SIMD_TARGET("avx512f,avx512bw")
+inline float hik_float_avx512(const float* a, const float* b, size_t size)
+{
+    __m512 sum0 = _mm512_setzero_ps();
+    __m512 sum1 = _mm512_setzero_ps();
+    size_t i = 0;
+    for (; i+32<=size; i+=32) {
+        sum0 = _mm512_add_ps(sum0, _mm512_min_ps(_mm512_loadu_ps(a+i), _mm512_loadu_ps(b+i)));
+        sum1 = _mm512_add_ps(sum1, _mm512_min_ps(_mm512_loadu_ps(a+i+16), _mm512_loadu_ps(b+i+16)));
+    }
+    for (; i<size; i+=16) {
+        __mmask16 mask = tail_mask16(size-i<16 ? size-i : 16);
+        sum0 = _mm512_add_ps(sum0, _mm512_min_ps(_mm512_maskz_loadu_ps(mask, a+i), _mm512_maskz_loadu_ps(mask, b+i)));
+    }
+    return _mm512_reduce_add_ps(_mm512_add_ps(sum0, sum1));
+}
+
+FLANN_SIMD_TARGET("avx512f,avx512bw")
+inline float l2_uchar_avx512(const unsigned char* a, const unsigned char* b, size_t size)
+{
+    float result = 0;
+    size_t i = 0;
+    while (i+32<=size) {
+        size_t end = i + UCHAR_L2_BLOCK < size ? i + UCHAR_L2_BLOCK : size;
+        __m512i sum = _mm512_setzero_si512();
+        for (; i+32<=end; i+=32) {
+            __m512i va = _mm512_cvtepu8_epi16(_mm256_loadu_si256(reinterpret_cast<const __m256i*>(a+i)));
+            __m512i vb = _mm512_cvtepu8_epi16(_mm256_loadu_si256(reinterpret_cast<const __m256i*>(b+i)));
+            __m512i diff = _mm512_sub_epi16(va, vb);
+            sum = _mm512_add_epi32(sum, _mm512_madd_epi16(diff, diff));
+        }
+        result += (float)_mm512_reduce_add_epi32(sum);
+    }
+    for (; i<size; ++i) {
+        float diff = (float)(a[i] - b[i]);
+        result += diff * diff;
+    }
+    return result;
+}
+
+FLANN_SIMD_TARGET("avx512f,avx512bw")
+inline float l1_uchar_avx512(const unsigned char* a, const unsigned char* b, size_t size)
+{
+    __m512i sum = _mm512_setzero_si512();
+    for (size_t i = 0; i<size; i+=64) {
+        __mmask64 mask = tail_mask64(size-i);
+        __m512i va = _mm512_maskz_loadu_epi8(mask, a+i);
+        __m512i vb = _mm512_maskz_loadu_epi8(mask, b+i);
+        sum = _mm512_add_epi64(sum, _mm512_sad_epu8(va, vb));
+    }
+    return (float)_mm512_reduce_add_epi64(sum);
+}
+
+FLANN_SIMD_TARGET("avx512f,avx512bw")
+inline float hik_uchar_avx512(const unsigned char* a, const unsigned char* b, size_t size)
+{
+    const __m512i zero = _mm512_setzero_si512();
+    __m512i sum = _mm512_setzero_si512();
+    for (size_t i = 0; i<size; i+=64) {
+        __mmask64 mask = tail_mask64(size-i);
+        __m512i va = _mm512_maskz_loadu_epi8(mask, a+i);
+        __m512i vb = _mm512_maskz_loadu_epi8(mask, b+i);
+        sum = _mm512_add_epi64(sum, _mm512_sad_epu8(_mm512_min_epu8(va, vb), zero));
+    }
+    return (float)_mm512_reduce_add_epi64(sum);
+}
+
+FLANN_SIMD_TARGET("avx512f,avx512bw")
+inline float l2_int_avx512(const int* a, const int* b, size_t size)
+{
+    __m512 sum = _mm512_setzero_ps();
+    for (size_t i = 0; i<size; i+=16) {
+        __mmask16 mask = tail_mask16(size-i<16 ? size-i : 16);
+        __m512i diff = _mm512_sub_epi32(_mm512_maskz_loadu_epi32(mask, a+i), _mm512_maskz_loadu_epi32(mask, b+i));
+        __m512 fdiff = _mm512_cvtepi32_ps(diff);
+        sum = _mm512_fmadd_ps(fdiff, fdiff, sum);
+    }
+    return _mm512_reduce_add_ps(sum);
+}
+
+FLANN_SIMD_TARGET("avx512f,avx512bw")
+inline float l1_int_avx512(const int* a, const int* b, size_t size)
+{
+    __m512 sum = _mm512_setzero_ps();
+    for (size_t i = 0; i<size; i+=16) {
+        __mmask16 mask = tail_mask16(size-i<16 ? size-i : 16);
+        __m512i diff = _mm512_sub_epi32(_mm512_maskz_loadu_epi32(mask, a+i), _mm512_maskz_loadu_epi32(mask, b+i));
+        sum = _mm512_add_ps(sum, _mm512_cvtepi32_ps(_mm512_abs_epi32(diff)));
+    }
+    return _mm512_reduce_add_ps(sum);
+}
+
+FLANN_SIMD_TARGET("avx512f,avx512bw")
+inline float hik_int_avx512(const int* a, const int* b, size_t size)
+{
+    __m512 sum = _mm512_setzero_ps();
+    for (size_t i = 0; i<size; i+=16) {
+        __mmask16 mask = tail_mask16(size-i<16 ? size-i : 16);
+        __m512i smaller = _mm512_min_epi32(_mm512_maskz_loadu_epi32(mask, a+i), _mm512_maskz_loadu_epi32(mask, b+i));
+        sum = _mm512_add_ps(sum, _mm512_cvtepi32_ps(smaller));
+    }
+    return _mm512_reduce_add_ps(sum);
+}
+
+#endif // FLANN_SIMD_AVX512
+
+
+template <typename T>
+inline KernelTable<T> make_kernel_table(typename KernelTable<T>::Function l2,
+                                        typename KernelTable<T>::Function l1,
+                                        typename KernelTable<T>::Function hik)
+{
+    KernelTable<T> table;
+    table.functions[KERNEL_L2] = l2;
+    table.functions[KERNEL_L1] = l1;
+    table.functions[KERNEL_HIK] = hik;
+    return table;
+}
+
+#ifdef FLANN_SIMD_AVX512
+#define FLANN_SIMD_SELECT_AVX512(ElementType, type) \
+    if (level()>=LEVEL_AVX512) return make_kernel_table<ElementType>(l2_##type##_avx512, l1_##type##_avx512, hik_##type##_avx512);
+#else
+#define FLANN_SIMD_SELECT_AVX512(ElementType, type)
+#endif
+
+/* Defines kernel_table<ElementType>(), selecting its kernels on first use. */
+#define FLANN_SIMD_KERNEL_TABLE(ElementType, type) \
+    inline KernelTable<ElementType> select_##type##_kernels() \
+    { \
+        FLANN_SIMD_SELECT_AVX512(ElementType, type) \
+        if (level()>=LEVEL_AVX2) return make_kernel_table<ElementType>(l2_##type##_avx2, l1_##type##_avx2, hik_##type##_avx2); \
+        if (level()>=LEVEL_SSE2) return make_kernel_table<ElementType>(l2_##type##_sse2, l1_##type##_sse2, hik_##type##_sse2); \
+        return make_kernel_table<ElementType>(NULL, NULL, NULL); \
+    } \
+    template <> \
+    inline const KernelTable<ElementType>* kernel_table<ElementType>() \
+    { \
+        static const KernelTable<ElementType> table = select_##type##_kernels(); \
+        return &table; \
+    }
+
+FLANN_SIMD_KERNEL_TABLE(float, float)
+FLANN_SIMD_KERNEL_TABLE(unsigned char, uchar)
+FLANN_SIMD_KERNEL_TABLE(int, int)
+
+#undef FLANN_SIMD_KERNEL_TABLE
+#undef FLANN_SIMD_SELECT_AVX512
+
+#endif // FLANN_SIMD_DISPATCH
+
+
+template <typename Pointer>
+struct mutable_pointer { typedef Pointer type; };
+template <typename T>
+struct mutable_pointer<const T*> { typedef T* type; };
+
+/**
+ * Calls the kernels for vectors of T, the other iterators are left to the
+ * functors' own loops.
+ */
+template <typename T, typename Iterator1, typename Iterator2>
+struct Dispatcher
+{
+    template <typename I1, typename I2, typename ResultType>
+    static bool compute(Kernel, I1, I2, size_t, ResultType&)
+    {
+        return false;
+    }
+};
+
+template <typename T>
+struct Dispatcher<T, T*, T*>
+{
+    template <typename ResultType>
+    static bool compute(Kernel kernel, const T* a, const T* b, size_t size, ResultType& result)
+    {
+        const KernelTable<T>* table = kernel_table<T>();
+        if (table==NULL || size<MIN_SIZE || table->functions[kernel]==NULL) {
+            return false;
+        }
+        result = (ResultType)table->functions[kernel](a, b, size);
+        return true;
+    }
+};
+
+/**
+ * Computes a distance with the selected kernel.
+ *
+ * @return false if there is no kernel for the vectors, result is then unchanged
+ */
+template <typename T, typename Iterator1, typename Iterator2, typename ResultType>
+inline bool compute(Kernel kernel, Iterator1 a, Iterator2 b, size_t size, ResultType& result)
+{
+    return Dispatcher<T, typename mutable_pointer<Iterator1>::type,
+                      typename mutable_pointer<Iterator2>::type>::compute(kernel, a, b, size, result);
+}
+
+}
+
+}
+
+#endif //FLANN_SIMD_H_
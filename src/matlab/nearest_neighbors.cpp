@@ -91,11 +91,23 @@ static void matlabStructToFlannStruct( const mxArray* mexParams, FLANNParameters
     flannParams.table_number_ = (unsigned int)*(mxGetPr(mxGetField(mexParams, 0, "table_number")));
     flannParams.key_size_ = (unsigned int)*(mxGetPr(mxGetField(mexParams, 0, "key_size")));
     flannParams.multi_probe_level_ = (unsigned int)*(mxGetPr(mxGetField(mexParams, 0, "multi_probe_level")));
+
+    // product quantization
+    flannParams.subquantizers = (int)*(mxGetPr(mxGetField(mexParams, 0, "subquantizers")));
+    flannParams.rerank = (int)*(mxGetPr(mxGetField(mexParams, 0, "rerank")));
+
+    // hnsw
+    flannParams.connections = (int)*(mxGetPr(mxGetField(mexParams, 0, "connections")));
+    flannParams.ef_construction = (int)*(mxGetPr(mxGetField(mexParams, 0, "ef_construction")));
+
+    // distance, the one set with flann_set_distance_type
+    flannParams.distance_type = (flann_distance_t)0;
+    flannParams.distance_order = 0;
 }
 
 static mxArray* flannStructToMatlabStruct( const FLANNParameters& flannParams )
 {
-    const char* fieldnames[] = {"algorithm", "checks", "eps", "sorted", "max_neighbors", "cores", "trees", "leaf_max_size", "branching", "iterations", "centers_init", "cb_index", "table_number", "key_size", "multi_probe_level"};
+    const char* fieldnames[] = {"algorithm", "checks", "eps", "sorted", "max_neighbors", "cores", "trees", "leaf_max_size", "branching", "iterations", "centers_init", "cb_index", "table_number", "key_size", "multi_probe_level", "subquantizers", "rerank", "connections", "ef_construction"};
     mxArray* mexParams = mxCreateStructMatrix(1, 1, sizeof(fieldnames)/sizeof(const char*), fieldnames);
 
     mxSetField(mexParams, 0, "algorithm", to_mx_array(flannParams.algorithm));
@@ -117,6 +129,12 @@ static mxArray* flannStructToMatlabStruct( const FLANNParameters& flannParams )
     mxSetField(mexParams, 0, "key_size", to_mx_array(flannParams.key_size_));
     mxSetField(mexParams, 0, "multi_probe_level", to_mx_array(flannParams.multi_probe_level_));
 
+    mxSetField(mexParams, 0, "subquantizers", to_mx_array(flannParams.subquantizers));
+    mxSetField(mexParams, 0, "rerank", to_mx_array(flannParams.rerank));
+
+    mxSetField(mexParams, 0, "connections", to_mx_array(flannParams.connections));
+    mxSetField(mexParams, 0, "ef_construction", to_mx_array(flannParams.ef_construction));
+
     return mexParams;
 }
 
@@ -29,5 +29,6 @@
 #sys.path.insert(0, os.path.split(__file__)[0]) # make python3 happy
 
 from pyflann.index import *
+from pyflann.sharded import ShardedFLANN
 
 __version__ = '1.8.4.0'
@@ -0,0 +1,148 @@
+#Copyright 2008-2010  Marius Muja (mariusm@cs.ubc.ca). All rights reserved.
+#Copyright 2008-2010  David G. Lowe (lowe@cs.ubc.ca). All rights reserved.
+#
+#THE BSD LICENSE
+#
+#Redistribution and use in source and binary forms, with or without
+#modification, are permitted provided that the following conditions
+#are met:
+#
+#1. Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+#2. Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+#
+#THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+#IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+#OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+#IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+#INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+#NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+#THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+asyncio front end for pyflann. Requires Python 3.7 or later, so it is
+not imported by the pyflann package and has to be imported explicitly:
+
+    from pyflann.aio import AsyncFLANN
+"""
+
+import asyncio
+import functools
+import numpy as np
+
+from pyflann.exceptions import FLANNException
+
+
+class AsyncFLANN(object):
+    """
+    Wraps a FLANN object whose index has been built and answers single
+    point searches from coroutines.
+
+    Concurrent requests are gathered into batches that are searched with
+    a single nn_index call on an executor thread, so that the library can
+    process the queries of a batch in parallel (see the 'cores' search
+    parameter). A batch is searched as soon as it holds max_batch_size
+    points, or max_wait_us microseconds after its first point arrived.
+    """
+
+    def __init__(self, flann, max_batch_size=64, max_wait_us=200, executor=None, **kwargs):
+        """
+        flann is the FLANN object to search, executor the
+        concurrent.futures executor running the searches (None for the
+        default executor of the event loop). Any keyword arguments are
+        passed as search parameters to nn_index.
+        """
+        if max_batch_size < 1:
+            raise ValueError('max_batch_size must be at least 1')
+
+        self.flann = flann
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_us * 1e-6
+        self.executor = executor
+        self.search_params = kwargs
+
+        # pending requests, grouped by number of neighbors
+        self.__pending = {}
+        self.__timers = {}
+        # running batches, kept alive until they are done
+        self.__tasks = set()
+
+    async def search(self, query, num_neighbors=1):
+        """
+        Returns the indices and distances of the num_neighbors nearest
+        neighbors of a single query point, as two arrays of length
+        num_neighbors.
+        """
+        if self.flann._as_parameter_ is None:
+            raise FLANNException(
+                'build_index(...) method not called first or current index deleted.')
+        # a query of the wrong type or size would fail the whole batch, so
+        # it is checked here, before it is batched with the other ones
+        dtype = self.flann.get_indexed_data()[0].dtype
+        if isinstance(query, np.ndarray):
+            if query.dtype.type != dtype.type:
+                raise FLANNException('Index and query must have the same type')
+        else:
+            # sequences of numbers take the type of the index
+            query = np.asarray(query, dtype=dtype)
+        if query.ndim != 1:
+            query = query.reshape(-1)
+        npts, dim = self.flann.get_indexed_shape()
+        if query.size != dim:
+            raise FLANNException('The query has %d values, the indexed points %d'
+                                 % (query.size, dim))
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self.__pending.setdefault(num_neighbors, [])
+        batch.append((query, future))
+
+        if len(batch) >= self.max_batch_size:
+            self.__flush(loop, num_neighbors)
+        elif len(batch) == 1:
+            self.__timers[num_neighbors] = loop.call_later(
+                self.max_wait, self.__flush, loop, num_neighbors)
+
+        return await future
+
+    async def flush(self):
+        """
+        Searches all the pending requests without waiting for their
+        batches to fill up.
+        """
+        loop = asyncio.get_running_loop()
+        for num_neighbors in list(self.__pending):
+            self.__flush(loop, num_neighbors)
+
+    def __flush(self, loop, num_neighbors):
+        timer = self.__timers.pop(num_neighbors, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self.__pending.pop(num_neighbors, None)
+        if batch:
+            task = loop.create_task(self.__run_batch(loop, batch, num_neighbors))
+            self.__tasks.add(task)
+            task.add_done_callback(self.__tasks.discard)
+
+    async def __run_batch(self, loop, batch, num_neighbors):
+        try:
+            qpts = np.vstack([query for query, future in batch])
+            search = functools.partial(self.flann.nn_index, qpts, num_neighbors,
+                                       **self.search_params)
+            result, dists = await loop.run_in_executor(self.executor, search)
+        except Exception as e:
+            for query, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        result = result.reshape(len(batch), num_neighbors)
+        dists = dists.reshape(len(batch), num_neighbors)
+        for i, (query, future) in enumerate(batch):
+            if not future.done():
+                future.set_result((result[i], dists[i]))
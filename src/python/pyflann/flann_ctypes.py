@@ -30,7 +30,7 @@ from numpy import (float32, float64, uint8, int32, require)
 #import ctypes
 #import numpy as np
 from ctypes import (Structure, c_char_p, c_int, c_float, c_uint, c_long,
-                    c_void_p, cdll, POINTER)
+                    c_double, c_void_p, c_size_t, cdll, POINTER)
 from numpy.ctypeslib import ndpointer
 import os
 import sys
@@ -72,6 +72,12 @@ class CustomStructure(Structure):
     def keys(self):
         return self.__field_names
 
+    def copy(self):
+        """ Returns an independent copy of the structure """
+        other = self.__class__.from_buffer_copy(self)
+        other.__field_names = self.__field_names
+        return other
+
     def __translate(self, k, v):
         if k in self._translation_:
             if v in self._translation_[k]:
@@ -109,6 +115,12 @@ class FLANNParameters(CustomStructure):
         ('multi_probe_level_', c_uint),
         ('log_level', c_int),
         ('random_seed', c_long),
+        ('distance_type', c_int),
+        ('distance_order', c_int),
+        ('subquantizers', c_int),
+        ('rerank', c_int),
+        ('connections', c_int),
+        ('ef_construction', c_int),
     ]
     _defaults_ = {
         'algorithm' : 'kdtree',
@@ -131,12 +143,20 @@ class FLANNParameters(CustomStructure):
         'key_size_': 20,
         'multi_probe_level_': 2,
         'log_level' : 'warning',
-        'random_seed' : -1
+        'random_seed' : -1,
+        'distance_type' : 'default',
+        'distance_order' : 0,
+        'subquantizers' : 8,
+        'rerank' : 0,
+        'connections' : 16,
+        'ef_construction' : 200
     }
     _translation_ = {
-        'algorithm'     : {'linear'    : 0, 'kdtree'    : 1, 'kmeans'    : 2, 'composite' : 3, 'kdtree_single' : 4, 'hierarchical': 5, 'lsh': 6, 'saved': 254, 'autotuned' : 255, 'default'   : 1},
+        'algorithm'     : {'linear'    : 0, 'kdtree'    : 1, 'kmeans'    : 2, 'composite' : 3, 'kdtree_single' : 4, 'hierarchical': 5, 'lsh': 6, 'pq': 8, 'hnsw': 9, 'saved': 254, 'autotuned' : 255, 'default'   : 1},
         'centers_init'  : {'random'    : 0, 'gonzales'  : 1, 'kmeanspp'  : 2, 'default'   : 0},
-        'log_level'     : {'none'      : 0, 'fatal'     : 1, 'error'     : 2, 'warning'   : 3, 'info'      : 4, 'default'   : 2}
+        'log_level'     : {'none'      : 0, 'fatal'     : 1, 'error'     : 2, 'warning'   : 3, 'info'      : 4, 'default'   : 2},
+        'distance_type' : {'default'   : 0, 'euclidean' : 1, 'manhattan' : 2, 'minkowski' : 3, 'max_dist' : 4, 'hik' : 5, 'hellinger' : 6,
+                           'chi_square' : 7, 'cs' : 7, 'kullback_leibler' : 8, 'kl' : 8, 'hamming' : 9}
     }
 
 
@@ -239,6 +259,22 @@ flannlib.flann_set_distance_type.argtypes = [
     c_int,
 ]
 
+flannlib.flann_get_distance_type.restype = c_int
+flannlib.flann_get_distance_type.argtypes = []
+
+flannlib.flann_get_distance_order.restype = c_int
+flannlib.flann_get_distance_order.argtypes = []
+
+flannlib.flann_get_index_distance_type.restype = c_int
+flannlib.flann_get_index_distance_type.argtypes = [
+    FLANN_INDEX,  # index_ptr
+]
+
+flannlib.flann_get_index_distance_order.restype = c_int
+flannlib.flann_get_index_distance_order.argtypes = [
+    FLANN_INDEX,  # index_ptr
+]
+
 type_mappings = ( ('float', 'float32'),
                   ('double', 'float64'),
                   ('byte', 'uint8'),
@@ -307,6 +343,51 @@ flannlib.flann_remove_point_%(C)s.argtypes = [
 flann.remove_point[%(numpy)s] = flannlib.flann_remove_point_%(C)s
 """)
 
+flann.remove_points = {}
+define_functions(r"""
+flannlib.flann_remove_points_%(C)s.restype = None
+flannlib.flann_remove_points_%(C)s.argtypes = [
+        FLANN_INDEX,  # index_ptr
+        ndpointer(int32, ndim=1, flags='aligned, c_contiguous'),  # ids
+        c_int,  # count
+]
+flann.remove_points[%(numpy)s] = flannlib.flann_remove_points_%(C)s
+""")
+
+flann.relocate_points = {}
+define_functions(r"""
+flannlib.flann_relocate_points_%(C)s.restype = c_int
+flannlib.flann_relocate_points_%(C)s.argtypes = [
+        FLANN_INDEX,  # index_ptr
+        c_int,  # first_id
+        ndpointer(%(numpy)s, ndim=2, flags='aligned, c_contiguous'),  # dataset
+        c_int,  # rows
+]
+flann.relocate_points[%(numpy)s] = flannlib.flann_relocate_points_%(C)s
+""")
+
+
+flann.clone_index = {}
+define_functions(r"""
+flannlib.flann_clone_index_%(C)s.restype = FLANN_INDEX
+flannlib.flann_clone_index_%(C)s.argtypes = [
+        FLANN_INDEX,  # index_ptr
+        POINTER(FLANNParameters)  # flann_params
+]
+flann.clone_index[%(numpy)s] = flannlib.flann_clone_index_%(C)s
+""")
+
+
+flann.rebuild_index = {}
+define_functions(r"""
+flannlib.flann_rebuild_index_%(C)s.restype = c_int
+flannlib.flann_rebuild_index_%(C)s.argtypes = [
+        FLANN_INDEX,  # index_ptr
+        POINTER(FLANNParameters)  # flann_params
+]
+flann.rebuild_index[%(numpy)s] = flannlib.flann_rebuild_index_%(C)s
+""")
+
 
 flann.save_index = {}
 define_functions(r"""
@@ -318,6 +399,18 @@ flannlib.flann_save_index_%(C)s.argtypes = [
 flann.save_index[%(numpy)s] = flannlib.flann_save_index_%(C)s
 """)
 
+flann.save_index_with_compression = {}
+define_functions(r"""
+flannlib.flann_save_index_with_compression_%(C)s.restype = c_int
+flannlib.flann_save_index_with_compression_%(C)s.argtypes = [
+        FLANN_INDEX,  # index_id
+        c_char_p,  # filename
+        c_int,  # compression
+        c_int,  # level
+]
+flann.save_index_with_compression[%(numpy)s] = flannlib.flann_save_index_with_compression_%(C)s
+""")
+
 flann.load_index = {}
 define_functions(r"""
 flannlib.flann_load_index_%(C)s.restype = FLANN_INDEX
@@ -330,6 +423,54 @@ flannlib.flann_load_index_%(C)s.argtypes = [
 flann.load_index[%(numpy)s] = flannlib.flann_load_index_%(C)s
 """)
 
+flann.load_index_with_distance = {}
+define_functions(r"""
+flannlib.flann_load_index_with_distance_%(C)s.restype = FLANN_INDEX
+flannlib.flann_load_index_with_distance_%(C)s.argtypes = [
+        c_char_p,  #filename
+        ndpointer(%(numpy)s, ndim=2, flags='aligned, c_contiguous'),  # dataset
+        c_int,  # rows
+        c_int,  # cols
+        c_int,  # distance_type
+        c_int,  # order
+]
+flann.load_index_with_distance[%(numpy)s] = flannlib.flann_load_index_with_distance_%(C)s
+""")
+
+flann.save_index_to_buffer = {}
+define_functions(r"""
+flannlib.flann_save_index_to_buffer_%(C)s.restype = c_int
+flannlib.flann_save_index_to_buffer_%(C)s.argtypes = [
+        FLANN_INDEX,  # index_id
+        c_int,  # compression
+        c_int,  # level
+        c_size_t,  # reserve
+        POINTER(c_void_p),  # buffer
+        POINTER(c_size_t),  # size
+]
+flann.save_index_to_buffer[%(numpy)s] = flannlib.flann_save_index_to_buffer_%(C)s
+""")
+
+flannlib.flann_free_buffer.restype = None
+flannlib.flann_free_buffer.argtypes = [
+        c_void_p,  # buffer
+]
+
+flann.load_index_from_buffer = {}
+define_functions(r"""
+flannlib.flann_load_index_from_buffer_%(C)s.restype = FLANN_INDEX
+flannlib.flann_load_index_from_buffer_%(C)s.argtypes = [
+        c_void_p,  # buffer
+        c_size_t,  # size
+        ndpointer(%(numpy)s, ndim=2, flags='aligned, c_contiguous'),  # dataset
+        c_int,  # rows
+        c_int,  # cols
+        c_int,  # distance_type
+        c_int,  # order
+]
+flann.load_index_from_buffer[%(numpy)s] = flannlib.flann_load_index_from_buffer_%(C)s
+""")
+
 flann.find_nearest_neighbors = {}
 define_functions(r"""
 flannlib.flann_find_nearest_neighbors_%(C)s.restype = c_int
@@ -391,6 +532,24 @@ flannlib.flann_find_nearest_neighbors_index_double.argtypes = [
 ]
 flann.find_nearest_neighbors_index[float64] = flannlib.flann_find_nearest_neighbors_index_double
 
+# Separate function objects taking plain pointers, used by prepared searches
+# to skip the per-call ndpointer checks.
+flann.find_nearest_neighbors_index_raw = {}
+define_functions(r"""
+raw_function = flannlib['flann_find_nearest_neighbors_index_%(C)s']
+raw_function.restype = c_int
+raw_function.argtypes = [
+        FLANN_INDEX,  # index_id
+        c_void_p,  # testset
+        c_int,  # tcount
+        c_void_p,  # result
+        c_void_p,  # dists
+        c_int,  # nn
+        POINTER(FLANNParameters) # flann_params
+]
+flann.find_nearest_neighbors_index_raw[%(numpy)s] = raw_function
+""")
+
 flann.radius_search = {}
 define_functions(r"""
 flannlib.flann_radius_search_%(C)s.restype = c_int
@@ -418,6 +577,37 @@ flannlib.flann_radius_search_double.argtypes = [
 ]
 flann.radius_search[float64] = flannlib.flann_radius_search_double
 
+flann.radius_search_batch = {}
+define_functions(r"""
+flannlib.flann_radius_search_batch_%(C)s.restype = c_int
+flannlib.flann_radius_search_batch_%(C)s.argtypes = [
+        FLANN_INDEX,  # index_id
+        ndpointer(%(numpy)s, ndim=2, flags='aligned, c_contiguous'),  # testset
+        c_int,  # tcount
+        ndpointer(int32, ndim=1, flags='aligned, c_contiguous, writeable'),  # offsets
+        ndpointer(int32, ndim=1, flags='aligned, c_contiguous, writeable'),  # indices
+        ndpointer(float32, ndim=1, flags='aligned, c_contiguous, writeable'),  # dists
+        c_int,  # max_total
+        c_float,  # radius
+        POINTER(FLANNParameters) # flann_params
+]
+flann.radius_search_batch[%(numpy)s] = flannlib.flann_radius_search_batch_%(C)s
+""")
+
+flannlib.flann_radius_search_batch_double.restype = c_int
+flannlib.flann_radius_search_batch_double.argtypes = [
+    FLANN_INDEX,  # index_id
+    ndpointer(float64, ndim=2, flags='aligned, c_contiguous'),  # testset
+    c_int,  # tcount
+    ndpointer(int32, ndim=1, flags='aligned, c_contiguous, writeable'),  # offsets
+    ndpointer(int32, ndim=1, flags='aligned, c_contiguous, writeable'),  # indices
+    ndpointer(float64, ndim=1, flags='aligned, c_contiguous, writeable'),  # dists
+    c_int,  # max_total
+    c_float,  # radius
+    POINTER(FLANNParameters)  # flann_params
+]
+flann.radius_search_batch[float64] = flannlib.flann_radius_search_batch_double
+
 
 flann.compute_cluster_centers = {}
 define_functions(r"""
@@ -445,6 +635,38 @@ flannlib.flann_compute_cluster_centers_double.argtypes = [
 flann.compute_cluster_centers[float64] = flannlib.flann_compute_cluster_centers_double
 
 
+flann.kmeans = {}
+define_functions(r"""
+flannlib.flann_kmeans_%(C)s.restype = c_int
+flannlib.flann_kmeans_%(C)s.argtypes = [
+        ndpointer(%(numpy)s, ndim=2, flags='aligned, c_contiguous'),  # dataset
+        c_int,  # rows
+        c_int,  # cols
+        c_int,  # clusters
+        ndpointer(float32, flags='aligned, c_contiguous, writeable'),  # centers
+        ndpointer(int32, flags='aligned, c_contiguous, writeable'),  # labels
+        POINTER(c_double),  # inertia
+        c_int,  # batch_size
+        POINTER(FLANNParameters)  # flann_params
+]
+flann.kmeans[%(numpy)s] = flannlib.flann_kmeans_%(C)s
+""")
+# double is an exception
+flannlib.flann_kmeans_double.restype = c_int
+flannlib.flann_kmeans_double.argtypes = [
+    ndpointer(float64, ndim=2, flags='aligned, c_contiguous'),  # dataset
+    c_int,  # rows
+    c_int,  # cols
+    c_int,  # clusters
+    ndpointer(float64, flags='aligned, c_contiguous, writeable'),  # centers
+    ndpointer(int32, flags='aligned, c_contiguous, writeable'),  # labels
+    POINTER(c_double),  # inertia
+    c_int,  # batch_size
+    POINTER(FLANNParameters)  # flann_params
+]
+flann.kmeans[float64] = flannlib.flann_kmeans_double
+
+
 flann.free_index = {}
 define_functions(r"""
 flannlib.flann_free_index_%(C)s.restype = None
@@ -25,8 +25,14 @@
 #THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 #from pyflann.flann_ctypes import *  # NOQA
+import os
 import sys
-from ctypes import pointer, c_float, byref, c_char_p
+import json
+import struct
+import threading
+import weakref
+from mmap import ALLOCATIONGRANULARITY
+from ctypes import pointer, c_float, c_double, byref, c_char_p, c_void_p, c_size_t
 from pyflann.flann_ctypes import (flannlib, FLANNParameters, allowed_types,
                                   ensure_2d_array, default_flags, flann)
 import numpy as np
@@ -37,35 +43,394 @@ import numpy.random as _rn
 
 index_type = np.int32
 
+_HAMMING = FLANNParameters._translation_['distance_type']['hamming']
+
+# compressions of the saved indexes (flann_compression_t), with their
+# default level
+_COMPRESSIONS = {'none': (0, 0), 'lz4': (1, 1), 'lz4hc': (2, 9)}
+
+# A bundle is an index file as written by save_index, followed by the
+# dataset (aligned so that it can be memory mapped), the parameters in
+# JSON and a fixed size trailer describing the sections. As the index
+# comes first, a bundle is also a valid index file for load_index.
+_BUNDLE_MAGIC = b'FLANNBDL'
+_BUNDLE_VERSION = 1
+# magic, version, dtype, rows, cols, distance type, distance order,
+# dataset offset, parameters offset, parameters size, removed ids offset,
+# number of removed ids
+_BUNDLE_TRAILER = struct.Struct('<8sI8sqqiiqqqqq')
+
+# A shared memory segment written by save_shared holds a header with the
+# size of the bundle that follows it. The header keeps the dataset of the
+# bundle aligned on 64 bytes.
+_SHARED_MAGIC = b'FLANNSHM'
+# magic, bundle size
+_SHARED_HEADER = struct.Struct('<8sq48x')
+
+# The index files written by save_index are followed by the added points,
+# the removed ids and the distance of the index, located by a fixed size
+# trailer.
+_STATE_MAGIC = b'FLANNSTA'
+# magic, dtype, added rows, cols, added points offset, removed ids offset,
+# number of removed ids, distance type, distance order
+_STATE_TRAILER = struct.Struct('<8s8sqqqqqii')
+
+
+def _read_trailer(filename, trailer, magic):
+    """
+    Returns the fields of the trailer at the end of the file, or None if
+    the file does not end with a trailer with the given magic.
+    """
+    try:
+        with open(filename, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() < trailer.size:
+                return None
+            f.seek(-trailer.size, os.SEEK_END)
+            fields = trailer.unpack(f.read(trailer.size))
+    except (IOError, OSError):
+        return None
+    if fields[0] != magic:
+        return None
+    return fields
+
+
+def _unpack_trailer(memory, trailer, magic):
+    """
+    Returns the fields of the trailer at the end of the array of bytes, or
+    None if it does not end with a trailer with the given magic.
+    """
+    if memory.size < trailer.size:
+        return None
+    fields = trailer.unpack_from(memory, memory.size - trailer.size)
+    if fields[0] != magic:
+        return None
+    return fields
+
+
+def _compression(compression, level):
+    """ returns the flann_compression_t and level of a compression """
+    if compression not in _COMPRESSIONS:
+        raise FLANNException('Unknown compression: %r, expected one of %s'
+                             % (compression, ', '.join(sorted(_COMPRESSIONS))))
+    compression_type, default_level = _COMPRESSIONS[compression]
+    return compression_type, default_level if level is None else int(level)
+
+
+def _shared_memory():
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:
+        raise FLANNException('Shared memory indexes require Python 3.8 or later')
+    return shared_memory
+
+
+class _SharedBuffer(object):
+    """
+    Exposes the memory of a shared memory segment to numpy. The arrays
+    created from the buffer keep it alive, and the segment is detached
+    from the process once they have all been freed.
+    """
+
+    def __init__(self, name):
+        shared_memory = _shared_memory()
+        self.segment = None
+        try:
+            self.segment = shared_memory.SharedMemory(name, track=False)
+        except TypeError:
+            # before Python 3.13 attaching registers the segment with the
+            # resource tracker, which unlinks it when the processes using
+            # the tracker exit. That is wanted when the tracker is shared
+            # with the process that created the segment (e.g. a forked
+            # worker), not when attaching starts a tracker of its own.
+            from multiprocessing import resource_tracker
+            tracker = getattr(resource_tracker, '_resource_tracker', None)
+            own_tracker = getattr(tracker, '_fd', None) is None
+            self.segment = shared_memory.SharedMemory(name)
+            if own_tracker and os.name == 'posix':
+                resource_tracker.unregister(self.segment._name, 'shared_memory')
+        address = np.frombuffer(self.segment.buf, dtype=np.uint8).ctypes.data
+        self.__array_interface__ = {'data': (address, True), 'shape': (self.segment.size,),
+                                    'typestr': '|u1', 'version': 3}
+
+    def __del__(self):
+        if self.segment is not None:
+            self.segment.close()
+
+
+class _LibraryBuffer(object):
+    """
+    Exposes to numpy a buffer allocated by the library, which is freed
+    once the arrays created from it have all been freed.
+    """
+
+    def __init__(self, address, size):
+        self.address = address
+        self.__array_interface__ = {'data': (address, False), 'shape': (size,),
+                                    'typestr': '|u1', 'version': 3}
+
+    def __del__(self):
+        flannlib.flann_free_buffer(self.address)
+
 
 def set_distance_type(distance_type, order=0):
     """
     Sets the distance type used. Possible values: euclidean, manhattan, minkowski, max_dist,
-    hik, hellinger, cs, kl.
-    """
+    hik, hellinger, cs, kl, hamming.
+
+    The hamming distance counts the differing bits of binary descriptors
+    (such as ORB or BRIEF codes) stored as uint8 rows, and is supported by
+    the linear, hierarchical and lsh algorithms.
 
-    distance_translation = {'euclidean': 1,
-                            'manhattan': 2,
-                            'minkowski': 3,
-                            'max_dist': 4,
-                            'hik': 5,
-                            'hellinger': 6,
-                            'chi_square': 7,
-                            'cs': 7,
-                            'kullback_leibler': 8,
-                            'kl': 8,
-                            }
+    This is the default of the whole process, used by the FLANN objects
+    whose distance_type parameter is not set (see FLANN.set_distance_type).
+    An index keeps the distance it was built with.
+    """
     if isinstance(distance_type, str):
-        distance_type = distance_translation[distance_type]
+        distance_type = FLANNParameters._translation_['distance_type'][distance_type]
 
     flannlib.flann_set_distance_type(distance_type, order)
 
 
+def check_output_array(arr, dtype, shape, name):
+    """
+    Checks that arr can be written in place as the output buffer of a
+    search and returns a view of it with the given shape (or a flat view if
+    shape is None). The array must have the given type, be C-contiguous,
+    aligned and writeable; it is never copied.
+    """
+    if not isinstance(arr, np.ndarray) or arr.dtype != dtype:
+        raise FLANNException('The %s output array must be a numpy array of type %s'
+                             % (name, np.dtype(dtype)))
+    if not (arr.flags.c_contiguous and arr.flags.aligned and arr.flags.writeable):
+        raise FLANNException('The %s output array must be C-contiguous, aligned and writeable'
+                             % name)
+    if shape is None:
+        return arr.reshape(arr.size)
+    if arr.size != int(np.prod(shape)):
+        raise FLANNException('The %s output array must have %d elements, got %d'
+                             % (name, int(np.prod(shape)), arr.size))
+    return arr.reshape(shape)
+
+
+def open_dataset(filename, dtype, shape, offset=0):
+    """
+    Opens a dataset stored in a file as a raw C-ordered array and returns
+    it as a read-only np.memmap, so that its rows are paged in from disk
+    when the index accesses them instead of being loaded into memory.
+
+    shape is (rows, cols); rows may be -1 to use all the rows in the file
+    after offset.
+    """
+    dtype = np.dtype(dtype)
+    if dtype.type not in allowed_types:
+        raise FLANNException('Cannot handle type: %s' % dtype)
+    rows, cols = shape
+    if rows < 0:
+        rows = (os.path.getsize(filename) - offset) // (cols * dtype.itemsize)
+    return np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=(rows, cols))
+
+
+def _as_dataset(pts, dtype=None, shape=None):
+    """
+    Returns pts as an array that can be indexed without copying it. pts
+    may also be a file name, opened with open_dataset(pts, dtype, shape).
+    Memory maps are never copied, an exception is raised instead.
+    """
+    if isinstance(pts, str):
+        if dtype is None or shape is None:
+            raise FLANNException('The dtype and shape of the dataset file must be given')
+        pts = open_dataset(pts, dtype, shape)
+
+    if pts.dtype.type not in allowed_types:
+        raise FLANNException('Cannot handle type: %s' % pts.dtype)
+
+    if isinstance(pts, np.memmap) and not (pts.flags.c_contiguous and pts.flags.aligned):
+        raise FLANNException('Memory mapped datasets must be C-contiguous and aligned')
+
+    return ensure_2d_array(pts, default_flags)
+
+
 def to_bytes(string):
     if sys.hexversion > 0x03000000:
         return bytes(string, 'utf-8')
     return string
 
+
+class _PointStore(object):
+    """
+    A single contiguous buffer holding the points added to an index. The
+    index points into the buffer, whose capacity doubles when it is full,
+    so that appending n points copies O(n) rows in total.
+    """
+
+    def __init__(self, dtype, dim):
+        self.buffer = np.empty((0, dim), dtype=dtype)
+        self.size = 0
+
+    @property
+    def capacity(self):
+        return self.buffer.shape[0]
+
+    @property
+    def data(self):
+        """ the points in the store, as a view of the buffer """
+        return self.buffer[:self.size]
+
+    def append(self, pts):
+        """
+        Copies pts at the end of the store. Returns the previous buffer if
+        it had to be reallocated, otherwise None.
+        """
+        rows = pts.shape[0]
+        old_buffer = None
+        if self.size + rows > self.capacity:
+            old_buffer = self.reserve(max(self.size + rows, 2 * self.capacity))
+        self.buffer[self.size:self.size + rows] = pts
+        self.size += rows
+        return old_buffer
+
+    def reserve(self, capacity):
+        """
+        Moves the points to a new buffer of the given capacity, which must
+        be at least the size of the store, and returns the previous buffer.
+        """
+        old_buffer = self.buffer
+        self.buffer = np.empty((capacity, old_buffer.shape[1]), dtype=old_buffer.dtype)
+        self.buffer[:self.size] = old_buffer[:self.size]
+        return old_buffer
+
+
+class _IndexHandle(object):
+    """
+    Owns an index created by the library and frees it once it is no longer
+    referenced. Searches hold a reference to the handle for the duration
+    of the call, so an index that is replaced while searches are running
+    on it is only freed after they return.
+    """
+
+    def __init__(self, index, index_type, flann_parameters):
+        self._as_parameter_ = index
+        self.index_type = index_type
+        self.flann_parameters = flann_parameters.copy()
+        self.distance_type = flannlib.flann_get_index_distance_type(index)
+        self.distance_order = flannlib.flann_get_index_distance_order(index)
+
+    def __del__(self):
+        if flann is not None:
+            flann.free_index[self.index_type](
+                self._as_parameter_, pointer(self.flann_parameters))
+
+
+class PreparedSearch(object):
+    """
+    A k-nearest neighbor search with frozen search parameters, created by
+    FLANN.prepare_search(). The parameters structure and the library
+    function are resolved once, so calling the object only costs the
+    library call itself plus a size check.
+
+    The search is bound to the index that existed when it was prepared;
+    it becomes invalid when that index is rebuilt, reloaded or deleted.
+    """
+
+    def __init__(self, index, index_type, dim, num_neighbors, flann_parameters):
+        self.num_neighbors = num_neighbors
+        self.dim = dim
+        self.index_type = index_type
+        if index_type == np.float64:
+            self.dist_type = np.float64
+        else:
+            self.dist_type = np.float32
+
+        self._index = index
+        self._function = flann.find_nearest_neighbors_index_raw[index_type]
+        self._flann_parameters = flann_parameters
+        self._parameters_ptr = pointer(flann_parameters)
+        # the arrays used by the last call and their addresses, replaced
+        # together so that concurrent calls never pair the addresses with
+        # other arrays; holding a reference to the arrays guarantees that
+        # their memory is not reused
+        self._last = (None, None, None, None, None, None)
+
+    def invalidate(self):
+        self._index = None
+
+    def __call__(self, qpts, indices, dists):
+        """
+        Finds the num_neighbors nearest neighbors of the points in qpts
+        and writes them into indices and dists.
+
+        qpts, indices and dists must be C-contiguous numpy arrays of the
+        index type, int32 and the distance type respectively. Only the
+        types and sizes of the arrays are checked.
+
+        Returns: (indices, dists)
+        """
+        index = self._index
+        if index is None:
+            raise FLANNException('The index of this prepared search was rebuilt or deleted.')
+
+        self.__check_arrays(qpts, indices, dists)
+
+        last = self._last
+        if qpts is last[0] and indices is last[1] and dists is last[2]:
+            qpts_ptr, indices_ptr, dists_ptr = last[3:]
+        else:
+            qpts_ptr = qpts.ctypes.data
+            indices_ptr = indices.ctypes.data
+            dists_ptr = dists.ctypes.data
+            self._last = (qpts, indices, dists, qpts_ptr, indices_ptr, dists_ptr)
+        nqpts = qpts.size // self.dim
+
+        if self._function(index, qpts_ptr, nqpts, indices_ptr, dists_ptr,
+                          self.num_neighbors, self._parameters_ptr) < 0:
+            raise FLANNException('Error occured during the nearest neighbor search.')
+        return (indices, dists)
+
+    def bind(self, qpts, indices, dists):
+        """
+        Returns a function without arguments that searches for the points
+        currently stored in qpts and writes the results into indices and
+        dists, with the buffer addresses resolved in advance. This is the
+        cheapest way to run repeated searches from a fixed set of buffers,
+        for example by copying each new query into qpts before the call.
+
+        The arrays must stay alive and must not be resized while the
+        returned function is in use.
+        """
+        self.__check_arrays(qpts, indices, dists)
+        nqpts = qpts.size // self.dim
+
+        function = self._function
+        qpts_ptr = c_void_p(qpts.ctypes.data)
+        indices_ptr = c_void_p(indices.ctypes.data)
+        dists_ptr = c_void_p(dists.ctypes.data)
+        num_neighbors = self.num_neighbors
+        parameters_ptr = self._parameters_ptr
+        buffers = (qpts, indices, dists)
+
+        def search():
+            index = self._index
+            if index is None:
+                raise FLANNException('The index of this prepared search was rebuilt or deleted.')
+            if function(index, qpts_ptr, nqpts, indices_ptr, dists_ptr,
+                        num_neighbors, parameters_ptr) < 0:
+                raise FLANNException('Error occured during the nearest neighbor search.')
+            return buffers[1:]
+
+        return search
+
+    def __check_arrays(self, qpts, indices, dists):
+        if (qpts.dtype.type is not self.index_type or indices.dtype.type is not index_type
+                or dists.dtype.type is not self.dist_type):
+            raise FLANNException('The arrays must be of types %s, %s and %s'
+                                 % (np.dtype(self.index_type), np.dtype(index_type),
+                                    np.dtype(self.dist_type)))
+        num_results = (qpts.size // self.dim) * self.num_neighbors
+        if indices.size < num_results or dists.size < num_results:
+            raise FLANNException('The output arrays must have room for %d results' % num_results)
+
+
 # This class is derived from an initial implementation by Hoyt Koepke
 # (hoytak@cs.ubc.ca)
 
@@ -73,6 +438,25 @@ def to_bytes(string):
 class FLANN(object):
     """
     This class defines a python interface to the FLANN lirary.
+
+    The search methods (nn_index, nn_radius, nn_radius_batch and the
+    prepared searches) may be called concurrently from several threads on
+    the same object. Each call works on its own copy of the parameters, so
+    search keyword arguments only apply to that call, and the library is
+    called without holding the GIL, so the searches run in parallel.
+    Methods that change the index (build_index, add_points, remove_point,
+    remove_points, compact without background, load_index and
+    delete_index) must not run concurrently with any other call on the
+    same object.
+
+    Each object has its own distance, given by the distance_type and
+    distance_order parameters (see set_distance_type), so indexes with
+    different distances can be used concurrently.
+
+    Removed points are only flagged and are still visited by the searches
+    until the index is rebuilt. compact() rebuilds the index, optionally
+    on a background thread while the searches keep using the current
+    index, and set_compaction_policy() makes this happen automatically.
     """
     __rn_gen = _rn.RandomState()
 
@@ -89,9 +473,17 @@ class FLANN(object):
 
         self.__curindex = None
         self.__curindex_data = None  # pointer to keep the numpy data alive
-        self.__added_data = []  # contained to keep any added numpy data alive
-        self.__removed_ids = []  # contains the point ids that have been removed
+        self.__added_points = None  # contiguous store of the added points
+        self.__removed_ids = set()  # contains the point ids that have been removed
         self.__curindex_type = None
+        self.__prepared_searches = weakref.WeakSet()
+
+        self.__lock = threading.RLock()
+        self.__compaction = None  # thread rebuilding a copy of the index
+        self.__compaction_log = []  # changes to replay on the rebuilt copy
+        self.__compaction_data = []  # datasets still used by the copy
+        self.__compaction_policy = (None, None, True)
+        self.__built_state = (0, 0, 0)  # (ids, removed ids, points) at the last build
 
         self.__flann_parameters = FLANNParameters()
         self.__flann_parameters.update(kwargs)
@@ -111,29 +503,47 @@ class FLANN(object):
     def get_indexed_shape(self):
         """ returns the shape of the data being indexed """
         npts, dim = self.__curindex_data.shape
-        for _extra in self.__added_data:
-            npts += _extra.shape[0]
-        npts -= len(self.__removed_ids)
+        npts += self.__added_points.size - len(self.__removed_ids)
         return npts, dim
 
+    def get_indexed_capacity(self):
+        """
+        returns the number of points the dataset can hold before the
+        buffer of the added points has to grow, and their dimension
+        """
+        npts, dim = self.__curindex_data.shape
+        return npts + self.__added_points.capacity, dim
+
     def get_indexed_data(self):
         """
-        returns all the data indexed by the FLANN object
+        returns all the data indexed by the FLANN object, as the dataset the
+        index was built on and a list holding the added points, if any
 
         (this returns points that have been removed but still exist in memory)
         """
-        return self.__curindex_data, self.__added_data
+        if self.__added_points.size == 0:
+            return self.__curindex_data, []
+        return self.__curindex_data, [self.__added_points.data]
 
     def used_memory_dataset(self):
         """
-        Returns the amount of memory used by the dataset
+        Returns the amount of memory used by the dataset, including the
+        unused capacity of the buffer of the added points
         """
         if self.__curindex_data is None:
             return 0
-        num_bytes = self.__curindex_data.nbytes
-        for _extra in self.__added_data:
-            num_bytes += _extra.nbytes
-        return num_bytes
+        return self.__curindex_data.nbytes + self.__added_points.buffer.nbytes
+
+    def shrink_to_fit(self):
+        """
+        Reallocates the buffer of the added points to their number, which
+        releases its unused capacity.
+        """
+        with self.__lock:
+            if self.__curindex is None or \
+                    self.__added_points.capacity == self.__added_points.size:
+                return
+            self.__move_added_points(self.__added_points.reserve(self.__added_points.size))
 
     def used_memory(self):
         """
@@ -148,10 +558,15 @@ class FLANN(object):
     ##########################################################################
     # actual workhorse functions
 
-    def nn(self, pts, qpts, num_neighbors=1, **kwargs):
+    def nn(self, pts, qpts, num_neighbors=1, out=None, **kwargs):
         """
         Returns the num_neighbors nearest points in dataset for each point
         in testset.
+
+        If out=(indices, dists) is given, the results are written in place
+        into these arrays, which must be C-contiguous and hold
+        len(testset)*num_neighbors elements of type int32 and of the
+        distance type (float64 for float64 data, float32 otherwise).
         """
 
         if pts.dtype.type not in allowed_types:
@@ -172,18 +587,24 @@ class FLANN(object):
         assert qpts.shape[1] == dim, 'data and query must have the same dims'
         assert npts >= num_neighbors, 'more neighbors than there are points'
 
-        result = np.empty((nqpts, num_neighbors), dtype=index_type)
         if pts.dtype == np.float64:
-            dists = np.empty((nqpts, num_neighbors), dtype=np.float64)
+            dist_type = np.float64
         else:
-            dists = np.empty((nqpts, num_neighbors), dtype=np.float32)
+            dist_type = np.float32
 
-        self.__flann_parameters.update(kwargs)
+        if out is None:
+            result = np.empty((nqpts, num_neighbors), dtype=index_type)
+            dists = np.empty((nqpts, num_neighbors), dtype=dist_type)
+        else:
+            result = check_output_array(out[0], index_type, (nqpts, num_neighbors), 'indices')
+            dists = check_output_array(out[1], dist_type, (nqpts, num_neighbors), 'dists')
+
+        flann_parameters = self.__search_parameters(kwargs)
 
         flann.find_nearest_neighbors[
             pts.dtype.type](
             pts, npts, dim, qpts, nqpts, result, dists, num_neighbors,
-            pointer(self.__flann_parameters))
+            pointer(flann_parameters))
 
         if num_neighbors == 1:
             return (result.reshape(nqpts), dists.reshape(nqpts))
@@ -201,39 +622,114 @@ class FLANN(object):
         pts is a 2d numpy array or matrix. All the computation is done
         in np.float32 type, but pts may be any type that is convertable
         to np.float32.
-        """
 
-        if pts.dtype.type not in allowed_types:
-            raise FLANNException('Cannot handle type: %s' % pts.dtype)
+        pts may also be a np.memmap, or the name of a file holding the
+        raw dataset together with the dtype and shape keyword arguments
+        (see open_dataset). The index keeps pointers into the dataset
+        rather than a copy, so its rows are paged in from disk as they
+        are used. Note that the kdtree_single index reorders a copy of
+        the dataset unless reorder=False.
+
+        The kdtree and kmeans indexes are built with as many threads as
+        the 'cores' parameter (0 for all the cores of the machine). The
+        index built is the same for any number of threads given the same
+        random_seed.
+        """
 
-        pts = ensure_2d_array(pts, default_flags)
+        pts = _as_dataset(pts, kwargs.pop('dtype', None), kwargs.pop('shape', None))
         npts, dim = pts.shape
 
         self.__ensureRandomSeed(kwargs)
 
         self.__flann_parameters.update(kwargs)
+        if self.__distance()[0] == _HAMMING and pts.dtype.type != np.uint8:
+            raise FLANNException('The hamming distance requires uint8 data, not %s' % pts.dtype)
 
         if self.__curindex is not None:
-            flann.free_index[self.__curindex_type](
-                self.__curindex, pointer(self.__flann_parameters))
+            self.__invalidate_prepared_searches()
+            self.__release_data()
             self.__curindex = None
 
         speedup = c_float(0)
-        self.__curindex = flann.build_index[pts.dtype.type](
-            pts, npts, dim, byref(speedup), pointer(self.__flann_parameters))
+        self.__curindex = self.__make_handle(flann.build_index[pts.dtype.type](
+            pts, npts, dim, byref(speedup), pointer(self.__flann_parameters)), pts.dtype.type)
+        if self.__curindex is None:
+            raise FLANNException('Error occured while building the index.'
+                                 ' C++ may have thrown more detailed errors')
         self.__curindex_data = pts
+        self.__added_points = _PointStore(pts.dtype, dim)
+        self.__removed_ids = set()
         self.__curindex_type = pts.dtype.type
+        self.__built_state = self.__current_state()
 
         params = dict(self.__flann_parameters)
         params['speedup'] = speedup.value
 
         return params
 
+    def build_index_from_chunks(self, chunks, total_rows=None, sample_rows=None,
+                                rebuild_threshold=0, **kwargs):
+        """
+        Builds an index over the rows of an iterable of 2d arrays (the
+        chunks) without concatenating them. The index structure is built
+        from the first chunks, until they hold sample_rows rows, and the
+        following chunks are inserted as with add_points.
+
+        sample_rows defaults to a tenth of total_rows when given,
+        otherwise to the first chunk only. When total_rows is given, a
+        FLANNException is raised if the chunks hold a different number
+        of rows. rebuild_threshold is passed to add_points, the default
+        never rebuilds the index, so that the structure stays the one
+        built from the sample.
+
+        The chunks are copied, so they can be reused afterwards, e.g. as
+        buffers by the code producing them. The other keyword arguments
+        are the parameters of build_index.
+        """
+        if sample_rows is None:
+            sample_rows = total_rows // 10 if total_rows is not None else 1
+
+        chunks = iter(chunks)
+        sample = []
+        num_rows = 0
+        for chunk in chunks:
+            # the index keeps the sample, which must not change with the chunks
+            chunk = np.array(ensure_2d_array(chunk, default_flags), copy=True)
+            sample.append(chunk)
+            num_rows += chunk.shape[0]
+            if num_rows >= sample_rows:
+                break
+        if not sample:
+            raise FLANNException('No chunks to build the index from')
+
+        if len(sample) > 1:
+            sample = [np.concatenate(sample)]
+        params = self.build_index(sample.pop(), **kwargs)
+
+        dim = self.__curindex_data.shape[1]
+        for chunk in chunks:
+            chunk = ensure_2d_array(chunk, default_flags)
+            if chunk.shape[1] != dim:
+                raise FLANNException('The chunks must have %d columns, not %d' % (dim, chunk.shape[1]))
+            num_rows += chunk.shape[0]
+            if total_rows is not None and num_rows > total_rows:
+                raise FLANNException('The chunks hold more than %d rows' % total_rows)
+            if chunk.shape[0] > 0:
+                self.add_points(chunk, rebuild_threshold)
+
+        if total_rows is not None and num_rows != total_rows:
+            raise FLANNException('The chunks hold %d rows instead of %d' % (num_rows, total_rows))
+        return params
+
     def add_points(self, new_pts, rebuild_threshold=2):
         """
         Adds pts to the current index. If the number of added points is more
         than a factor of rebuild_threshold larger than the original number of
         points, the index is rebuilt.
+
+        The points are copied into a single buffer holding all the added
+        points, which doubles its capacity when it is full (see
+        get_indexed_capacity and shrink_to_fit).
         """
         if new_pts.dtype.type not in allowed_types:
             raise FLANNException('Cannot handle type: %s' % new_pts.dtype)
@@ -241,8 +737,17 @@ class FLANN(object):
             raise FLANNException('New points must have the same type')
         new_pts = ensure_2d_array(new_pts, default_flags)
         rows = new_pts.shape[0]
-        flann.add_points[self.__curindex_type](self.__curindex, new_pts, rows, rebuild_threshold)
-        self.__added_data.append(new_pts)
+        with self.__lock:
+            first_row = self.__added_points.size
+            old_buffer = self.__added_points.append(new_pts)
+            if old_buffer is not None:
+                self.__move_added_points(old_buffer, first_row)
+            flann.add_points[self.__curindex_type](
+                self.__curindex, self.__added_points.buffer[first_row:first_row + rows],
+                rows, rebuild_threshold)
+            if self.__compaction is not None:
+                self.__compaction_log.append((first_row, rows, rebuild_threshold))
+        self.__check_compaction_policy()
 
     def remove_point(self, id_):
         """
@@ -253,66 +758,325 @@ class FLANN(object):
 
         Returns: void
         """
-        flann.remove_point[self.__curindex_type](self.__curindex, id_)
-        self.__removed_ids.append(id_)
+        with self.__lock:
+            flann.remove_point[self.__curindex_type](self.__curindex, id_)
+            if 0 <= id_ < self.__num_ids():
+                self.__removed_ids.add(id_)
+            if self.__compaction is not None:
+                self.__compaction_log.append(np.array([id_], dtype=index_type))
+        self.__check_compaction_policy()
 
     def remove_points(self, id_list):
         """
-        Removes multiple points from the index
+        Removes multiple points from the index with a single call into
+        the library.
 
         Params:
-            id_list = point ids to be removed
+            id_list = point ids to be removed, as a sequence or numpy array
 
         Returns: void
         """
-        for id_ in id_list:
-            flann.remove_point[self.__curindex_type](self.__curindex, id_)
+        ids = np.require(np.asarray(id_list).reshape(-1), index_type, default_flags)
+        with self.__lock:
+            flann.remove_points[self.__curindex_type](self.__curindex, ids, ids.size)
+            num_ids = self.__num_ids()
+            self.__removed_ids.update(ids[(ids >= 0) & (ids < num_ids)].tolist())
+            if self.__compaction is not None:
+                self.__compaction_log.append(ids)
+        self.__check_compaction_policy()
+
+    def compact(self, background=False):
+        """
+        Rebuilds the index over its current points, discarding the removed
+        points. The point ids are not changed.
+
+        If background is True, a copy of the index is rebuilt on a
+        separate thread, which is returned, while the searches keep using
+        the current index. Points added or removed in the meantime are
+        applied to the copy as well before it replaces the current index.
+        If a compaction is already running its thread is returned.
+        """
+        with self.__lock:
+            if self.__curindex is None:
+                raise FLANNException(
+                    'build_index(...) method not called first or current index deleted.')
+            if self.__compaction is not None:
+                return self.__compaction
+
+            flann_parameters = self.__flann_parameters.copy()
+            if not background:
+                if flann.rebuild_index[self.__curindex_type](
+                        self.__curindex, pointer(flann_parameters)) < 0:
+                    raise FLANNException('Error occured while rebuilding the index.')
+                self.__built_state = self.__current_state()
+                return None
+
+            copy = self.__make_handle(flann.clone_index[self.__curindex_type](
+                self.__curindex, pointer(flann_parameters)), self.__curindex_type)
+            if copy is None:
+                raise FLANNException('Error occured while copying the index.')
+
+            self.__compaction_log = []
+            self.__compaction = threading.Thread(
+                target=self.__run_compaction,
+                args=(self.__curindex, copy, flann_parameters, self.__current_state()))
+            self.__compaction.daemon = True
+            self.__compaction.start()
+            return self.__compaction
+
+    def wait_for_compaction(self, timeout=None):
+        """
+        Waits until the background compaction, if any, has finished.
+        """
+        compaction = self.__compaction
+        if compaction is not None:
+            compaction.join(timeout)
+
+    def set_compaction_policy(self, max_removed=None, max_added=None, background=True):
+        """
+        Makes add_points and remove_point(s) compact the index (see
+        compact) once the number of points removed since the index was
+        built is larger than max_removed times the number of points it was
+        built with, or the number of points added is larger than max_added
+        times that number. None disables the corresponding limit.
+        """
+        self.__compaction_policy = (max_removed, max_added, background)
+        self.__check_compaction_policy()
 
-    def save_index(self, filename):
+    def set_distance_type(self, distance_type, order=0):
+        """
+        Sets the distance used by the indexes built by this object, with
+        the same values as the set_distance_type function of the module.
+        The current index keeps its distance.
+        """
+        self.__flann_parameters.update({'distance_type': distance_type,
+                                        'distance_order': order})
+
+    def save_index(self, filename, compression='lz4hc', level=None):
         """
         This saves the index to a disk file.
+
+        The distance of the index and, if points have been added to or
+        removed from the index, the added points and the removed ids are
+        saved in the file as well, so that load_index restores the index
+        with the dataset it was built on.
+
+        compression is 'lz4hc' (the default, smallest files), 'lz4'
+        (faster) or 'none' (fastest, largest files). level is the level of
+        lz4hc, from 1 to 16 (9 by default), or the acceleration of lz4 (1
+        by default, higher is faster and compresses less). The index is
+        compressed in independent blocks by several threads (as many as
+        OpenMP uses). Uncompressed indexes are loaded by reading the file
+        directly, and can be loaded from a memory mapping of the file with
+        load_index_from_buffer.
         """
+        compression, level = _compression(compression, level)
         if self.__curindex is not None:
-            flann.save_index[self.__curindex_type](
-                self.__curindex, c_char_p(to_bytes(filename)))
+            if flann.save_index_with_compression[self.__curindex_type](
+                    self.__curindex, c_char_p(to_bytes(filename)), compression, level) != 0:
+                raise FLANNException('Error saving the FLANN index to %r. '
+                                     'C++ may have thrown more detailed errors' % (filename,))
+            self.__save_state(filename)
 
-    def load_index(self, filename, pts):
+    def load_index(self, filename, pts, dtype=None, shape=None):
         """
         Loads an index previously saved to disk.
+
+        pts is the dataset the index was built on. As in build_index, it
+        may be a np.memmap or a file name with the given dtype and shape,
+        and it is not copied unless points had been added to the index
+        before it was saved: the dataset is then concatenated with the
+        added points stored in the file.
         """
 
-        if pts.dtype.type not in allowed_types:
-            raise FLANNException('Cannot handle type: %s' % pts.dtype)
+        pts = _as_dataset(pts, dtype, shape)
 
-        pts = ensure_2d_array(pts, default_flags)
-        npts, dim = pts.shape
+        def read(dtype, count, offset):
+            return np.fromfile(filename, dtype=dtype, count=count, offset=offset)
 
-        if self.__curindex is not None:
-            flann.free_index[self.__curindex_type](
-                self.__curindex, pointer(self.__flann_parameters))
-            self.__curindex = None
-            self.__curindex_data = None
-            self.__added_data = []
-            self.__curindex_type = None
+        def load(pts, distance_type, order):
+            return flann.load_index_with_distance[pts.dtype.type](
+                c_char_p(to_bytes(filename)), pts, pts.shape[0], pts.shape[1],
+                distance_type, order)
 
-        self.__curindex = flann.load_index[pts.dtype.type](
-            c_char_p(to_bytes(filename)), pts, npts, dim)
+        self.__load_index(pts, _read_trailer(filename, _BUNDLE_TRAILER, _BUNDLE_MAGIC),
+                          _read_trailer(filename, _STATE_TRAILER, _STATE_MAGIC),
+                          read, load, 'with filename=%r' % (filename,))
 
+    def save_index_to_bytes(self, compression='lz4hc', level=None):
+        """
+        Returns the index saved as by save_index, without going through a
+        file, as a read only memoryview of a buffer allocated by the
+        library. The buffer is freed once the memoryview and the objects
+        created from it have been released; bytes(...) copies it.
+        """
+        compression, level = _compression(compression, level)
         if self.__curindex is None:
-            raise FLANNException(
-                ('Error loading the FLANN index with filename=%r.'
-                 ' C++ may have thrown more detailed errors') % (filename,))
+            raise FLANNException('There is no index to save.')
 
-        self.__curindex_data = pts
-        self.__added_data = []
-        self.__removed_ids = []
-        self.__curindex_type = pts.dtype.type
+        state_size = (self.__added_points.data.nbytes + _STATE_TRAILER.size
+                      + len(self.__removed_ids) * np.dtype(index_type).itemsize)
+        memory, index_size = self.__save_to_buffer(state_size, compression, level)
+        for offset, section in self.__state_sections(index_size):
+            memory[offset:offset + section.nbytes] = section.reshape(-1).view(np.uint8)
+        memory.flags.writeable = False
+        return memoryview(memory)
+
+    def load_index_from_buffer(self, buf, pts, dtype=None, shape=None):
+        """
+        Loads an index from a buffer holding an index saved with
+        save_index_to_bytes or save_index, e.g. bytes, a memoryview, a
+        numpy array or a mmap. The buffer is read in place, and it is not
+        used once the index is loaded.
+
+        pts is the dataset the index was built on, as for load_index.
+        """
+        pts = _as_dataset(pts, dtype, shape)
+        try:
+            memory = np.frombuffer(buf, dtype=np.uint8)
+        except (TypeError, ValueError) as e:
+            raise FLANNException('Cannot read the index from the buffer: %s' % (e,))
+
+        def read(dtype, count, offset):
+            return np.frombuffer(memory, dtype=dtype, count=count, offset=offset)
+
+        def load(pts, distance_type, order):
+            return flann.load_index_from_buffer[pts.dtype.type](
+                memory.ctypes.data, memory.size, pts, pts.shape[0], pts.shape[1],
+                distance_type, order)
+
+        self.__load_index(pts, _unpack_trailer(memory, _BUNDLE_TRAILER, _BUNDLE_MAGIC),
+                          _unpack_trailer(memory, _STATE_TRAILER, _STATE_MAGIC),
+                          read, load, 'from the buffer')
+
+    def save_bundle(self, filename):
+        """
+        Saves the index together with its dataset, the parameters and the
+        distance type in a single file, which can be loaded with
+        load_bundle. The dataset is stored page aligned so that it can be
+        memory mapped when the bundle is loaded.
+        """
+        if self.__curindex is None:
+            raise FLANNException('There is no index to save.')
+
+        flann.save_index[self.__curindex_type](
+            self.__curindex, c_char_p(to_bytes(filename)))
+        with open(filename, 'r+b') as f:
+            f.seek(0, os.SEEK_END)
+            sections, _ = self.__bundle_sections(f.tell())
+            for offset, section in sections:
+                f.seek(offset)
+                section.tofile(f)
+
+    def load_bundle(self, filename, mmap=True):
+        """
+        Loads an index saved with save_bundle, with the distance stored in
+        the bundle. Points added to the index before it was saved are part
+        of the dataset of the loaded index.
+
+        If mmap is True the dataset is memory mapped from the bundle, so
+        loading does not read it; its pages are loaded when the index
+        accesses them. Otherwise the dataset is read into memory. The
+        index structure itself is always deserialized.
+        """
+        trailer = _read_trailer(filename, _BUNDLE_TRAILER, _BUNDLE_MAGIC)
+        if trailer is None:
+            raise FLANNException('%r is not a FLANN bundle.' % (filename,))
+        (magic, version, dtype, rows, cols, distance_type, order, dataset_offset,
+         params_offset, params_size, removed_offset, num_removed) = trailer
+        if version > _BUNDLE_VERSION:
+            raise FLANNException('Unsupported FLANN bundle version: %d' % version)
+        with open(filename, 'rb') as f:
+            f.seek(params_offset)
+            params = json.loads(f.read(params_size).decode('utf-8'))
+
+        dtype = np.dtype(dtype.rstrip(b'\0').decode('ascii'))
+        if mmap:
+            pts = np.memmap(filename, dtype=dtype, mode='r', offset=dataset_offset,
+                            shape=(rows, cols))
+        else:
+            pts = np.fromfile(filename, dtype=dtype, count=rows * cols,
+                              offset=dataset_offset).reshape(rows, cols)
+
+        self.load_index(filename, pts)
+        self.__flann_parameters.update(params)
+
+    def save_shared(self, name=None):
+        """
+        Copies the index, its dataset and its parameters, as written by
+        save_bundle, into a new shared memory segment from which other
+        processes load the index with load_shared (this requires the
+        multiprocessing.shared_memory module of Python 3.8 or later).
+
+        The processes loading the segment all use the dataset stored in it
+        without copying it, so that they share a single copy of the
+        dataset. The index structure is deserialized in each process.
+
+        Returns the multiprocessing.shared_memory.SharedMemory object of
+        the segment, whose name identifies it. The segment stays in memory
+        until its unlink method is called.
+        """
+        shared_memory = _shared_memory()
+        if self.__curindex is None:
+            raise FLANNException('There is no index to save.')
+
+        index, index_size = self.__save_to_buffer()
+        sections, size = self.__bundle_sections(index_size)
+        segment = shared_memory.SharedMemory(name, create=True, size=_SHARED_HEADER.size + size)
+        try:
+            _SHARED_HEADER.pack_into(segment.buf, 0, _SHARED_MAGIC, size)
+            bundle = np.frombuffer(segment.buf, dtype=np.uint8, count=size,
+                                   offset=_SHARED_HEADER.size)
+            bundle[:index_size] = index
+            for offset, section in sections:
+                bundle[offset:offset + section.nbytes] = section.reshape(-1).view(np.uint8)
+            # the segment cannot be closed while arrays use its memory
+            del bundle
+        except BaseException:
+            segment.close()
+            segment.unlink()
+            raise
+        return segment
+
+    def load_shared(self, name):
+        """
+        Loads an index from the shared memory segment with the given name
+        written by save_shared. The dataset is used in place, as a read
+        only array, and the segment stays attached to this process as long
+        as the index uses it.
+        """
+        try:
+            memory = np.asarray(_SharedBuffer(name))
+        except OSError as e:
+            raise FLANNException('Cannot open the shared memory segment %r: %s' % (name, e))
+        magic, size = _SHARED_HEADER.unpack_from(memory)
+        if magic != _SHARED_MAGIC:
+            raise FLANNException('%r is not a FLANN shared memory segment.' % (name,))
+        bundle = memory[_SHARED_HEADER.size:_SHARED_HEADER.size + size]
+        (magic, version, dtype, rows, cols, distance_type, order, dataset_offset,
+         params_offset, params_size, removed_offset,
+         num_removed) = _BUNDLE_TRAILER.unpack_from(bundle, size - _BUNDLE_TRAILER.size)
+        if magic != _BUNDLE_MAGIC or version > _BUNDLE_VERSION:
+            raise FLANNException('Unsupported FLANN shared memory segment: %r' % (name,))
+
+        params = json.loads(bundle[params_offset:params_offset + params_size].tobytes()
+                            .decode('utf-8'))
+        dtype = np.dtype(dtype.rstrip(b'\0').decode('ascii'))
+        pts = bundle[dataset_offset:dataset_offset + rows * cols * dtype.itemsize]
+        pts = pts.view(dtype).reshape(rows, cols)
+
+        self.load_index_from_buffer(bundle, pts)
+        self.__flann_parameters.update(params)
 
-    def nn_index(self, qpts, num_neighbors=1, **kwargs):
+    def nn_index(self, qpts, num_neighbors=1, out=None, **kwargs):
         """
         For each point in querypts, (which may be a single point), it
         returns the num_neighbors nearest points in the index built by
         calling build_index.
+
+        If out=(indices, dists) is given, the results are written in place
+        into these arrays (see nn), so that a search loop can reuse the
+        same buffers for every call.
         """
 
         if self.__curindex is None:
@@ -337,25 +1101,65 @@ class FLANN(object):
         assert qpts.shape[1] == dim, 'data and query must have the same dims'
         assert npts >= num_neighbors, 'more neighbors than there are points'
 
-        result = np.empty((nqpts, num_neighbors), dtype=index_type)
         if self.__curindex_type == np.float64:
-            dists = np.empty((nqpts, num_neighbors), dtype=np.float64)
+            dist_type = np.float64
         else:
-            dists = np.empty((nqpts, num_neighbors), dtype=np.float32)
+            dist_type = np.float32
 
-        self.__flann_parameters.update(kwargs)
+        if out is None:
+            result = np.empty((nqpts, num_neighbors), dtype=index_type)
+            dists = np.empty((nqpts, num_neighbors), dtype=dist_type)
+        else:
+            result = check_output_array(out[0], index_type, (nqpts, num_neighbors), 'indices')
+            dists = check_output_array(out[1], dist_type, (nqpts, num_neighbors), 'dists')
+
+        flann_parameters = self.__search_parameters(kwargs)
 
         flann.find_nearest_neighbors_index[
             self.__curindex_type](
             self.__curindex, qpts, nqpts, result, dists, num_neighbors,
-            pointer(self.__flann_parameters))
+            pointer(flann_parameters))
 
         if num_neighbors == 1:
             return (result.reshape(nqpts), dists.reshape(nqpts))
         else:
             return (result, dists)
 
-    def nn_radius(self, query, radius, **kwargs):
+    def prepare_search(self, num_neighbors=1, **kwargs):
+        """
+        Returns a PreparedSearch object that finds the num_neighbors
+        nearest neighbors in the current index using the given search
+        parameters. The parameters are frozen when the search is prepared
+        and are not affected by later calls on this object.
+
+        Calling the prepared search skips the type checks, the parameter
+        translation and the array conversions done by nn_index, which
+        dominate the cost of searching for a single point.
+        """
+
+        if self.__curindex is None:
+            raise FLANNException(
+                'build_index(...) method not called first or current index deleted.')
+
+        npts, dim = self.get_indexed_shape()
+        assert npts >= num_neighbors, 'more neighbors than there are points'
+
+        flann_parameters = self.__search_parameters(kwargs)
+
+        search = PreparedSearch(self.__curindex, self.__curindex_type, dim,
+                                num_neighbors, flann_parameters)
+        self.__prepared_searches.add(search)
+        return search
+
+    def nn_radius(self, query, radius, out=None, **kwargs):
+        """
+        Returns the indices and distances of the points in the index that
+        are within radius from the query point.
+
+        If out=(indices, dists) is given, the results are written in place
+        into these arrays and at most len(indices) neighbors are returned.
+        Otherwise arrays large enough to hold the whole index are used.
+        """
 
         if self.__curindex is None:
             raise FLANNException(
@@ -370,21 +1174,110 @@ class FLANN(object):
         npts, dim = self.get_indexed_shape()
         assert(query.shape[0] == dim), 'data and query must have the same dims'
 
-        result = np.empty(npts, dtype=index_type)
         if self.__curindex_type == np.float64:
-            dists = np.empty(npts, dtype=np.float64)
+            dist_type = np.float64
         else:
-            dists = np.empty(npts, dtype=np.float32)
+            dist_type = np.float32
 
-        self.__flann_parameters.update(kwargs)
+        if out is None:
+            result = np.empty(npts, dtype=index_type)
+            dists = np.empty(npts, dtype=dist_type)
+        else:
+            result = check_output_array(out[0], index_type, None, 'indices')
+            dists = check_output_array(out[1], dist_type, None, 'dists')
+        max_nn = min(result.size, dists.size)
+
+        flann_parameters = self.__search_parameters(kwargs)
 
         nn = flann.radius_search[
             self.__curindex_type](
-            self.__curindex, query, result, dists, npts, radius,
-            pointer(self.__flann_parameters))
+            self.__curindex, query, result, dists, max_nn, radius,
+            pointer(flann_parameters))
 
         return (result[0:nn], dists[0:nn])
 
+    def nn_radius_batch(self, qpts, radius, capacity=None, out=None, **kwargs):
+        """
+        Performs a radius search for all the points in qpts with a single
+        call into the library, the queries being processed in parallel
+        according to the 'cores' parameter.
+
+        The result is returned in compressed sparse row form as a tuple
+        (offsets, indices, dists): the neighbors of query i are
+        indices[offsets[i]:offsets[i+1]] and their distances are
+        dists[offsets[i]:offsets[i+1]].
+
+        capacity is the initial size of the output arrays. If more
+        neighbors are found the search is repeated with arrays of the
+        exact size needed. When max_neighbors is positive the output
+        arrays are sized to hold all the results and the search is never
+        repeated.
+
+        If out=(offsets, indices, dists) is given, the results are written
+        in place into these arrays; offsets must hold len(qpts)+1 elements
+        and the size of indices and dists is used as the capacity. An
+        exception is raised if the neighbors found do not fit.
+        """
+
+        if self.__curindex is None:
+            raise FLANNException(
+                'build_index(...) method not called first or current index deleted.')
+
+        if qpts.dtype.type not in allowed_types:
+            raise FLANNException('Cannot handle type: %s' % qpts.dtype)
+
+        if self.__curindex_type != qpts.dtype.type:
+            raise FLANNException('Index and query must have the same type')
+
+        qpts = ensure_2d_array(qpts, default_flags)
+
+        npts, dim = self.get_indexed_shape()
+        nqpts = qpts.shape[0]
+
+        assert qpts.shape[1] == dim, 'data and query must have the same dims'
+
+        flann_parameters = self.__search_parameters(kwargs)
+
+        max_neighbors = flann_parameters['max_neighbors']
+        if max_neighbors >= 0:
+            capacity = nqpts * min(max_neighbors, npts)
+        elif capacity is None:
+            capacity = nqpts * min(npts, 32)
+
+        if self.__curindex_type == np.float64:
+            dist_type = np.float64
+        else:
+            dist_type = np.float32
+
+        if out is None:
+            offsets = np.empty(nqpts + 1, dtype=index_type)
+        else:
+            offsets = check_output_array(out[0], index_type, (nqpts + 1,), 'offsets')
+            result = check_output_array(out[1], index_type, None, 'indices')
+            dists = check_output_array(out[2], dist_type, None, 'dists')
+            capacity = min(result.size, dists.size)
+
+        while True:
+            if out is None:
+                result = np.empty(capacity, dtype=index_type)
+                dists = np.empty(capacity, dtype=dist_type)
+
+            total = flann.radius_search_batch[
+                self.__curindex_type](
+                self.__curindex, qpts, nqpts, offsets, result, dists,
+                capacity, radius, pointer(flann_parameters))
+
+            if total < 0:
+                raise FLANNException('Error occured during radius search.')
+            if total <= capacity:
+                break
+            if out is not None:
+                raise FLANNException('Found %d neighbors, but the output arrays only have room for %d'
+                                     % (total, capacity))
+            capacity = total
+
+        return (offsets, result[0:total], dists[0:total])
+
     def delete_index(self, **kwargs):
         """
         Deletes the current index freeing all the momory it uses.
@@ -395,12 +1288,12 @@ class FLANN(object):
         self.__flann_parameters.update(kwargs)
 
         if self.__curindex is not None and flann is not None:
-            flann.free_index[self.__curindex_type](
-                self.__curindex, pointer(self.__flann_parameters))
+            self.__invalidate_prepared_searches()
+            self.__release_data()
             self.__curindex = None
             self.__curindex_data = None
-            self.__added_data = []
-            self.__removed_ids = []
+            self.__added_points = None
+            self.__removed_ids = set()
 
     ##########################################################################
     # Clustering functions
@@ -444,6 +1337,8 @@ class FLANN(object):
         This method can be significantly faster when the number of
         desired clusters is quite large (e.g. a hundred or more).
         Higher branch sizes are slower but may give better results.
+        The clusters are computed with as many threads as the 'cores'
+        parameter (0 for all the cores of the machine).
 
         If dtype is None (the default), the array returned is the same
         type as pts.  Otherwise, the returned array is of type dtype.
@@ -488,6 +1383,8 @@ class FLANN(object):
                   'algorithm': 'kmeans',
                   'branching': branch_size,
                   'random_seed': kwargs['random_seed']}
+        if 'cores' in kwargs:
+            params['cores'] = kwargs['cores']
 
         self.__flann_parameters.update(params)
 
@@ -502,9 +1399,270 @@ class FLANN(object):
         else:
             return dtype(result)
 
+    def kmeans_clustering(self, pts, num_clusters, max_iterations=None,
+                          batch_size=0, return_inertia=False, center_dtype=None,
+                          **kwargs):
+        """
+        Runs a flat kmeans on pts with num_clusters centers for the
+        euclidean distance. Returns the centers (num_clusters x dim) and
+        the cluster of each point, and if return_inertia is True the sum
+        of the squared distances of the points to their centers.
+
+        The closest center of the points is searched in randomized
+        kd-trees of the centers according to the 'trees' and 'checks'
+        parameters (checks=-1 searches all the centers) with as many
+        threads as the 'cores' parameter (0 for all the cores of the
+        machine), so that large numbers of clusters can be computed.
+
+        If max_iterations is not None, the centers are updated at most
+        max_iterations times. The default is to run until convergence.
+
+        If batch_size is positive, each update of the centers uses
+        batch_size random points instead of all of them (mini-batch
+        kmeans), so that only part of a dataset opened with open_dataset
+        is read before the final assignment of the points. The default
+        number of updates then samples as many points as there are.
+
+        pts may also be a np.memmap, or the name of a file holding the
+        raw dataset together with the dtype and shape keyword arguments
+        (see open_dataset), as in build_index.
+
+        If center_dtype is None (the default), the centers returned are
+        float64 for float64 points and float32 otherwise. Otherwise, they
+        are of type center_dtype.
+        """
+
+        pts = _as_dataset(pts, kwargs.pop('dtype', None), kwargs.pop('shape', None))
+        npts, dim = pts.shape
+
+        if int(num_clusters) != num_clusters or not 1 <= num_clusters <= npts:
+            raise FLANNException('num_clusters must be an integer between 1 and the number of points')
+        if int(batch_size) != batch_size or batch_size < 0:
+            raise FLANNException('batch_size must be an integer >= 0')
+
+        self.__ensureRandomSeed(kwargs)
+        kwargs['iterations'] = -1 if max_iterations is None else int(max_iterations)
+        flann_parameters = self.__search_parameters(kwargs)
+
+        center_type = np.float64 if pts.dtype.type == np.float64 else np.float32
+        centers = np.empty((int(num_clusters), dim), dtype=center_type)
+        labels = np.empty(npts, dtype=np.int32)
+        inertia = c_double()
+
+        numclusters = flann.kmeans[pts.dtype.type](
+            pts, npts, dim, int(num_clusters), centers, labels, byref(inertia),
+            int(batch_size), pointer(flann_parameters))
+        if numclusters <= 0:
+            raise FLANNException('Error occured during clustering procedure.')
+
+        if center_dtype is not None:
+            centers = center_dtype(centers)
+        if return_inertia:
+            return centers, labels, inertia.value
+        return centers, labels
+
     ##########################################################################
     # internal bookkeeping functions
 
+    def __make_handle(self, index, index_type):
+        if not index:
+            return None
+        return _IndexHandle(index, index_type, self.__flann_parameters)
+
+    def __current_state(self):
+        num_ids = self.__num_ids()
+        return (num_ids, len(self.__removed_ids), num_ids - len(self.__removed_ids))
+
+    def __check_compaction_policy(self):
+        max_removed, max_added, background = self.__compaction_policy
+        if self.__curindex is None or (max_removed is None and max_added is None):
+            return
+        built_ids, built_removed, built_points = self.__built_state
+        built_points = max(built_points, 1)
+        removed = len(self.__removed_ids) - built_removed
+        added = self.__num_ids() - built_ids
+        if ((max_removed is not None and removed > max_removed * built_points) or
+                (max_added is not None and added > max_added * built_points)):
+            self.compact(background)
+
+    def __run_compaction(self, source, copy, flann_parameters, state):
+        rebuilt = flann.rebuild_index[copy.index_type](copy, pointer(flann_parameters)) == 0
+
+        with self.__lock:
+            self.__compaction = None
+            log, self.__compaction_log = self.__compaction_log, []
+            # the copy may still point into these until it is relocated
+            compaction_data, self.__compaction_data = self.__compaction_data, []
+            # the index was rebuilt, reloaded or deleted in the meantime
+            if self.__curindex is not source:
+                return
+            self.__built_state = state
+            if not rebuilt:
+                return
+
+            added = self.__added_points
+            if compaction_data and added.size > 0:
+                flann.relocate_points[copy.index_type](
+                    copy, self.__curindex_data.shape[0], added.data, added.size)
+            for change in log:
+                if isinstance(change, tuple):
+                    first_row, rows, rebuild_threshold = change
+                    flann.add_points[copy.index_type](
+                        copy, added.buffer[first_row:first_row + rows], rows,
+                        rebuild_threshold)
+                else:
+                    flann.remove_points[copy.index_type](copy, change, change.size)
+
+            self.__curindex = copy
+            for search in self.__prepared_searches:
+                search._index = copy
+
+    def __num_ids(self):
+        # ids are assigned to the points in the order they were indexed
+        return self.__curindex_data.shape[0] + self.__added_points.size
+
+    def __move_added_points(self, old_buffer, rows=None):
+        # makes the index use the current buffer of the added points instead
+        # of old_buffer, for the first rows points (all of them by default)
+        added = self.__added_points
+        if rows is None:
+            rows = added.size
+        if rows > 0:
+            if flann.relocate_points[self.__curindex_type](
+                    self.__curindex, self.__curindex_data.shape[0],
+                    added.buffer[:rows], rows) < 0:
+                raise FLANNException('Error occured while moving the added points.')
+        if self.__compaction is not None:
+            self.__compaction_data.append(old_buffer)
+
+    def __release_data(self):
+        # a running compaction still reads the points of the current index
+        if self.__compaction is not None:
+            self.__compaction_data.append((self.__curindex_data, self.__added_points))
+
+    def __save_state(self, filename):
+        with open(filename, 'r+b') as f:
+            f.seek(0, os.SEEK_END)
+            for _, section in self.__state_sections(f.tell()):
+                section.tofile(f)
+
+    def __state_sections(self, index_size):
+        """
+        Returns the sections following an index of index_size bytes in the
+        files written by save_index, as a list of (offset, array).
+        """
+        added = self.__added_points.data
+        removed = np.array(sorted(self.__removed_ids), dtype=index_type)
+        added_offset = index_size
+        removed_offset = added_offset + added.nbytes
+        trailer = _STATE_TRAILER.pack(
+            _STATE_MAGIC, np.dtype(self.__curindex_type).str.encode('ascii'),
+            added.shape[0], added.shape[1], added_offset, removed_offset, removed.size,
+            self.__curindex.distance_type, self.__curindex.distance_order)
+        return [(added_offset, added), (removed_offset, removed),
+                (removed_offset + removed.nbytes, np.frombuffer(trailer, dtype=np.uint8))]
+
+    def __bundle_sections(self, index_size):
+        """
+        Returns the sections following an index of index_size bytes in a
+        bundle, as a list of (offset, array), and the size of the bundle.
+        """
+        pts = self.__curindex_data
+        added = self.__added_points.data
+        params = json.dumps(dict(self.__flann_parameters), sort_keys=True).encode('utf-8')
+        removed = np.array(sorted(self.__removed_ids), dtype=index_type)
+        dataset_offset = -(-index_size // ALLOCATIONGRANULARITY) * ALLOCATIONGRANULARITY
+        params_offset = dataset_offset + pts.nbytes + added.nbytes
+        removed_offset = params_offset + len(params)
+        trailer = _BUNDLE_TRAILER.pack(
+            _BUNDLE_MAGIC, _BUNDLE_VERSION, pts.dtype.str.encode('ascii'),
+            pts.shape[0] + added.shape[0], pts.shape[1],
+            self.__curindex.distance_type, self.__curindex.distance_order,
+            dataset_offset, params_offset, len(params), removed_offset, removed.size)
+        trailer_offset = removed_offset + removed.nbytes
+        return ([(dataset_offset, pts), (dataset_offset + pts.nbytes, added),
+                 (params_offset, np.frombuffer(params, dtype=np.uint8)),
+                 (removed_offset, removed),
+                 (trailer_offset, np.frombuffer(trailer, dtype=np.uint8))],
+                trailer_offset + len(trailer))
+
+    def __save_to_buffer(self, reserve=0, compression=None, level=None):
+        """
+        Saves the index to a buffer allocated by the library, followed by
+        reserve free bytes. Returns the buffer as an array and the size of
+        the index.
+        """
+        if compression is None:
+            compression, level = _compression('lz4hc', level)
+        buffer, size = c_void_p(), c_size_t()
+        if flann.save_index_to_buffer[self.__curindex_type](
+                self.__curindex, compression, level, reserve, byref(buffer), byref(size)) != 0:
+            raise FLANNException('Error saving the FLANN index. '
+                                 'C++ may have thrown more detailed errors')
+        return np.asarray(_LibraryBuffer(buffer.value, size.value + reserve)), size.value
+
+    def __load_index(self, pts, bundle, state, read, load, source):
+        """
+        Loads the index saved with the given bundle and state trailers,
+        whose sections, including the removed ids, are read with
+        read(dtype, count, offset) before the state of the index is
+        recorded for the compaction policy, calling
+        load(pts, distance_type, order) to load the index structure.
+        """
+        removed_ids = set()
+        distance = self.__distance()
+        if bundle is not None:
+            distance = bundle[5:7]
+            removed_offset, num_removed = bundle[10:12]
+            removed_ids = set(read(index_type, num_removed, removed_offset).tolist())
+        if state is not None:
+            (magic, added_dtype, rows, cols, added_offset,
+             removed_offset, num_removed, distance_type, order) = state
+            distance = (distance_type, order)
+            if rows > 0:
+                added = read(pts.dtype, rows * cols, added_offset).reshape(rows, cols)
+                pts = np.concatenate((pts, added))
+            removed_ids = set(read(index_type, num_removed, removed_offset).tolist())
+
+        if self.__curindex is not None:
+            self.__invalidate_prepared_searches()
+            self.__release_data()
+            self.__curindex = None
+            self.__curindex_data = None
+            self.__added_points = None
+            self.__curindex_type = None
+
+        self.__curindex = self.__make_handle(load(pts, distance[0], distance[1]),
+                                             pts.dtype.type)
+
+        if self.__curindex is None:
+            raise FLANNException(
+                ('Error loading the FLANN index %s.'
+                 ' C++ may have thrown more detailed errors') % (source,))
+
+        self.__curindex_data = pts
+        self.__added_points = _PointStore(pts.dtype, pts.shape[1])
+        self.__removed_ids = removed_ids
+        self.__curindex_type = pts.dtype.type
+        self.__built_state = self.__current_state()
+        self.set_distance_type(*distance)
+
+    def __distance(self):
+        params = self.__flann_parameters
+        if params.distance_type == 0:
+            return (flannlib.flann_get_distance_type(), flannlib.flann_get_distance_order())
+        return (params.distance_type, params.distance_order)
+
+    def __search_parameters(self, kwargs):
+        flann_parameters = self.__flann_parameters.copy()
+        flann_parameters.update(kwargs)
+        return flann_parameters
+
+    def __invalidate_prepared_searches(self):
+        for search in self.__prepared_searches:
+            search.invalidate()
+        self.__prepared_searches.clear()
+
     def __ensureRandomSeed(self, kwargs):
         if 'random_seed' not in kwargs:
             kwargs['random_seed'] = self.__rn_gen.randint(2 ** 30)
@@ -0,0 +1,515 @@
+#Copyright 2008-2010  Marius Muja (mariusm@cs.ubc.ca). All rights reserved.
+#Copyright 2008-2010  David G. Lowe (lowe@cs.ubc.ca). All rights reserved.
+#
+#THE BSD LICENSE
+#
+#Redistribution and use in source and binary forms, with or without
+#modification, are permitted provided that the following conditions
+#are met:
+#
+#1. Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+#2. Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+#
+#THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+#IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+#OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+#IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+#INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+#NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+#THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+Serves FLANN indexes to other processes of the same host, or of the
+network, over a Unix or TCP socket. Requires Python 3, so it is not
+imported by the pyflann package and has to be imported explicitly:
+
+    from pyflann.server import FLANNServer, FLANNClient
+
+The server can also be started from the command line with the bundles
+(see FLANN.save_bundle) to serve, for example:
+
+    python -m pyflann.server --unix /tmp/flann.sock images=images.flann
+
+Messages are a little endian uint32 payload size followed by the
+payload. A request holds a fixed size header (see _REQUEST), the name of
+the index padded to a multiple of 8 bytes and the raw query rows. A
+response holds a fixed size header (see _RESPONSE) followed by the raw
+int32 ids and float32 distances of the neighbors, or by an error
+message.
+"""
+
+import argparse
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+import numpy as np
+
+from pyflann.exceptions import FLANNException
+from pyflann.index import FLANN, index_type
+
+
+_SIZE = struct.Struct('<I')
+# operation, query type, name size, rows, cols, number of neighbors,
+# checks (0 for the default of the server), radius
+_REQUEST = struct.Struct('<BBHIIIif')
+# status, rows, number of neighbors per row (k-nn) or in total (radius)
+_RESPONSE = struct.Struct('<B7xII')
+
+OP_KNN = 1
+OP_RADIUS = 2
+
+_STATUS_OK = 0
+_STATUS_ERROR = 1
+
+# query types, in the order of their codes
+_DTYPES = [np.dtype('<f4'), np.dtype('u1'), np.dtype('<f8'), np.dtype('<i4')]
+_DIST_TYPE = np.dtype('<f4')
+
+
+def _padded(size):
+    # the query rows start at a multiple of 8 bytes of the payload
+    return (size + 7) & ~7
+
+
+def _recv_exactly(sock, size):
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if n == 0:
+            if received == 0:
+                return None
+            raise EOFError('Connection closed in the middle of a message')
+        received += n
+    return buf
+
+
+def _recv_message(sock, max_size=None):
+    """
+    Returns the payload of the next message, or None if the connection was
+    closed. A message larger than max_size raises FLANNException before its
+    payload is read.
+    """
+    size = _recv_exactly(sock, _SIZE.size)
+    if size is None:
+        return None
+    size, = _SIZE.unpack(size)
+    if max_size is not None and size > max_size:
+        raise FLANNException('The message holds %d bytes, more than the maximum of %d'
+                             % (size, max_size))
+    payload = _recv_exactly(sock, size)
+    if payload is None and size > 0:
+        raise EOFError('Connection closed in the middle of a message')
+    return payload or bytearray()
+
+
+def _send_message(sock, parts):
+    parts = [np.ascontiguousarray(part).reshape(-1).view(np.uint8)
+             if isinstance(part, np.ndarray) else part for part in parts]
+    size = sum(len(part) for part in parts)
+    sock.sendall(b''.join([_SIZE.pack(size)] + parts))
+
+
+class _Request(object):
+
+    def __init__(self, flann, qpts, num_neighbors, search_params):
+        self.flann = flann
+        self.qpts = qpts
+        self.num_neighbors = num_neighbors
+        self.search_params = search_params
+        self.key = (id(flann), num_neighbors, tuple(sorted(search_params.items())))
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Batcher(object):
+    """
+    Gathers the k-nn requests of all the connections into batches that
+    are searched with a single nn_index call per index, number of
+    neighbors and search parameters. A batch is searched once it holds
+    max_batch_size query rows, or max_wait seconds after its first
+    request arrived.
+    """
+
+    def __init__(self, max_batch_size, max_wait):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.__queue = queue.Queue()
+        self.__thread = threading.Thread(target=self.__run)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def search(self, flann, qpts, num_neighbors, search_params):
+        request = _Request(flann, qpts, num_neighbors, search_params)
+        self.__queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def stop(self):
+        self.__queue.put(None)
+
+    def __run(self):
+        while True:
+            request = self.__queue.get()
+            if request is None:
+                return
+            batch = [request]
+            rows = len(request.qpts)
+            deadline = time.time() + self.max_wait
+            while rows < self.max_batch_size:
+                try:
+                    request = self.__queue.get(timeout=max(deadline - time.time(), 0))
+                except queue.Empty:
+                    break
+                if request is None:
+                    self.__queue.put(None)
+                    break
+                batch.append(request)
+                rows += len(request.qpts)
+
+            groups = {}
+            for request in batch:
+                groups.setdefault(request.key, []).append(request)
+            for group in groups.values():
+                self.__search(group)
+
+    def __search(self, group):
+        first = group[0]
+        try:
+            qpts = np.concatenate([request.qpts for request in group])
+            result, dists = first.flann.nn_index(qpts, first.num_neighbors,
+                                                 **first.search_params)
+            result = result.reshape(len(qpts), first.num_neighbors)
+            dists = dists.reshape(len(qpts), first.num_neighbors)
+            start = 0
+            for request in group:
+                end = start + len(request.qpts)
+                request.result = (result[start:end], dists[start:end])
+                start = end
+        except Exception as e:
+            if len(group) > 1:
+                # searches the requests one by one, so that the error only
+                # reaches the request that caused it
+                for request in group:
+                    self.__search([request])
+                return
+            first.error = e
+        for request in group:
+            request.done.set()
+
+
+class _Handler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        server = self.server.flann_server
+        while True:
+            try:
+                payload = _recv_message(self.request, server.max_message_size)
+            except FLANNException as e:
+                # the payload is not read, so the connection cannot be used anymore
+                try:
+                    _send_message(self.request, [_RESPONSE.pack(_STATUS_ERROR, 0, 0),
+                                                 str(e).encode('utf-8')])
+                except OSError:
+                    pass
+                return
+            except (EOFError, OSError):
+                return
+            if payload is None:
+                return
+            try:
+                parts = server._process(payload)
+            except Exception as e:
+                parts = [_RESPONSE.pack(_STATUS_ERROR, 0, 0), str(e).encode('utf-8')]
+            try:
+                _send_message(self.request, parts)
+            except OSError:
+                return
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FLANNServer(object):
+    """
+    Answers the k-nearest neighbor and radius searches of FLANNClient
+    objects in the indexes it holds, so that several processes can share
+    a single copy of an index.
+
+    The k-nn searches of all the connections are gathered into batches
+    (see _Batcher) searched with a single call, so that the library can
+    process the queries of a batch in parallel (see the 'cores' search
+    parameter). Radius searches are run as they arrive.
+    """
+
+    def __init__(self, indexes, address, max_batch_size=256, max_wait_us=200,
+                 max_message_size=1 << 28, **kwargs):
+        """
+        indexes maps names to FLANN objects whose index has been built.
+        address is the path of a Unix socket or a (host, port) tuple for
+        a TCP socket (port 0 picks a free port, see server_address).
+        max_message_size is the largest request accepted, in bytes, larger
+        ones are answered with an error and their connection is closed
+        without reading them. Any keyword arguments are the default search
+        parameters.
+        """
+        if max_batch_size < 1:
+            raise ValueError('max_batch_size must be at least 1')
+
+        self.indexes = dict(indexes)
+        self.max_message_size = max_message_size
+        self.search_params = kwargs
+        self.__batcher = _Batcher(max_batch_size, max_wait_us * 1e-6)
+        if isinstance(address, str):
+            self.__server = _UnixServer(address, _Handler)
+        else:
+            self.__server = _TCPServer(tuple(address), _Handler)
+        self.__server.flann_server = self
+        self.__thread = None
+
+    @property
+    def server_address(self):
+        return self.__server.server_address
+
+    def serve_forever(self):
+        """ Answers the requests until shutdown is called """
+        self.__server.serve_forever()
+
+    def start(self):
+        """ Answers the requests on a background thread """
+        self.__thread = threading.Thread(target=self.serve_forever)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def shutdown(self):
+        """ Stops answering the requests and closes the socket """
+        if self.__thread is not None:
+            self.__server.shutdown()
+            self.__thread.join()
+            self.__thread = None
+        self.__server.server_close()
+        self.__batcher.stop()
+        if isinstance(self.server_address, str) and os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+    def _process(self, payload):
+        if len(payload) < _REQUEST.size:
+            raise FLANNException('The request holds %d bytes, less than its header'
+                                 % len(payload))
+        (op, dtype, name_size, rows, cols, num_neighbors, checks,
+         radius) = _REQUEST.unpack_from(payload)
+        offset = _REQUEST.size
+        name = bytes(payload[offset:offset + name_size]).decode('utf-8')
+        offset = _padded(offset + name_size)
+        if name not in self.indexes:
+            raise FLANNException('Unknown index: %r' % name)
+        flann = self.indexes[name]
+        if dtype >= len(_DTYPES):
+            raise FLANNException('Unknown query type: %d' % dtype)
+        dtype = _DTYPES[dtype]
+        if len(payload) != offset + rows * cols * dtype.itemsize:
+            raise FLANNException('The request holds %d bytes of queries instead of %d'
+                                 % (len(payload) - offset, rows * cols * dtype.itemsize))
+        qpts = np.frombuffer(payload, dtype=dtype, count=rows * cols,
+                             offset=offset).reshape(rows, cols)
+        if qpts.dtype.type != flann.get_indexed_data()[0].dtype.type:
+            raise FLANNException('Index and query must have the same type')
+        # the queries are checked before they are batched with those of
+        # the other connections
+        npts, dim = flann.get_indexed_shape()
+        if cols != dim:
+            raise FLANNException('The queries have %d columns instead of %d' % (cols, dim))
+
+        search_params = dict(self.search_params)
+        if checks != 0:
+            search_params['checks'] = checks
+
+        if op == OP_KNN:
+            if not 0 < num_neighbors <= npts:
+                raise FLANNException('The number of neighbors must be between 1 and %d' % npts)
+            if rows == 0:
+                return [_RESPONSE.pack(_STATUS_OK, 0, num_neighbors)]
+            result, dists = self.__batcher.search(flann, qpts, num_neighbors, search_params)
+            return [_RESPONSE.pack(_STATUS_OK, rows, num_neighbors),
+                    np.ascontiguousarray(result, dtype='<i4'),
+                    np.ascontiguousarray(dists, dtype=_DIST_TYPE)]
+        elif op == OP_RADIUS:
+            offsets, result, dists = flann.nn_radius_batch(qpts, radius, **search_params)
+            return [_RESPONSE.pack(_STATUS_OK, rows, len(result)),
+                    np.ascontiguousarray(offsets, dtype='<i4'),
+                    np.ascontiguousarray(result, dtype='<i4'),
+                    np.ascontiguousarray(dists, dtype=_DIST_TYPE)]
+        raise FLANNException('Unknown operation: %d' % op)
+
+
+class FLANNClient(object):
+    """
+    Searches the indexes of a FLANNServer. The client can be used from
+    several threads, each search using one of up to pool_size
+    connections, which are kept open between the searches.
+    """
+
+    def __init__(self, address, pool_size=4, timeout=None):
+        self.address = address
+        self.timeout = timeout
+        self.__idle = queue.LifoQueue()
+        self.__slots = threading.BoundedSemaphore(pool_size)
+
+    def close(self):
+        """ Closes the idle connections """
+        while True:
+            try:
+                self.__idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def nn_index(self, name, qpts, num_neighbors=1, checks=0):
+        """
+        Returns the ids and distances of the num_neighbors nearest
+        neighbors of the points in qpts (which may be a single point) in
+        the index with the given name, as FLANN.nn_index does. checks
+        overrides the checks search parameter of the server if not 0.
+        """
+        qpts = self.__queries(qpts)
+        rows, num_neighbors, payload = self.__request(
+            OP_KNN, name, qpts, num_neighbors, checks, 0)
+        count = rows * num_neighbors
+        result = np.frombuffer(payload, dtype='<i4', count=count,
+                               offset=_RESPONSE.size).astype(index_type)
+        dists = np.frombuffer(payload, dtype=_DIST_TYPE, count=count,
+                              offset=_RESPONSE.size + 4 * count).astype(np.float32)
+        if num_neighbors == 1:
+            return (result, dists)
+        return (result.reshape(rows, num_neighbors), dists.reshape(rows, num_neighbors))
+
+    def nn_radius(self, name, qpts, radius, checks=0):
+        """
+        Returns the neighbors within radius of the points in qpts in the
+        index with the given name, in the compressed sparse row form
+        (offsets, indices, dists) of FLANN.nn_radius_batch.
+        """
+        qpts = self.__queries(qpts)
+        rows, total, payload = self.__request(OP_RADIUS, name, qpts, 0, checks, radius)
+        offset = _RESPONSE.size
+        offsets = np.frombuffer(payload, dtype='<i4', count=rows + 1, offset=offset)
+        offset += 4 * (rows + 1)
+        result = np.frombuffer(payload, dtype='<i4', count=total, offset=offset)
+        offset += 4 * total
+        dists = np.frombuffer(payload, dtype=_DIST_TYPE, count=total, offset=offset)
+        return (offsets.astype(index_type), result.astype(index_type), dists.astype(np.float32))
+
+    def __queries(self, qpts):
+        qpts = np.asarray(qpts)
+        if qpts.ndim == 1:
+            qpts = qpts.reshape(1, -1)
+        for code, dtype in enumerate(_DTYPES):
+            if qpts.dtype.type == dtype.type:
+                return code, np.ascontiguousarray(qpts, dtype=dtype)
+        raise FLANNException('Cannot handle type: %s' % qpts.dtype)
+
+    def __request(self, op, name, queries, num_neighbors, checks, radius):
+        code, qpts = queries
+        name = name.encode('utf-8')
+        header = _REQUEST.pack(op, code, len(name), qpts.shape[0], qpts.shape[1],
+                               num_neighbors, checks, radius)
+        padding = b'\0' * (_padded(len(header) + len(name)) - len(header) - len(name))
+        with self.__slots:
+            sock = self.__connection()
+            try:
+                _send_message(sock, [header, name, padding, qpts])
+                payload = _recv_message(sock)
+                if payload is None:
+                    raise EOFError('Connection closed by the server')
+            except BaseException:
+                sock.close()
+                raise
+            self.__idle.put(sock)
+
+        status, rows, count = _RESPONSE.unpack_from(payload)
+        if status != _STATUS_OK:
+            raise FLANNException(bytes(payload[_RESPONSE.size:]).decode('utf-8'))
+        return rows, count, payload
+
+    def __connection(self):
+        try:
+            return self.__idle.get_nowait()
+        except queue.Empty:
+            pass
+        if isinstance(self.address, str):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.address if isinstance(self.address, str) else tuple(self.address))
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Serves FLANN bundles over a socket.')
+    address = parser.add_mutually_exclusive_group(required=True)
+    address.add_argument('--unix', metavar='PATH', help='path of the Unix socket')
+    address.add_argument('--tcp', metavar='HOST:PORT', help='TCP address to listen on')
+    parser.add_argument('--max-batch-size', type=int, default=256,
+                        help='maximum number of query rows searched in a batch')
+    parser.add_argument('--max-wait-us', type=int, default=200,
+                        help='time a batch waits for more requests, in microseconds')
+    parser.add_argument('--checks', type=int, default=None, help='default checks parameter')
+    parser.add_argument('--cores', type=int, default=None,
+                        help='number of threads searching a batch (0 for all the cores)')
+    parser.add_argument('bundles', nargs='+', metavar='NAME=BUNDLE',
+                        help='name and file of a bundle saved by FLANN.save_bundle')
+    args = parser.parse_args(args)
+
+    indexes = {}
+    for bundle in args.bundles:
+        name, sep, filename = bundle.partition('=')
+        if not sep:
+            parser.error('expected NAME=BUNDLE, not %r' % bundle)
+        indexes[name] = FLANN()
+        indexes[name].load_bundle(filename)
+
+    if args.unix is not None:
+        address = args.unix
+    else:
+        host, sep, port = args.tcp.rpartition(':')
+        address = (host, int(port))
+    search_params = dict((key, value) for key, value in
+                         (('checks', args.checks), ('cores', args.cores)) if value is not None)
+
+    server = FLANNServer(indexes, address, args.max_batch_size, args.max_wait_us,
+                         **search_params)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
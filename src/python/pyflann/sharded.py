@@ -0,0 +1,298 @@
+#Copyright 2008-2010  Marius Muja (mariusm@cs.ubc.ca). All rights reserved.
+#Copyright 2008-2010  David G. Lowe (lowe@cs.ubc.ca). All rights reserved.
+#
+#THE BSD LICENSE
+#
+#Redistribution and use in source and binary forms, with or without
+#modification, are permitted provided that the following conditions
+#are met:
+#
+#1. Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+#2. Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in the
+#   documentation and/or other materials provided with the distribution.
+#
+#THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+#IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+#OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+#IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+#INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+#NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+#THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""
+An index partitioned over several FLANN objects (shards), which are
+built, saved, loaded and searched in parallel.
+"""
+
+from multiprocessing.pool import ThreadPool
+import threading
+import numpy as np
+
+from pyflann.exceptions import FLANNException
+from pyflann.flann_ctypes import ensure_2d_array, default_flags
+from pyflann.index import FLANN, index_type, _as_dataset
+
+
+_PARTITIONS = ('hash', 'range', 'kmeans')
+
+# Knuth's multiplicative hash, spreads consecutive ids over the shards
+_HASH_MULTIPLIER = np.uint64(2654435761)
+
+
+class ShardedFLANN(object):
+    """
+    Partitions a dataset across num_shards FLANN objects and searches them
+    on a pool of threads, merging the neighbors found in each shard.
+
+    The points are assigned to the shards according to partition:
+
+    'hash'   a hash of the point id, which balances the shards
+    'range'  consecutive ranges of the dataset rows, so that each shard
+             indexes a view of the dataset instead of a copy
+    'kmeans' the closest of num_shards centers computed by
+             FLANN.kmeans_clustering (euclidean distance only), so that
+             the searches can be restricted to the shards whose centers
+             are the closest to the query (see nn_index)
+
+    The ids returned by the searches are the rows of the whole dataset.
+    """
+
+    def __init__(self, num_shards, partition='hash', num_threads=None, **kwargs):
+        """
+        num_threads is the size of the pool searching the shards, by
+        default one thread per shard. Any keyword arguments are the
+        parameters of the shards, as for FLANN.
+        """
+        if int(num_shards) != num_shards or num_shards < 1:
+            raise FLANNException('num_shards must be a positive integer')
+        if partition not in _PARTITIONS:
+            raise FLANNException('Unknown partition: %r, expected one of %s'
+                                 % (partition, ', '.join(_PARTITIONS)))
+
+        self.num_shards = int(num_shards)
+        self.partition = partition
+        self.shards = [FLANN(**kwargs) for _ in range(self.num_shards)]
+        self.__num_threads = num_threads or self.num_shards
+        self.__pool = None
+        self.__pool_lock = threading.Lock()  # creates a single pool for concurrent searches
+        self.__ids = None  # dataset rows of the points of each shard
+        self.__centers = None  # centers of the shards for the kmeans partition
+        self.__shape = None
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        """ Stops the threads searching the shards """
+        with self.__pool_lock:
+            if self.__pool is not None:
+                self.__pool.terminate()
+                self.__pool = None
+
+    def get_indexed_shape(self):
+        """ returns the shape of the data being indexed """
+        return self.__shape
+
+    def build_index(self, pts, **kwargs):
+        """
+        Partitions pts and builds the index of every shard in parallel,
+        with the parameters given as keyword arguments (see
+        FLANN.build_index). Returns the parameters of each shard.
+        """
+        pts = _as_dataset(pts, kwargs.pop('dtype', None), kwargs.pop('shape', None))
+        npts, dim = pts.shape
+        if npts < self.num_shards:
+            raise FLANNException('The dataset has fewer points than there are shards')
+
+        if self.partition == 'kmeans':
+            seed = dict((key, kwargs[key]) for key in ('random_seed',) if key in kwargs)
+            centers, labels = FLANN().kmeans_clustering(pts, self.num_shards, **seed)
+            self.__centers = centers
+            ids = self.__split(np.argsort(labels, kind='mergesort'),
+                               np.bincount(labels, minlength=self.num_shards))
+        elif self.partition == 'range':
+            bounds = np.linspace(0, npts, self.num_shards + 1).astype(np.int64)
+            ids = [np.arange(bounds[i], bounds[i + 1], dtype=index_type)
+                   for i in range(self.num_shards)]
+        else:
+            labels = _hash_shard(np.arange(npts, dtype=np.uint64), self.num_shards)
+            ids = self.__split(np.argsort(labels, kind='mergesort'),
+                               np.bincount(labels, minlength=self.num_shards))
+
+        if any(shard_ids.size == 0 for shard_ids in ids):
+            raise FLANNException('The partition left a shard without points')
+
+        def build(i):
+            return self.shards[i].build_index(self.__rows(pts, ids[i], self.partition), **kwargs)
+
+        params = self.__map(build, range(self.num_shards))
+        self.__ids = ids
+        self.__shape = (npts, dim)
+        return params
+
+    def nn_index(self, qpts, num_neighbors=1, probes=None, **kwargs):
+        """
+        For each point in qpts (which may be a single point), returns the
+        ids and distances of its num_neighbors nearest points among the
+        nearest neighbors found in the shards, which are searched in
+        parallel with the given search parameters.
+
+        With the kmeans partition, probes is the number of shards searched
+        for each query, those with the closest centers. The default
+        searches all the shards. When the shards searched for a query hold
+        fewer than num_neighbors points, its missing neighbors have the id
+        -1 and an infinite distance.
+        """
+        if self.__ids is None:
+            raise FLANNException(
+                'build_index(...) method not called first or current index deleted.')
+
+        npts, dim = self.__shape
+        qpts = ensure_2d_array(qpts, default_flags)
+        if qpts.size == dim:
+            qpts = qpts.reshape(1, dim)
+        nqpts = qpts.shape[0]
+        if num_neighbors > npts:
+            raise FLANNException('more neighbors than there are points')
+
+        dist_type = np.float64 if qpts.dtype.type == np.float64 else np.float32
+        if nqpts == 0:
+            return _merge([], nqpts, num_neighbors, dist_type)
+
+        routes = None
+        if probes is not None and self.partition == 'kmeans' and probes < self.num_shards:
+            routes, _ = FLANN().nn(self.__centers, qpts.astype(self.__centers.dtype),
+                                   int(probes), algorithm='linear')
+            routes = routes.reshape(nqpts, -1)
+
+        def search(i):
+            shard_queries = None
+            if routes is not None:
+                shard_queries = np.nonzero((routes == i).any(axis=1))[0]
+                if shard_queries.size == 0:
+                    return shard_queries, None, None
+            knn = min(num_neighbors, self.__ids[i].size)
+            result, dists = self.shards[i].nn_index(
+                qpts if shard_queries is None else qpts[shard_queries], knn, **kwargs)
+            return shard_queries, self.__ids[i][result.reshape(-1, knn)], dists.reshape(-1, knn)
+
+        results = self.__map(search, range(self.num_shards))
+        return _merge(results, nqpts, num_neighbors, dist_type)
+
+    def save_index(self, filename):
+        """
+        Saves the shards to the files filename.0 to filename.<num_shards-1>
+        in parallel, and the partition of the dataset to filename.
+        """
+        if self.__ids is None:
+            raise FLANNException('There is no index to save.')
+
+        def save(i):
+            self.shards[i].save_index('%s.%d' % (filename, i))
+
+        self.__map(save, range(self.num_shards))
+        arrays = dict(('ids%d' % i, ids) for i, ids in enumerate(self.__ids))
+        if self.__centers is not None:
+            arrays['centers'] = self.__centers
+        with open(filename, 'wb') as f:
+            np.savez(f, partition=np.array(self.partition), shape=np.array(self.__shape),
+                     **arrays)
+
+    def load_index(self, filename, pts, dtype=None, shape=None):
+        """
+        Loads the shards saved by save_index in parallel. pts is the whole
+        dataset the index was built on, as for FLANN.load_index.
+        """
+        pts = _as_dataset(pts, dtype, shape)
+        with open(filename, 'rb') as f:
+            saved = np.load(f)
+            partition = str(saved['partition'])
+            num_shards = sum(1 for name in saved.files if name.startswith('ids'))
+            if num_shards != self.num_shards:
+                raise FLANNException('%r holds %d shards, not %d'
+                                     % (filename, num_shards, self.num_shards))
+            ids = [saved['ids%d' % i] for i in range(num_shards)]
+            centers = saved['centers'] if 'centers' in saved.files else None
+            saved_shape = tuple(saved['shape'])
+        if pts.shape[0] != saved_shape[0]:
+            raise FLANNException('The index was built on %d points, not %d'
+                                 % (saved_shape[0], pts.shape[0]))
+
+        # the shards are loaded with the saved partition, whatever the
+        # partition this object was created with
+        def load(i):
+            self.shards[i].load_index('%s.%d' % (filename, i), self.__rows(pts, ids[i], partition))
+
+        self.__map(load, range(self.num_shards))
+        self.partition = partition
+        self.__ids = ids
+        self.__centers = centers
+        self.__shape = pts.shape
+
+    def delete_index(self):
+        """ Deletes the index of every shard """
+        for shard in self.shards:
+            shard.delete_index()
+        self.__ids = None
+        self.__centers = None
+        self.__shape = None
+
+    def __map(self, function, args):
+        with self.__pool_lock:
+            if self.__pool is None:
+                self.__pool = ThreadPool(self.__num_threads)
+            pool = self.__pool
+        return pool.map(function, args)
+
+    def __rows(self, pts, ids, partition):
+        # the rows of a range are a view of the dataset, the others a copy
+        if partition == 'range':
+            return pts[ids[0]:ids[-1] + 1]
+        return pts[ids]
+
+    def __split(self, order, counts):
+        return [ids.astype(index_type) for ids in np.split(order, np.cumsum(counts)[:-1])]
+
+
+def _hash_shard(ids, num_shards):
+    return (((ids * _HASH_MULTIPLIER) & np.uint64(0xffffffff)) % np.uint64(num_shards)).astype(np.int64)
+
+
+def _merge(results, nqpts, num_neighbors, dist_type):
+    """
+    Merges the neighbors found in the shards, given as a list of
+    (queries, ids, dists) with queries None for all the queries and ids
+    None for a shard that was not searched, into the num_neighbors nearest
+    ones of each query, padded with -1 ids and infinite distances.
+    """
+    width = max(num_neighbors, sum(ids.shape[1] for _, ids, _ in results if ids is not None))
+    all_ids = np.full((nqpts, width), -1, dtype=index_type)
+    all_dists = np.full((nqpts, width), np.inf, dtype=dist_type)
+    column = 0
+    for queries, ids, dists in results:
+        if ids is None:
+            continue
+        columns = slice(column, column + ids.shape[1])
+        if queries is None:
+            all_ids[:, columns] = ids
+            all_dists[:, columns] = dists
+        else:
+            all_ids[queries, columns] = ids
+            all_dists[queries, columns] = dists
+        column += ids.shape[1]
+
+    rows = np.arange(nqpts)[:, np.newaxis]
+    if width > num_neighbors:
+        nearest = np.argpartition(all_dists, num_neighbors - 1, axis=1)[:, :num_neighbors]
+        all_ids, all_dists = all_ids[rows, nearest], all_dists[rows, nearest]
+    order = np.argsort(all_dists, axis=1, kind='mergesort')
+    result, dists = all_ids[rows, order], all_dists[rows, order]
+
+    if num_neighbors == 1:
+        return (result.reshape(nqpts), dists.reshape(nqpts))
+    return (result, dists)
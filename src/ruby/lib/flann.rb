@@ -37,12 +37,12 @@ module Flann
   ffi_lib "libflann"
 
   # Declare enumerators
-  Algorithm    = enum(:algorithm, [:linear, :kdtree, :kmeans, :composite, :kdtree_single, :hierarchical, :lsh, :kdtree_cuda, :saved, 254, :autotuned, 255])
+  Algorithm    = enum(:algorithm, [:linear, :kdtree, :kmeans, :composite, :kdtree_single, :hierarchical, :lsh, :kdtree_cuda, :pq, :hnsw, :saved, 254, :autotuned, 255])
   CentersInit  = enum(:centers_init, [:random, :gonzales, :kmeanspp])
   LogLevel     = enum(:log_level, [:none, :fatal, :error, :warn, :info, :debug])
 
   # Note that Hamming and beyond are not supported in the C API. We include them here just in case of future improvements.
-  DistanceType = enum(:distance_type, [:undefined, :euclidean, :l2, :manhattan, :l1, :minkowski, :max, :hist_intersect, :hellinger, :chi_square, :kullback_leibler, :hamming, :hamming_lut, :hamming_popcnt, :l2_simple])
+  DistanceType = enum(:distance_type, [:undefined, 0, :l2, 1, :euclidean, 1, :l1, 2, :manhattan, 2, :minkowski, 3, :max, 4, :hist_intersect, 5, :hellinger, 6, :chi_square, 7, :kullback_leibler, 8, :hamming, 9, :hamming_lut, 10, :hamming_popcnt, 11, :l2_simple, 12])
 
   # For NMatrix compatibility
   typedef :float,   :float32
@@ -101,7 +101,16 @@ module Flann
            :multi_probe_level, :uint,       # Number of levels to use in multi-probe LSH, 0 for standard LSH
 
            :log_level, Flann::LogLevel,     # Determines the verbosity of each flann function
-           :random_seed, :long              # Random seed to use
+           :random_seed, :long,             # Random seed to use
+
+           :distance_type, Flann::DistanceType, # Distance of the indexes built, :undefined for the one set with set_distance_type
+           :distance_order, :int,           # Order of the minkowski distance
+
+           :subquantizers, :int,            # Number of sub-vectors the points are split in (for pq)
+           :rerank, :int,                   # Number of candidates re-ranked with the exact distance, 0 to search the codes only (for pq)
+
+           :connections, :int,              # Number of links of a point on the upper layers of the graph (for hnsw)
+           :ef_construction, :int           # Size of the candidate list when inserting a point (for hnsw)
 
     DEFAULT       = {algorithm: :kdtree,
                      checks: 32, eps: 0.0,
@@ -117,7 +126,10 @@ module Flann
                      table_number: 12,
                      key_size: 20,
                      multi_probe_level: 2,
-                     log_level: :warn, random_seed: -1}
+                     log_level: :warn, random_seed: -1,
+                     distance_type: :undefined, distance_order: 0,
+                     subquantizers: 8, rerank: 0,
+                     connections: 16, ef_construction: 200}
 
 
   end
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""
+Compares searches over binary descriptors with the hamming distance on
+the packed uint8 codes against the euclidean distance on the same bits
+unpacked to float32 (which ranks the neighbors the same way).
+
+    python test/bench_hamming.py [num_bytes] [num_points] [num_queries]
+"""
+import sys
+import time
+from pyflann import FLANN
+import numpy as np
+
+
+def run(name, data, queries, exact, checks=32, **params):
+    flann = FLANN()
+    start = time.time()
+    flann.build_index(data, **params)
+    build_time = time.time() - start
+
+    start = time.time()
+    _, dists = flann.nn_index(queries, 1, checks=checks)
+    search_time = (time.time() - start) / len(queries) * 1e6
+
+    # squared euclidean distances between bits are hamming distances
+    precision = np.mean(dists == exact)
+    print('%-26s build %7.3f s  search %9.2f us/query  precision %.3f'
+          % (name, build_time, search_time, precision))
+
+
+if __name__ == '__main__':
+    num_bytes = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    num_points = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    num_queries = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+
+    rng = np.random.RandomState(0)
+    codes = rng.randint(0, 256, (num_points, num_bytes)).astype(np.uint8)
+    # queries close to dataset points, as when matching descriptors
+    picked = rng.randint(0, num_points, num_queries)
+    noise = (rng.rand(num_queries, num_bytes * 8) < 0.05).astype(np.uint8)
+    queries = codes[picked] ^ np.packbits(noise, axis=1)
+    bits = np.unpackbits(codes, axis=1).astype(np.float32)
+    query_bits = np.unpackbits(queries, axis=1).astype(np.float32)
+
+    _, exact = FLANN(distance_type='hamming').nn(codes, queries, 1, algorithm='linear')
+
+    print('bytes=%d points=%d queries=%d' % (num_bytes, num_points, num_queries))
+    run('hamming linear', codes, queries, exact,
+        algorithm='linear', distance_type='hamming')
+    run('hamming lsh', codes, queries, exact,
+        algorithm='lsh', table_number_=12, key_size_=20, multi_probe_level_=2,
+        distance_type='hamming')
+    run('hamming hierarchical', codes, queries, exact,
+        algorithm='hierarchical', branching=32, trees=4, leaf_max_size=100,
+        checks=512, distance_type='hamming')
+    run('euclidean linear (bits)', bits, query_bits, exact,
+        algorithm='linear', distance_type='euclidean')
+    run('euclidean kdtree (bits)', bits, query_bits, exact,
+        algorithm='kdtree', trees=4, checks=512, distance_type='euclidean')
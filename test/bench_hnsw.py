@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+"""
+Compares the recall and search time of hnsw graph indexes with kd-trees
+and hierarchical k-means for increasing checks, on data of a lower
+intrinsic dimension (as descriptors usually are).
+
+    python test/bench_hnsw.py [num_points] [dim] [num_queries]
+"""
+import sys
+import time
+from pyflann import FLANN
+import numpy as np
+
+
+def run(name, data, queries, exact, checks_list, **params):
+    flann = FLANN()
+    start = time.time()
+    flann.build_index(data, random_seed=1, **params)
+    print('%s: build %.2f s, index %.1f MB' % (name, time.time() - start, flann.used_memory() / 1e6))
+
+    for checks in checks_list:
+        start = time.time()
+        result, _ = flann.nn_index(queries, exact.shape[1], checks=checks)
+        search_time = (time.time() - start) / len(queries) * 1e6
+        recall = np.mean([len(set(r) & set(e)) / float(len(e)) for r, e in zip(result, exact)])
+        print('    checks %6d  search %9.1f us/query  recall@%d %.3f'
+              % (checks, search_time, exact.shape[1], recall))
+
+
+if __name__ == '__main__':
+    num_points = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 128
+    num_queries = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+
+    rng = np.random.RandomState(0)
+    latent = rng.randn(num_points + num_queries, 32)
+    points = (latent.dot(rng.randn(32, dim)) + 0.1 * rng.randn(len(latent), dim)).astype(np.float32)
+    data, queries = points[:num_points], points[num_points:]
+    start = time.time()
+    exact, _ = FLANN().nn(data, queries, 10, algorithm='linear')
+    linear_time = (time.time() - start) / num_queries * 1e6
+
+    print('points=%d dim=%d queries=%d, linear search %.1f us/query'
+          % (num_points, dim, num_queries, linear_time))
+    run('kdtree trees=8', data, queries, exact, [128, 512, 2048, 8192],
+        algorithm='kdtree', trees=8)
+    run('kmeans branching=32', data, queries, exact, [128, 512, 2048, 8192],
+        algorithm='kmeans', branching=32, iterations=5)
+    run('hnsw connections=16', data, queries, exact, [16, 32, 64, 128, 256],
+        algorithm='hnsw', connections=16, ef_construction=200)
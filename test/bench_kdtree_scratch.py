@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+"""
+Measures the per-query latency of kd-tree searches with few checks as the
+dataset grows. Each search reuses pooled scratch space (the branch heap and
+the set of checked points), so the latency should stay roughly flat rather
+than grow with the number of points.
+
+    python test/bench_kdtree_scratch.py [dim] [num_queries] [checks]
+"""
+import sys
+import time
+from pyflann import FLANN
+import numpy as np
+
+
+def time_per_query(flann, queries, checks, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        for q in queries:
+            flann.nn_index(q, 1, checks=checks)
+        elapsed = (time.time() - start) / len(queries)
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1e6
+
+
+if __name__ == '__main__':
+    dim = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    num_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    checks = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+
+    rng = np.random.RandomState(0)
+    queries = rng.rand(num_queries, dim).astype(np.float32)
+
+    print('dim=%d queries=%d checks=%d' % (dim, num_queries, checks))
+    for num_points in [10000, 100000, 1000000, 4000000]:
+        data = rng.rand(num_points, dim).astype(np.float32)
+        flann = FLANN()
+        flann.build_index(data, algorithm='kdtree', trees=4)
+        print('%9d points  %8.2f us/query'
+              % (num_points, time_per_query(flann, queries, checks)))
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+"""
+Reports the time and inertia of flat k-means with an exact and an
+approximate (kd-tree) search of the closest centers, with and without
+mini-batches, next to the hierarchical k-means of FLANN.kmeans.
+
+    python test/bench_kmeans.py [num_points] [dim] [num_clusters] [cores]
+"""
+import sys
+import time
+from pyflann import FLANN
+import numpy as np
+
+
+def inertia_of(data, centers):
+    flann = FLANN()
+    _, dists = flann.nn(centers, data, 1, algorithm='linear', cores=0)
+    return dists.astype(np.float64).sum()
+
+
+if __name__ == '__main__':
+    num_points = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    num_clusters = int(sys.argv[3]) if len(sys.argv) > 3 else 5000
+    cores = int(sys.argv[4]) if len(sys.argv) > 4 else 0
+
+    rng = np.random.RandomState(0)
+    latent = rng.randn(num_points, 16)
+    data = (latent.dot(rng.randn(16, dim)) + 0.1 * rng.randn(num_points, dim)).astype(np.float32)
+
+    print('points=%d dim=%d clusters=%d' % (num_points, dim, num_clusters))
+    runs = [('exact', dict(checks=-1)),
+            ('kdtree checks=32', dict(trees=4, checks=32)),
+            ('kdtree checks=32 batch', dict(trees=4, checks=32, batch_size=10000, max_iterations=50))]
+    for name, params in runs:
+        params.setdefault('max_iterations', 10)
+        start = time.time()
+        _, _, inertia = FLANN().kmeans_clustering(data, num_clusters, return_inertia=True,
+                                                  cores=cores, random_seed=1, **params)
+        print('%-26s %8.2f s  inertia %.4g' % (name, time.time() - start, inertia))
+
+    start = time.time()
+    centers = FLANN().kmeans(data, num_clusters, max_iterations=10, cores=cores, random_seed=1)
+    elapsed = time.time() - start
+    print('%-26s %8.2f s  inertia %.4g' % ('hierarchical (kmeans)', elapsed, inertia_of(data, centers)))
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+"""
+Reports the build time of kd-tree and hierarchical k-means indexes for an
+increasing number of threads, and checks that the indexes built are the
+same for any number of threads.
+
+    python test/bench_parallel_build.py [num_points] [dim] [max_cores]
+"""
+import multiprocessing
+import sys
+import time
+from pyflann import FLANN
+import numpy as np
+
+
+def run(name, data, queries, cores_list, **params):
+    reference = None
+    for cores in cores_list:
+        flann = FLANN()
+        start = time.time()
+        flann.build_index(data, random_seed=1, cores=cores, **params)
+        build_time = time.time() - start
+        result, _ = flann.nn_index(queries, 5, checks=128)
+        if reference is None:
+            reference = (build_time, result)
+        print('%-22s cores %3d  build %8.2f s  speedup %5.2f  same index %s'
+              % (name, cores, build_time, reference[0] / build_time,
+                 np.array_equal(result, reference[1])))
+
+
+if __name__ == '__main__':
+    num_points = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 128
+    max_cores = int(sys.argv[3]) if len(sys.argv) > 3 else multiprocessing.cpu_count()
+
+    rng = np.random.RandomState(0)
+    data = rng.rand(num_points, dim).astype(np.float32)
+    queries = rng.rand(100, dim).astype(np.float32)
+    cores_list = [1]
+    while cores_list[-1] * 2 <= max_cores:
+        cores_list.append(cores_list[-1] * 2)
+
+    print('points=%d dim=%d' % (num_points, dim))
+    run('kdtree trees=16', data, queries, cores_list, algorithm='kdtree', trees=16)
+    run('kmeans branching=32', data, queries, cores_list,
+        algorithm='kmeans', branching=32, iterations=5)
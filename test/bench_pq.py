@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""
+Reports the recall, search time and memory of product quantization indexes
+with and without re-ranking, next to a kd-tree index, on data of a lower
+intrinsic dimension (as descriptors usually are).
+
+    python test/bench_pq.py [num_points] [dim] [num_queries]
+"""
+import sys
+import time
+from pyflann import FLANN
+import numpy as np
+
+
+def run(name, data, queries, exact, checks=32, **params):
+    flann = FLANN()
+    start = time.time()
+    flann.build_index(data, random_seed=1, **params)
+    build_time = time.time() - start
+
+    start = time.time()
+    result, _ = flann.nn_index(queries, exact.shape[1], checks=checks)
+    search_time = (time.time() - start) / len(queries) * 1e6
+
+    recall = np.mean([len(set(r) & set(e)) / float(len(e)) for r, e in zip(result, exact)])
+    memory = flann.used_memory()
+    print('%-24s build %7.2f s  search %9.1f us/query  recall@%d %.3f  index %8.1f MB (%6.1f B/point)'
+          % (name, build_time, search_time, exact.shape[1], recall, memory / 1e6,
+             memory / float(len(data))))
+
+
+if __name__ == '__main__':
+    num_points = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 128
+    num_queries = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+
+    rng = np.random.RandomState(0)
+    latent = rng.randn(num_points + num_queries, 16)
+    points = (latent.dot(rng.randn(16, dim)) + 0.1 * rng.randn(len(latent), dim)).astype(np.float32)
+    data, queries = points[:num_points], points[num_points:]
+    exact, _ = FLANN().nn(data, queries, 10, algorithm='linear')
+
+    print('points=%d dim=%d queries=%d, dataset %.1f MB (%d B/point)'
+          % (num_points, dim, num_queries, data.nbytes / 1e6, data.nbytes // num_points))
+    run('kdtree', data, queries, exact, algorithm='kdtree', trees=4, checks=256)
+    for subquantizers in [8, 16, 32]:
+        for rerank in [0, 100]:
+            run('pq m=%d rerank=%d' % (subquantizers, rerank), data, queries, exact,
+                algorithm='pq', subquantizers=subquantizers, rerank=rerank)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""
+Measures the per-query overhead of single point searches done through
+FLANN.nn_index and through a prepared search.
+
+    python test/bench_prepared_search.py [dim] [num_points] [num_queries]
+"""
+import sys
+import time
+from pyflann import FLANN
+import numpy as np
+
+
+def time_per_query(search, queries):
+    start = time.time()
+    for q in queries:
+        search(q)
+    return (time.time() - start) / len(queries) * 1e6
+
+
+if __name__ == '__main__':
+    dim = int(sys.argv[1]) if len(sys.argv) > 1 else 128
+    num_points = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    num_queries = int(sys.argv[3]) if len(sys.argv) > 3 else 20000
+
+    rng = np.random.RandomState(0)
+    dataset = rng.rand(num_points, dim).astype(np.float32)
+    queries = rng.rand(num_queries, 1, dim).astype(np.float32)
+
+    flann = FLANN()
+    flann.build_index(dataset, algorithm='kdtree', trees=4, random_seed=1)
+
+    # checks=1 makes the search itself as cheap as possible, so that the
+    # measured time is dominated by the per-call overhead
+    def nn_index(q):
+        return flann.nn_index(q, 1, checks=1)
+
+    prepared = flann.prepare_search(1, checks=1)
+    indices = np.empty((1, 1), dtype=np.int32)
+    dists = np.empty((1, 1), dtype=np.float32)
+
+    def prepared_call(q):
+        return prepared(q, indices, dists)
+
+    query = np.empty((1, dim), dtype=np.float32)
+    bound = prepared.bind(query, indices, dists)
+
+    def prepared_reused_call(q):
+        query[...] = q
+        return prepared(query, indices, dists)
+
+    def bound_call(q):
+        query[...] = q
+        return bound()
+
+    print('dim=%d points=%d queries=%d' % (dim, num_points, num_queries))
+    for name, search in [('nn_index', nn_index),
+                         ('prepared', prepared_call),
+                         ('prepared (reused)', prepared_reused_call),
+                         ('prepared (bound)', bound_call)]:
+        time_per_query(search, queries[:1000])  # warm up
+        print('%-20s %8.2f us/query' % (name, time_per_query(search, queries)))
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""
+Reports the save and load times and the file size of a kd-tree index for
+each compression of save_index, and the load time of the uncompressed
+index from a memory mapping of the file. The compression uses as many
+threads as OpenMP does (set OMP_NUM_THREADS to change it).
+
+    python test/bench_save.py [num_points] [dim] [filename]
+"""
+import mmap
+import os
+import sys
+import time
+from pyflann import FLANN
+import numpy as np
+
+
+COMPRESSIONS = [('none', None), ('lz4', None), ('lz4', 8), ('lz4hc', 1), ('lz4hc', 4),
+                ('lz4hc', 9)]
+
+
+def timed(function, *args, **kwargs):
+    start = time.time()
+    function(*args, **kwargs)
+    return time.time() - start
+
+
+if __name__ == '__main__':
+    num_points = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 128
+    filename = sys.argv[3] if len(sys.argv) > 3 else 'index_bench.dat'
+
+    rng = np.random.RandomState(0)
+    data = rng.rand(num_points, dim).astype(np.float32)
+    queries = rng.rand(100, dim).astype(np.float32)
+
+    flann = FLANN()
+    flann.build_index(data, algorithm='kdtree', trees=8, random_seed=1)
+    expected, _ = flann.nn_index(queries, 5, checks=128)
+
+    print('points=%d dim=%d' % (num_points, dim))
+    try:
+        for compression, level in COMPRESSIONS:
+            save_time = timed(flann.save_index, filename, compression=compression, level=level)
+            size = os.path.getsize(filename)
+            loaded = FLANN()
+            load_time = timed(loaded.load_index, filename, data)
+            result, _ = loaded.nn_index(queries, 5, checks=128)
+            print('%-6s level %-4s save %7.3f s  load %7.3f s  size %9.1f MB  same index %s'
+                  % (compression, level if level is not None else '-', save_time, load_time,
+                     size / 1e6, np.array_equal(result, expected)))
+
+        flann.save_index(filename, compression='none')
+        with open(filename, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            loaded = FLANN()
+            load_time = timed(loaded.load_index_from_buffer, mapping, data)
+            mapping.close()
+        result, _ = loaded.nn_index(queries, 5, checks=128)
+        print('none   mmap       %18s load %7.3f s  %20s same index %s'
+              % ('', load_time, '', np.array_equal(result, expected)))
+    finally:
+        os.remove(filename)
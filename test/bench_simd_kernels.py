@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""
+Times the distance kernels per element type, dimension and instruction set
+with linear searches, whose cost is almost only distance computations. The
+instruction set is limited with the FLANN_SIMD environment variable, which
+is read once, so each one is timed in a separate process. Instruction sets
+that the CPU lacks fall back to the widest one it has.
+
+    python test/bench_simd_kernels.py [num_points] [num_queries]
+"""
+import os
+import subprocess
+import sys
+import time
+from pyflann import FLANN
+import numpy as np
+
+LEVELS = ['scalar', 'sse2', 'avx2', 'avx512']
+DTYPES = ['float32', 'uint8', 'int32']
+DIMS = [32, 64, 128, 960]
+DISTANCES = ['euclidean', 'manhattan', 'hik']
+
+
+def time_per_distance(dtype, dim, distance, num_points, num_queries, repeat=3):
+    rng = np.random.RandomState(0)
+    data = (rng.rand(num_points, dim) * 255).astype(dtype)
+    queries = (rng.rand(num_queries, dim) * 255).astype(dtype)
+    flann = FLANN(distance_type=distance)
+    flann.build_index(data, algorithm='linear')
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        flann.nn_index(queries, 1)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / (num_points * num_queries) * 1e9
+
+
+def run_level(num_points, num_queries):
+    for dtype in DTYPES:
+        for dim in DIMS:
+            for distance in DISTANCES:
+                print('%s %d %s %f' % (dtype, dim, distance,
+                      time_per_distance(dtype, dim, distance, num_points, num_queries)))
+
+
+if __name__ == '__main__':
+    num_points = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    num_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    if 'FLANN_SIMD' in os.environ:
+        run_level(num_points, num_queries)
+        sys.exit(0)
+
+    timings = {}
+    for level in LEVELS:
+        env = dict(os.environ, FLANN_SIMD=level)
+        output = subprocess.check_output([sys.executable] + sys.argv, env=env)
+        for line in output.decode().splitlines():
+            dtype, dim, distance, ns = line.split()
+            timings[(dtype, int(dim), distance, level)] = float(ns)
+
+    print('points=%d queries=%d, ns per distance (speedup over scalar)' % (num_points, num_queries))
+    print('%-8s %5s %-10s' % ('dtype', 'dim', 'distance') + ''.join('%18s' % level for level in LEVELS))
+    for dtype in DTYPES:
+        for dim in DIMS:
+            for distance in DISTANCES:
+                scalar = timings[(dtype, dim, distance, 'scalar')]
+                print('%-8s %5d %-10s' % (dtype, dim, distance) +
+                      ''.join('%10.1f (%4.1fx)' % (timings[(dtype, dim, distance, level)],
+                                                   scalar / timings[(dtype, dim, distance, level)])
+                              for level in LEVELS))
@@ -99,6 +99,8 @@ const char* index_type_to_name(flann_algorithm_t index_type)
 	case FLANN_INDEX_KDTREE_SINGLE: return "single kd-tree";
 	case FLANN_INDEX_HIERARCHICAL: return "hierarchical";
 	case FLANN_INDEX_LSH: return "LSH";
+	case FLANN_INDEX_PQ: return "product quantization";
+	case FLANN_INDEX_HNSW: return "hnsw";
 #ifdef FLANN_USE_CUDA
 	case FLANN_INDEX_KDTREE_CUDA: return "kd-tree CUDA";
 #endif
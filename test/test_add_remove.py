@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import pyflann
+import os
 import sys
 import numpy as np
 import unittest
@@ -122,6 +123,201 @@ class Test_PyFlann_add_remove(unittest.TestCase):
         self.assertTrue(np.all(check2_odd), 'unremoved points should have unchanged neighbors')
         self.assertTrue(not np.any(check2_even), 'removed points should have different neighbors')
 
+    def test_remove_points(self):
+        """
+        Test that bulk removal matches removing the points one by one
+        """
+        data_dim = 16
+        num_dpts = 1000
+        num_neighbs = 5
+        random_seed = 42
+        rng = np.random.RandomState(0)
+        dataset = rand_vecs(num_dpts, data_dim, rng)
+
+        remove_ids = rng.permutation(num_dpts)[:400]
+        # duplicates and unknown ids are ignored
+        bulk_ids = np.concatenate([remove_ids, remove_ids[:10], [-1, num_dpts + 5]])
+
+        flann1 = pyflann.FLANN()
+        params = flann1.build_index(dataset, algorithm='kdtree', trees=4, random_seed=random_seed)
+        for id_ in remove_ids:
+            flann1.remove_point(id_)
+
+        flann2 = pyflann.FLANN()
+        flann2.build_index(dataset, algorithm='kdtree', trees=4, random_seed=random_seed)
+        flann2.remove_points(bulk_ids)
+
+        self.assertEqual(flann2.get_indexed_shape(), (num_dpts - 400, data_dim))
+        self.assertEqual(flann1.get_indexed_shape(), flann2.get_indexed_shape())
+        result1, _ = flann1.nn_index(dataset, num_neighbs, checks=params['checks'])
+        result2, _ = flann2.nn_index(dataset, num_neighbs, checks=params['checks'])
+        self.assertTrue(np.all(result1 == result2))
+        self.assertFalse(np.any(np.in1d(result2, remove_ids)))
+
+    def test_compact(self):
+        """
+        Test that compacting in the background keeps the results and the
+        points added or removed while it runs
+        """
+        data_dim = 16
+        num_dpts = 2000
+        num_qpts = 100
+        num_neighbs = 5
+        random_seed = 42
+        rng = np.random.RandomState(0)
+        dataset = rand_vecs(num_dpts, data_dim, rng)
+        testset = rand_vecs(num_qpts, data_dim, rng)
+        new_pts = rand_vecs(200, data_dim, rng)
+
+        flann1 = pyflann.FLANN()
+        flann1.build_index(dataset, algorithm='kdtree', trees=4, random_seed=random_seed)
+        flann2 = pyflann.FLANN()
+        flann2.build_index(dataset, algorithm='kdtree', trees=4, random_seed=random_seed)
+        flann1.remove_points(np.arange(0, num_dpts, 2))
+        flann2.remove_points(np.arange(0, num_dpts, 2))
+        prepared = flann2.prepare_search(num_neighbs, checks=-1)
+
+        thread = flann2.compact(background=True)
+        self.assertIs(flann2.compact(background=True), thread)
+        for flann in (flann1, flann2):
+            flann.add_points(new_pts, 2)
+            flann.remove_points([1, 3, num_dpts + 1])
+        result_during, _ = flann2.nn_index(testset, num_neighbs, checks=-1)
+        flann2.wait_for_compaction()
+
+        result1, dists1 = flann1.nn_index(testset, num_neighbs, checks=-1)
+        result2, dists2 = flann2.nn_index(testset, num_neighbs, checks=-1)
+        self.assertTrue(np.all(result1 == result_during))
+        self.assertTrue(np.all(result1 == result2))
+        self.assertTrue(np.allclose(dists1, dists2))
+        indices = np.empty((num_qpts, num_neighbs), dtype=np.int32)
+        dists = np.empty((num_qpts, num_neighbs), dtype=np.float32)
+        self.assertTrue(np.all(prepared(testset, indices, dists)[0] == result2))
+        self.assertEqual(flann1.get_indexed_shape(), flann2.get_indexed_shape())
+
+        # the policy compacts once more than half of the points are removed
+        flann3 = pyflann.FLANN()
+        flann3.build_index(dataset, algorithm='kdtree', trees=4, random_seed=random_seed)
+        flann3.set_compaction_policy(max_removed=0.5, background=False)
+        memory = flann3.used_memory()
+        flann3.remove_points(np.arange(num_dpts // 2))
+        self.assertEqual(flann3.used_memory(), memory)
+        flann3.remove_point(num_dpts // 2)
+        self.assertTrue(flann3.used_memory() < memory)
+
+    def test_build_index_from_chunks(self):
+        """
+        Test that an index built from chunks finds the rows of every chunk
+        """
+        data_dim = 16
+        num_chunks = 10
+        chunk_rows = 500
+        rng = np.random.RandomState(0)
+        chunks = [rand_vecs(chunk_rows, data_dim, rng, np.float32) for _ in range(num_chunks)]
+        dataset = np.concatenate(chunks)
+        testset = rand_vecs(100, data_dim, rng, np.float32)
+
+        flann = pyflann.FLANN()
+        flann.build_index_from_chunks((chunk for chunk in chunks), total_rows=num_chunks * chunk_rows,
+                                      algorithm='kdtree', trees=4, random_seed=42)
+        self.assertEqual(flann.get_indexed_shape(), dataset.shape)
+
+        # the rows of the chunks have consecutive ids
+        result, dists = flann.nn_index(dataset[::50], 1, checks=-1)
+        self.assertTrue(np.all(result == np.arange(0, len(dataset), 50)))
+        self.assertTrue(np.all(dists == 0))
+        # the structure built from the sample still finds the neighbors
+        exact, _ = pyflann.FLANN().nn(dataset, testset, 5, algorithm='linear')
+        result, _ = flann.nn_index(testset, 5, checks=-1)
+        self.assertTrue(np.all(result == exact))
+
+        flann2 = pyflann.FLANN()
+        self.assertRaises(pyflann.FLANNException, flann2.build_index_from_chunks, iter(chunks),
+                          total_rows=num_chunks * chunk_rows + 1)
+        self.assertRaises(pyflann.FLANNException, flann2.build_index_from_chunks, iter(chunks),
+                          total_rows=chunk_rows * 2)
+        self.assertRaises(pyflann.FLANNException, flann2.build_index_from_chunks, iter([]))
+
+    def test_build_index_from_reused_buffer(self):
+        """
+        Test that an index built from chunks refilling a single buffer
+        keeps the rows the chunks held when they were passed
+        """
+        data_dim = 16
+        num_chunks = 3
+        chunk_rows = 1000
+        rng = np.random.RandomState(0)
+        dataset = rand_vecs(num_chunks * chunk_rows, data_dim, rng, np.float32)
+        buf = np.empty((chunk_rows, data_dim), dtype=np.float32)
+
+        def chunks():
+            for start in range(0, len(dataset), chunk_rows):
+                buf[:] = dataset[start:start + chunk_rows]
+                yield buf
+
+        for sample_rows in [chunk_rows, 2 * chunk_rows]:
+            flann = pyflann.FLANN()
+            flann.build_index_from_chunks(chunks(), sample_rows=sample_rows,
+                                          algorithm='kdtree', trees=4, random_seed=42)
+            self.assertFalse(np.shares_memory(flann.get_indexed_data()[0], buf))
+            result, dists = flann.nn_index(dataset, 1, checks=-1)
+            self.assertTrue(np.all(result == np.arange(len(dataset))))
+            self.assertTrue(np.all(dists == 0))
+
+    def test_added_points_buffer(self):
+        """
+        Test that points added one by one are found after the buffer holding
+        them was reallocated or shrunk
+        """
+        data_dim = 8
+        num_dpts = 200
+        num_added = 300
+        rng = np.random.RandomState(0)
+        dataset = rand_vecs(num_dpts, data_dim, rng, np.float32)
+        added = rand_vecs(num_added, data_dim, rng, np.float32)
+        alldata = np.concatenate((dataset, added))
+
+        for params in [dict(algorithm='kdtree', trees=2), dict(algorithm='kmeans', branching=8),
+                       dict(algorithm='hierarchical', branching=8, trees=2),
+                       dict(algorithm='composite', trees=2, branching=8),
+                       dict(algorithm='hnsw'), dict(algorithm='linear')]:
+            flann = pyflann.FLANN()
+            flann.build_index(dataset, random_seed=42, **params)
+            self.assertEqual(flann.get_indexed_capacity(), dataset.shape)
+            point = np.empty((1, data_dim), dtype=np.float32)
+            for i in range(num_added):
+                # the point is copied, so the array can be reused
+                point[:] = added[i]
+                flann.add_points(point, 0)
+            npts, capacity = flann.get_indexed_shape()[0], flann.get_indexed_capacity()[0]
+            self.assertEqual(npts, len(alldata))
+            self.assertTrue(npts <= capacity < num_dpts + 2 * num_added)
+            self.assertEqual(flann.used_memory_dataset(), capacity * data_dim * 4)
+
+            result, dists = flann.nn_index(alldata, 1, checks=-1)
+            self.assertTrue(np.all(result == np.arange(len(alldata))), params)
+            self.assertTrue(np.all(dists == 0))
+
+            flann.shrink_to_fit()
+            self.assertEqual(flann.get_indexed_capacity()[0], len(alldata))
+            _, added_data = flann.get_indexed_data()
+            self.assertTrue(np.all(added_data[0] == added))
+            result, dists = flann.nn_index(alldata, 1, checks=-1)
+            self.assertTrue(np.all(result == np.arange(len(alldata))), params)
+
+        # points added and buffers reallocated during a background compaction
+        flann = pyflann.FLANN()
+        flann.build_index(dataset, algorithm='kdtree', trees=2, random_seed=42)
+        flann.add_points(added[:10], 0)
+        flann.remove_points(np.arange(0, num_dpts, 2))
+        flann.compact(background=True)
+        for i in range(10, num_added):
+            flann.add_points(added[i:i + 1], 0)
+        flann.wait_for_compaction()
+        result, dists = flann.nn_index(alldata[1::2], 1, checks=-1)
+        self.assertTrue(np.all(result == np.arange(1, len(alldata), 2)))
+        self.assertTrue(np.all(dists == 0))
+
     def test_used_memory(self):
         """
         Simple test to make sure the used_memory binding works
@@ -158,6 +354,55 @@ class Test_PyFlann_add_remove(unittest.TestCase):
         self.assertTrue(index_memory_diff > 0, 'add points should increase memory usage')
         self.assertTrue(data_memory_diff > 0, 'add points should increase memory usage')
 
+    def test_save_load_state(self):
+        """
+        Test that added and removed points survive save_index/load_index
+        and save_bundle/load_bundle, including a rebuild on add
+        """
+        data_dim = 32
+        num_dpts = 500
+        num_qpts = 100
+        num_neighbs = 5
+        random_seed = 42
+        rng = np.random.RandomState(0)
+
+        dataset = rand_vecs(num_dpts, data_dim, rng)
+        testset = rand_vecs(num_qpts, data_dim, rng)
+        flann = pyflann.FLANN()
+        params = flann.build_index(dataset, algorithm='kdtree', trees=4, random_seed=random_seed)
+
+        for id_ in range(0, num_dpts, 3):
+            flann.remove_point(id_)
+        flann.add_points(rand_vecs(100, data_dim, rng), 2)
+        flann.remove_point(num_dpts + 1)
+        # triggers a rebuild, which compacts the removed points
+        flann.add_points(rand_vecs(2000, data_dim, rng), 2)
+
+        result1, dists1 = flann.nn_index(testset, num_neighbs, checks=params['checks'])
+        shape1 = flann.get_indexed_shape()
+
+        try:
+            flann.save_index('index_state.dat')
+            flann2 = pyflann.FLANN()
+            flann2.load_index('index_state.dat', dataset)
+            result2, dists2 = flann2.nn_index(testset, num_neighbs, checks=params['checks'])
+            self.assertEqual(flann2.get_indexed_shape(), shape1)
+            self.assertTrue(np.all(result1 == result2))
+            self.assertTrue(np.all(dists1 == dists2))
+
+            flann.save_bundle('index_state.dat')
+            flann3 = pyflann.FLANN()
+            flann3.load_bundle('index_state.dat')
+            result3, dists3 = flann3.nn_index(testset, num_neighbs, checks=params['checks'])
+            self.assertEqual(flann3.get_indexed_shape(), shape1)
+            self.assertTrue(np.all(result1 == result3))
+            # the removed ids are restored before the state of the index is
+            # recorded, so that they do not count as pending removals
+            self.assertEqual(flann3._FLANN__built_state, flann2._FLANN__built_state)
+            self.assertTrue(flann3._FLANN__built_state[1] > 0)
+        finally:
+            os.remove('index_state.dat')
+
 
 if __name__ == '__main__':
     """
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+from pyflann import *
+from pyflann.aio import AsyncFLANN
+from numpy import *
+from numpy.random import *
+import asyncio
+import unittest
+
+
+class Test_PyFLANN_aio(unittest.TestCase):
+
+    def setUp(self):
+        self.x = rand(1000, 8).astype(float32)
+        self.q = rand(100, 8).astype(float32)
+        self.nn = FLANN()
+        self.nn.build_index(self.x, algorithm='linear')
+
+        # count the number of batches searched
+        self.batches = []
+        nn_index = self.nn.nn_index
+
+        def counting_nn_index(qpts, *args, **kwargs):
+            self.batches.append(len(qpts))
+            return nn_index(qpts, *args, **kwargs)
+        self.nn.nn_index = counting_nn_index
+
+    def tearDown(self):
+        self.nn.delete_index()
+
+    def run_loop(self, coroutine):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+
+    def search_all(self, index, num_neighbors):
+        async def run():
+            return await asyncio.gather(*[index.search(q, num_neighbors) for q in self.q])
+        return self.run_loop(run())
+
+    def test_search_batched(self):
+        expected_idx, expected_dists = self.nn.nn_index(self.q, 3)
+        del self.batches[:]
+
+        index = AsyncFLANN(self.nn, max_batch_size=16, max_wait_us=100000)
+        results = self.search_all(index, 3)
+
+        self.assertEqual(len(results), len(self.q))
+        for i, (idx, dists) in enumerate(results):
+            self.assertTrue(all(idx == expected_idx[i]))
+            self.assertTrue(allclose(dists, expected_dists[i]))
+        self.assertEqual(sum(self.batches), len(self.q))
+        self.assertTrue(max(self.batches) <= 16)
+        self.assertTrue(len(self.batches) < len(self.q))
+
+    def test_search_timeout(self):
+        """ a partial batch is searched once the wait window expires """
+        index = AsyncFLANN(self.nn, max_batch_size=1000, max_wait_us=1000)
+        results = self.search_all(index, 1)
+
+        expected_idx, expected_dists = self.nn.nn_index(self.q, 1)
+        self.assertTrue(all(array([r[0][0] for r in results]) == expected_idx))
+
+    def test_search_error(self):
+        index = AsyncFLANN(self.nn)
+
+        async def run():
+            return await index.search(zeros(8, dtype=float64))
+        self.assertRaises(FLANNException, self.run_loop, run())
+
+    def test_search_wrong_size(self):
+        """ a query of the wrong size fails alone, not with its batch """
+        expected_idx, _ = self.nn.nn_index(self.q[:2], 1)
+        index = AsyncFLANN(self.nn, max_batch_size=3, max_wait_us=100000)
+
+        async def run():
+            return await asyncio.gather(index.search(self.q[0]), index.search(self.q[0, :4]),
+                                        index.search(self.q[1]), return_exceptions=True)
+        results = self.run_loop(run())
+        self.assertTrue(isinstance(results[1], FLANNException))
+        self.assertEqual(results[0][0][0], expected_idx[0])
+        self.assertEqual(results[2][0][0], expected_idx[1])
+
+    def test_search_wrong_type(self):
+        """ a query of the wrong type fails alone, not with its batch """
+        expected_idx, _ = self.nn.nn_index(self.q[:2], 1)
+        index = AsyncFLANN(self.nn, max_batch_size=3, max_wait_us=100000)
+
+        async def run():
+            return await asyncio.gather(index.search(self.q[0]),
+                                        index.search(self.q[0].astype(float64)),
+                                        index.search(list(self.q[1])), return_exceptions=True)
+        results = self.run_loop(run())
+        self.assertTrue(isinstance(results[1], FLANNException))
+        self.assertEqual(results[0][0][0], expected_idx[0])
+        self.assertEqual(results[2][0][0], expected_idx[1])
+
+    def test_search_unbuilt(self):
+        index = AsyncFLANN(FLANN())
+
+        async def run():
+            return await index.search(self.q[0])
+        self.assertRaises(FLANNException, self.run_loop, run())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -90,6 +90,58 @@ class Test_PyFLANN_clustering(unittest.TestCase):
         self.assertTrue(any(cl1 != cl2))
         
 
+    def test_kmeans_clustering(self):
+        """ flat kmeans returns the centers, the labels and the inertia """
+        seed(0)
+        centers = rand(20, 8) * 10
+        data = (centers[arange(4000) % 20] + randn(4000, 8) * 0.1).astype(float32)
+
+        result, labels, inertia = self.nn.kmeans_clustering(data, 20, return_inertia=True,
+                                                           checks=-1, random_seed=1)
+        self.assertEqual(result.shape, (20, 8))
+        self.assertEqual(labels.shape, (4000,))
+        # every label is the closest center, and the inertia their distances
+        dists = ((data[:, newaxis, :] - result[newaxis, :, :]) ** 2).sum(axis=2)
+        self.assertTrue(all(labels == dists.argmin(axis=1)))
+        self.assertAlmostEqual(inertia, dists.min(axis=1).sum(), delta=inertia * 1e-4)
+        # the iterations improve the initial centers
+        _, _, initial_inertia = self.nn.kmeans_clustering(data, 20, max_iterations=0, return_inertia=True,
+                                                          checks=-1, random_seed=1)
+        self.assertTrue(inertia < initial_inertia)
+
+        # the same seed gives the same clusters with any number of threads
+        approx = [self.nn.kmeans_clustering(data, 20, trees=4, checks=32, cores=cores, random_seed=1)
+                  for cores in [1, 3]]
+        self.assertTrue(all(approx[0][0] == approx[1][0]))
+        self.assertTrue(all(approx[0][1] == approx[1][1]))
+
+    def test_kmeans_clustering_batches(self):
+        """ mini-batch kmeans only samples part of the points at each update """
+        seed(0)
+        centers = rand(10, 4) * 10
+        data = (centers[arange(20000) % 10] + randn(20000, 4) * 0.1).astype(float32)
+        full, _, full_inertia = self.nn.kmeans_clustering(data, 10, return_inertia=True, random_seed=3)
+        batch, labels, batch_inertia = self.nn.kmeans_clustering(data, 10, max_iterations=50, batch_size=500,
+                                                                return_inertia=True, random_seed=3)
+        self.assertTrue(batch_inertia < full_inertia * 1.5)
+        self.assertEqual(labels.max(), 9)
+
+        # the dataset may be read from a raw file given with its dtype and shape
+        filename = 'kmeans_clustering.dat'
+        data.tofile(filename)
+        try:
+            mapped, mapped_labels = self.nn.kmeans_clustering(filename, 10, max_iterations=50, batch_size=500,
+                                                              dtype=float32, shape=data.shape,
+                                                              center_dtype=float64, random_seed=3)
+        finally:
+            os.remove(filename)
+        self.assertEqual(mapped.dtype, float64)
+        self.assertTrue(all(mapped == batch))
+        self.assertTrue(all(mapped_labels == labels))
+
+        self.assertRaises(FLANNException, self.nn.kmeans_clustering, data, 0)
+        self.assertRaises(FLANNException, self.nn.kmeans_clustering, data, 10, batch_size=-1)
+
         
 if __name__ == '__main__':
     unittest.main()
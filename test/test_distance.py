@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+from pyflann import *
+from numpy import *
+from numpy.random import *
+import os
+import threading
+import unittest
+
+
+def brute_force(x, q, num_neighbors, distance):
+    if distance == 'manhattan':
+        d = abs(q[:, newaxis, :] - x[newaxis, :, :]).sum(axis=2)
+    elif distance == 'chi_square':
+        s = q[:, newaxis, :] + x[newaxis, :, :]
+        d = ((q[:, newaxis, :] - x[newaxis, :, :]) ** 2 / s).sum(axis=2)
+    else:
+        d = ((q[:, newaxis, :] - x[newaxis, :, :]) ** 2).sum(axis=2)
+    return argsort(d, axis=1)[:, :num_neighbors]
+
+
+class Test_PyFLANN_distance(unittest.TestCase):
+
+    def setUp(self):
+        self.x = rand(500, 8).astype(float32) + 0.1
+        self.q = rand(50, 8).astype(float32) + 0.1
+
+    def tearDown(self):
+        set_distance_type('euclidean')
+        if os.path.exists('index_distance.dat'):
+            os.remove('index_distance.dat')
+
+    def test_distance_per_object(self):
+        """ objects with different distances are searched concurrently """
+        distances = ['euclidean', 'manhattan', 'chi_square']
+        indexes = []
+        for distance in distances:
+            nn = FLANN(distance_type=distance)
+            nn.build_index(self.x, algorithm='linear')
+            indexes.append(nn)
+        # changing the process default does not affect the indexes
+        set_distance_type('manhattan')
+
+        errors = []
+
+        def run(nn, distance):
+            try:
+                for _ in range(20):
+                    result, _ = nn.nn_index(self.q, 3)
+                    if not all(result == brute_force(self.x, self.q, 3, distance)):
+                        errors.append(distance)
+                        return
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=args) for args in zip(indexes, distances)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+
+    def test_default_distance(self):
+        """ objects without a distance use the process default when building """
+        set_distance_type('manhattan')
+        nn = FLANN()
+        nn.build_index(self.x, algorithm='linear')
+        set_distance_type('euclidean')
+        result, _ = nn.nn_index(self.q, 3)
+        self.assertTrue(all(result == brute_force(self.x, self.q, 3, 'manhattan')))
+
+    def test_save_load_distance(self):
+        """ save_index stores the distance, which load_index restores """
+        nn = FLANN()
+        nn.set_distance_type('chi_square')
+        nn.build_index(self.x, algorithm='kdtree', trees=1)
+        result, dists = nn.nn_index(self.q, 3, checks=-1)
+        nn.save_index('index_distance.dat')
+
+        nn2 = FLANN()
+        nn2.load_index('index_distance.dat', self.x)
+        result2, dists2 = nn2.nn_index(self.q, 3, checks=-1)
+        self.assertTrue(all(result == result2))
+        self.assertTrue(all(dists == dists2))
+        self.assertTrue(all(result2 == brute_force(self.x, self.q, 3, 'chi_square')))
+        # the loaded distance is used for the next index as well
+        nn2.build_index(self.x, algorithm='linear')
+        result3, _ = nn2.nn_index(self.q, 3)
+        self.assertTrue(all(result3 == result2))
+
+    def test_hamming(self):
+        """ the hamming distance counts the differing bits of uint8 codes """
+        x = randint(0, 256, (2000, 32)).astype(uint8)
+        q = randint(0, 256, (50, 32)).astype(uint8)
+        bits = unpackbits(x, axis=1).astype(int32)
+        qbits = unpackbits(q, axis=1).astype(int32)
+        exact = (qbits[:, newaxis, :] != bits[newaxis, :, :]).sum(axis=2)
+
+        nn = FLANN(distance_type='hamming')
+        nn.build_index(x, algorithm='linear')
+        result, dists = nn.nn_index(q, 5)
+        self.assertTrue(all(dists == sort(exact, axis=1)[:, :5]))
+        self.assertTrue(all(dists == exact[arange(50)[:, newaxis], result]))
+
+        # the points themselves are found at distance 0 by the approximate indexes
+        for params in [dict(algorithm='lsh', table_number_=8, key_size_=16, multi_probe_level_=1),
+                       dict(algorithm='hierarchical', branching=16, trees=4, leaf_max_size=50)]:
+            nn.build_index(x, **params)
+            result, dists = nn.nn_index(x[:100], 1, checks=256)
+            self.assertTrue(all(result == arange(100)))
+            self.assertTrue(all(dists == 0))
+
+        nn.build_index(x, algorithm='linear')
+        nn.save_index('index_distance.dat')
+        nn2 = FLANN()
+        nn2.load_index('index_distance.dat', x)
+        result2, dists2 = nn2.nn_index(q, 5)
+        self.assertTrue(all(dists2 == sort(exact, axis=1)[:, :5]))
+
+        self.assertRaises(FLANNException, nn.build_index, x.astype(float32))
+        self.assertRaises(FLANNException, nn.build_index, x, algorithm='kdtree')
+
+
+if __name__ == '__main__':
+    unittest.main()
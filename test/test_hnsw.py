@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+from pyflann import *
+from numpy import *
+from numpy.random import *
+import os
+import unittest
+
+
+class Test_PyFLANN_hnsw(unittest.TestCase):
+
+    def setUp(self):
+        seed(0)
+        self.x = rand(5000, 32).astype(float32)
+        self.q = rand(100, 32).astype(float32)
+        self.exact, self.exact_dists = FLANN().nn(self.x, self.q, 5, algorithm='linear')
+
+    def tearDown(self):
+        if os.path.exists('index_hnsw.dat'):
+            os.remove('index_hnsw.dat')
+
+    def recall(self, result):
+        return mean([len(set(r) & set(e)) / float(len(e)) for r, e in zip(result, self.exact)])
+
+    def test_checks(self):
+        """ more checks explore more of the graph """
+        nn = FLANN()
+        nn.build_index(self.x, algorithm='hnsw', connections=8, ef_construction=100, random_seed=1)
+        result, _ = nn.nn_index(self.q, 5, checks=5)
+        recall_low = self.recall(result)
+
+        result, dists = nn.nn_index(self.q, 5, checks=200)
+        self.assertTrue(self.recall(result) > 0.97)
+        self.assertTrue(self.recall(result) >= recall_low)
+        found = result == self.exact
+        self.assertTrue(allclose(dists[found], self.exact_dists[found], rtol=1e-4))
+
+        # unlimited checks explore the whole graph
+        result, _ = nn.nn_index(self.q, 5, checks=-1)
+        self.assertTrue(all(result == self.exact))
+
+    def test_more_neighbors_than_checks(self):
+        """ a search keeps at least as many points as neighbors searched """
+        nn = FLANN()
+        nn.build_index(self.x, algorithm='hnsw', random_seed=1)
+        result, dists = nn.nn_index(self.q, 50, checks=8)
+        self.assertEqual(result.shape, (len(self.q), 50))
+        self.assertTrue(all(result >= 0))
+        self.assertTrue(all(isfinite(dists)))
+
+    def test_save_load(self):
+        nn = FLANN()
+        nn.build_index(self.x, algorithm='hnsw', connections=12)
+        result, dists = nn.nn_index(self.q, 5, checks=64)
+        nn.save_index('index_hnsw.dat')
+
+        nn2 = FLANN()
+        nn2.load_index('index_hnsw.dat', self.x)
+        result2, dists2 = nn2.nn_index(self.q, 5, checks=64)
+        self.assertTrue(all(result == result2))
+        self.assertTrue(all(dists == dists2))
+
+    def test_add_remove_points(self):
+        """ added points are inserted in the graph, removed ones are not returned """
+        nn = FLANN()
+        nn.build_index(self.x[:1000], algorithm='hnsw')
+        for start in range(1000, 5000, 1000):
+            nn.add_points(self.x[start:start + 1000])
+        result, _ = nn.nn_index(self.q, 5, checks=100)
+        self.assertTrue(self.recall(result) > 0.97)
+
+        nn.remove_points(self.exact[:, 0])
+        result, _ = nn.nn_index(self.q, 5, checks=100)
+        self.assertFalse(any(in1d(result, self.exact[:, 0])))
+        self.assertTrue(mean(result[:, 0] == self.exact[:, 1]) > 0.95)
+
+    def test_hamming(self):
+        x = randint(0, 256, (3000, 32)).astype(uint8)
+        nn = FLANN(distance_type='hamming')
+        nn.build_index(x, algorithm='hnsw')
+        result, dists = nn.nn_index(x[:100], 1, checks=32)
+        self.assertTrue(all(result == arange(100)))
+        self.assertTrue(all(dists == 0))
+
+    def test_invalid_connections(self):
+        nn = FLANN()
+        self.assertRaises(FLANNException, nn.build_index, self.x, algorithm='hnsw', connections=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
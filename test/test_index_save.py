@@ -4,6 +4,8 @@ from pyflann import *
 from copy import copy
 from numpy import *
 from numpy.random import *
+import mmap
+import os
 import unittest
 
 
@@ -187,5 +189,124 @@ class Test_PyFLANN_nn_index(unittest.TestCase):
         correct = all(nnidx == nnidx2)
         self.assertTrue(correct)
 
+    def testnn_bundle(self):
+        x = rand(1000, 64).astype(float32)
+        x_query = rand(100, 64).astype(float32)
+
+        set_distance_type('manhattan')
+        nn = FLANN()
+        nn.build_index(x, algorithm="kmeans", branching=16, iterations=5)
+        nnidx, nndist = nn.nn_index(x_query, 3, checks=64)
+        nn.save_bundle("index.dat")
+        del nn
+        set_distance_type('euclidean')
+
+        for mmap in [True, False]:
+            nn = FLANN()
+            nn.load_bundle("index.dat", mmap=mmap)
+            self.assertEqual(nn.shape, x.shape)
+            self.assertEqual(isinstance(nn._FLANN__curindex_data, memmap), mmap)
+            if mmap:
+                self.assertEqual(nn._FLANN__curindex_data.offset % 4096, 0)
+            nnidx2, nndist2 = nn.nn_index(x_query, 3, checks=64)
+            self.assertTrue(all(nnidx == nnidx2))
+            self.assertTrue(all(nndist == nndist2))
+            del nn
+
+        # the bundle is also a regular index file
+        nn = FLANN()
+        nn.load_index("index.dat", x)
+        nnidx2, nndist2 = nn.nn_index(x_query, 3, checks=64)
+        self.assertTrue(all(nnidx == nnidx2))
+        set_distance_type('euclidean')
+
+    def testnn_bundle_not_a_bundle(self):
+        nn = FLANN()
+        nn.build_index(rand(100, 8))
+        nn.save_index("index.dat")
+        self.assertRaises(FLANNException, lambda: nn.load_bundle("index.dat"))
+
+    def testnn_bytes(self):
+        x = rand(1000, 32).astype(float32)
+        x_query = rand(100, 32).astype(float32)
+
+        nn = FLANN()
+        nn.set_distance_type('manhattan')
+        nn.build_index(x, algorithm="kdtree", trees=4, random_seed=1)
+        nn.add_points(x_query[:10])
+        nn.remove_points([0, 5])
+        nnidx, nndist = nn.nn_index(x_query, 3, checks=64)
+        data = nn.save_index_to_bytes()
+        self.assertTrue(data.readonly)
+
+        # the buffer holds what save_index writes to a file
+        nn.save_index("index.dat")
+        with open("index.dat", "rb") as f:
+            self.assertEqual(f.read(), data.tobytes())
+        del nn
+
+        for buf in [data, data.tobytes(), bytearray(data), frombuffer(data, uint8)]:
+            nn = FLANN()
+            nn.load_index_from_buffer(buf, x)
+            self.assertEqual(nn.shape, (1008, 32))
+            nnidx2, nndist2 = nn.nn_index(x_query, 3, checks=64)
+            self.assertTrue(all(nnidx == nnidx2))
+            self.assertTrue(all(nndist == nndist2))
+            del nn
+
+        # the buffer is read in place and not used after loading
+        buf = bytearray(data)
+        del data
+        nn = FLANN()
+        nn.load_index_from_buffer(buf, x)
+        buf[:] = bytearray(len(buf))
+        nnidx2, _ = nn.nn_index(x_query, 3, checks=64)
+        self.assertTrue(all(nnidx == nnidx2))
+
+        self.assertRaises(FLANNException, nn.load_index_from_buffer, b'not an index', x)
+        self.assertRaises(FLANNException, FLANN().save_index_to_bytes)
+
+
+    def testnn_compression(self):
+        x = rand(5000, 16).astype(float32)
+        x_query = rand(100, 16).astype(float32)
+
+        for params in [dict(algorithm="kdtree", trees=4), dict(algorithm="kmeans", branching=16),
+                       dict(algorithm="hierarchical", branching=16)]:
+            nn = FLANN()
+            nn.build_index(x, random_seed=1, **params)
+            nnidx, nndist = nn.nn_index(x_query, 3, checks=64)
+
+            sizes = {}
+            for compression, level in [('none', None), ('lz4', None), ('lz4', 8), ('lz4hc', 4), ('lz4hc', None)]:
+                nn.save_index("index.dat", compression=compression, level=level)
+                sizes[compression] = os.path.getsize("index.dat")
+                nn2 = FLANN()
+                nn2.load_index("index.dat", x)
+                nnidx2, nndist2 = nn2.nn_index(x_query, 3, checks=64)
+                self.assertTrue(all(nnidx == nnidx2), (params, compression, level))
+                self.assertTrue(all(nndist == nndist2))
+                del nn2
+            self.assertTrue(sizes['none'] > sizes['lz4'] >= sizes['lz4hc'], sizes)
+
+            # an uncompressed index is loaded from a memory mapping of the file
+            nn.save_index("index.dat", compression='none')
+            with open("index.dat", "rb") as f:
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                nn2 = FLANN()
+                nn2.load_index_from_buffer(mapping, x)
+                mapping.close()
+            nnidx2, _ = nn2.nn_index(x_query, 3, checks=64)
+            self.assertTrue(all(nnidx == nnidx2))
+
+        data = nn.save_index_to_bytes(compression='lz4')
+        nn2 = FLANN()
+        nn2.load_index_from_buffer(data, x)
+        self.assertTrue(all(nn2.nn_index(x_query, 3, checks=64)[0] == nnidx))
+
+        self.assertRaises(FLANNException, nn.save_index, "index.dat", compression='zip')
+
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+from pyflann import *
+from numpy import *
+from numpy.random import *
+import os
+import shutil
+import tempfile
+import unittest
+
+
+def anonymous_rss():
+    """ resident memory not backed by files (in bytes), None if unknown """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('RssAnon:'):
+                    return int(line.split()[1]) * 1024
+    except IOError:
+        pass
+    return None
+
+
+class Test_PyFLANN_memmap(unittest.TestCase):
+
+    rows = 200000
+    dim = 64
+    # growth of the anonymous memory allowed while indexing the dataset
+    rss_cap = 24 * 1024 * 1024
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'dataset.bin')
+        seed(1)
+        # written in chunks so the dataset is never held in memory
+        with open(self.filename, 'wb') as f:
+            for i in range(0, self.rows, 10000):
+                rand(10000, self.dim).astype(float32).tofile(f)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_build_larger_than_rss_cap(self):
+        start = anonymous_rss()
+        if start is None:
+            self.skipTest('anonymous RSS is not available on this platform')
+
+        dataset = open_dataset(self.filename, float32, (-1, self.dim))
+        self.assertEqual(dataset.shape, (self.rows, self.dim))
+        self.assertTrue(dataset.nbytes > self.rss_cap)
+
+        nn = FLANN()
+        nn.build_index(dataset, algorithm='kmeans', branching=32, iterations=2, random_seed=1)
+        idx, dists = nn.nn_index(dataset[:100], 1, checks=-1)
+        self.assertTrue(all(idx == arange(100)))
+
+        self.assertTrue(anonymous_rss() - start < self.rss_cap)
+        nn.delete_index()
+
+    def test_dataset_file_name(self):
+        index_file = os.path.join(self.tmpdir, 'index.dat')
+        nn = FLANN()
+        nn.build_index(self.filename, dtype=float32, shape=(self.rows, self.dim),
+                       algorithm='kdtree', trees=1)
+        nn.save_index(index_file)
+        query = open_dataset(self.filename, float32, (10, self.dim))
+        idx, dists = nn.nn_index(query, 1, checks=-1)
+        nn.delete_index()
+
+        nn.load_index(index_file, self.filename, float32, (-1, self.dim))
+        idx2, dists2 = nn.nn_index(query, 1, checks=-1)
+        self.assertTrue(all(idx == idx2))
+        nn.delete_index()
+
+    def test_memmap_not_copied(self):
+        dataset = open_dataset(self.filename, float32, (-1, self.dim))
+        nn = FLANN()
+        self.assertRaises(FLANNException, lambda: nn.build_index(dataset[:, :8]))
+        self.assertRaises(FLANNException, lambda: nn.build_index(self.filename))
+
+
+if __name__ == '__main__':
+    unittest.main()
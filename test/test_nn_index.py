@@ -76,6 +76,118 @@ class Test_PyFLANN_nn_index(unittest.TestCase):
        
         self.assertRaises(FLANNException, lambda: nn.nn_index(rand(5,5)))
 
+    def testnn_radius_batch(self):
+
+        dim = 4
+        N = 500
+        Nq = 50
+        radius = 0.1
+
+        x = rand(N, dim).astype(float32)
+        q = rand(Nq, dim).astype(float32)
+        nn = FLANN()
+        nn.build_index(x, algorithm='linear')
+
+        # use a small initial capacity to exercise the resizing path
+        offsets, idx, dists = nn.nn_radius_batch(q, radius, capacity=1)
+        self.assertEqual(len(offsets), Nq + 1)
+        self.assertEqual(offsets[-1], len(idx))
+
+        for i in range(Nq):
+            gt = nonzero(((x - q[i]) ** 2).sum(1) <= radius)[0]
+            ridx, rdists = nn.nn_radius(q[i], radius)
+            bidx = idx[offsets[i]:offsets[i + 1]]
+            self.assertEqual(set(bidx), set(gt))
+            self.assertEqual(set(bidx), set(ridx))
+            self.assertTrue(allclose(sort(dists[offsets[i]:offsets[i + 1]]), sort(rdists)))
+
+        # limit the number of neighbors returned for each query
+        offsets, idx, dists = nn.nn_radius_batch(q, radius, max_neighbors=2)
+        self.assertTrue(all(diff(offsets) <= 2))
+        nn.delete_index()
+
+    def testnn_index_out(self):
+
+        dim = 10
+        N = 100
+        k = 3
+
+        x = rand(N, dim).astype(float32)
+        nn = FLANN()
+        nn.build_index(x, algorithm='linear')
+        nnidx, nndist = nn.nn_index(x, k)
+
+        indices = empty((N, k), dtype=int32)
+        dists = empty((N, k), dtype=float32)
+        for i in range(2):
+            ridx, rdist = nn.nn_index(x, k, out=(indices, dists))
+            self.assertTrue(ridx is indices or ridx.base is indices)
+            self.assertTrue(all(indices == nnidx))
+            self.assertTrue(all(dists == nndist))
+
+        ridx, rdist = nn.nn(x, x, k, algorithm='linear', out=(indices, dists))
+        self.assertTrue(all(indices == nnidx))
+
+        # radius search writes into caller provided flat buffers
+        ridx, rdist = nn.nn_radius(x[0], 0.5, out=(indices.reshape(-1), dists.reshape(-1)))
+        self.assertTrue(len(ridx) <= N * k)
+        self.assertTrue(ridx.base is indices or ridx.base is indices.base)
+
+        offsets = empty(N + 1, dtype=int32)
+        flat_idx = empty(N * N, dtype=int32)
+        flat_dists = empty(N * N, dtype=float32)
+        offsets, bidx, bdists = nn.nn_radius_batch(x, 0.5, out=(offsets, flat_idx, flat_dists))
+        self.assertEqual(offsets[-1], len(bidx))
+
+        # wrong types, shapes or layouts are rejected
+        self.assertRaises(FLANNException, lambda: nn.nn_index(x, k, out=(indices.astype(int64), dists)))
+        self.assertRaises(FLANNException, lambda: nn.nn_index(x, k + 1, out=(indices, dists)))
+        self.assertRaises(FLANNException, lambda: nn.nn_index(x, 1, out=(indices[:, 0], dists[:, 0])))
+        self.assertRaises(FLANNException,
+                          lambda: nn.nn_radius_batch(x, 0.5, out=(offsets, flat_idx[:1], flat_dists[:1])))
+        nn.delete_index()
+
+    def testnn_prepare_search(self):
+
+        dim = 10
+        N = 100
+        k = 2
+
+        x = rand(N, dim).astype(float32)
+        nn = FLANN()
+        nn.build_index(x, algorithm='linear')
+        nnidx, nndist = nn.nn_index(x, k)
+
+        search = nn.prepare_search(k)
+        indices = empty((N, k), dtype=int32)
+        dists = empty((N, k), dtype=float32)
+        search(x, indices, dists)
+        self.assertTrue(all(indices == nnidx))
+
+        # single row queries through reused and bound buffers
+        query = empty((1, dim), dtype=float32)
+        row_idx = empty((1, k), dtype=int32)
+        row_dists = empty((1, k), dtype=float32)
+        bound = search.bind(query, row_idx, row_dists)
+        for i in range(N):
+            query[...] = x[i]
+            search(query, row_idx, row_dists)
+            self.assertTrue(all(row_idx[0] == nnidx[i]))
+            row_idx[...] = -1
+            bound()
+            self.assertTrue(all(row_idx[0] == nnidx[i]))
+
+        self.assertRaises(FLANNException, lambda: search(x, row_idx, row_dists))
+        self.assertRaises(FLANNException, lambda: search(x.astype(float64), indices, dists))
+        self.assertRaises(FLANNException, lambda: search(x, indices.astype(int64), dists))
+        self.assertRaises(FLANNException, lambda: search.bind(x, indices, dists.astype(float64)))
+
+        # rebuilding the index invalidates the prepared searches
+        nn.build_index(x, algorithm='linear')
+        self.assertRaises(FLANNException, lambda: search(x, indices, dists))
+        self.assertRaises(FLANNException, bound)
+        nn.delete_index()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+from pyflann import *
+from numpy import *
+from numpy.random import *
+import os
+import unittest
+
+
+class Test_PyFLANN_pq(unittest.TestCase):
+
+    def setUp(self):
+        seed(0)
+        self.x = rand(5000, 32).astype(float32)
+        self.q = rand(100, 32).astype(float32)
+        self.exact, self.exact_dists = FLANN().nn(self.x, self.q, 5, algorithm='linear')
+
+    def tearDown(self):
+        if os.path.exists('index_pq.dat'):
+            os.remove('index_pq.dat')
+
+    def recall(self, result):
+        return mean([len(set(r) & set(e)) / float(len(e)) for r, e in zip(result, self.exact)])
+
+    def test_rerank(self):
+        """ re-ranking the candidates of the codes with the exact distance """
+        nn = FLANN()
+        nn.build_index(self.x, algorithm='pq', subquantizers=8, rerank=0, random_seed=1)
+        result, dists = nn.nn_index(self.q, 5)
+        recall_codes = self.recall(result)
+        self.assertTrue(recall_codes > 0.3)
+
+        nn.build_index(self.x, algorithm='pq', subquantizers=8, rerank=100, random_seed=1)
+        result, dists = nn.nn_index(self.q, 5)
+        self.assertTrue(self.recall(result) > 0.95)
+        self.assertTrue(self.recall(result) > recall_codes)
+        # the re-ranked distances are exact
+        found = result == self.exact
+        self.assertTrue(allclose(dists[found], self.exact_dists[found], rtol=1e-4))
+
+    def test_used_memory(self):
+        """ the index holds one byte per subquantizer and point, and the codebooks """
+        nn = FLANN()
+        nn.build_index(self.x, algorithm='pq', subquantizers=8)
+        codebooks = 256 * 32 * 4
+        self.assertTrue(nn.used_memory() <= 5000 * 8 + codebooks + 1024)
+        self.assertTrue(nn.used_memory() < self.x.nbytes / 4)
+
+    def test_save_load(self):
+        nn = FLANN()
+        nn.build_index(self.x, algorithm='pq', subquantizers=16, rerank=50)
+        result, dists = nn.nn_index(self.q, 5)
+        nn.save_index('index_pq.dat')
+
+        nn2 = FLANN()
+        nn2.load_index('index_pq.dat', self.x)
+        result2, dists2 = nn2.nn_index(self.q, 5)
+        self.assertTrue(all(result == result2))
+        self.assertTrue(all(dists == dists2))
+
+    def test_add_remove_points(self):
+        nn = FLANN()
+        nn.build_index(self.x[:4000], algorithm='pq', subquantizers=8, rerank=20)
+        nn.add_points(self.x[4000:], rebuild_threshold=100)
+        result, _ = nn.nn_index(self.x[4000:4100], 1)
+        self.assertTrue(mean(result == arange(4000, 4100)) > 0.95)
+
+        nn.remove_points(arange(4000, 4100))
+        result, _ = nn.nn_index(self.x[4000:4100], 1)
+        self.assertFalse(any((result >= 4000) & (result < 4100)))
+
+    def test_uint8(self):
+        x = randint(0, 256, (3000, 64)).astype(uint8)
+        nn = FLANN()
+        nn.build_index(x, algorithm='pq', subquantizers=16, rerank=10)
+        result, dists = nn.nn_index(x[:100], 1)
+        self.assertTrue(all(result == arange(100)))
+        self.assertTrue(all(dists == 0))
+
+    def test_invalid_subquantizers(self):
+        nn = FLANN()
+        self.assertRaises(FLANNException, nn.build_index, self.x, algorithm='pq', subquantizers=33)
+
+
+if __name__ == '__main__':
+    unittest.main()
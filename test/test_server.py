@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+from pyflann import *
+from pyflann.server import FLANNServer, FLANNClient
+from numpy import *
+from numpy.random import *
+import os
+import socket
+import struct
+import tempfile
+import threading
+import unittest
+
+
+class Test_PyFLANN_server(unittest.TestCase):
+
+    def setUp(self):
+        seed(0)
+        self.x = rand(1000, 8).astype(float32)
+        self.q = rand(100, 8).astype(float32)
+        self.bx = randint(0, 255, (500, 16)).astype(uint8)
+        self.nn = FLANN()
+        self.nn.build_index(self.x, algorithm='linear')
+        self.bnn = FLANN()
+        self.bnn.build_index(self.bx, algorithm='linear')
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.address = os.path.join(self.tmpdir, 'flann.sock')
+        self.server = FLANNServer({'points': self.nn, 'bytes': self.bnn}, self.address,
+                                  max_wait_us=20000)
+        self.server.start()
+        self.client = FLANNClient(self.address, pool_size=4)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.assertFalse(os.path.exists(self.address))
+        os.rmdir(self.tmpdir)
+
+    def test_knn(self):
+        """ the server returns the neighbors found by nn_index """
+        for name, index, qpts in [('points', self.nn, self.q), ('bytes', self.bnn, self.bx[:50])]:
+            expected, expected_dists = index.nn_index(qpts, 5)
+            result, dists = self.client.nn_index(name, qpts, 5)
+            self.assertTrue(all(result == expected))
+            self.assertTrue(allclose(dists, expected_dists))
+
+        result, dists = self.client.nn_index('points', self.q[0])
+        self.assertEqual(result.shape, (1,))
+        self.assertEqual(result[0], self.nn.nn_index(self.q[:1])[0][0])
+
+    def test_radius(self):
+        """ the radius searches return the neighbors in compressed sparse row form """
+        expected = self.nn.nn_radius_batch(self.q, 0.2)
+        offsets, result, dists = self.client.nn_radius('points', self.q, 0.2)
+        self.assertTrue(all(offsets == expected[0]))
+        self.assertTrue(all(result == expected[1]))
+        self.assertTrue(allclose(dists, expected[2]))
+
+    def test_errors(self):
+        """ errors are reported to the client, whose connection stays usable """
+        self.assertRaises(FLANNException, self.client.nn_index, 'missing', self.q, 1)
+        self.assertRaises(FLANNException, self.client.nn_index, 'points', self.bx, 1)
+        self.assertRaises(FLANNException, self.client.nn_index, 'points', self.q[:, :4], 1)
+        self.assertRaises(FLANNException, self.client.nn_radius, 'points', self.q[:, :4], 0.2)
+        self.assertRaises(FLANNException, self.client.nn_index, 'points', self.q, 0)
+        self.assertRaises(FLANNException, self.client.nn_index, 'points', self.q, len(self.x) + 1)
+        result, _ = self.client.nn_index('points', self.q, 1)
+        self.assertEqual(len(result), len(self.q))
+
+    def test_message_size(self):
+        """ requests larger than max_message_size or shorter than a header are rejected """
+        for size, closed in [(1 << 31, True), (4, False)]:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.address)
+            sock.sendall(struct.pack('<I', size) + b'\0' * min(size, 4))
+            response = sock.makefile('rb')
+            response_size, = struct.unpack('<I', response.read(4))
+            self.assertEqual(response.read(response_size)[0], 1)
+            if closed:
+                self.assertEqual(response.read(), b'')
+            response.close()
+            sock.close()
+        result, _ = self.client.nn_index('points', self.q, 1)
+        self.assertEqual(len(result), len(self.q))
+
+    def test_concurrent_clients(self):
+        """ the single point searches of several threads are batched """
+        batches = []
+        nn_index = self.nn.nn_index
+
+        def counting_nn_index(qpts, *args, **kwargs):
+            batches.append(len(qpts))
+            return nn_index(qpts, *args, **kwargs)
+        self.nn.nn_index = counting_nn_index
+
+        expected, _ = nn_index(self.q, 3)
+        results = [None] * len(self.q)
+
+        def search(i):
+            results[i] = self.client.nn_index('points', self.q[i], 3)[0]
+
+        threads = [threading.Thread(target=search, args=(i,)) for i in range(len(self.q))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertTrue(all(vstack(results) == expected))
+        self.assertEqual(sum(batches), len(self.q))
+        self.assertTrue(len(batches) < len(self.q))
+
+    def test_batch_error(self):
+        """ an error of a batched search only reaches the request that caused it """
+        nn_index = self.nn.nn_index
+        bad = -ones(8, dtype=float32)
+
+        def failing_nn_index(qpts, *args, **kwargs):
+            if any(all(qpts == bad, axis=1)):
+                raise FLANNException('bad query')
+            return nn_index(qpts, *args, **kwargs)
+        self.nn.nn_index = failing_nn_index
+
+        expected, _ = nn_index(self.q[:20], 3)
+        results = [None] * 21
+
+        def search(i):
+            try:
+                results[i] = self.client.nn_index('points', self.q[i] if i < 20 else bad, 3)[0]
+            except FLANNException as e:
+                results[i] = e
+
+        threads = [threading.Thread(target=search, args=(i,)) for i in range(21)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertTrue(all(vstack(results[:20]) == expected))
+        self.assertTrue(isinstance(results[20], FLANNException))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+from pyflann import *
+from numpy import *
+from numpy.random import *
+import pyflann.sharded
+import os
+import glob
+import threading
+import time
+import unittest
+
+
+class Test_PyFLANN_sharded(unittest.TestCase):
+
+    def setUp(self):
+        seed(0)
+        self.x = rand(3000, 16).astype(float32)
+        self.q = rand(100, 16).astype(float32)
+        self.exact, self.exact_dists = FLANN().nn(self.x, self.q, 5, algorithm='linear')
+
+    def tearDown(self):
+        for filename in glob.glob('index_sharded.dat*'):
+            os.remove(filename)
+
+    def test_partitions(self):
+        """ exact searches of the shards find the neighbors in the whole dataset """
+        for partition in ['hash', 'range', 'kmeans']:
+            nn = ShardedFLANN(4, partition)
+            nn.build_index(self.x, algorithm='kdtree', trees=2, random_seed=1)
+            self.assertEqual(nn.get_indexed_shape(), self.x.shape)
+            self.assertEqual(sum([shard.get_indexed_shape()[0] for shard in nn.shards]), len(self.x))
+
+            result, dists = nn.nn_index(self.q, 5, checks=-1)
+            self.assertTrue(all(result == self.exact), partition)
+            self.assertTrue(allclose(dists, self.exact_dists, rtol=1e-5))
+
+            result, dists = nn.nn_index(self.q[0], 1, checks=-1)
+            self.assertEqual(result.shape, (1,))
+            self.assertEqual(result[0], self.exact[0, 0])
+            nn.close()
+
+    def test_probes(self):
+        """ the kmeans partition only searches the shards closest to the queries """
+        nn = ShardedFLANN(8, 'kmeans', num_threads=2)
+        nn.build_index(self.x, algorithm='linear', random_seed=1)
+
+        result, _ = nn.nn_index(self.q, 5, probes=8)
+        self.assertTrue(all(result == self.exact))
+
+        result, dists = nn.nn_index(self.q, 5, probes=3)
+        recall = mean([len(set(r) & set(e)) / 5.0 for r, e in zip(result, self.exact)])
+        self.assertTrue(recall > 0.8)
+        # the neighbors found are the nearest points of the searched shards
+        self.assertTrue(all(dists >= self.exact_dists * (1 - 1e-5)))
+        nn.close()
+
+    def test_probes_padding(self):
+        """ missing neighbors of the probed shards are padded, empty batches return empty arrays """
+        nn = ShardedFLANN(8, 'kmeans')
+        nn.build_index(self.x[:40], algorithm='linear', random_seed=1)
+
+        result, dists = nn.nn_index(self.q, 30, probes=1)
+        self.assertEqual(result.shape, (len(self.q), 30))
+        self.assertEqual(dists.shape, (len(self.q), 30))
+        self.assertTrue(all((result == -1) == isinf(dists)))
+        self.assertTrue(any(result == -1))
+
+        result, dists = nn.nn_index(zeros((0, 16), dtype=float32), 5, probes=2)
+        self.assertEqual(result.shape, (0, 5))
+        self.assertEqual(dists.shape, (0, 5))
+        self.assertEqual(dists.dtype, float32)
+        nn.close()
+
+    def test_concurrent_searches(self):
+        """ concurrent first searches create a single pool """
+        nn = ShardedFLANN(4, 'hash')
+        nn.build_index(self.x, algorithm='linear')
+        nn.close()
+        pools = []
+        thread_pool = pyflann.sharded.ThreadPool
+
+        def slow_thread_pool(*args):
+            # leaves time for the other searches to create a pool too
+            time.sleep(0.05)
+            pools.append(thread_pool(*args))
+            return pools[-1]
+        pyflann.sharded.ThreadPool = slow_thread_pool
+        results = [None] * 8
+
+        def search(i):
+            results[i] = nn.nn_index(self.q, 5)[0]
+
+        try:
+            threads = [threading.Thread(target=search, args=(i,)) for i in range(len(results))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            pyflann.sharded.ThreadPool = thread_pool
+            nn.close()
+        self.assertEqual(len(pools), 1)
+        for result in results:
+            self.assertTrue(all(result == self.exact))
+
+    def test_save_load(self):
+        """ the shards are saved and loaded with the partition of the dataset """
+        nn = ShardedFLANN(3, 'hash')
+        nn.build_index(self.x, algorithm='kmeans', branching=16, random_seed=1)
+        result, dists = nn.nn_index(self.q, 5, checks=64)
+        nn.save_index('index_sharded.dat')
+        self.assertEqual(len(glob.glob('index_sharded.dat.*')), 3)
+
+        nn2 = ShardedFLANN(3)
+        nn2.load_index('index_sharded.dat', self.x)
+        result2, dists2 = nn2.nn_index(self.q, 5, checks=64)
+        self.assertTrue(all(result == result2))
+        self.assertTrue(all(dists == dists2))
+
+        # the saved partition replaces the one the object was created with
+        nn3 = ShardedFLANN(3, 'range')
+        nn3.load_index('index_sharded.dat', self.x)
+        self.assertEqual(nn3.partition, 'hash')
+        result3, dists3 = nn3.nn_index(self.q, 5, checks=64)
+        self.assertTrue(all(result == result3))
+        self.assertTrue(all(dists == dists3))
+        nn3.close()
+
+        self.assertRaises(FLANNException, ShardedFLANN(2).load_index, 'index_sharded.dat', self.x)
+        self.assertRaises(FLANNException, nn2.load_index, 'index_sharded.dat', self.x[:100])
+        nn.close()
+        nn2.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+from pyflann import *
+from numpy import *
+from numpy.random import *
+import gc
+import os
+import subprocess
+import sys
+import unittest
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+
+# loads the index from the segment given as argument in a separate
+# process, and prints the neighbors of the first points of the dataset
+# and the growth of its anonymous memory (not backed by files or shared
+# memory) while loading, in KB
+WORKER = """
+import sys
+from pyflann import *
+
+def anonymous_rss():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('RssAnon:'):
+                return int(line.split()[1])
+    return 0
+
+before = anonymous_rss()
+nn = FLANN()
+nn.load_shared(sys.argv[1])
+pts = nn.get_indexed_data()[0]
+result, _ = nn.nn_index(pts[:10], 1, checks=-1)
+after = anonymous_rss()
+print(' '.join(str(r) for r in result))
+print(after - before)
+"""
+
+
+@unittest.skipIf(shared_memory is None, 'requires Python 3.8 or later')
+class Test_PyFLANN_shared_memory(unittest.TestCase):
+
+    def setUp(self):
+        seed(0)
+        self.x = rand(20000, 64).astype(float32)
+        self.q = rand(50, 64).astype(float32)
+        self.segments = []
+
+    def tearDown(self):
+        for segment in self.segments:
+            segment.close()
+            segment.unlink()
+
+    def test_load_shared(self):
+        """ the index loaded from shared memory uses the dataset in place """
+        nn = FLANN()
+        nn.build_index(self.x, algorithm='kdtree', trees=2, random_seed=1)
+        nn.add_points(self.q[:10])
+        nn.remove_points([1, 2, 3])
+        segment = nn.save_shared()
+        self.segments.append(segment)
+
+        nn2 = FLANN()
+        nn2.load_shared(segment.name)
+        self.assertEqual(nn2.get_indexed_shape(), nn.get_indexed_shape())
+        # the removed points are known before the state of the index is
+        # recorded, as when the index is loaded from a file
+        rows = len(self.x) + 10
+        self.assertEqual(nn2._FLANN__built_state, (rows, 3, rows - 3))
+        pts = nn2.get_indexed_data()[0]
+        self.assertFalse(pts.flags.writeable)
+        self.assertTrue(all(pts[:len(self.x)] == self.x))
+
+        result, dists = nn.nn_index(self.q, 5, checks=128)
+        result2, dists2 = nn2.nn_index(self.q, 5, checks=128)
+        self.assertTrue(all(result == result2))
+        self.assertTrue(all(dists == dists2))
+
+        # the segment stays attached until the index is released
+        del pts
+        nn2.delete_index()
+        del nn2
+        gc.collect()
+
+        self.assertRaises(FLANNException, FLANN().load_shared, segment.name + '_missing')
+
+    @unittest.skipUnless(os.path.exists('/proc/self/status'), 'requires /proc')
+    def test_other_process(self):
+        """ another process loads the index without copying the dataset """
+        nn = FLANN()
+        nn.build_index(self.x, algorithm='kdtree', trees=1, random_seed=1)
+        segment = nn.save_shared()
+        self.segments.append(segment)
+
+        output = subprocess.check_output([sys.executable, '-c', WORKER, segment.name])
+        result, growth = output.decode('ascii').split('\n')[:2]
+        self.assertEqual([int(r) for r in result.split()], list(range(10)))
+        # the dataset is 5 MB, the kd-tree about 1 MB
+        self.assertTrue(int(growth) * 1024 < self.x.nbytes / 2, growth)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+from pyflann import *
+from numpy import *
+from numpy.random import *
+import threading
+import unittest
+
+
+class Test_PyFLANN_threading(unittest.TestCase):
+
+    def setUp(self):
+        self.x = rand(2000, 16).astype(float32)
+        self.q = rand(200, 16).astype(float32)
+        self.nn = FLANN()
+        self.nn.build_index(self.x, algorithm='kdtree', trees=4, random_seed=1)
+
+    def tearDown(self):
+        self.nn.delete_index()
+
+    def run_threads(self, num_threads, work):
+        errors = []
+
+        def run(i):
+            try:
+                work(i)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(num_threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+
+    def test_concurrent_nn_index(self):
+        """ threads searching with different checks get the single-threaded results """
+        checks = [1, 4, 16, 64, 256, -1]
+        expected = [self.nn.nn_index(self.q, 5, checks=c) for c in checks]
+        mismatches = []
+
+        def work(i):
+            for j in range(30):
+                c = (i + j) % len(checks)
+                idx, dists = self.nn.nn_index(self.q, 5, checks=checks[c])
+                if not (all(idx == expected[c][0]) and all(dists == expected[c][1])):
+                    mismatches.append(checks[c])
+
+        self.run_threads(8, work)
+        self.assertEqual(mismatches, [])
+
+    def test_concurrent_radius_search(self):
+        radius = 0.5
+        expected = self.nn.nn_radius_batch(self.q, radius, checks=-1)
+        mismatches = []
+
+        def work(i):
+            for j in range(10):
+                if (i + j) % 2:
+                    result = self.nn.nn_radius_batch(self.q, radius, checks=-1)
+                    if not all(all(a == b) for a, b in zip(result, expected)):
+                        mismatches.append(i)
+                else:
+                    k = j % len(self.q)
+                    idx, dists = self.nn.nn_radius(self.q[k], radius, checks=-1, sorted=True)
+                    begin, end = expected[0][k], expected[0][k + 1]
+                    if set(idx) != set(expected[1][begin:end]):
+                        mismatches.append(i)
+
+        self.run_threads(8, work)
+        self.assertEqual(mismatches, [])
+
+    def test_search_kwargs_not_shared(self):
+        """ search keyword arguments only apply to the call they are given to """
+        self.nn.nn_index(self.q, 1, checks=1)
+        self.assertEqual(self.nn.nn_index(self.q, 1)[0].tolist(),
+                         self.nn.nn_index(self.q, 1, checks=32)[0].tolist())
+
+    def test_parallel_build(self):
+        """ the indexes built with several threads only depend on the random seed """
+        x = rand(30000, 16).astype(float32)
+        for params in [dict(algorithm='kdtree', trees=8),
+                       dict(algorithm='kmeans', branching=16, iterations=5)]:
+            results = []
+            for cores in [1, 4, 3]:
+                nn = FLANN()
+                nn.build_index(x, random_seed=7, cores=cores, **params)
+                results.append(nn.nn_index(self.q, 5, checks=64, cores=1))
+            for idx, dists in results[1:]:
+                self.assertTrue(all(idx == results[0][0]))
+                self.assertTrue(all(dists == results[0][1]))
+
+
+if __name__ == '__main__':
+    unittest.main()